@@ -4,9 +4,12 @@ Provides secure API endpoints for generating reels (images and videos).
 """
 
 import os
-from flask import Flask, send_from_directory
-from flask_cors import CORS
-from dotenv import load_dotenv
+from utils.startup_profile import startup_profile, STARTUP_PROFILE_ENABLED
+
+with startup_profile.phase('import:flask'):
+    from flask import Flask, send_from_directory, request
+    from flask_cors import CORS
+    from dotenv import load_dotenv
 
 # Load environment variables
 # Try to load from backend/.env first, then current directory
@@ -16,6 +19,11 @@ if os.path.exists(env_path):
 else:
     load_dotenv()
 
+# 启动模式：
+#   - lazy（默认）：Firebase/Gemini 在后台线程并行预热，不阻塞冷启动
+#   - eager：在启动时同步初始化 Firebase（旧行为）
+STARTUP_MODE = os.getenv('STARTUP_MODE', 'lazy').lower()
+
 # 配置静态文件目录（前端构建产物）
 # 在 Docker 容器中：
 #   - 工作目录是 /app
@@ -27,19 +35,22 @@ else:
 FRONTEND_DIST = None
 FRONTEND_DIST_EXISTS = False
 
-# 尝试多个可能的路径
+# 尝试多个可能的路径（可通过 FRONTEND_DIST 环境变量直接指定，跳过探测）
 possible_paths = [
     '/app/frontend/dist',  # Docker 容器中的路径
     os.path.join(os.path.dirname(__file__), '..', 'frontend', 'dist'),  # 开发环境相对路径
     os.path.join(os.getcwd(), 'frontend', 'dist'),  # 当前工作目录
 ]
+if os.getenv('FRONTEND_DIST'):
+    possible_paths = [os.getenv('FRONTEND_DIST')]
 
-for path in possible_paths:
-    if os.path.exists(path):
-        FRONTEND_DIST = path
-        FRONTEND_DIST_EXISTS = True
-        print(f"Found frontend dist at: {FRONTEND_DIST}")
-        break
+with startup_profile.phase('frontend_probe'):
+    for path in possible_paths:
+        if os.path.exists(path):
+            FRONTEND_DIST = path
+            FRONTEND_DIST_EXISTS = True
+            print(f"Found frontend dist at: {FRONTEND_DIST}")
+            break
 
 if not FRONTEND_DIST_EXISTS:
     print(f"Warning: Frontend dist not found. Checked paths: {possible_paths}")
@@ -70,35 +81,73 @@ if GEMINI_API_KEY:
 print(f"  FIREBASE_CREDENTIALS_PATH: {'✅ SET' if FIREBASE_CREDENTIALS_PATH else '❌ NOT SET'}")
 print(f"  FIREBASE_CREDENTIALS_JSON: {'✅ SET' if FIREBASE_CREDENTIALS_JSON else '❌ NOT SET'}")
 print(f"  FIREBASE_STORAGE_BUCKET: {'✅ SET' if FIREBASE_STORAGE_BUCKET else '❌ NOT SET'}")
+print(f"  STARTUP_MODE: {STARTUP_MODE}")
 print("=" * 50)
 
-# Initialize Firebase Admin SDK on startup
-print("\n" + "=" * 50)
-print("Initializing Firebase Admin SDK...")
-try:
-    from utils.auth import _initialize_firebase
-    firebase_admin = _initialize_firebase()
-    if firebase_admin and firebase_admin._apps:
-        print("✅ Firebase Admin SDK initialized successfully")
-    else:
-        print("⚠️  WARNING: Firebase Admin SDK not initialized. Auth verification will fail.")
-        print("   Please configure FIREBASE_CREDENTIALS_PATH or FIREBASE_CREDENTIALS_JSON in .env file")
-except Exception as e:
-    print(f"❌ ERROR: Failed to initialize Firebase Admin SDK: {e}")
-    print("   Auth verification will fail. Please check your Firebase configuration.")
-print("=" * 50 + "\n")
+if STARTUP_MODE == 'eager':
+    # Initialize Firebase Admin SDK on startup
+    print("\n" + "=" * 50)
+    print("Initializing Firebase Admin SDK...")
+    try:
+        from utils.auth import _initialize_firebase
+        with startup_profile.phase('firebase_init'):
+            firebase_admin = _initialize_firebase()
+        if firebase_admin and firebase_admin._apps:
+            print("✅ Firebase Admin SDK initialized successfully")
+        else:
+            print("⚠️  WARNING: Firebase Admin SDK not initialized. Auth verification will fail.")
+            print("   Please configure FIREBASE_CREDENTIALS_PATH or FIREBASE_CREDENTIALS_JSON in .env file")
+    except Exception as e:
+        print(f"❌ ERROR: Failed to initialize Firebase Admin SDK: {e}")
+        print("   Auth verification will fail. Please check your Firebase configuration.")
+    print("=" * 50 + "\n")
+else:
+    # 后台并行预热 Firebase 和 Gemini 客户端，不阻塞启动
+    from utils.warmup import start_background_warmup
+    start_background_warmup()
+    print("Firebase / Gemini warm-up started in background")
 
 # Register blueprints
-from routes.reel import reel_bp
-from routes.brand_dna import brand_dna_bp
-app.register_blueprint(reel_bp)
-app.register_blueprint(brand_dna_bp)
+with startup_profile.phase('register_blueprints'):
+    from routes.reel import reel_bp
+    from routes.brand_dna import brand_dna_bp
+    app.register_blueprint(reel_bp)
+    app.register_blueprint(brand_dna_bp)
+
+
+# 进程退出（含 Cloud Run 的 SIGTERM）前排空 Firestore 写入缓冲区
+from services.firestore_write_buffer import install_shutdown_hooks
+install_shutdown_hooks()
+
+
+@app.after_request
+def record_first_response(response):
+    """记录冷启动到首个响应的耗时"""
+    if startup_profile.first_response is None:
+        startup_profile.mark_first_response(request.path, response.status_code)
+    return response
+
 
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint."""
     return {"status": "ok"}
 
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """
+    Readiness endpoint（用于 Cloud Run startup probe）
+    所有依赖预热并探测成功后返回 200，否则返回 503 和各依赖状态
+    """
+    from utils.warmup import get_readiness
+    readiness = get_readiness()
+    body = {
+        "status": "ready" if readiness['ready'] else "warming_up",
+        "dependencies": readiness['dependencies'],
+    }
+    return body, (200 if readiness['ready'] else 503)
+
 # SPA 路由处理：所有非 API 请求返回 index.html
 # 这必须在所有蓝图注册之后，以确保 API 路由优先级更高
 # 注意：只处理 GET 请求，避免拦截 POST/PUT/DELETE 等 API 请求
@@ -149,6 +198,11 @@ def serve_frontend(path):
             }), 503
 
 
+# lazy 模式下 SDK 在后台预热时才加载，报告由 utils.warmup 在预热完成后打印
+if STARTUP_PROFILE_ENABLED and STARTUP_MODE == 'eager':
+    startup_profile.print_report()
+
+
 if __name__ == '__main__':
     # Cloud Run 使用 PORT 环境变量，默认为 8080
     # 开发环境可以使用 8787
@@ -3,18 +3,46 @@ Reel Generation 路由
 处理所有 Reel 生成相关的 API 端点（图片和视频）
 """
 
-from flask import Blueprint, request, jsonify
-from services.gemini_service import get_gemini_service_safe
+from flask import Blueprint, Response, request, jsonify, send_file, stream_with_context
+from services.gemini_service import get_gemini_service_safe, IMAGE_ASPECT_RATIOS
 from services.video_asset_service import get_video_asset_service
+from services.image_upscale_service import get_image_upscale_service, decode_base64_image, SUPPORTED_FACTORS
+from services.background_removal_service import get_background_removal_service, BG_REMOVAL_MAX_IMAGES
+from services.image_normalization_service import get_image_normalization_service, parse_aspect_ratio
+from services.asset_derivative_service import get_asset_derivative_service, ASSET_DERIVATIVES_ENABLED
+from services.video_proxy_service import get_video_proxy_service, is_valid_video_id, parse_range
+from services.video_transfer_service import get_video_transfer_service
+from services.video_frame_service import get_video_frame_service
+from services.reel_assembly_service import (
+    get_reel_assembly_service, AssemblyOptions, decode_audio_bed, REEL_ASSEMBLY_MAX_BED_VOLUME
+)
 from utils.auth import verify_firebase_token
-from utils.brand_dna_utils import get_brand_dna_profile, inject_brand_dna_to_prompt, get_brand_dna_style_reference
+from utils.brand_dna_utils import get_brand_dna_profile, inject_brand_dna_to_prompt, get_brand_dna_style_reference, render_brand_guidelines
+from utils.prompt_templates import render_prompt
+from utils.genai_client import get_genai_api_key, get_genai_client
+from utils.response_schemas import (
+    ENHANCED_PROMPT, ENHANCED_PROMPT_LIST, DESIGN_PLAN, DESIGN_PLAN_LIST, MODALITY_VERDICT, MISMATCH_VERDICT,
+)
+from services.reel_session_service import get_reel_session_store, SessionConflictError
+from services.reel_context_service import get_reel_context_manager, format_history
+from services.research_cache_service import get_research_cache, research_cache_key
+from services.option_fanout_service import (
+    get_option_fanout_service, OPTION_FANOUT_ENABLED,
+    ENHANCE_VIDEO_OPTIONS, ENHANCE_IMAGE_OPTIONS, DESIGN_VIDEO_OPTIONS, DESIGN_IMAGE_OPTIONS,
+)
+from utils.asset_manifest import CREATIVE_DIRECTOR_MAX_BODY_BYTES, slim_asset_manifest, slim_messages, asset_id_if_type
 import json
 import base64
 import os
+import re
 import time
-from urllib.parse import urlparse, urlencode, parse_qs, urlunparse
-from google import genai as genai_new
-from google.genai import types
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.lazy_import import lazy_import
+from utils.base64_stream import open_base64, decoded_base64_length, HashingReader
+from utils.media_probe import MediaInfo, probe_base64_image, probe_remote_video
+
+# google.genai 延迟加载以缩短冷启动时间（客户端与 GeminiService 共享）
+types = lazy_import('google.genai.types')
 
 reel_bp = Blueprint('reel', __name__, url_prefix='/api/reel')
 
@@ -36,6 +64,11 @@ def safe_get_text(response) -> str:
 
 def safe_json_parse(json_string: str, fallback: any) -> any:
     """安全解析 JSON，处理可能的 markdown 包装"""
+    # 结构化输出的响应本身就是合法 JSON，直接解析
+    try:
+        return json.loads(json_string)
+    except (TypeError, ValueError):
+        pass
     try:
         text_to_parse = json_string
         
@@ -76,6 +109,10 @@ def is_video_model(model: str) -> bool:
     return 'veo' in model.lower()
 
 
+# 创意总监提示词中使用的最近消息数（未使用服务端会话的请求；会话模式见 reel_context_service）
+CREATIVE_DIRECTOR_HISTORY_MESSAGES = 4
+
+
 @reel_bp.route('/creative-director', methods=['POST'])
 @verify_firebase_token
 def creative_director():
@@ -85,11 +122,15 @@ def creative_director():
     Request: {
         "userPrompt": string,
         "selectedModel": string,
-        "assets": Record<string, ReelAsset>,
+        "assets": Record<string, { type, prompt, width, height, mimeType?, duration? }>,  // 资产清单，不含 src
         "selectedAssetId": string | null,
         "lastGeneratedAssetId": string | null,
         "messages": ReelMessage[],
-        "hasUploadedFiles": boolean
+        "hasUploadedFiles": boolean,
+        // 服务端会话模式：只发送增量，assets / messages / selectedAssetId / lastGeneratedAssetId 从会话读取
+        "sessionId"?: string,
+        "baseVersion"?: number,
+        "sessionDelta"?: { reset?, messages?, assets?, selectedAssetId?, lastGeneratedAssetId? }
     }
     Response: {
         "action": 'NEW_ASSET' | 'EDIT_ASSET' | 'ANSWER_QUESTION' | 'MODEL_MISMATCH',
@@ -110,6 +151,14 @@ def creative_director():
         print(f"[API] Time: {time.strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"{'='*60}")
         
+        # 在解析 JSON 之前拒绝过大的请求体（客户端应只发送资产清单）
+        if request.content_length and request.content_length > CREATIVE_DIRECTOR_MAX_BODY_BYTES:
+            print(f"[API] ❌ Error: Request body too large ({request.content_length} bytes)")
+            return jsonify({
+                "error": "Request body too large",
+                "message": "Send an asset manifest (type, prompt, width, height) instead of full assets."
+            }), 413
+        
         data = request.get_json()
         if not data or 'userPrompt' not in data:
             print(f"[API] ❌ Error: Missing 'userPrompt' in request body")
@@ -117,15 +166,46 @@ def creative_director():
         
         user_prompt = data['userPrompt']
         selected_model = data.get('selectedModel', 'banana')
-        assets = data.get('assets', {})
-        selected_asset_id = data.get('selectedAssetId')
-        last_generated_asset_id = data.get('lastGeneratedAssetId')
-        messages = data.get('messages', [])
         has_uploaded_files = data.get('hasUploadedFiles', False)
+        session_id = data.get('sessionId')
+        if session_id is not None:
+            # 服务端会话：应用增量后从会话读取上下文
+            try:
+                session = get_reel_session_store().apply_delta(
+                    uid, session_id, data.get('sessionDelta') or {}, int(data.get('baseVersion') or 0)
+                )
+            except SessionConflictError as e:
+                print(f"[API] ⚠️ Session {session_id} out of sync (server version {e.version})")
+                return jsonify({
+                    "error": "session_out_of_sync",
+                    "message": "Session state is missing or stale; resend the full state with reset.",
+                    "version": e.version
+                }), 409
+            except (TypeError, ValueError) as e:
+                print(f"[API] ❌ Error: Invalid session request: {e}")
+                return jsonify({"error": f"Invalid session request: {e}"}), 400
+            assets, stripped_fields = session.assets, 0
+            selected_asset_id = session.selected_asset_id
+            last_generated_asset_id = session.last_generated_asset_id
+            # 滚动摘要 + 预算内的最近消息；摘要在后台刷新，不阻塞本次请求
+            context_manager = get_reel_context_manager()
+            context = context_manager.build_context(session)
+            messages, history_summary = context.messages, context.summary
+            context_manager.schedule_refresh(session)
+            print(f"[API] Session: {session_id} (version {session.version}, {len(messages)} recent messages, "
+                  f"summary {'yes' if history_summary else 'no'})")
+        else:
+            assets, stripped_fields = slim_asset_manifest(data.get('assets', {}))
+            selected_asset_id = data.get('selectedAssetId')
+            last_generated_asset_id = data.get('lastGeneratedAssetId')
+            messages = slim_messages(data.get('messages', []), CREATIVE_DIRECTOR_HISTORY_MESSAGES)
+            history_summary = ''
         
         print(f"[API] Prompt: {user_prompt[:100]}..." if len(user_prompt) > 100 else f"[API] Prompt: {user_prompt}")
         print(f"[API] Model: {selected_model}")
         print(f"[API] Assets count: {len(assets)}")
+        if stripped_fields:
+            print(f"[API] ⚠️ Stripped {stripped_fields} non-manifest asset fields (client sent full assets)")
         print(f"[API] Has uploaded files: {has_uploaded_files}")
         
         gemini, error_response = get_gemini_service_safe()
@@ -136,22 +216,9 @@ def creative_director():
         # 检查模型不匹配（仅在无上传文件时）
         if not has_uploaded_files:
             current_modality = 'VIDEO' if is_video_model(selected_model) else 'IMAGE'
-            check_prompt = f"""
-You are a specialized Intent Classifier for a creative AI tool.
-Your ONLY job is to detect if the User's Prompt CONTRADICTS the Current Selected Model Modality.
-
-Current Model Modality: {current_modality}
-User Prompt: "{user_prompt}"
-
-Rules:
-1. If User Prompt clearly asks for VIDEO (e.g. "drone shot", "moving", "animation", "pan", "zoom", "video", "clip") AND Current Modality is IMAGE -> Mismatch = TRUE.
-2. If User Prompt clearly asks for IMAGE (e.g. "logo", "icon", "poster", "picture", "photo", "static") AND Current Modality is VIDEO -> Mismatch = TRUE.
-3. Otherwise (ambiguous or matching) -> Mismatch = FALSE.
-
-Return JSON: {{ "mismatch": boolean, "suggestedModel": "veo_fast" | "banana", "reasoning": "string (in Chinese)" }}
-"""
+            check_prompt = render_prompt('creative_director_modality_check', current_modality=current_modality, user_prompt=user_prompt)
             try:
-                check_response = gemini.generate_content(check_prompt, model='gemini-2.5-flash')
+                check_response = gemini.generate_content(check_prompt, model='gemini-2.5-flash', response_schema=MISMATCH_VERDICT)
                 check_text = safe_get_text(check_response)
                 check_result = safe_json_parse(check_text, {})
                 
@@ -168,20 +235,11 @@ Return JSON: {{ "mismatch": boolean, "suggestedModel": "veo_fast" | "banana", "r
         # 根据模型类型选择处理逻辑
         if is_video_model(selected_model):
             # 视频模型逻辑
-            safe_selected_id = (selected_asset_id and assets.get(selected_asset_id, {}).get('type') == 'video') if selected_asset_id else None
-            safe_last_id = (last_generated_asset_id and assets.get(last_generated_asset_id, {}).get('type') == 'video') if last_generated_asset_id else None
+            safe_selected_id = asset_id_if_type(assets, selected_asset_id, 'video')
+            safe_last_id = asset_id_if_type(assets, last_generated_asset_id, 'video')
             
-            # 构建历史记录
-            history_lines = []
-            for msg in messages[-4:]:
-                role = msg.get('role', 'user')
-                content = msg.get('content', '')
-                if isinstance(content, str):
-                    history_lines.append(f"{role}: {content}")
-                else:
-                    msg_type = msg.get('type', 'unknown')
-                    history_lines.append(f"{role}: [{msg_type} message]")
-            history_for_prompt = '\n'.join(history_lines)
+            # 构建历史记录（会话模式下带较早轮次的滚动摘要）
+            history_for_prompt = format_history(messages, history_summary)
             
             creative_director_tool = {
                 'name': 'video_creative_director_action',
@@ -210,31 +268,13 @@ Return JSON: {{ "mismatch": boolean, "suggestedModel": "veo_fast" | "banana", "r
                 }
             }
             
-            prompt = f"""
-You are an AI Video Director. Analyze the user's request in the context of a video creation session.
-
-**Context**:
-- Explicitly Selected Video ID: {safe_selected_id or 'None'}
-- Last Generated Video ID: {safe_last_id or 'None'}
-- Recent Chat:
-{history_for_prompt}
-- User Request: "{user_prompt}"
-
-**Logic**:
-1. **EDIT_VIDEO**: If the user wants to change, modify, extend, or iterate on a video (e.g., "make it faster", "change style to claymation", "redo this"), the action is EDIT_VIDEO.
-2. **NEW_VIDEO**: If the user wants a completely new subject or scene (e.g., "show me a cat instead", "create a video of space").
-3. **ANSWER_QUESTION**: If it's a general question or conversational remark.
-
-**Output**: Call 'video_creative_director_action'.
-- `action`: "EDIT_VIDEO" | "NEW_VIDEO" | "ANSWER_QUESTION"
-- `prompt`: The refined video generation prompt (or text answer).
-- `reasoning`: Detailed explanation in Chinese following this structured format:
-  * For NEW_VIDEO: "用户想要创建一个新的 YouTube Short 视频，主题是关于{{用户提示词的总结和描述}}。因此，执行新建视频操作。"
-  * For EDIT_VIDEO: "用户想要编辑视频，调整内容为{{修改要求}}。因此，执行编辑视频操作。"
-  * For ANSWER_QUESTION: Provide appropriate contextual answer in Chinese.
-  IMPORTANT: Summarize the user's prompt naturally in Chinese rather than directly quoting it.
-- `targetVideoId`: The ID of the video to edit/reference (if action is EDIT_VIDEO).
-"""
+            prompt = render_prompt(
+                'creative_director_video',
+                selected_id=safe_selected_id or 'None',
+                last_id=safe_last_id or 'None',
+                history=history_for_prompt,
+                user_prompt=user_prompt,
+            )
             
             try:
                 response = gemini.generate_content_with_function_calling(prompt, [creative_director_tool], model='gemini-2.5-pro')
@@ -291,20 +331,11 @@ You are an AI Video Director. Analyze the user's request in the context of a vid
             })
         else:
             # 图片模型逻辑
-            safe_selected_id = (selected_asset_id and assets.get(selected_asset_id, {}).get('type') == 'image') if selected_asset_id else None
-            safe_last_id = (last_generated_asset_id and assets.get(last_generated_asset_id, {}).get('type') == 'image') if last_generated_asset_id else None
+            safe_selected_id = asset_id_if_type(assets, selected_asset_id, 'image')
+            safe_last_id = asset_id_if_type(assets, last_generated_asset_id, 'image')
             
-            # 构建历史记录
-            history_lines = []
-            for msg in messages[-4:]:
-                role = msg.get('role', 'user')
-                content = msg.get('content', '')
-                if isinstance(content, str):
-                    history_lines.append(f"{role}: {content}")
-                else:
-                    msg_type = msg.get('type', 'unknown')
-                    history_lines.append(f"{role}: [{msg_type} message]")
-            history_for_prompt = '\n'.join(history_lines)
+            # 构建历史记录（会话模式下带较早轮次的滚动摘要）
+            history_for_prompt = format_history(messages, history_summary)
             
             creative_director_tool = {
                 'name': 'creative_director_action',
@@ -333,27 +364,13 @@ You are an AI Video Director. Analyze the user's request in the context of a vid
                 }
             }
             
-            prompt = f"""
-You are an AI Creative Director. Your job is to analyze the user's request in the context of an image creation session and decide the next action.
-
-**Current Context**:
-- Explicitly Selected Image ID: {safe_selected_id or 'None'}
-- Most Recently Generated Image ID: {safe_last_id or 'None'}
-- Recent Conversation History:
-{history_for_prompt}
-- User's Latest Request: "{user_prompt}"
-
-**Your Logic & Rules**:
-1. **Prioritize Editing**: If an image is explicitly selected OR if the request is a clear follow-up modification to the last generated image (e.g., "change the background", "make it blue"), the action MUST be **EDIT_IMAGE**.
-2. **Answer Question**: If the user is asking a question or making a comment that doesn't seem to be an image request (e.g., "what can you do?", "that's cool"), the action is **ANSWER_QUESTION**.
-3. **Default to New Creation**: For any other creative request that is not an edit or a question, the action is **NEW_CREATION**.
-
-Based on this logic, call the 'creative_director_action' function with your decision. The 'reasoning' should follow this structured format in Chinese:
-  * For NEW_CREATION: "用户想要创建一张新图片，主题是关于{{用户提示词的总结和描述}}。因此，执行新建创作操作。"
-  * For EDIT_IMAGE: "用户想要编辑图片，调整内容为{{修改要求}}。因此，执行编辑图片操作。"
-  * For ANSWER_QUESTION: Provide appropriate contextual answer in Chinese.
-  IMPORTANT: Summarize the user's prompt naturally in Chinese rather than directly quoting it.
-"""
+            prompt = render_prompt(
+                'creative_director_image',
+                selected_id=safe_selected_id or 'None',
+                last_id=safe_last_id or 'None',
+                history=history_for_prompt,
+                user_prompt=user_prompt,
+            )
             
             response = gemini.generate_content_with_function_calling(prompt, [creative_director_tool], model='gemini-2.5-pro')
             
@@ -435,8 +452,14 @@ def generate():
         "images": [{"data": string, "mimeType": string}],
         "aspectRatio": '9:16',
         "sourceAssetId"?: string,
-        "activeProfileId"?: string  # Brand DNA ID
+        "activeProfileId"?: string,  # Brand DNA ID
+        "count"?: number  # 图片变体数量（1-4，别名 variants）；大于 1 时以 NDJSON 流式返回
     }
+    
+    count > 1 时每完成一个变体输出一行：
+        {"event": "variant", "index": 0, "asset": {...与单张响应相同...}}
+        {"event": "error", "index": 1, "error": "..."}
+        {"event": "done", "count": 4, "succeeded": 3, "failed": 1}
     """
     import time
     start_time = time.time()
@@ -457,9 +480,20 @@ def generate():
         prompt = data['prompt']
         model = data.get('model', 'banana')
         images = data.get('images', [])
-        aspect_ratio = data.get('aspectRatio', '9:16')
+        aspect_ratio = data.get('aspectRatio') or '9:16'
         source_asset_id = data.get('sourceAssetId')
         active_profile_id = data.get('activeProfileId')  # 新增：Brand DNA ID
+        try:
+            count = int(data.get('count', data.get('variants', 1)) or 1)
+        except (TypeError, ValueError):
+            return jsonify({"error": "'count' must be an integer"}), 400
+        if not 1 <= count <= REEL_MAX_VARIANTS:
+            return jsonify({"error": f"'count' must be between 1 and {REEL_MAX_VARIANTS}"}), 400
+        if count > 1 and is_video_model(model):
+            return jsonify({"error": "'count' is only supported for image models"}), 400
+        supported_ratios = VEO_ASPECT_RATIOS if is_video_model(model) else IMAGE_ASPECT_RATIOS
+        if aspect_ratio not in supported_ratios:
+            return jsonify({"error": f"'aspectRatio' must be one of {', '.join(supported_ratios)}"}), 400
         
         print(f"[API] Prompt: {prompt[:100]}..." if len(prompt) > 100 else f"[API] Prompt: {prompt}")
         print(f"[API] Model: {model}")
@@ -467,6 +501,8 @@ def generate():
         print(f"[API] Images count: {len(images)}")
         print(f"[API] Source Asset ID: {source_asset_id or 'None'}")
         print(f"[API] Active Profile ID: {active_profile_id or 'None'}")
+        if count > 1:
+            print(f"[API] Variants: {count}")
         
         # 读取并注入 Brand DNA（如果提供）
         brand_dna = None
@@ -487,7 +523,7 @@ def generate():
         if is_video_model(model):
             print(f"[API] 🎬 Generating VIDEO with model: {model}")
             # 视频生成逻辑
-            api_key = os.getenv('GEMINI_API_KEY') or os.getenv('GOOGLE_API_KEY')
+            api_key = get_genai_api_key()
             if not api_key:
                 print(f"[API] ❌ Error: API Key is missing")
                 return jsonify({"error": "API Key is missing"}), 500
@@ -503,8 +539,8 @@ def generate():
             print(f"[API] Using Veo model: {actual_model} (requested: {model})")
             
             try:
-                client = genai_new.Client(api_key=api_key)
-                print(f"[API] ✅ Gen AI client initialized")
+                client = get_genai_client()
+                print(f"[API] ✅ Gen AI client ready")
             except Exception as e:
                 print(f"[API] ❌ Failed to initialize Gen AI client: {e}")
                 import traceback
@@ -521,91 +557,21 @@ def generate():
             
             if images and len(images) > 0:
                 print(f"[API] Processing {len(images)} input image(s)")
-                image_data_str = images[0]['data']
-                image_mime_type = images[0].get('mimeType', 'image/jpeg')
-                
-                try:
-                    image_bytes = base64.b64decode(image_data_str)
-                    print(f"[API] ✅ Decoded base image ({len(image_bytes)} bytes, {image_mime_type})")
-                except Exception as e:
-                    print(f"[API] ⚠️ Error decoding base image: {e}")
-                    image_bytes = base64.b64decode(image_data_str) if isinstance(image_data_str, str) else image_data_str
-                
-                # 上传到 Firebase Storage 并获取 GCS URI
-                first_gcs_uri = None
                 try:
-                    doc_ref, _, first_gcs_uri = asset_service.archive_and_prepare_reference(
-                        image_bytes,
-                        image_mime_type,
-                        prompt
-                    )
-                    if first_gcs_uri:
-                        print(f"[API] ✅ Image uploaded to Firebase Storage")
-                        print(f"[API] GCS URI: {first_gcs_uri}")
-                    else:
-                        print(f"[API] ⚠️ Failed to get GCS URI, using fallback")
-                except Exception as e:
-                    print(f"[API] ⚠️ Failed to upload image to Firebase Storage: {e}")
-                    import traceback
-                    traceback.print_exc()
-                    first_gcs_uri = None
-                
-                # 使用 GCS URI 创建图片对象（推荐）或使用 bytes（fallback）
-                if first_gcs_uri:
-                    base_interpol_image = types.Image(gcs_uri=first_gcs_uri)
-                    print(f"[API] ✅ Using GCS URI for base image")
-                else:
-                    # Fallback: 使用直接 bytes（可能不支持或效果不佳）
-                    print(f"[API] ⚠️ Using direct image_bytes (fallback)")
-                    base_interpol_image = types.Image(
-                        image_bytes=image_bytes,
-                        mime_type=image_mime_type
-                    )
-                
-                # 处理尾帧（首尾帧插值）
-                if len(images) >= 2:
-                    print(f"[API] Processing last frame image for interpolation")
-                    last_frame_data_str = images[1]['data']
-                    last_frame_mime_type = images[1].get('mimeType', 'image/jpeg')
-                    try:
-                        last_frame_bytes = base64.b64decode(last_frame_data_str)
-                        print(f"[API] ✅ Decoded last frame ({len(last_frame_bytes)} bytes, {last_frame_mime_type})")
-                    except Exception as e:
-                        print(f"[API] ⚠️ Error decoding last frame: {e}")
-                        last_frame_bytes = base64.b64decode(last_frame_data_str) if isinstance(last_frame_data_str, str) else last_frame_data_str
-                    
-                    # 上传尾帧到 Firebase Storage
-                    last_frame_gcs_uri = None
-                    try:
-                        _, _, last_frame_gcs_uri = asset_service.archive_and_prepare_reference(
-                            last_frame_bytes,
-                            last_frame_mime_type,
-                            f"{prompt} (Last Frame)"
-                        )
-                        if last_frame_gcs_uri:
-                            print(f"[API] ✅ Last frame uploaded to Firebase Storage")
-                            print(f"[API] Last Frame GCS URI: {last_frame_gcs_uri}")
-                    except Exception as e:
-                        print(f"[API] ⚠️ Failed to upload last frame to Firebase Storage: {e}")
-                        last_frame_gcs_uri = None
+                    base_interpol_image, doc_ref = _prepare_veo_frame(asset_service, images[0], prompt, 'base image', aspect_ratio, uid)
                     
-                    # 使用 GCS URI 创建尾帧图片对象
-                    if last_frame_gcs_uri:
-                        last_frame_image = types.Image(gcs_uri=last_frame_gcs_uri)
-                        print(f"[API] ✅ Using GCS URI for last frame")
-                    else:
-                        # Fallback
-                        print(f"[API] ⚠️ Using direct image_bytes for last frame (fallback)")
-                        last_frame_image = types.Image(
-                            image_bytes=last_frame_bytes,
-                            mime_type=last_frame_mime_type
-                        )
+                    # 处理尾帧（首尾帧插值）
+                    if len(images) >= 2:
+                        print(f"[API] Processing last frame image for interpolation")
+                        last_frame_image, _ = _prepare_veo_frame(asset_service, images[1], f"{prompt} (Last Frame)", 'last frame', aspect_ratio, uid)
+                except ValueError as e:
+                    return jsonify({"error": str(e)}), 400
             else:
                 print(f"[API] No input images, generating from text prompt only")
             
             config = types.GenerateVideosConfig(
                 numberOfVideos=1,
-                durationSeconds=8,
+                durationSeconds=VEO_DEFAULT_DURATION_SECONDS,
                 aspectRatio=aspect_ratio,
                 negativePrompt='',
             )
@@ -726,23 +692,16 @@ def generate():
             
             print(f"[API] ✅ Video URI obtained: {video_uri[:100]}...")
             
-            # 构建签名 URL
-            try:
-                parsed_url = urlparse(video_uri)
-                query_params = parse_qs(parsed_url.query)
-                query_params['key'] = [api_key]
-                new_query = urlencode(query_params, doseq=True)
-                final_video_uri = urlunparse((
-                    parsed_url.scheme,
-                    parsed_url.netloc,
-                    parsed_url.path,
-                    parsed_url.params,
-                    new_query,
-                    parsed_url.fragment
-                ))
-            except Exception as e:
-                separator = '&' if '?' in video_uri else '?'
-                final_video_uri = f"{video_uri}{separator}key={api_key}"
+            # 通过服务端代理访问视频，API Key 不再拼接到返回给客户端的 URL 中
+            video_proxy = get_video_proxy_service()
+            video_id = video_proxy.register(video_uri, asset_doc_id=doc_ref.id if doc_ref else None)
+            proxy_src = f"/api/reel/videos/{video_id}"
+            # 提前在后台把完整视频缓存到本地，首次播放和拖动进度条直接命中缓存
+            video_proxy.ensure_cached(video_id, {"source_uri": video_uri})
+            # 上游文件会过期：在后台转存到 Storage，完成后代理改为从 Storage 读取
+            get_video_transfer_service().enqueue(video_id, video_uri, asset_doc_id=doc_ref.id if doc_ref else None)
+            # 后台抽取海报帧和关键帧（按时间点 seek，不解码整段视频）
+            frame_job = get_video_frame_service().submit(video_id, {"source_uri": video_uri})
             
             asset_id = f"reel-vid-{int(time.time() * 1000)}"
             duration = time.time() - start_time
@@ -752,16 +711,25 @@ def generate():
             
             # 更新资源状态为成功
             if doc_ref:
-                asset_service.update_asset_status(doc_ref, "completed", video_uri=final_video_uri)
+                asset_service.update_asset_status(doc_ref, "completed", video_uri=video_uri)
+            
+            # 通过 Range 请求只读取 moov 头部，获取真实尺寸和时长
+            media_info = probe_remote_video(video_uri, headers=video_proxy.upstream_headers())
+            if media_info is None or not media_info.width:
+                media_info = _fallback_media_info('video', aspect_ratio)
+            print(f"[API] Output: {media_info.width}x{media_info.height} {media_info.mime_type}, {media_info.duration}s")
             
             print(f"{'='*60}\n")
             return jsonify({
                 "assetId": asset_id,
                 "type": "video",
-                "src": final_video_uri,
+                "src": proxy_src,
                 "prompt": prompt,
-                "width": 512,
-                "height": 896,
+                "width": media_info.width,
+                "height": media_info.height,
+                "mimeType": media_info.mime_type,
+                "duration": media_info.duration,
+                "thumbnailSrc": f"{proxy_src}/poster" if frame_job else None,
                 "status": "done",
                 "generationModel": model
             })
@@ -771,13 +739,14 @@ def generate():
             model_level = 'banana_pro' if model == 'banana_pro' else 'banana'
             print(f"[API] Model level: {model_level}")
             
-            # 准备输入图片
+            # 准备输入图片（缩小到模型有效输入分辨率并去除元数据）
+            normalizer = get_image_normalization_service()
             image_parts = []
             for img in images:
-                image_parts.append({
+                image_parts.append(normalizer.normalize_part({
                     'data': img.get('data', ''),
                     'mimeType': img.get('mimeType', 'image/jpeg')
-                })
+                }, 'image_generation'))
             
             # Brand DNA 风格参考图片（图片模式专用）
             # 如果用户没有上传图片，且 Brand DNA 有 styleReferenceUrl，使用它作为参考
@@ -798,10 +767,10 @@ def generate():
                         elif '.webp' in style_ref_url.lower():
                             mime_type = 'image/webp'
                         
-                        image_parts.append({
+                        image_parts.append(normalizer.normalize_part({
                             'data': image_base64,
                             'mimeType': mime_type
-                        })
+                        }, 'image_generation'))
                         print(f"[API] ✅ Added Brand DNA style reference image")
                     except Exception as e:
                         print(f"[API] ⚠️ Failed to load Brand DNA style reference: {e}")
@@ -811,6 +780,10 @@ def generate():
             else:
                 print(f"[API] Generating from text prompt only")
             
+            if count > 1:
+                # 共享的准备工作（鉴权、Brand DNA、输入图片规范化）只执行一次，各变体并发生成并逐个流式返回
+                return _stream_image_variants(gemini, prompt, image_parts, aspect_ratio, model_level, model, count, start_time)
+            
             print(f"[API] 🚀 Starting image generation...")
             try:
                 base64_image = gemini.generate_image_with_aspect_ratio(
@@ -827,21 +800,12 @@ def generate():
                 raise
             
             asset_id = f"reel-img-{int(time.time() * 1000)}"
-            duration = time.time() - start_time
+            asset = _build_image_asset(base64_image, asset_id, prompt, model, aspect_ratio)
             print(f"[API] ✅ Image generation completed successfully")
             print(f"[API] Asset ID: {asset_id}")
-            print(f"[API] Duration: {duration:.2f}s")
+            print(f"[API] Duration: {time.time() - start_time:.2f}s")
             print(f"{'='*60}\n")
-            return jsonify({
-                "assetId": asset_id,
-                "type": "image",
-                "src": f"data:image/jpeg;base64,{base64_image}",
-                "prompt": prompt,
-                "width": 512,
-                "height": 896,
-                "status": "done",
-                "generationModel": model
-            })
+            return jsonify(asset)
     
     except Exception as e:
         duration = time.time() - start_time
@@ -864,6 +828,264 @@ def generate():
         return jsonify({"error": str(e)}), 500
 
 
+# Veo 默认输出 720p、时长与 GenerateVideosConfig.durationSeconds 一致
+VEO_DEFAULT_SHORT_EDGE = 720
+VEO_DEFAULT_DURATION_SECONDS = 8
+# Veo 只支持横屏与竖屏
+VEO_ASPECT_RATIOS = ('16:9', '9:16')
+
+# 单次请求的图片变体上限，以及所有请求共享的变体生成线程数
+REEL_MAX_VARIANTS = int(os.getenv('REEL_MAX_VARIANTS', '4'))
+REEL_VARIANT_WORKERS = int(os.getenv('REEL_VARIANT_WORKERS', '8'))
+_variant_executor = ThreadPoolExecutor(max_workers=REEL_VARIANT_WORKERS, thread_name_prefix='reel-variants')
+
+
+def _build_image_asset(base64_image: str, asset_id: str, prompt: str, model: str, aspect_ratio: str) -> dict:
+    """
+    构建图片生成结果：从文件头读取真实尺寸和格式，先返回预览图，
+    原图和缩略图通过 /api/reel/assets/<key> 按需获取
+    """
+    media_info = probe_base64_image(base64_image)
+    if media_info is None:
+        media_info = _fallback_media_info('image', aspect_ratio)
+    print(f"[API] Output: {media_info.width}x{media_info.height} {media_info.mime_type}")
+    
+    asset_urls = {}
+    src = f"data:{media_info.mime_type};base64,{base64_image}"
+    if ASSET_DERIVATIVES_ENABLED:
+        try:
+            asset_key, preview = get_asset_derivative_service().register_image(
+                base64.b64decode(base64_image), media_info.mime_type
+            )
+            asset_urls = {
+                "fullSrc": f"/api/reel/assets/{asset_key}",
+                "thumbnailSrc": f"/api/reel/assets/{asset_key}?variant=thumb"
+            }
+            if preview:
+                preview_bytes, preview_mime = preview
+                src = f"data:{preview_mime};base64,{base64.b64encode(preview_bytes).decode('ascii')}"
+                print(f"[API] Preview: {len(preview_bytes)} bytes (original {len(base64_image) * 3 // 4} bytes)")
+        except Exception as e:
+            print(f"[API] ⚠️ Failed to build derivatives, returning original: {e}")
+    return {
+        "assetId": asset_id,
+        "type": "image",
+        "src": src,
+        **asset_urls,
+        "prompt": prompt,
+        "width": media_info.width,
+        "height": media_info.height,
+        "mimeType": media_info.mime_type,
+        "status": "done",
+        "generationModel": model
+    }
+
+
+def _stream_image_variants(gemini, prompt: str, image_parts: list, aspect_ratio: str, model_level: str,
+                           model: str, count: int, start_time: float):
+    """并发生成 count 个图片变体，按完成顺序以 NDJSON 逐行返回，单个变体失败不影响其他变体"""
+    batch_id = int(time.time() * 1000)
+    print(f"[API] 🚀 Starting {count} image variants...")
+    futures = {
+        _variant_executor.submit(
+            gemini.generate_image_with_aspect_ratio,
+            prompt=prompt,
+            images=image_parts if image_parts else None,
+            aspect_ratio=aspect_ratio,
+            model_level=model_level
+        ): index
+        for index in range(count)
+    }
+    
+    def events():
+        succeeded = 0
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                asset = _build_image_asset(future.result(), f"reel-img-{batch_id}-{index}", prompt, model, aspect_ratio)
+                succeeded += 1
+                print(f"[API] ✅ Variant {index} completed after {time.time() - start_time:.2f}s")
+                yield json.dumps({"event": "variant", "index": index, "asset": asset}) + "\n"
+            except Exception as e:
+                print(f"[API] ❌ Variant {index} failed: {e}")
+                yield json.dumps({"event": "error", "index": index, "error": str(e)}) + "\n"
+        print(f"[API] Variants done: {succeeded}/{count} succeeded in {time.time() - start_time:.2f}s")
+        print(f"{'='*60}\n")
+        yield json.dumps({"event": "done", "count": count, "succeeded": succeeded, "failed": count - succeeded}) + "\n"
+    
+    return Response(stream_with_context(events()), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def _fallback_media_info(asset_type: str, aspect_ratio: str) -> MediaInfo:
+    """头部探测失败时，根据请求的 aspectRatio 推算元数据"""
+    ratio = parse_aspect_ratio(aspect_ratio) or 9 / 16
+    if asset_type == 'video':
+        short_edge = VEO_DEFAULT_SHORT_EDGE
+        width, height = (round(short_edge * ratio), short_edge) if ratio >= 1 else (short_edge, round(short_edge / ratio))
+        return MediaInfo('video/mp4', width, height, VEO_DEFAULT_DURATION_SECONDS)
+    # Gemini 图片模型输出约 1024 长边
+    width, height = (1024, round(1024 / ratio)) if ratio >= 1 else (round(1024 * ratio), 1024)
+    return MediaInfo('image/png', width, height)
+
+
+def _prepare_veo_frame(asset_service, image: dict, prompt: str, label: str, aspect_ratio: str = None, owner: str = None):
+    """
+    准备 Veo 的首帧/尾帧图片
+
+    优先使用已上传的 gcsUri（必须是该用户通过 /reference-uploads 上传到本服务 bucket 的图片）；
+    图片超过 Veo 输出分辨率或不是 JPEG / PNG 时（只读取 base64 头部判断）先规范化（缩小并裁剪到视频比例）再上传，
+    否则把 base64 数据增量解码并分块流式上传，不完整解码到内存；上传失败时才完整解码为 bytes 直接传给 Veo（fallback）
+
+    Returns:
+        (types.Image, doc_ref)
+
+    Raises:
+        ValueError: gcsUri 不属于该用户，或图片数据为空
+    """
+    if image.get('gcsUri'):
+        if not asset_service.owns_reference(image['gcsUri'], owner):
+            raise ValueError(f"gcsUri for {label} must be a reference uploaded via /reference-uploads")
+        print(f"[API] ✅ Using pre-uploaded GCS URI for {label}: {image['gcsUri']}")
+        return types.Image(gcs_uri=image['gcsUri']), None
+    if not image.get('data'):
+        raise ValueError(f"Missing image data for {label}")
+
+    normalizer = get_image_normalization_service()
+    if normalizer.needs_normalization(image, 'veo_frame'):
+        normalized = normalizer.normalize_part(image, 'veo_frame', aspect_ratio)
+    else:
+        normalized = image
+    mime_type = normalized.get('mimeType', 'image/jpeg')
+    data_str = normalized.get('data', '')
+    doc_ref, gcs_uri = None, None
+    try:
+        if normalized is not image:
+            # 规范化后的图片已经很小，直接整块上传
+            upload_source, size = base64.b64decode(data_str), None
+        else:
+            upload_source, size = open_base64(data_str), decoded_base64_length(data_str)
+        doc_ref, _, gcs_uri = asset_service.archive_and_prepare_reference(
+            upload_source,
+            mime_type,
+            prompt,
+            size=size,
+            owner=owner
+        )
+        if gcs_uri:
+            print(f"[API] ✅ {label} streamed to Firebase Storage")
+            print(f"[API] GCS URI: {gcs_uri}")
+        else:
+            print(f"[API] ⚠️ Failed to get GCS URI for {label}, using fallback")
+    except Exception as e:
+        print(f"[API] ⚠️ Failed to upload {label} to Firebase Storage: {e}")
+        import traceback
+        traceback.print_exc()
+        gcs_uri = None
+    
+    # 使用 GCS URI 创建图片对象（推荐）或使用 bytes（fallback）
+    if gcs_uri:
+        print(f"[API] ✅ Using GCS URI for {label}")
+        return types.Image(gcs_uri=gcs_uri), doc_ref
+    
+    # Fallback: 使用直接 bytes（可能不支持或效果不佳）
+    image_bytes = base64.b64decode(data_str.split(',', 1)[1] if data_str.startswith('data:') else data_str)
+    print(f"[API] ⚠️ Using direct image_bytes for {label} ({len(image_bytes)} bytes, fallback)")
+    return types.Image(image_bytes=image_bytes, mime_type=mime_type), doc_ref
+
+
+@reel_bp.route('/reference-uploads', methods=['POST'])
+@verify_firebase_token
+def upload_reference():
+    """
+    流式上传参考图片到 Firebase Storage（用于 Veo 首帧/尾帧）
+
+    请求体直接是图片数据，不经过 JSON 解析，服务端边读取边上传：
+      - Content-Type: image/*          原始图片字节
+      - Content-Type: text/plain       base64 文本（需附带 X-Image-Mime-Type header）
+    可选 header: X-Reference-Prompt（写入 veo_assets 记录）
+
+    Response: { "gcsUri": string, "sha256": string, "size": number }
+    之后可在 /generate 的 images 中传入 {"gcsUri": ..., "mimeType": ...} 代替 data
+    """
+    content_type = (request.mimetype or '').lower()
+    if content_type.startswith('image/'):
+        mime_type = content_type
+        reader = HashingReader(request.stream)
+        size = request.content_length
+    elif content_type == 'text/plain':
+        mime_type = request.headers.get('X-Image-Mime-Type', 'image/jpeg')
+        reader = open_base64(request.stream)
+        size = None
+    else:
+        return jsonify({"error": "Unsupported Content-Type, expected image/* or text/plain (base64)"}), 415
+
+    asset_service = get_video_asset_service()
+    if not asset_service.is_available():
+        return jsonify({"error": "Storage not configured"}), 503
+
+    try:
+        _, _, gcs_uri = asset_service.archive_and_prepare_reference(
+            reader,
+            mime_type,
+            request.headers.get('X-Reference-Prompt', ''),
+            size=size,
+            owner=request.uid
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not gcs_uri:
+        return jsonify({"error": "Failed to upload reference image"}), 500
+    return jsonify({"gcsUri": gcs_uri, "sha256": reader.sha256, "size": reader.bytes_read})
+
+
+def _parse_option(text: str):
+    """单方案输出：JSON 对象（模型偶尔仍返回只含一个元素的数组）"""
+    value = safe_json_parse(text, None)
+    if isinstance(value, list):
+        value = value[0] if value else None
+    return value if isinstance(value, dict) else None
+
+
+def _parse_options(text: str) -> list:
+    value = safe_json_parse(text, [])
+    return value if isinstance(value, list) else []
+
+
+def _options_response(results, stream: bool, fallback: list):
+    """
+    返回多方案结果
+    
+    stream=False 时按方案顺序返回 JSON 数组（与原响应相同）；stream=True 时按完成顺序以 NDJSON 逐行返回，
+    没有任何方案成功时返回 fallback
+    """
+    if not stream:
+        options = sorted((r for r in results if r.option is not None), key=lambda r: r.index)
+        return jsonify([r.option for r in options] or fallback)
+    
+    def events():
+        succeeded = 0
+        mode = 'fanout'
+        try:
+            for result in results:
+                mode = result.mode
+                if result.option is None:
+                    yield json.dumps({"event": "error", "index": result.index, "error": result.error}) + "\n"
+                    continue
+                succeeded += 1
+                yield json.dumps({"event": "option", "index": result.index, "option": result.option, "mode": mode}) + "\n"
+        except Exception as e:
+            print(f"[API] ❌ Option generation failed: {e}")
+            yield json.dumps({"event": "error", "index": None, "error": str(e)}) + "\n"
+        if not succeeded:
+            for index, option in enumerate(fallback):
+                yield json.dumps({"event": "option", "index": index, "option": option, "mode": "fallback"}) + "\n"
+        yield json.dumps({"event": "done", "succeeded": succeeded, "mode": mode}) + "\n"
+    
+    return Response(stream_with_context(events()), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @reel_bp.route('/enhance-prompt', methods=['POST'])
 @verify_firebase_token
 def enhance_prompt():
@@ -873,7 +1095,9 @@ def enhance_prompt():
     Request: { 
         "prompt": string, 
         "model": string,
-        "activeProfileId"?: string  # Brand DNA ID
+        "activeProfileId"?: string,  # Brand DNA ID
+        "fanout"?: boolean,  # 每个方案单独并发生成（默认 OPTION_FANOUT_ENABLED，即关闭）
+        "stream"?: boolean  # 按完成顺序以 NDJSON 返回各方案
     }
     Response: EnhancedPrompt[] // Array of {title, description, tags, fullPrompt}
     """
@@ -896,99 +1120,34 @@ def enhance_prompt():
         if error_response:
             return error_response
         
-        # 构建 Brand DNA 上下文（如果存在）
+        # 构建 Brand DNA 上下文（如果存在，按 profile 修订版本缓存）
         brand_context = ""
         if brand_dna and brand_dna.get('isActive'):
-            # 预先构建字符串，避免在 f-string 表达式中使用包含反斜杠的变量
-            brand_context_base = f"""
-
-**MANDATORY BRAND GUIDELINES (Brand DNA - {brand_dna.get('name', 'Active Profile')}):**
-- **Visual Style**: {brand_dna.get('visualStyle', '')}
-- **Color Palette**: {brand_dna.get('colorPalette', '')}
-- **Mood**: {brand_dna.get('mood', '')}
-- **Negative Constraints (AVOID)**: {brand_dna.get('negativeConstraint', '')}"""
-            
-            motion_style_line = ""
-            if is_video_model(model) and brand_dna.get('motionStyle'):
-                motion_style_line = f"\n- **Motion Style**: {brand_dna.get('motionStyle', '')}"
-            
-            brand_context = brand_context_base + motion_style_line + """
-
-IMPORTANT: All generated prompt options MUST strictly adhere to these brand guidelines. Integrate them naturally into the visual description."""
+            brand_context = render_brand_guidelines(brand_dna, 'enhance', is_video=is_video_model(model))
         
         if is_video_model(model):
             # 视频提示词优化
-            system_instruction = f"""You are a Senior VEO 3.1 Prompt Specialist & Cinematic Director. Your task is to transform a user's basic idea into three distinct, professional creative directions for high-end video generation.
-
-The Veo model requires specific prompt engineering to achieve the best results. You must strictly follow these VEO Golden Rules in your `fullPrompt`:
-1. **Subject & Action**: Describe fluid motion, physics, and specific activities clearly (not just who, but *what* they are doing dynamically).
-2. **Environment & Lighting**: Include atmospheric details (e.g., volumetric fog, golden hour, cinematic lighting, HDR, neon noir).
-3. **Camera Language**: MANDATORY. Use specific cinematic terms (e.g., Drone FPV, Low angle, Dolly zoom, Slow pan, Handheld shake, Bokeh, Rack focus).
-4. **Style & Aesthetics**: Specify film stock, render engine, or artistic style (e.g., 35mm film grain, Photorealistic, 8k, Unreal Engine 5 style).
-{brand_context if brand_context else ""}
-
-Based on the user's idea, generate three distinct "Video Concept Cards" that tell a story:
-- **Option A (Realistic/Cinematic)**: Focus on photorealism, movie-like quality, high-end production value (ARRI/IMAX aesthetics).
-- **Option B (Creative/Stylized)**: Focus on unique art styles, animation (e.g., claymation, cyber-anime), or surreal visuals.
-- **Option C (Dynamic/Action)**: Focus on speed, intense motion, fast cuts, and visual impact.
-
-You must return a valid JSON array of objects."""
-            
-            # 视频模型专用 user_content
-            user_content = f"""
-The user's idea is: "{prompt}"
-{brand_context if brand_context else ""}
-
-Based on this idea, generate three distinct "Video Concept Cards" that tell a story. For each card, provide:
-
-1. `title`: A short, catchy title **in Simplified Chinese** (e.g., "精准与优雅", "活力与真实", NOT "Precision and Elegance" or "Neon Drift: Cyberpunk").
-2. `description`: A one-sentence summary of the narrative and visual mood **in Simplified Chinese**.
-3. `tags`: An array of 3-4 relevant keyword tags **in Simplified Chinese**.
-4. `fullPrompt`: A comprehensive, detailed prompt using the VEO Golden Rules above{" and Brand DNA guidelines" if brand_context else ""}. **MUST BE IN ENGLISH** for optimal video generation.
-
-CRITICAL LANGUAGE REQUIREMENT:
-- The UI display fields (title, description, tags) MUST be in **Simplified Chinese**, regardless of the user's input language.
-- The generation field (fullPrompt) MUST be in **English** for optimal video generation results.
-
-Your entire output must be a single, valid JSON array adhering to this TypeScript interface:
-```typescript
-interface EnhancedPrompt {{
-  title: string;
-  description: string;
-  tags: string[];
-  fullPrompt: string;
-}}
-```"""
+            system_instruction = render_prompt('enhance_prompt_video_system', brand_context=brand_context)
+            brand_dna_note = " and Brand DNA guidelines" if brand_context else ""
+            user_content = render_prompt(
+                'enhance_prompt_video_user',
+                prompt=prompt,
+                brand_context=brand_context,
+                brand_dna_note=brand_dna_note,
+            )
+            option_prompts = [
+                render_prompt('enhance_prompt_video_option', prompt=prompt, brand_context=brand_context,
+                              brand_dna_note=brand_dna_note, option=option)
+                for option in ENHANCE_VIDEO_OPTIONS
+            ]
         else:
             # 图片提示词优化
-            system_instruction = f"""You are an expert AI Art Director. Your task is to transform a user's basic idea into three distinct, professional creative directions. You must return a valid JSON array of objects.{brand_context}"""
-            
-            # 图片模型专用 user_content
-            user_content = f"""
-The user's idea is: "{prompt}"
-{brand_context if brand_context else ""}
-
-Based on this idea, generate three distinct "Prompt Optimization Cards". For each card, provide:
-
-1. `title`: A short, catchy title for the creative direction **in Simplified Chinese** (e.g., "精准与优雅", "活力与真实", NOT "Cinematic Portrait" or "Retro Anime Style").
-2. `description`: A one-sentence summary of the style and mood **in Simplified Chinese**.
-3. `tags`: An array of 3-4 relevant keyword tags **in Simplified Chinese** (e.g., ["特写", "黄金时刻", "浅景深"], NOT ["close-up", "golden hour", "shallow depth of field"]).
-4. `fullPrompt`: A complete, detailed, and enhanced prompt for the 'gemini-2.5-flash-image' model that fully realizes the creative direction. **MUST BE IN ENGLISH**.
-
-IMPORTANT: The UI fields (title, description, tags) MUST be in **Simplified Chinese**. The generation field (fullPrompt) MUST be in **English**.
-
-Your entire output must be a single, valid JSON array adhering to this TypeScript interface:
-```typescript
-interface EnhancedPrompt {{
-  title: string;
-  description: string;
-  tags: string[];
-  fullPrompt: string;
-}}
-```"""
-        
-        response = gemini.generate_content(user_content, model='gemini-2.5-flash', system_instruction=system_instruction)
-        text = safe_get_text(response)
+            system_instruction = render_prompt('enhance_prompt_image_system', brand_context=brand_context)
+            user_content = render_prompt('enhance_prompt_image_user', prompt=prompt, brand_context=brand_context)
+            option_prompts = [
+                render_prompt('enhance_prompt_image_option', prompt=prompt, brand_context=brand_context, option=option)
+                for option in ENHANCE_IMAGE_OPTIONS
+            ]
         
         # Fallback 结果：UI字段使用中文，fullPrompt保持原样（用于生成）
         fallback_result = [{
@@ -998,11 +1157,20 @@ interface EnhancedPrompt {{
             "fullPrompt": prompt
         }]
         
-        result = safe_json_parse(text, fallback_result)
-        if not isinstance(result, list):
-            result = fallback_result
-        
-        return jsonify(result)
+        # 默认一次生成三个方案；OPTION_FANOUT_ENABLED 或请求中 "fanout": true 时每个方案单独并发生成，全部失败时回退为一次生成
+        results = get_option_fanout_service().generate(
+            f"enhance-prompt/{'video' if is_video_model(model) else 'image'}",
+            gemini,
+            user_content,
+            option_prompts,
+            _parse_option,
+            _parse_options,
+            system_instruction=system_instruction,
+            fanout=bool(data.get('fanout', OPTION_FANOUT_ENABLED)),
+            option_schema=ENHANCED_PROMPT,
+            list_schema=ENHANCED_PROMPT_LIST,
+        )
+        return _options_response(results, bool(data.get('stream')), fallback_result)
     
     except Exception as e:
         print(f"Error in enhance_prompt: {e}")
@@ -1011,6 +1179,16 @@ interface EnhancedPrompt {{
         return jsonify({"error": str(e)}), 500
 
 
+def _cached_research(mode: str, topic: str, research) -> str:
+    """按归一化话题读取调研摘要缓存（命中时 design-plan 只需一次结构化调用）"""
+    cache = get_research_cache()
+    if cache is None:
+        return research()
+    summary, status = cache.get_or_compute(mode, topic, research)
+    print(f"[API] Research cache {status}: {research_cache_key(mode, topic)}")
+    return summary
+
+
 @reel_bp.route('/design-plan', methods=['POST'])
 @verify_firebase_token
 def design_plan():
@@ -1020,7 +1198,9 @@ def design_plan():
     Request: { 
         "topic": string, 
         "model": string,
-        "activeProfileId"?: string  # Brand DNA ID
+        "activeProfileId"?: string,  # Brand DNA ID
+        "fanout"?: boolean,  # 每个方案单独并发生成（默认 OPTION_FANOUT_ENABLED，即关闭）
+        "stream"?: boolean  # 按完成顺序以 NDJSON 返回各方案
     }
     Response: DesignPlan[] // Array of {title, description, prompt, referenceImagePrompt}
     """
@@ -1043,107 +1223,69 @@ def design_plan():
         if error_response:
             return error_response
         
-        # 构建 Brand DNA 上下文（如果存在）
+        # 构建 Brand DNA 上下文（如果存在，按 profile 修订版本缓存）
         brand_context = ""
         if brand_dna and brand_dna.get('isActive'):
-            # 预先构建字符串，避免在 f-string 表达式中使用包含反斜杠的变量
-            brand_context_base = f"""
-
-**MANDATORY BRAND GUIDELINES (Brand DNA - {brand_dna.get('name', 'Active Profile')}):**
-- **Visual Style**: {brand_dna.get('visualStyle', '')}
-- **Color Palette**: {brand_dna.get('colorPalette', '')}
-- **Mood**: {brand_dna.get('mood', '')}
-- **Negative Constraints**: {brand_dna.get('negativeConstraint', '')}"""
-            
-            motion_style_line = ""
-            if is_video_model(model) and brand_dna.get('motionStyle'):
-                motion_style_line = f"\n- **Motion Style**: {brand_dna.get('motionStyle', '')}"
-            
-            brand_context = brand_context_base + motion_style_line + """
-
-IMPORTANT: All suggested design strategies MUST align with these brand guidelines while incorporating trends from the research."""
+            brand_context = render_brand_guidelines(brand_dna, 'design', is_video=is_video_model(model))
         
         if is_video_model(model):
             # 视频设计灵感
-            research_prompt = f"""
-Act as an AI Cinematography & Motion Trend Researcher.
-Conduct a deep dive search on Google for the topic: "{topic}".
-
-Do NOT just search for general definitions. You must find:
-1. **Cinematic Lighting Trends** relevant to this topic (e.g., Volumetric lighting, Rembrandt, Neon noir).
-2. **Camera Movement Trends** (e.g., FPV Drone, Dolly Zoom, Orbit shot, Handheld).
-3. **Motion Aesthetics** (e.g., Slow motion fluid, Hyper-lapse, Morphing).
-4. **Render/Visual Styles** (e.g., Unreal Engine 5, Analog film grain, Claymation).
-
-Detect the language of the topic (Chinese or English). Provide a concise but technical summary in that same language, focusing on "How to shoot it" rather than just "What it is".
-"""
-            try:
-                research_response = gemini.generate_content_with_google_search(research_prompt, model='gemini-2.5-flash')
-            except Exception:
-                research_response = gemini.generate_content(research_prompt, model='gemini-2.5-flash')
+            research_prompt = render_prompt('design_plan_video_research', topic=topic)
             
-            research_summary = safe_get_text(research_response)
+            def research():
+                try:
+                    research_response = gemini.generate_content_with_google_search(research_prompt, model='gemini-2.5-flash')
+                except Exception:
+                    research_response = gemini.generate_content(research_prompt, model='gemini-2.5-flash')
+                return safe_get_text(research_response)
             
-            # 预先构建字符串，避免 f-string 中包含反斜杠
-            video_brand_note = " Strictly adhere to Brand DNA guidelines." if brand_context else ""
+            research_summary = _cached_research('video', topic, research)
             
-            structuring_prompt = f"""
-Act as a VEO 3.1 Creative Director.
-Based on the following Visual Research Summary about "{topic}", create three distinct video production schemes.
-{brand_context if brand_context else ""}
-
-Research Summary:
-{research_summary}
-
-Create these 3 schemes:
-- **Scheme A: Cinematic Masterpiece** (Realistic, Physical Light, High-end Camera).
-- **Scheme B: Avant-Garde / Stylized** (Unique Art Style, Animation, Mixed Media).
-- **Scheme C: Commercial / Dynamic** (High Impact, Fast Paced, Product Showcase).
-
-For each scheme, provide a JSON object with:
-1. `title`: Creative title.
-2. `description`: Brief visual summary.
-3. `referenceImagePrompt`: **CRITICAL**: This must describe a single **KEYFRAME** (First Frame) composition. Use terms like "A still shot of...", "Hyper-realistic photography of...", "Golden ratio composition". Do not describe motion here, only the static visual start point.
-4. `prompt`: The video generation prompt. Must follow the **[Subject + Action + Environment + Lighting + Camera + Style]** formula. Include specific camera moves (e.g., "Slow dolly in") and temporal details.{video_brand_note}
-
-Output: A valid JSON array of 3 objects. Use the same language as the input topic.
-"""
+            structuring_values = dict(
+                topic=topic,
+                brand_context=brand_context,
+                research_summary=research_summary,
+                video_brand_note=" Strictly adhere to Brand DNA guidelines." if brand_context else "",
+            )
+            structuring_prompt = render_prompt('design_plan_video_structuring', **structuring_values)
+            option_prompts = [
+                render_prompt('design_plan_video_option', option=option, **structuring_values)
+                for option in DESIGN_VIDEO_OPTIONS
+            ]
         else:
             # 图片设计灵感
-            research_prompt = f"""
-As an AI Art Director and visual trend researcher, research current visual trends, popular aesthetics, color palettes, and best practices related to the topic: "{topic}".
-Detect the language of the topic (Chinese or English) and provide your findings as a detailed text summary in that same language.
-"""
-            research_response = gemini.generate_content(research_prompt, model='gemini-2.5-flash')
-            research_summary = safe_get_text(research_response)
+            research_prompt = render_prompt('design_plan_image_research', topic=topic)
             
-            # 预先构建所有包含反斜杠的字符串，避免在 f-string 表达式中使用
-            brand_dna_suffix = ", strictly adhering to Brand DNA" if brand_context else ""
+            def research():
+                return safe_get_text(gemini.generate_content(research_prompt, model='gemini-2.5-flash'))
             
-            # 构建 IMPORTANT 部分的完整文本
-            important_base = """- You MUST detect the language from the research summary (it will be either Chinese or English).
-- You MUST generate all parts of your response (title, description, and both prompts) exclusively in that SAME language. Do not mix languages."""
-            important_with_dna = important_base + "\n- All suggested design strategies MUST strictly adhere to the Brand DNA guidelines provided above."
-            important_text = important_with_dna if brand_context else important_base
+            research_summary = _cached_research('image', topic, research)
             
-            # 构建 TypeScript 接口注释
-            prompt_line = f"  prompt: string; // A detailed, ready-to-use prompt for the FINAL image creation if the user chooses this plan{brand_dna_suffix}."
-            ref_prompt_line = f"  referenceImagePrompt: string; // A separate, detailed prompt specifically for generating a high-quality REFERENCE image that visually represents this strategy's mood and style{brand_dna_suffix}."
-            
-            # 构建完整的 prompt 字符串（避免在 f-string 表达式中使用包含反斜杠的变量）
-            structuring_prompt = "Based on the following research summary about the topic \"" + topic + "\", create three distinct creative strategies.\n"
-            if brand_context:
-                structuring_prompt += brand_context + "\n\n"
-            structuring_prompt += "**Research Summary**:\n---\n" + research_summary + "\n---\n\n**IMPORTANT**:\n" + important_text + "\n\n**Output Format**:\nReturn a valid JSON array of three objects adhering to this TypeScript interface. Do not include any text outside the JSON.\n```typescript\ninterface DesignPlanWithImagePrompt {\n  title: string; // A creative title for the design strategy.\n  description: string; // A short explanation of the visual direction.\n" + prompt_line + "\n" + ref_prompt_line + "\n}\n```\n"
-        
-        structuring_response = gemini.generate_content(structuring_prompt, model='gemini-2.5-flash')
-        text = safe_get_text(structuring_response)
-        
-        result = safe_json_parse(text, [])
-        if not isinstance(result, list):
-            result = []
+            structuring_values = dict(
+                topic=topic,
+                brand_block=brand_context + "\n\n" if brand_context else "",
+                research_summary=research_summary,
+                brand_dna_rule="\n- All suggested design strategies MUST strictly adhere to the Brand DNA guidelines provided above." if brand_context else "",
+                brand_dna_suffix=", strictly adhering to Brand DNA" if brand_context else "",
+            )
+            structuring_prompt = render_prompt('design_plan_image_structuring', **structuring_values)
+            option_prompts = [
+                render_prompt('design_plan_image_option', option=option, **structuring_values)
+                for option in DESIGN_IMAGE_OPTIONS
+            ]
         
-        return jsonify(result)
+        results = get_option_fanout_service().generate(
+            f"design-plan/{'video' if is_video_model(model) else 'image'}",
+            gemini,
+            structuring_prompt,
+            option_prompts,
+            _parse_option,
+            _parse_options,
+            fanout=bool(data.get('fanout', OPTION_FANOUT_ENABLED)),
+            option_schema=DESIGN_PLAN,
+            list_schema=DESIGN_PLAN_LIST,
+        )
+        return _options_response(results, bool(data.get('stream')), [])
     
     except Exception as e:
         print(f"Error in design_plan: {e}")
@@ -1152,37 +1294,240 @@ Detect the language of the topic (Chinese or English) and provide your findings
         return jsonify({"error": str(e)}), 500
 
 
+_ASSET_KEY_PATTERN = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+
+@reel_bp.route('/assets/<asset_key>', methods=['GET'])
+def get_asset(asset_key):
+    """
+    获取生成图片的原图或派生图
+    
+    不需要 Authorization header，便于 <img> 直接引用：asset_key 为 128 位随机值，只有生成者能拿到（能力 URL）
+    
+    Query: variant = original（默认）| preview | thumb；format = webp | avif（可选，默认按 Accept 协商）
+    Response: 图片字节，长期缓存（内容不可变）
+    """
+    if not _ASSET_KEY_PATTERN.match(asset_key):
+        return jsonify({"error": "Asset not found"}), 404
+    
+    variant = request.args.get('variant', 'original')
+    requested_format = request.args.get('format')
+    if requested_format:
+        formats = [requested_format.lower()]
+    elif 'image/avif' in request.headers.get('Accept', ''):
+        formats = ['avif', 'webp']
+    else:
+        formats = ['webp']
+    
+    etag = f"{asset_key}-{variant}-{'-'.join(formats) if variant != 'original' else 'original'}"
+    if etag in request.if_none_match:
+        return Response(status=304, headers={"ETag": f'"{etag}"'})
+    
+    found = get_asset_derivative_service().get(asset_key, variant, formats)
+    if found is None:
+        return jsonify({"error": "Asset not found"}), 404
+    
+    data, mime_type = found
+    response = Response(data, mimetype=mime_type)
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    response.headers['ETag'] = f'"{etag}"'
+    response.headers['Vary'] = 'Accept'
+    return response
+
+
+@reel_bp.route('/videos/<video_id>', methods=['GET'])
+def stream_video(video_id):
+    """
+    Veo 视频代理（支持 HTTP Range）
+    
+    不需要 Authorization header，便于 <video src> 直接播放：video_id 为 128 位随机值（能力 URL）
+    已缓存到本地磁盘的视频由 send_file 直接提供（Range / 条件请求由 werkzeug 处理），
+    已转存到 Storage 的视频按 Range 从 Storage 分块读取，否则把 Range 转发给上游并分块转发响应
+    """
+    video_proxy = get_video_proxy_service()
+    cached_path = video_proxy.cached_path(video_id) if is_valid_video_id(video_id) else None
+    if cached_path:
+        response = send_file(cached_path, mimetype='video/mp4', conditional=True, etag=video_id)
+        response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+        return response
+    
+    record = video_proxy.resolve(video_id)
+    if not record:
+        return jsonify({"error": "Video not found"}), 404
+    
+    range_header = request.headers.get('Range')
+    if range_header and parse_range(range_header) is None:
+        range_header = None
+    try:
+        status, headers, chunks = video_proxy.open_source(record, range_header)
+    except Exception as e:
+        print(f"[VideoProxy] ❌ Upstream request failed for {video_id}: {e}")
+        return jsonify({"error": "Video temporarily unavailable"}), 502
+    if status == 416:
+        return Response(status=416, headers=headers)
+    if status >= 400:
+        print(f"[VideoProxy] ❌ Upstream returned HTTP {status} for {video_id}")
+        return jsonify({"error": "Video temporarily unavailable"}), 404 if status == 404 else 502
+    
+    # 本实例尚未缓存时在后台补齐（例如请求落到了另一个实例）
+    video_proxy.ensure_cached(video_id, record)
+    headers.setdefault('Content-Type', 'video/mp4')
+    headers['Cache-Control'] = 'private, max-age=3600'
+    return Response(stream_with_context(chunks), status=status, headers=headers, direct_passthrough=True)
+
+
+@reel_bp.route('/videos/<video_id>/poster', methods=['GET'])
+def video_poster(video_id):
+    """
+    视频海报帧（用作 <video poster> 和画廊缩略图）
+    
+    与视频代理相同，不需要 Authorization header；抽帧尚未完成时等待进行中的任务
+    """
+    frames = _get_video_frames(video_id)
+    if isinstance(frames, tuple):
+        return frames
+    frame = frames.poster or (frames.keyframes[0] if frames.keyframes else None)
+    if frame is None:
+        return jsonify({"error": "Poster not available"}), 404
+    response = Response(frame.data, mimetype=frame.mime_type)
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+
+@reel_bp.route('/videos/<video_id>/frames', methods=['GET'])
+def video_frames(video_id):
+    """
+    视频关键帧（均匀分布，含首帧和尾帧）
+    
+    Response: { "videoId": string, "duration": number, "images": [{ "data": base64, "mimeType": string, "timestamp": number }] }
+    images 可直接作为 /generate 的 images 输入（例如用尾帧延展视频）
+    """
+    frames = _get_video_frames(video_id)
+    if isinstance(frames, tuple):
+        return frames
+    return jsonify({
+        "videoId": video_id,
+        "duration": frames.duration,
+        "images": [frame.to_image_part() for frame in frames.keyframes]
+    })
+
+
+def _get_video_frames(video_id):
+    """读取抽帧结果；本实例没有任务且 Storage 中也没有时按视频记录重新抽取"""
+    if not is_valid_video_id(video_id):
+        return jsonify({"error": "Video not found"}), 404
+    frame_service = get_video_frame_service()
+    frames = frame_service.get(video_id)
+    if frames is not None:
+        return frames
+    record = get_video_proxy_service().resolve(video_id)
+    if not record:
+        return jsonify({"error": "Video not found"}), 404
+    job = frame_service.submit(video_id, record)
+    if job is None:
+        return jsonify({"error": "Frame extraction unavailable"}), 503
+    frames = frame_service.get(video_id)
+    if frames is None:
+        return jsonify({"error": "Frame extraction failed"}), 502
+    return frames
+
+
+def _bed_volume(value) -> float:
+    """解析 audioVolume：未提供时为 1.0，显式的 0 表示静音，超出范围时限制在 0-REEL_ASSEMBLY_MAX_BED_VOLUME"""
+    if value is None:
+        return 1.0
+    return min(max(float(value), 0.0), REEL_ASSEMBLY_MAX_BED_VOLUME)
+
+
+@reel_bp.route('/assemble', methods=['POST'])
+@verify_firebase_token
+def assemble_reel():
+    """
+    把多个生成的视频拼接为一条成片（异步任务）
+    
+    Request: {
+        "videoIds": string[],          // /api/reel/videos/<id> 中的 id，按播放顺序
+        "crossfade"?: number,          // 转场交叉淡化时长（秒），0 为直接拼接
+        "aspectRatio"?: "9:16",
+        "audio"?: { "data": base64, "mimeType": string },  // 共享背景音乐
+        "keepClipAudio"?: boolean,     // 有背景音乐时是否保留片段原声
+        "audioVolume"?: number         // 背景音乐音量，默认 1.0，限制在 0-2（0 为静音）
+    }
+    Response (202): { "jobId": string, "status": "queued", "progress": 0, ... }
+    """
+    try:
+        data = request.get_json() or {}
+        assembly = get_reel_assembly_service()
+        if not assembly.is_available():
+            return jsonify({"error": "Reel assembly unavailable (ffmpeg not installed)"}), 503
+        options = AssemblyOptions(
+            crossfade=float(data.get('crossfade') or 0),
+            aspect_ratio=data.get('aspectRatio') or '9:16',
+            keep_clip_audio=bool(data.get('keepClipAudio')),
+            bed_volume=_bed_volume(data.get('audioVolume'))
+        )
+        job = assembly.submit(request.uid, list(data.get('videoIds') or []), options, decode_audio_bed(data.get('audio')))
+        return jsonify(job.to_dict()), 202
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"[API] ❌ Reel assembly error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@reel_bp.route('/assemble/<job_id>', methods=['GET'])
+@verify_firebase_token
+def get_assembly_job(job_id):
+    """
+    查询拼接任务进度
+    
+    Response: { "jobId", "status": "queued" | "running" | "uploading" | "completed" | "failed",
+                "progress": 0-1, "mode": "copy" | "copy_video" | "encode", "src"?, "thumbnailSrc"?, "duration"?, "error"? }
+    """
+    job = get_reel_assembly_service().get(job_id, request.uid)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+
 @reel_bp.route('/upscale', methods=['POST'])
 @verify_firebase_token
 def upscale():
     """
-    高清放大图片
+    高清放大图片（本地 CPU 重采样，直接处理输入图片像素）
     
-    Request: { "base64Data": string, "mimeType": string, "factor": 2 | 4, "prompt": string }
-    Response: { "base64Image": string }
+    Request: { "base64Data": string, "mimeType": string, "factor": 2 | 4, "prompt"?: string, "method"?: "lanczos" | "bicubic" | "onnx" }
+    Response: { "base64Image": string, "mimeType": string, "width": number, "height": number, "engine": string }
     """
     try:
         data = request.get_json()
-        if not data or 'base64Data' not in data or 'prompt' not in data:
+        if not data or 'base64Data' not in data:
             return jsonify({"error": "Missing required fields"}), 400
         
         base64_data = data['base64Data']
-        mime_type = data.get('mimeType', 'image/jpeg')
-        prompt = data['prompt']
         factor = data.get('factor', 2)
+        if not isinstance(factor, int) or factor not in SUPPORTED_FACTORS:
+            return jsonify({"error": f"Invalid factor: {factor}. Must be 2 or 4"}), 400
         
-        gemini, error_response = get_gemini_service_safe()
-        if error_response:
-            return error_response
+        try:
+            image_bytes = decode_base64_image(base64_data)
+        except Exception:
+            return jsonify({"error": "Invalid base64Data"}), 400
         
-        # 使用 Imagen 重新生成高质量版本
-        base64_image = gemini.generate_image_with_imagen(
-            prompt=prompt,
-            aspect_ratio='9:16',  # Reel 固定比例
-            number_of_images=1
-        )
+        try:
+            result = get_image_upscale_service().upscale(image_bytes, factor, method=data.get('method'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
-        return jsonify({"base64Image": base64_image})
+        print(f"[Upscale] ✅ {result['width']}x{result['height']} via {result['engine']} "
+              f"(timings ms: {result['timings']})")
+        return jsonify({
+            "base64Image": base64.b64encode(result['data']).decode('ascii'),
+            "mimeType": result['mimeType'],
+            "width": result['width'],
+            "height": result['height'],
+            "engine": result['engine']
+        })
     
     except Exception as e:
         print(f"Error in upscale: {e}")
@@ -1191,28 +1536,7 @@ def upscale():
         return jsonify({"error": str(e)}), 500
 
 
-@reel_bp.route('/remove-background', methods=['POST'])
-@verify_firebase_token
-def remove_background():
-    """
-    去除背景
-    
-    Request: { "base64Data": string, "mimeType": string }
-    Response: { "base64Image": string } // PNG with transparency
-    """
-    try:
-        data = request.get_json()
-        if not data or 'base64Data' not in data:
-            return jsonify({"error": "Missing 'base64Data' in request body"}), 400
-        
-        base64_data = data['base64Data']
-        mime_type = data.get('mimeType', 'image/jpeg')
-        
-        gemini, error_response = get_gemini_service_safe()
-        if error_response:
-            return error_response
-        
-        prompt = """
+BACKGROUND_REMOVAL_PROMPT = """
 # System Role: High-Precision Computer Vision Engine
 # Task: Zero-Shot Image Segmentation & Background Removal
 
@@ -1229,14 +1553,92 @@ def remove_background():
 * **NO HALLUCINATIONS:** The texture, lighting, and resolution of the subject must match the source bit-for-bit.
 * **OUTPUT:** Return the image with a transparent PNG background.
 """
+
+
+def _remove_background_with_gemini(gemini, base64_data, mime_type):
+    """使用 Gemini 图片模型去除背景（本地模型不可用时的回退路径）"""
+    return gemini.generate_image_with_modality(
+        prompt=BACKGROUND_REMOVAL_PROMPT,
+        image_data=base64_data,
+        mime_type=mime_type
+    )
+
+
+@reel_bp.route('/remove-background', methods=['POST'])
+@verify_firebase_token
+def remove_background():
+    """
+    去除背景（优先使用本地 ONNX 分割模型，不可用或失败时回退到 Gemini）
+    
+    Request: { "base64Data": string, "mimeType": string }
+          或 { "images": [{ "base64Data": string, "mimeType": string }, ...] }（批量）
+    Response: { "base64Image": string, "engine": "local" | "gemini", "timings"?: {...} } // PNG with transparency
+          批量时: { "images": [{ "base64Image": string, "engine": string, "timings"?: {...} } | { "error": string }] }
+    """
+    try:
+        data = request.get_json()
+        is_batch = bool(data) and isinstance(data.get('images'), list)
+        if is_batch:
+            items = data['images']
+            if not items or not all(isinstance(item, dict) and item.get('base64Data') for item in items):
+                return jsonify({"error": "Each item in 'images' must contain 'base64Data'"}), 400
+            if len(items) > BG_REMOVAL_MAX_IMAGES:
+                return jsonify({"error": f"At most {BG_REMOVAL_MAX_IMAGES} images per request"}), 400
+        elif not data or 'base64Data' not in data:
+            return jsonify({"error": "Missing 'base64Data' in request body"}), 400
+        else:
+            items = [data]
         
-        base64_image = gemini.generate_image_with_modality(
-            prompt=prompt,
-            image_data=base64_data,
-            mime_type=mime_type
-        )
+        results = [None] * len(items)
         
-        return jsonify({"base64Image": base64_image})
+        # 0. 逐张解码：无效 base64 只影响该图片
+        decoded = [None] * len(items)
+        for i, item in enumerate(items):
+            try:
+                decoded[i] = decode_base64_image(item['base64Data'])
+            except (TypeError, ValueError) as e:
+                if not is_batch:
+                    return jsonify({"error": "Invalid base64 image data"}), 400
+                print(f"[RemoveBackground] ❌ Invalid base64 for image {i}: {e}")
+                results[i] = {"error": "Invalid base64 image data"}
+        
+        # 1. 本地模型：按批次推理，只有失败的图片回退到 Gemini
+        local_service = get_background_removal_service()
+        if local_service.is_available() and any(d is not None for d in decoded):
+            try:
+                local_results = local_service.try_remove_backgrounds(decoded)
+            except Exception as e:
+                print(f"[RemoveBackground] ⚠️ Local model failed, falling back to Gemini: {e}")
+                local_results = []
+            for i, result in enumerate(local_results):
+                if result is not None:
+                    results[i] = {
+                        "base64Image": base64.b64encode(result['data']).decode('ascii'),
+                        "engine": "local",
+                        "timings": result['timings']
+                    }
+        
+        # 2. 回退：Gemini 逐张处理
+        pending = [i for i, result in enumerate(results) if result is None]
+        if pending:
+            gemini, error_response = get_gemini_service_safe()
+            if error_response:
+                return error_response
+            for i in pending:
+                try:
+                    base64_image = _remove_background_with_gemini(
+                        gemini, items[i]['base64Data'], items[i].get('mimeType', 'image/jpeg')
+                    )
+                    results[i] = {"base64Image": base64_image, "engine": "gemini"}
+                except Exception as e:
+                    if not is_batch:
+                        raise
+                    print(f"[RemoveBackground] ❌ Gemini fallback failed for image {i}: {e}")
+                    results[i] = {"error": str(e)}
+        
+        if is_batch:
+            return jsonify({"images": results})
+        return jsonify(results[0])
     
     except Exception as e:
         print(f"Error in remove_background: {e}")
@@ -1280,7 +1682,8 @@ Return JSON: {{ "modality": "VIDEO" | "IMAGE" }}"""
             response = gemini.generate_content(
                 classification_prompt,
                 model='gemini-2.5-flash',
-                system_instruction=system_instruction
+                system_instruction=system_instruction,
+                response_schema=MODALITY_VERDICT
             )
             text = safe_get_text(response)
             result = safe_json_parse(text, {"modality": "IMAGE"})
@@ -0,0 +1,257 @@
+"""
+Asset Derivative Service
+为生成的图片构建缩略图 / 预览图（WebP，Pillow 支持时额外生成 AVIF）
+- 每张图片只解码一次，由大到小逐级缩小，在后台线程池中构建
+- 预览图（WebP）最先完成并直接随 /generate 响应返回，其余尺寸和格式继续在后台生成
+- 原图与派生图保存在按字节数限制的内存 LRU 中，Storage 可用时同时上传，供 /api/reel/assets/<key> 按需读取
+- 原图单独上传且先于派生图构建提交，不必等所有派生图完成，其他实例或本地 LRU 淘汰后也能尽快读取原图
+"""
+
+import io
+import os
+import secrets
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from utils.lazy_import import lazy_import
+from utils.firebase_registry import get_storage_bucket
+
+PIL_Image = lazy_import('PIL.Image')
+PIL_ImageOps = lazy_import('PIL.ImageOps')
+PIL_features = lazy_import('PIL.features')
+
+ASSET_DERIVATIVES_ENABLED = os.getenv('ASSET_DERIVATIVES_ENABLED', 'true').lower() == 'true'
+# 派生尺寸（名称:最大边长），按从大到小构建
+DERIVATIVE_SIZES = os.getenv('DERIVATIVE_SIZES', 'preview:768,thumb:256')
+# 派生格式，不支持的格式（如 Pillow 未编译 AVIF）会被跳过
+DERIVATIVE_FORMATS = os.getenv('DERIVATIVE_FORMATS', 'webp,avif')
+DERIVATIVE_WORKERS = int(os.getenv('DERIVATIVE_WORKERS', str(min(os.cpu_count() or 2, 4))))
+# 内存中原图 + 派生图的字节上限
+DERIVATIVE_CACHE_BYTES = int(os.getenv('DERIVATIVE_CACHE_BYTES', str(256 * 1024 * 1024)))
+# Storage 中的保存路径前缀
+DERIVATIVE_STORAGE_PREFIX = os.getenv('DERIVATIVE_STORAGE_PREFIX', 'generated_assets')
+# 等待预览图的最长时间（秒），超时则响应中返回原图
+DERIVATIVE_PREVIEW_TIMEOUT = float(os.getenv('DERIVATIVE_PREVIEW_TIMEOUT', '10'))
+
+# 随响应返回的派生图（名称, 格式）
+PREVIEW_VARIANT = ('preview', 'webp')
+
+_FORMAT_MIME = {'webp': 'image/webp', 'avif': 'image/avif', 'png': 'image/png', 'jpeg': 'image/jpeg'}
+# 原图按上传时的 MIME 类型选择扩展名；不认识的类型存为 .bin，读取 original 时按同一张表查找
+_ORIGINAL_MIME = {
+    **_FORMAT_MIME,
+    'gif': 'image/gif', 'bmp': 'image/bmp', 'tiff': 'image/tiff', 'heic': 'image/heic', 'heif': 'image/heif',
+    'bin': 'application/octet-stream',
+}
+_ENCODE_OPTIONS = {
+    'webp': {'format': 'WEBP', 'quality': 82, 'method': 4},
+    'avif': {'format': 'AVIF', 'quality': 60, 'speed': 8},
+}
+
+
+def _parse_sizes(spec: str) -> List[Tuple[str, int]]:
+    sizes = []
+    for item in spec.split(','):
+        name, _, edge = item.strip().partition(':')
+        if name and edge.isdigit():
+            sizes.append((name, int(edge)))
+    return sorted(sizes, key=lambda size: -size[1])
+
+
+def _supported_formats(spec: str) -> List[str]:
+    formats = []
+    for fmt in (f.strip().lower() for f in spec.split(',')):
+        if fmt == 'webp' and PIL_features.check('webp'):
+            formats.append(fmt)
+        elif fmt == 'avif' and PIL_features.check('avif'):
+            formats.append(fmt)
+    return formats
+
+
+def _extension(mime_type: str) -> str:
+    mime_type = (mime_type or '').lower()
+    if mime_type == 'image/jpg':
+        return 'jpeg'
+    return next((fmt for fmt, mime in _ORIGINAL_MIME.items() if mime == mime_type), 'bin')
+
+
+class AssetDerivativeService:
+    """生成图片的派生图服务"""
+
+    def __init__(self, sizes: Optional[List[Tuple[str, int]]] = None, formats: Optional[List[str]] = None,
+                 cache_bytes: int = DERIVATIVE_CACHE_BYTES, bucket=None, workers: int = DERIVATIVE_WORKERS):
+        self.sizes = sizes if sizes is not None else _parse_sizes(DERIVATIVE_SIZES)
+        self.formats = formats if formats is not None else _supported_formats(DERIVATIVE_FORMATS)
+        self.cache_bytes = cache_bytes
+        self.bucket = bucket
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='asset-derivatives')
+        # (asset_key, variant, format) -> (bytes, mime_type)
+        self._store: "OrderedDict[Tuple[str, str, str], Tuple[bytes, str]]" = OrderedDict()
+        self._store_size = 0
+        self._jobs: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # 构建
+    # ------------------------------------------------------------------
+
+    def register_image(self, image_bytes: bytes, mime_type: str) -> Tuple[str, Optional[Tuple[bytes, str]]]:
+        """
+        登记一张生成的图片并开始构建派生图
+
+        Returns:
+            (asset_key, preview)：asset_key 为不可猜测的随机标识；
+            preview 为 (bytes, mime_type)，超时或构建失败时为 None
+        """
+        asset_key = secrets.token_urlsafe(16)
+        self._put((asset_key, 'original', _extension(mime_type)), image_bytes, mime_type)
+        self.executor.submit(self._upload, asset_key, [('original', _extension(mime_type), image_bytes, mime_type)])
+
+        preview_ready: Future = Future()
+        job = self.executor.submit(self._build, asset_key, image_bytes, mime_type, preview_ready)
+        with self._lock:
+            self._jobs[asset_key] = job
+        job.add_done_callback(lambda _: self._finish_job(asset_key))
+
+        try:
+            preview = preview_ready.result(timeout=DERIVATIVE_PREVIEW_TIMEOUT)
+        except Exception as e:
+            print(f"[AssetDerivativeService] ⚠️ Preview not ready for {asset_key}: {e}")
+            preview = None
+        return asset_key, preview
+
+    def _finish_job(self, asset_key: str):
+        with self._lock:
+            self._jobs.pop(asset_key, None)
+
+    def _build(self, asset_key: str, image_bytes: bytes, mime_type: str, preview_ready: Future):
+        """解码一次，由大到小逐级缩小并编码所有尺寸和格式"""
+        try:
+            image = PIL_ImageOps.exif_transpose(PIL_Image.open(io.BytesIO(image_bytes)))
+            has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+            current = image.convert('RGBA' if has_alpha else 'RGB')
+            uploads = []
+            for name, max_edge in self.sizes:
+                scale = max_edge / max(current.size)
+                if scale < 1:
+                    target = (max(round(current.size[0] * scale), 1), max(round(current.size[1] * scale), 1))
+                    current = current.resize(target, PIL_Image.LANCZOS, reducing_gap=3.0)
+                for fmt in self.formats:
+                    buffer = io.BytesIO()
+                    current.save(buffer, **_ENCODE_OPTIONS[fmt])
+                    data = buffer.getvalue()
+                    self._put((asset_key, name, fmt), data, _FORMAT_MIME[fmt])
+                    uploads.append((name, fmt, data, _FORMAT_MIME[fmt]))
+                    if (name, fmt) == PREVIEW_VARIANT and not preview_ready.done():
+                        preview_ready.set_result((data, _FORMAT_MIME[fmt]))
+            if not preview_ready.done():
+                preview_ready.set_result(None)
+            self._upload(asset_key, uploads)
+        except Exception as e:
+            print(f"[AssetDerivativeService] ❌ Failed to build derivatives for {asset_key}: {e}")
+            if not preview_ready.done():
+                preview_ready.set_exception(e)
+
+    def _upload(self, asset_key: str, uploads):
+        """上传到 Storage，使其他实例和进程重启后仍可读取"""
+        bucket = self.bucket or get_storage_bucket()
+        if bucket is None:
+            return
+        for name, fmt, data, mime_type in uploads:
+            try:
+                blob = bucket.blob(f"{DERIVATIVE_STORAGE_PREFIX}/{asset_key}/{name}.{fmt}")
+                blob.cache_control = 'private, max-age=31536000, immutable'
+                blob.upload_from_string(data, content_type=mime_type)
+            except Exception as e:
+                print(f"[AssetDerivativeService] ⚠️ Failed to upload {name}.{fmt} for {asset_key}: {e}")
+                return
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+
+    def get(self, asset_key: str, variant: str = 'original', formats: Optional[List[str]] = None,
+            wait: float = DERIVATIVE_PREVIEW_TIMEOUT) -> Optional[Tuple[bytes, str]]:
+        """
+        读取原图或派生图
+
+        Args:
+            asset_key: register_image 返回的标识
+            variant: 'original' 或 DERIVATIVE_SIZES 中的名称
+            formats: 按优先级排列的可接受格式（派生图使用；默认 self.formats）
+            wait: 派生图仍在构建时的最长等待时间（秒）
+
+        Returns:
+            (bytes, mime_type)；不存在时返回 None
+        """
+        candidates = self._candidates(variant, formats)
+        found = self._lookup(asset_key, variant, candidates)
+        if found is not None:
+            return found
+        with self._lock:
+            job = self._jobs.get(asset_key)
+        if job is not None:
+            try:
+                job.result(timeout=wait)
+            except Exception:
+                pass
+            found = self._lookup(asset_key, variant, candidates)
+            if found is not None:
+                return found
+        return self._download(asset_key, variant, candidates)
+
+    def _candidates(self, variant: str, formats: Optional[List[str]]) -> List[str]:
+        if variant == 'original':
+            return list(_ORIGINAL_MIME)
+        return [fmt for fmt in (formats or self.formats) if fmt in self.formats] or self.formats
+
+    def _lookup(self, asset_key: str, variant: str, candidates: List[str]):
+        with self._lock:
+            for fmt in candidates:
+                key = (asset_key, variant, fmt)
+                entry = self._store.get(key)
+                if entry is not None:
+                    self._store.move_to_end(key)
+                    return entry
+        return None
+
+    def _download(self, asset_key: str, variant: str, candidates: List[str]):
+        bucket = self.bucket or get_storage_bucket()
+        if bucket is None:
+            return None
+        for fmt in candidates:
+            blob = bucket.blob(f"{DERIVATIVE_STORAGE_PREFIX}/{asset_key}/{variant}.{fmt}")
+            try:
+                data = blob.download_as_bytes()
+            except Exception:
+                continue
+            mime_type = _ORIGINAL_MIME.get(fmt, 'application/octet-stream')
+            self._put((asset_key, variant, fmt), data, mime_type)
+            return data, mime_type
+        return None
+
+    def _put(self, key: Tuple[str, str, str], data: bytes, mime_type: str):
+        with self._lock:
+            if key in self._store or len(data) > self.cache_bytes:
+                return
+            self._store[key] = (data, mime_type)
+            self._store_size += len(data)
+            while self._store_size > self.cache_bytes:
+                _, (evicted, _) = self._store.popitem(last=False)
+                self._store_size -= len(evicted)
+
+
+_derivative_service: Optional[AssetDerivativeService] = None
+_derivative_service_lock = threading.Lock()
+
+
+def get_asset_derivative_service() -> AssetDerivativeService:
+    """获取 AssetDerivativeService 单例"""
+    global _derivative_service
+    if _derivative_service is None:
+        with _derivative_service_lock:
+            if _derivative_service is None:
+                _derivative_service = AssetDerivativeService()
+    return _derivative_service
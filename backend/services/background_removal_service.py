@@ -0,0 +1,228 @@
+"""
+Background Removal Service
+本地 CPU 抠图（用于 /api/reel/remove-background）
+- 使用 ONNX Runtime 运行 U²-Net 类显著性分割模型（BG_REMOVAL_MODEL_PATH），支持多张图片合并为一个批次推理
+- 遮罩上采样复用 image_upscale_service 的可分离重采样，再做 alpha 细化，输出透明 PNG
+- 原图像素保持不变，只生成 alpha 通道；模型不可用时由路由回退到 Gemini
+"""
+
+import io
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from utils.lazy_import import lazy_import
+from services.image_upscale_service import resize_array
+
+np = lazy_import('numpy')
+PIL_Image = lazy_import('PIL.Image')
+# 可选依赖（requirements-onnx.txt），未安装时首次使用抛出 ImportError，由 _get_session 记录为模型不可用
+ort = lazy_import('onnxruntime')
+
+# U²-Net ONNX 模型路径（如 u2net.onnx / u2netp.onnx / isnet-general-use.onnx）
+BG_REMOVAL_MODEL_PATH = os.getenv('BG_REMOVAL_MODEL_PATH')
+# 模型输入边长（U²-Net 为 320，ISNet 为 1024）
+BG_REMOVAL_INPUT_SIZE = int(os.getenv('BG_REMOVAL_INPUT_SIZE', '320'))
+# 单次推理的最大图片数
+BG_REMOVAL_BATCH_SIZE = int(os.getenv('BG_REMOVAL_BATCH_SIZE', '4'))
+# 单个 /remove-background 请求最多处理的图片数
+BG_REMOVAL_MAX_IMAGES = int(os.getenv('BG_REMOVAL_MAX_IMAGES', '8'))
+# alpha 细化阈值：低于 low 视为背景，高于 high 视为前景，中间平滑过渡
+BG_REMOVAL_ALPHA_LOW = float(os.getenv('BG_REMOVAL_ALPHA_LOW', '0.05'))
+BG_REMOVAL_ALPHA_HIGH = float(os.getenv('BG_REMOVAL_ALPHA_HIGH', '0.95'))
+BG_REMOVAL_THREADS = int(os.getenv('BG_REMOVAL_THREADS', str(min(os.cpu_count() or 2, 8))))
+
+# U²-Net 训练时使用的 ImageNet 归一化参数
+_MEAN = (0.485, 0.456, 0.406)
+_STD = (0.229, 0.224, 0.225)
+
+
+def refine_alpha(mask, low: float = BG_REMOVAL_ALPHA_LOW, high: float = BG_REMOVAL_ALPHA_HIGH):
+    """
+    alpha 细化：把 [0, 1] 概率遮罩映射为 uint8 alpha
+
+    low/high 之外直接置为 0/255，去除背景噪点和前景内部的半透明；
+    中间区域使用 smoothstep 保留发丝等边缘的柔和过渡
+    """
+    t = np.clip((mask - low) / max(high - low, 1e-6), 0.0, 1.0)
+    t = t * t * (3.0 - 2.0 * t)
+    return (t * 255.0 + 0.5).astype(np.uint8)
+
+
+class BackgroundRemovalService:
+    """本地背景去除服务"""
+
+    def __init__(self, model_path: Optional[str] = BG_REMOVAL_MODEL_PATH, input_size: int = BG_REMOVAL_INPUT_SIZE,
+                 batch_size: int = BG_REMOVAL_BATCH_SIZE, session=None):
+        self.model_path = model_path
+        self.input_size = input_size
+        self.batch_size = max(batch_size, 1)
+        self._session = session
+        self._input_name = None
+        self._load_error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def _get_session(self):
+        """加载 ONNX 推理会话（未配置模型、未安装 onnxruntime 或加载失败时返回 None）"""
+        if self._session is None and self.model_path and not self._load_error:
+            with self._lock:
+                if self._session is None and not self._load_error:
+                    try:
+                        options = ort.SessionOptions()
+                        options.intra_op_num_threads = BG_REMOVAL_THREADS
+                        self._session = ort.InferenceSession(
+                            self.model_path, sess_options=options, providers=['CPUExecutionProvider']
+                        )
+                        print(f"[BackgroundRemovalService] ✅ Loaded ONNX model: {self.model_path}")
+                    except Exception as e:
+                        self._load_error = str(e)
+                        print(f"[BackgroundRemovalService] ⚠️ Model unavailable: {e}")
+        if self._session is not None and self._input_name is None:
+            self._input_name = self._session.get_inputs()[0].name
+        return self._session
+
+    def is_available(self) -> bool:
+        """检查本地模型是否可用"""
+        return self._get_session() is not None
+
+    def _preprocess(self, rgb):
+        """缩放到模型输入尺寸并归一化，返回 (3, S, S) float32"""
+        size = self.input_size
+        resized = resize_array(rgb, size, size, 'bicubic').astype(np.float32)
+        resized /= max(float(resized.max()), 1e-6)
+        resized = (resized - np.array(_MEAN, dtype=np.float32)) / np.array(_STD, dtype=np.float32)
+        return resized.transpose(2, 0, 1)
+
+    def _infer(self, batch):
+        """
+        对 (N, 3, S, S) 批次推理，返回 (N, S, S) 的 [0, 1] 遮罩
+
+        部分导出的模型只支持 batch=1，批量推理失败时逐张执行
+        """
+        session = self._get_session()
+        try:
+            outputs = session.run(None, {self._input_name: batch})[0]
+        except Exception as e:
+            if len(batch) == 1:
+                raise
+            print(f"[BackgroundRemovalService] ⚠️ Batched inference failed ({e}), running per image")
+            outputs = np.concatenate([session.run(None, {self._input_name: batch[i:i + 1]})[0]
+                                      for i in range(len(batch))])
+        masks = outputs.reshape(len(batch), self.input_size, self.input_size).astype(np.float32)
+        if masks.min() < 0 or masks.max() > 1:
+            masks = 1.0 / (1.0 + np.exp(-masks))
+        # 与 U²-Net 官方推理一致：按图片做 min-max 归一化
+        lo = masks.min(axis=(1, 2), keepdims=True)
+        hi = masks.max(axis=(1, 2), keepdims=True)
+        return (masks - lo) / np.maximum(hi - lo, 1e-6)
+
+    def remove_backgrounds(self, images: List[bytes]) -> List[Dict[str, Any]]:
+        """
+        批量去除背景
+
+        Args:
+            images: 原始图片字节列表
+
+        Returns:
+            与输入顺序一致的 [{"data": PNG bytes, "mimeType": "image/png", "width", "height", "timings": {stage: ms}}]
+            timings 为该图片所在批次的各阶段耗时
+        """
+        if not self.is_available():
+            raise RuntimeError("Background removal model is not available")
+
+        results: List[Dict[str, Any]] = []
+        for start in range(0, len(images), self.batch_size):
+            results.extend(self._process_batch(images[start:start + self.batch_size]))
+        return results
+
+    def try_remove_backgrounds(self, images: List[Optional[bytes]]) -> List[Optional[Dict[str, Any]]]:
+        """
+        批量去除背景，单张失败不影响其他图片
+
+        按批次推理，批次失败时逐张重试；输入为 None 或处理失败的图片对应结果为 None，由调用方回退
+        """
+        if not self.is_available():
+            raise RuntimeError("Background removal model is not available")
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(images)
+        indices = [i for i, data in enumerate(images) if data is not None]
+        for start in range(0, len(indices), self.batch_size):
+            chunk = indices[start:start + self.batch_size]
+            try:
+                for i, result in zip(chunk, self._process_batch([images[i] for i in chunk])):
+                    results[i] = result
+                continue
+            except Exception as e:
+                print(f"[BackgroundRemovalService] ⚠️ Batch of {len(chunk)} failed ({e}), retrying per image")
+            for i in chunk:
+                try:
+                    results[i] = self._process_batch([images[i]])[0]
+                except Exception as e:
+                    print(f"[BackgroundRemovalService] ❌ Image {i} failed: {e}")
+        return results
+
+    def remove_background(self, image_bytes: bytes) -> Dict[str, Any]:
+        """去除单张图片的背景"""
+        return self.remove_backgrounds([image_bytes])[0]
+
+    def _process_batch(self, images: List[bytes]) -> List[Dict[str, Any]]:
+        timings = {}
+
+        started = time.time()
+        pixels = [np.asarray(PIL_Image.open(io.BytesIO(data)).convert('RGB')) for data in images]
+        timings['decode'] = _elapsed_ms(started)
+
+        started = time.time()
+        batch = np.stack([self._preprocess(rgb) for rgb in pixels]).astype(np.float32)
+        timings['preprocess'] = _elapsed_ms(started)
+
+        started = time.time()
+        masks = self._infer(batch)
+        timings['inference'] = _elapsed_ms(started)
+
+        started = time.time()
+        alphas = []
+        for rgb, mask in zip(pixels, masks):
+            mask_u8 = (mask * 255.0 + 0.5).astype(np.uint8)[:, :, None]
+            upsampled = resize_array(mask_u8, rgb.shape[0], rgb.shape[1], 'bicubic')[:, :, 0]
+            alphas.append(refine_alpha(upsampled.astype(np.float32) / 255.0))
+        timings['postprocess'] = _elapsed_ms(started)
+
+        started = time.time()
+        encoded = []
+        for rgb, alpha in zip(pixels, alphas):
+            buffer = io.BytesIO()
+            PIL_Image.fromarray(np.dstack([rgb, alpha])).save(buffer, format='PNG', compress_level=3)
+            encoded.append(buffer.getvalue())
+        timings['encode'] = _elapsed_ms(started)
+
+        print(f"[BackgroundRemovalService] ✅ Processed {len(images)} image(s) (timings ms: {timings})")
+        return [
+            {
+                "data": data,
+                "mimeType": "image/png",
+                "width": rgb.shape[1],
+                "height": rgb.shape[0],
+                "timings": timings,
+            }
+            for data, rgb in zip(encoded, pixels)
+        ]
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.time() - started) * 1000, 1)
+
+
+_background_removal_service: Optional[BackgroundRemovalService] = None
+_background_removal_service_lock = threading.Lock()
+
+
+def get_background_removal_service() -> BackgroundRemovalService:
+    """获取 BackgroundRemovalService 单例"""
+    global _background_removal_service
+    if _background_removal_service is None:
+        with _background_removal_service_lock:
+            if _background_removal_service is None:
+                _background_removal_service = BackgroundRemovalService()
+    return _background_removal_service
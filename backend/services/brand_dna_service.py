@@ -4,11 +4,15 @@ Brand DNA Service
 分析 Logo、参考图片和视频 URL，提取视觉风格、配色、氛围等基因
 """
 
+import base64
 import json
-import os
 from typing import Optional, Dict, Any, List
-from services.gemini_service import get_gemini_service_safe
-import google.generativeai as genai
+from services.gemini_service import DEFAULT_MODEL, get_gemini_service
+from services.image_normalization_service import get_image_normalization_service
+from utils.lazy_import import lazy_import
+from utils.response_schemas import BRAND_DNA
+
+genai_types = lazy_import('google.genai.types')
 
 
 def safe_json_parse(json_string: str, fallback: Dict[str, Any]) -> Dict[str, Any]:
@@ -62,6 +66,13 @@ def safe_json_parse(json_string: str, fallback: Dict[str, Any]) -> Dict[str, Any
         return fallback
 
 
+def _image_parts(images: List[Dict[str, str]]) -> List[Any]:
+    return [
+        genai_types.Part.from_bytes(data=base64.b64decode(img.get('data', '')), mime_type=img.get('mimeType', 'image/jpeg'))
+        for img in images
+    ]
+
+
 def extract_brand_dna(
     logo_image: Optional[Dict[str, str]] = None,  # {"data": base64_string, "mimeType": "image/jpeg"}
     reference_images: List[Dict[str, str]] = None,  # [{"data": base64_string, "mimeType": "image/jpeg"}]
@@ -138,61 +149,28 @@ Return result as JSON:
     "motionStyle": "string"
 }}"""
     
-    # 构建完整的多模态 parts
-    full_prompt = f"{system_instruction}\n\n{analysis_prompt}"
-    
-    # 使用 genai SDK 直接调用，支持多模态输入
-    api_key = os.getenv('GEMINI_API_KEY') or os.getenv('GOOGLE_API_KEY')
-    if not api_key:
-        raise ValueError("GEMINI_API_KEY not configured")
-    
-    # 构建多模态 parts
-    multimodal_parts = []
+    # 构建多模态 parts（图片先缩小到分析所需分辨率并去除元数据）
+    gemini = get_gemini_service()  # 未配置 API Key 时抛出 ValueError
+    normalizer = get_image_normalization_service()
     if logo_image:
-        multimodal_parts.append({
-            'inline_data': {
-                'mime_type': logo_image.get('mimeType', 'image/jpeg'),
-                'data': logo_image.get('data', '')
-            }
-        })
-    for img in reference_images:
-        multimodal_parts.append({
-            'inline_data': {
-                'mime_type': img.get('mimeType', 'image/jpeg'),
-                'data': img.get('data', '')
-            }
-        })
-    multimodal_parts.append(full_prompt)
+        logo_image = normalizer.normalize_part(logo_image, 'brand_dna')
+    reference_images = [normalizer.normalize_part(img, 'brand_dna') for img in reference_images]
+    contents = _image_parts(([logo_image] if logo_image else []) + reference_images)
+    contents.append(analysis_prompt)
     
     # 根据是否有视频 URL 决定是否使用 Google Search 工具
     try:
         if video_urls and len(video_urls) > 0:
-            # 使用 Google Search 工具（需要创建带 tools 的模型实例）
-            # Python SDK 中，Google Search 工具格式可能不同，尝试多种格式
-            try:
-                model_with_tools = genai.GenerativeModel(
-                    'gemini-2.5-flash',
-                    tools=[{'googleSearch': {}}]  # 驼峰格式（与 gemini_service.py 保持一致）
-                )
-                response = model_with_tools.generate_content(multimodal_parts)
-            except Exception as e1:
-                print(f"Failed to create model with googleSearch tools: {e1}")
-                try:
-                    model_with_tools = genai.GenerativeModel(
-                        'gemini-2.5-flash',
-                        tools=[{'google_search': {}}]  # 下划线格式
-                    )
-                    response = model_with_tools.generate_content(multimodal_parts)
-                except Exception as e2:
-                    print(f"Failed to create model with google_search tools: {e2}")
-                    # 如果都不行，回退到无工具模式
-                    print("Falling back to model without tools")
-                    model_no_tools = genai.GenerativeModel('gemini-2.5-flash')
-                    response = model_no_tools.generate_content(multimodal_parts)
+            # 使用 Google Search 工具，不被接受时回退到无工具模式（googleSearch / google_search 在 SDK 中解析为同一个 Tool）
+            # 只有错误明确针对工具时才按模型缓存回退结果，之后的提取不再为已知被拒绝的工具发起请求
+            response = gemini.negotiate('search_tool', DEFAULT_MODEL, [
+                ('googleSearch', lambda: gemini.generate_content(
+                    contents, tools=[{'googleSearch': {}}], system_instruction=system_instruction)),
+                ('none', lambda: gemini.generate_content(contents, system_instruction=system_instruction)),
+            ], fields=('tool', 'google_search', 'googlesearch'))
         else:
-            # 不使用工具，直接生成
-            model = genai.GenerativeModel('gemini-2.5-flash')
-            response = model.generate_content(multimodal_parts)
+            # 无视频 URL 时使用结构化输出（Google Search 工具不能与 response_schema 同时使用），失败时回退为自由文本
+            response = gemini.generate_content(contents, system_instruction=system_instruction, response_schema=BRAND_DNA)
         
         # 提取响应文本
         text = ""
@@ -0,0 +1,233 @@
+"""
+Firestore Write-Behind Buffer
+把状态追踪类的 Firestore 写入（如 veo_assets 记录）放入后台队列，
+按数量或时间间隔合并为批量写入（WriteBatch），失败时指数退避重试，进程退出前排空队列
+请求线程只负责入队，不再等待 Firestore 往返
+"""
+
+import _thread
+import atexit
+import os
+import queue
+import random
+import signal
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.firebase_registry import get_firestore_client
+
+# 单个批次的最大写入数（Firestore WriteBatch 上限为 500）
+FIRESTORE_WRITE_BATCH_SIZE = min(int(os.getenv('FIRESTORE_WRITE_BATCH_SIZE', '20')), 500)
+# 未攒满批次时的最长等待时间（秒）
+FIRESTORE_WRITE_FLUSH_INTERVAL = float(os.getenv('FIRESTORE_WRITE_FLUSH_INTERVAL', '1.0'))
+# 批量提交失败后的最大重试次数
+FIRESTORE_WRITE_MAX_RETRIES = int(os.getenv('FIRESTORE_WRITE_MAX_RETRIES', '5'))
+# 关闭时等待队列排空的最长时间（秒）
+FIRESTORE_WRITE_DRAIN_TIMEOUT = float(os.getenv('FIRESTORE_WRITE_DRAIN_TIMEOUT', '8'))
+# 收到 SIGTERM 后留给进行中请求的时间（秒），之后停止服务并在 atexit 中排空队列
+SHUTDOWN_GRACE_SECONDS = float(os.getenv('SHUTDOWN_GRACE_SECONDS', '2'))
+
+# (doc_ref, data, merge)
+WriteOp = Tuple[Any, Dict[str, Any], bool]
+
+
+class FirestoreWriteBuffer:
+    """Firestore 批量写入缓冲区（单后台线程，按入队顺序提交）"""
+
+    def __init__(
+        self,
+        db,
+        batch_size: int = FIRESTORE_WRITE_BATCH_SIZE,
+        flush_interval: float = FIRESTORE_WRITE_FLUSH_INTERVAL,
+        max_retries: int = FIRESTORE_WRITE_MAX_RETRIES,
+        base_backoff: float = 0.5
+    ):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self._queue: "queue.Queue[Optional[WriteOp]]" = queue.Queue()
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self.stats = {"enqueued": 0, "committed": 0, "batches": 0, "retries": 0, "dropped": 0}
+        self._thread = threading.Thread(target=self._run, name='firestore-write-buffer', daemon=True)
+        self._thread.start()
+
+    def set(self, doc_ref, data: Dict[str, Any], merge: bool = False):
+        """入队一个 set 写入"""
+        if self._closed:
+            raise RuntimeError("FirestoreWriteBuffer is closed")
+        with self._stats_lock:
+            self.stats["enqueued"] += 1
+        self._queue.put((doc_ref, data, merge))
+
+    def update(self, doc_ref, data: Dict[str, Any]):
+        """
+        入队一个部分更新
+
+        以 set(merge=True) 提交：即使对应的 set 尚未提交或最终失败，
+        也不会因为文档不存在而让整个批次失败
+        """
+        self.set(doc_ref, data, merge=True)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待当前队列中的写入全部提交（或放弃），返回是否在超时前完成"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def close(self, timeout: float = FIRESTORE_WRITE_DRAIN_TIMEOUT) -> bool:
+        """停止接收新写入并排空队列"""
+        if self._closed:
+            return True
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+        drained = not self._thread.is_alive()
+        if not drained:
+            print(f"[FirestoreWriteBuffer] ⚠️ Shutdown drain timed out, {self._queue.qsize()} write(s) pending")
+        return drained
+
+    def stats_snapshot(self) -> Dict[str, int]:
+        """读取统计计数的一致快照（写入线程和关闭时的 flush 会并发更新 stats）"""
+        with self._stats_lock:
+            return dict(self.stats)
+
+    def _collect_batch(self) -> Tuple[List[WriteOp], bool]:
+        """从队列取出一个批次：攒满 batch_size 或等待 flush_interval 后返回"""
+        ops: List[WriteOp] = []
+        stop = False
+        first = self._queue.get()
+        if first is None:
+            self._queue.task_done()
+            return ops, True
+        ops.append(first)
+        deadline = time.time() + self.flush_interval
+        while len(ops) < self.batch_size:
+            remaining = deadline - time.time()
+            try:
+                op = self._queue.get(timeout=max(remaining, 0)) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if op is None:
+                self._queue.task_done()
+                stop = True
+                break
+            ops.append(op)
+        return ops, stop
+
+    def _commit(self, ops: List[WriteOp]):
+        """提交一个批次，失败时指数退避重试"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                batch = self.db.batch()
+                for doc_ref, data, merge in ops:
+                    batch.set(doc_ref, data, merge=merge)
+                batch.commit()
+                with self._stats_lock:
+                    self.stats["committed"] += len(ops)
+                    self.stats["batches"] += 1
+                return
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    with self._stats_lock:
+                        self.stats["dropped"] += len(ops)
+                    print(f"[FirestoreWriteBuffer] ❌ Dropping {len(ops)} write(s) after {attempt + 1} attempts: {e}")
+                    return
+                with self._stats_lock:
+                    self.stats["retries"] += 1
+                delay = self.base_backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+                print(f"[FirestoreWriteBuffer] ⚠️ Batch commit failed ({e}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+
+    def _run(self):
+        while True:
+            ops, stop = self._collect_batch()
+            if ops:
+                try:
+                    self._commit(ops)
+                finally:
+                    for _ in ops:
+                        self._queue.task_done()
+            if stop:
+                # 处理关闭信号之后仍残留的写入
+                remaining = []
+                while True:
+                    try:
+                        remaining.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                remaining_ops = [op for op in remaining if op is not None]
+                for start in range(0, len(remaining_ops), self.batch_size):
+                    self._commit(remaining_ops[start:start + self.batch_size])
+                for _ in remaining:
+                    self._queue.task_done()
+                return
+
+
+_write_buffer: Optional[FirestoreWriteBuffer] = None
+_write_buffer_lock = threading.Lock()
+
+
+def get_firestore_write_buffer() -> Optional[FirestoreWriteBuffer]:
+    """获取共享的写入缓冲区（Firestore 不可用时返回 None）"""
+    global _write_buffer
+    if _write_buffer is None:
+        with _write_buffer_lock:
+            if _write_buffer is None:
+                db = get_firestore_client()
+                if db is None:
+                    return None
+                _write_buffer = FirestoreWriteBuffer(db)
+    return _write_buffer
+
+
+def drain_firestore_write_buffer():
+    """排空写入缓冲区（进程退出时调用）"""
+    if _write_buffer is not None:
+        stats = _write_buffer.stats_snapshot()
+        print(f"[FirestoreWriteBuffer] Draining before shutdown "
+              f"(committed: {stats['committed']}, dropped: {stats['dropped']})")
+        _write_buffer.close()
+
+
+_shutdown_requested = threading.Event()
+
+
+def _stop_after_grace(grace: float):
+    """等待进行中的请求完成后中断主线程：app.run 的服务循环收到 KeyboardInterrupt 后正常退出，随后执行 atexit"""
+    time.sleep(grace)
+    _thread.interrupt_main()
+
+
+def install_shutdown_hooks():
+    """
+    注册进程退出时的排空逻辑（需在主线程调用）
+
+    Cloud Run 在缩容前发送 SIGTERM，默认处理会直接终止进程而跳过 atexit。
+    信号处理函数只记录关闭请求，SHUTDOWN_GRACE_SECONDS 后再停止服务循环，
+    排空只在 atexit 中执行一次（不在信号处理函数里做阻塞的网络 I/O）
+    """
+    atexit.register(drain_firestore_write_buffer)
+    if threading.current_thread() is not threading.main_thread():
+        return
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def handle_sigterm(signum, frame):
+        if callable(previous):
+            previous(signum, frame)
+        if _shutdown_requested.is_set():
+            return
+        _shutdown_requested.set()
+        print(f"[FirestoreWriteBuffer] SIGTERM received, stopping in {SHUTDOWN_GRACE_SECONDS:g}s")
+        threading.Thread(target=_stop_after_grace, args=(SHUTDOWN_GRACE_SECONDS,),
+                         name='shutdown-grace', daemon=True).start()
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
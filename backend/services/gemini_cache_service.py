@@ -0,0 +1,197 @@
+"""
+Gemini Context Cache Service
+把较大的静态 system instruction 创建为 Gemini cached content，调用时只引用缓存名，不再重复发送和处理这部分输入
+- 缓存按 (模型, 指令内容) 索引：每条静态指令一个，带 Brand DNA 的指令按 profile 内容各一个
+- 创建、续期、删除都在后台线程执行，请求路径只做字典查找；缓存未就绪时本次调用照常不走缓存
+- 距离过期不足 GEMINI_CACHE_REFRESH_MARGIN_SECONDS 时后台续期；创建失败（如指令低于模型的最小缓存长度）后冷却一段时间再重试
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from utils.genai_client import get_genai_client
+from utils.lazy_import import lazy_import
+from utils.prompt_templates import estimate_tokens
+
+types = lazy_import('google.genai.types')
+
+GEMINI_CONTEXT_CACHE_ENABLED = os.getenv('GEMINI_CONTEXT_CACHE_ENABLED', 'true').lower() == 'true'
+GEMINI_CACHE_TTL_SECONDS = int(os.getenv('GEMINI_CACHE_TTL_SECONDS', '3600'))
+GEMINI_CACHE_REFRESH_MARGIN_SECONDS = int(os.getenv('GEMINI_CACHE_REFRESH_MARGIN_SECONDS', '300'))
+GEMINI_CACHE_MAX_ENTRIES = int(os.getenv('GEMINI_CACHE_MAX_ENTRIES', '64'))
+GEMINI_CACHE_FAILURE_COOLDOWN_SECONDS = int(os.getenv('GEMINI_CACHE_FAILURE_COOLDOWN_SECONDS', '600'))
+# Gemini API 对 cached content 有最小 token 数要求，低于该值的指令不尝试创建缓存
+GEMINI_CACHE_MIN_TOKENS = int(os.getenv('GEMINI_CACHE_MIN_TOKENS', '1024'))
+
+
+@dataclass
+class CachedContext:
+    key: str
+    model: str
+    name: str
+    expires_at: float
+    hits: int = 0
+
+
+def context_cache_key(model: str, system_instruction: str) -> str:
+    return hashlib.sha256(f"{model}\n{system_instruction}".encode('utf-8')).hexdigest()
+
+
+class GeminiContextCache:
+    """静态 system instruction 的 Gemini cached content 管理"""
+
+    def __init__(
+        self,
+        client=None,
+        ttl_seconds: int = GEMINI_CACHE_TTL_SECONDS,
+        refresh_margin: int = GEMINI_CACHE_REFRESH_MARGIN_SECONDS,
+        max_entries: int = GEMINI_CACHE_MAX_ENTRIES,
+        min_tokens: int = GEMINI_CACHE_MIN_TOKENS,
+        failure_cooldown: int = GEMINI_CACHE_FAILURE_COOLDOWN_SECONDS,
+    ):
+        self._client = client
+        self.ttl_seconds = ttl_seconds
+        self.refresh_margin = refresh_margin
+        self.max_entries = max_entries
+        self.min_tokens = min_tokens
+        self.failure_cooldown = failure_cooldown
+        self._entries: "OrderedDict[str, CachedContext]" = OrderedDict()
+        self._pending: Dict[str, bool] = {}
+        self._failed_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='gemini-cache')
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_genai_client()
+        return self._client
+
+    def lookup(self, model: str, system_instruction: str, label: str = 'static') -> Optional[str]:
+        """
+        返回可用的 cached content 名称；没有可用缓存时返回 None 并在后台创建
+
+        Args:
+            model: 模型名称（缓存与模型绑定）
+            system_instruction: 静态指令文本
+            label: 缓存的 display_name，便于在控制台识别
+        """
+        if not system_instruction or estimate_tokens(system_instruction) < self.min_tokens:
+            return None
+        key = context_cache_key(model, system_instruction)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > now + 5:
+                entry.hits += 1
+                self._entries.move_to_end(key)
+                if entry.expires_at - now < self.refresh_margin:
+                    self._schedule(key, self._extend, entry)
+                return entry.name
+            if entry is not None:
+                del self._entries[key]
+            if self._failed_until.get(key, 0) > now:
+                return None
+            self._schedule(key, self._create, key, model, system_instruction, label)
+        return None
+
+    def invalidate(self, name: str):
+        """缓存在服务端已不可用（被删除或过期）时移除本地记录"""
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.name == name:
+                    del self._entries[key]
+
+    def _schedule(self, key: str, fn, *args):
+        """同一 key 同时只有一个后台任务（调用方持有锁）"""
+        if self._pending.get(key):
+            return
+        self._pending[key] = True
+        self.executor.submit(self._run, key, fn, *args)
+
+    def _run(self, key: str, fn, *args):
+        try:
+            fn(*args)
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def _create(self, key: str, model: str, system_instruction: str, label: str):
+        try:
+            cached = self.client.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=system_instruction,
+                    display_name=f"reel-{label}-{key[:8]}"[:128],
+                    ttl=f"{self.ttl_seconds}s",
+                ),
+            )
+        except Exception as e:
+            print(f"[GeminiCacheService] ⚠️ Failed to create cached content for {label} ({model}): {e}")
+            with self._lock:
+                self._failed_until[key] = time.time() + self.failure_cooldown
+            return
+        entry = CachedContext(key=key, model=model, name=cached.name, expires_at=self._expires_at(cached))
+        evicted = []
+        with self._lock:
+            self._entries[key] = entry
+            self._failed_until.pop(key, None)
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[1])
+        print(f"[GeminiCacheService] ✅ Cached {label} for {model}: {cached.name}")
+        for old in evicted:
+            self._delete(old)
+
+    def _extend(self, entry: CachedContext):
+        try:
+            cached = self.client.caches.update(
+                name=entry.name,
+                config=types.UpdateCachedContentConfig(ttl=f"{self.ttl_seconds}s"),
+            )
+        except Exception as e:
+            # 续期失败时让条目自然过期，之后的请求会重新创建
+            print(f"[GeminiCacheService] ⚠️ Failed to extend {entry.name}: {e}")
+            return
+        with self._lock:
+            entry.expires_at = self._expires_at(cached)
+
+    def _delete(self, entry: CachedContext):
+        try:
+            self.client.caches.delete(name=entry.name)
+        except Exception as e:
+            print(f"[GeminiCacheService] ⚠️ Failed to delete {entry.name}: {e}")
+
+    def _expires_at(self, cached) -> float:
+        expire_time = getattr(cached, 'expire_time', None)
+        if expire_time is not None and hasattr(expire_time, 'timestamp'):
+            return expire_time.timestamp()
+        return time.time() + self.ttl_seconds
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                entry.name: {'model': entry.model, 'hits': entry.hits, 'expiresIn': round(entry.expires_at - time.time())}
+                for entry in self._entries.values()
+            }
+
+
+_context_cache: Optional[GeminiContextCache] = None
+_context_cache_lock = threading.Lock()
+
+
+def get_gemini_context_cache() -> Optional[GeminiContextCache]:
+    """获取 GeminiContextCache 单例（GEMINI_CONTEXT_CACHE_ENABLED=false 时返回 None）"""
+    global _context_cache
+    if not GEMINI_CONTEXT_CACHE_ENABLED:
+        return None
+    if _context_cache is None:
+        with _context_cache_lock:
+            if _context_cache is None:
+                _context_cache = GeminiContextCache()
+    return _context_cache
@@ -1,12 +1,22 @@
 """
 Gemini API Service
-封装 Google Gemini API 调用
+封装 Google Gemini API 调用（google.genai，与 Veo、cached content 共用一个客户端）
 """
 
+import base64
 import os
-import google.generativeai as genai
-from typing import Optional, Dict, Any, List
-from google.generativeai.types import GenerateContentResponse
+import threading
+import time
+from typing import Optional, Dict, Any, List, Tuple, Callable, TYPE_CHECKING
+from utils.lazy_import import lazy_import
+from utils.genai_client import get_genai_api_key, get_genai_client
+from services.gemini_cache_service import get_gemini_context_cache
+
+# google.genai 导入耗时较长，延迟到首次使用（或后台预热）时再加载
+genai_types = lazy_import('google.genai.types')
+
+if TYPE_CHECKING:
+    from google.genai.types import GenerateContentResponse
 
 # 配置 Gemini
 # 确保加载 .env 文件
@@ -18,77 +28,267 @@ else:
     load_dotenv()
 
 # Support both GEMINI_API_KEY and GOOGLE_API_KEY for compatibility
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY') or os.getenv('GOOGLE_API_KEY')
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+GEMINI_API_KEY = get_genai_api_key()
 
 # 默认模型 - 使用 gemini-2.5-flash 作为默认（根据用户偏好）
 DEFAULT_MODEL = 'gemini-2.5-flash'
 PRO_MODEL = 'gemini-2.5-pro'
 
+# 请求格式协商结果（tools 写法、是否带 image config 等）的有效期，过期后重新探测
+GEMINI_CAPABILITY_TTL_SECONDS = int(os.getenv('GEMINI_CAPABILITY_TTL_SECONDS', '3600'))
+
+# 图片模型 image_config 支持的宽高比；其他值会被 API 以 400 拒绝，调用前校验
+IMAGE_ASPECT_RATIOS = ('1:1', '2:3', '3:2', '3:4', '4:3', '4:5', '5:4', '9:16', '16:9', '21:9')
+
+
+def _schema_name(response_schema: Optional[Dict[str, Any]]) -> str:
+    return (response_schema or {}).get('title', 'json')
+
+
+def _is_config_error(error: Exception) -> bool:
+    """请求配置不被模型接受（参数校验失败或 HTTP 400），而不是配额、网络等临时错误"""
+    return isinstance(error, (TypeError, AttributeError, ValueError)) or getattr(error, 'code', None) == 400
+
+
+def _rejects_field(error: Exception, fields: Tuple[str, ...]) -> bool:
+    """
+    配置错误是否明确针对该字段本身（可以缓存为"格式不被支持"）
+    SDK 缺少该字段（TypeError / AttributeError）时一定是；API 返回的 400 需要错误信息提到该字段，
+    否则可能是提示词、输入图片或参数取值的问题，只对当前请求回退
+    """
+    if isinstance(error, (TypeError, AttributeError)):
+        return True
+    message = str(error).lower()
+    return any(field.lower() in message for field in fields)
+
+
+def _image_contents(prompt: str, images: Optional[List[Dict[str, Any]]]) -> List[Any]:
+    """输入图片 [{"data": base64_string, "mimeType": ...}] + 文本提示词"""
+    parts: List[Any] = [
+        genai_types.Part.from_bytes(data=base64.b64decode(img.get('data', '')), mime_type=img.get('mimeType', 'image/jpeg'))
+        for img in images or []
+    ]
+    parts.append(prompt)
+    return parts
+
+
+def _extract_image(response) -> str:
+    """从响应中取出第一张图片，返回 base64 字符串"""
+    if hasattr(response, 'candidates') and response.candidates:
+        candidate = response.candidates[0]
+        if hasattr(candidate, 'content') and candidate.content:
+            for part in getattr(candidate.content, 'parts', None) or []:
+                inline_data = getattr(part, 'inline_data', None)
+                data = getattr(inline_data, 'data', None) if inline_data else None
+                if data:
+                    if isinstance(data, bytes):
+                        return base64.b64encode(data).decode('utf-8')
+                    return data
+    raise ValueError("No image data in response")
+
 
 class GeminiService:
     """Gemini API 服务封装"""
     
-    def __init__(self):
-        if not GEMINI_API_KEY:
+    def __init__(self, client=None):
+        if client is None and not GEMINI_API_KEY:
             raise ValueError("GEMINI_API_KEY not configured")
         try:
-            # 不在初始化时设置 tools，tools 应该在每次调用时传递
-            self.model = genai.GenerativeModel(DEFAULT_MODEL)
-            self.pro_model = genai.GenerativeModel(PRO_MODEL)
+            # 共享的 google.genai 客户端（首次创建时触发 SDK 的延迟导入）
+            self.client = client or get_genai_client()
         except Exception as e:
-            raise ValueError(f"Failed to initialize Gemini models: {str(e)}")
+            raise ValueError(f"Failed to initialize Gemini client: {str(e)}")
+        self._structured_stats: Dict[str, Dict[str, int]] = {}
+        # (capability, model) -> (可用的请求格式, 协商时间)
+        self._capabilities: Dict[Tuple[str, str], Tuple[str, float]] = {}
+        self._lock = threading.Lock()
     
     def generate_content(
         self,
-        prompt: str,
+        prompt: Any,
         model: str = DEFAULT_MODEL,
         tools: Optional[List[Dict[str, Any]]] = None,
         response_mime_type: Optional[str] = None,
-        system_instruction: Optional[str] = None
-    ) -> GenerateContentResponse:
+        system_instruction: Optional[str] = None,
+        response_schema: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None
+    ) -> 'GenerateContentResponse':
         """
         生成内容
         
         Args:
-            prompt: 提示词
+            prompt: 提示词，或 parts 列表（多模态）
             model: 模型名称
             tools: 工具列表（如 Google Search）
             response_mime_type: 响应 MIME 类型（如 'application/json'）
             system_instruction: 系统指令
+            response_schema: 结构化输出 schema（见 utils/response_schemas.py），设置后响应文本为符合 schema 的 JSON
+            timeout: 单次请求的 HTTP 超时（秒），None 时使用客户端默认值
         
         Returns:
             GenerateContentResponse
         """
-        # 根据测试，tools 参数在 generate_content 调用时传递会导致冲突
-        # 解决方案：在模型初始化时设置 tools
-        # 注意：当前版本的 google-generativeai 库不支持 system_instruction 参数
-        # 解决方案：将 system_instruction 作为 prompt 的一部分传递
         model_name = PRO_MODEL if model == PRO_MODEL else DEFAULT_MODEL
-        selected_model = self.pro_model if model == PRO_MODEL else self.model
+        config: Dict[str, Any] = {'tools': tools} if tools else {}
+        if timeout is not None:
+            config['http_options'] = genai_types.HttpOptions(timeout=max(1, int(timeout * 1000)))
+        
+        if response_schema is not None or response_mime_type:
+            try:
+                return self.generate_structured_content(
+                    prompt,
+                    response_schema,
+                    model=model_name,
+                    system_instruction=system_instruction,
+                    response_mime_type=response_mime_type or 'application/json',
+                    **config
+                )
+            except Exception as e:
+                # 只有 schema 不被接受时退回自由文本，由调用方容错解析；配额、网络、超时等错误直接抛出，避免重复请求
+                if not _is_config_error(e):
+                    raise
+                print(f"[GeminiService] ⚠️ Structured output failed ({_schema_name(response_schema)}), falling back to free text: {e}")
+        return self._generate(model_name, prompt, system_instruction, **config)
+    
+    async def generate_content_async(
+        self,
+        prompt: Any,
+        model: str = DEFAULT_MODEL,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        system_instruction: Optional[str] = None,
+        response_schema: Optional[Dict[str, Any]] = None
+    ) -> 'GenerateContentResponse':
+        """generate_content 的异步版本（client.aio），供 asyncio 调用方并发发起请求"""
+        model_name = PRO_MODEL if model == PRO_MODEL else DEFAULT_MODEL
+        config: Dict[str, Any] = {'tools': tools} if tools else {}
+        if response_schema is not None:
+            config.update(response_mime_type='application/json', response_schema=response_schema)
+        return await self.client.aio.models.generate_content(
+            model=model_name,
+            contents=prompt,
+            config=genai_types.GenerateContentConfig(system_instruction=system_instruction, **config),
+        )
+    
+    def generate_structured_content(
+        self,
+        contents: Any,
+        response_schema: Optional[Dict[str, Any]],
+        model: str = DEFAULT_MODEL,
+        system_instruction: Optional[str] = None,
+        response_mime_type: str = 'application/json',
+        **config: Any
+    ) -> 'GenerateContentResponse':
+        """
+        生成结构化输出（失败时抛出异常，由调用方决定是否回退）
+        
+        Args:
+            contents: 文本提示词，或 parts 列表（多模态）
+            response_schema: 输出 schema，None 时只要求返回 JSON
+            system_instruction: 系统指令（已创建 cached content 时引用缓存）
+        """
+        config['response_mime_type'] = response_mime_type
+        if response_schema is not None:
+            config['response_schema'] = response_schema
+        try:
+            response = self._generate(model, contents, system_instruction, **config)
+        except Exception:
+            self._record_structured(response_schema, 'failures')
+            raise
+        self._record_structured(response_schema, 'structured')
+        return response
+    
+    def _generate(self, model_name: str, contents: Any, system_instruction: Optional[str] = None, **config: Any):
+        """
+        调用 models.generate_content
+        静态 system instruction 已创建为 cached content 时只引用缓存名，不再随每次请求发送；缓存调用失败时改为内联发送
+        """
+        cache = get_gemini_context_cache() if system_instruction and not config.get('tools') else None
+        cache_name = cache.lookup(model_name, system_instruction) if cache is not None else None
+        if cache_name:
+            try:
+                return self.client.models.generate_content(
+                    model=model_name,
+                    contents=contents,
+                    config=genai_types.GenerateContentConfig(cached_content=cache_name, **config),
+                )
+            except Exception as e:
+                print(f"[GeminiService] ⚠️ Cached content {cache_name} failed, falling back to inline instruction: {e}")
+                cache.invalidate(cache_name)
+        return self.client.models.generate_content(
+            model=model_name,
+            contents=contents,
+            config=genai_types.GenerateContentConfig(system_instruction=system_instruction, **config),
+        )
+    
+    def _record_structured(self, response_schema: Optional[Dict[str, Any]], outcome: str):
+        with self._lock:
+            stats = self._structured_stats.setdefault(_schema_name(response_schema), {'structured': 0, 'failures': 0})
+            stats[outcome] += 1
+    
+    def structured_output_stats(self) -> Dict[str, Dict[str, int]]:
+        """按 schema 统计结构化输出成功次数和失败（调用方回退为自由文本）次数"""
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._structured_stats.items()}
+    
+    def negotiate(self, capability: str, model_name: str, variants: List[Tuple[str, Callable[[], Any]]],
+                  fields: Tuple[str, ...] = ()) -> Any:
+        """
+        按顺序尝试同一请求的多种格式，返回第一个成功的结果
+        每个 (capability, model) 记住可用的格式，之后的请求直接从该格式开始，不再为已知被拒绝的格式发起请求；
+        只有配置错误（_is_config_error）会尝试下一个格式，配额、网络等错误直接抛出；
+        只有被跳过的格式都明确因该字段被拒绝（_rejects_field）时才缓存降级结果，其他 400 只对当前请求回退
         
-        # 如果需要 tools，创建新的模型实例
-        if tools:
-            temp_model = genai.GenerativeModel(model_name, tools=tools)
-        else:
-            temp_model = selected_model
+        Args:
+            capability: 能力名称（如 'search_tool'、'image_config'）
+            model_name: 模型名称
+            variants: [(格式名称, 发起请求的函数)]，按优先级排列
+            fields: 错误信息中标识该字段的关键字（如 'image_config'、'aspect_ratio'）
+        """
+        key = (capability, model_name)
+        with self._lock:
+            entry = self._capabilities.get(key)
+            if entry and time.monotonic() - entry[1] > GEMINI_CAPABILITY_TTL_SECONDS:
+                del self._capabilities[key]
+                entry = None
+        names = [name for name, _ in variants]
+        start = names.index(entry[0]) if entry and entry[0] in names else 0
         
-        # 将 system_instruction 添加到 prompt 开头（如果提供）
-        final_prompt = prompt
-        if system_instruction:
-            final_prompt = f"{system_instruction}\n\n{prompt}"
+        last_error: Optional[Exception] = None
+        field_rejected = True
+        for name, call in variants[start:]:
+            try:
+                result = call()
+            except Exception as e:
+                if not _is_config_error(e):
+                    raise
+                print(f"[GeminiService] ⚠️ {capability} ({model_name}) rejected '{name}': {e}")
+                field_rejected = field_rejected and _rejects_field(e, fields)
+                last_error = e
+                continue
+            if not field_rejected:
+                print(f"[GeminiService] ⚠️ {capability} ({model_name}) fell back to '{name}' for this request only")
+            elif entry is None or entry[0] != name:
+                with self._lock:
+                    self._capabilities[key] = (name, time.monotonic())
+                print(f"[GeminiService] ✅ {capability} ({model_name}) negotiated '{name}'")
+            return result
         
-        # 调用 generate_content
-        # 注意：当前 API 版本不支持 response_mime_type 参数，暂时移除
-        return temp_model.generate_content(final_prompt)
+        # 所有格式都被拒绝：清除记录，下次请求重新从第一个格式探测
+        with self._lock:
+            self._capabilities.pop(key, None)
+        raise last_error
+    
+    def capabilities(self) -> Dict[str, str]:
+        """已协商的请求格式，{"capability:model": 格式名称}"""
+        with self._lock:
+            return {f"{capability}:{model}": name for (capability, model), (name, _) in self._capabilities.items()}
     
     def generate_content_with_function_calling(
         self,
         prompt: str,
         function_declarations: List[Dict[str, Any]],
         model: str = DEFAULT_MODEL
-    ) -> GenerateContentResponse:
+    ) -> 'GenerateContentResponse':
         """
         使用函数调用生成内容
         
@@ -108,7 +308,7 @@ class GeminiService:
         self,
         prompt: str,
         model: str = DEFAULT_MODEL
-    ) -> GenerateContentResponse:
+    ) -> 'GenerateContentResponse':
         """
         使用 Google Search 工具生成内容
         
@@ -127,30 +327,30 @@ class GeminiService:
     def generate_json(
         self,
         prompt: str,
-        model: str = DEFAULT_MODEL
-    ) -> Dict[str, Any]:
+        model: str = DEFAULT_MODEL,
+        response_schema: Optional[Dict[str, Any]] = None,
+        system_instruction: Optional[str] = None
+    ) -> Any:
         """
         生成 JSON 响应
         
         Args:
             prompt: 提示词
             model: 模型名称
+            response_schema: 结构化输出 schema（可选）
+            system_instruction: 系统指令（可选）
         
         Returns:
-            JSON 对象
+            JSON 对象（解析失败时为 {}）
         """
         import json
-        try:
-            # 使用 response_mime_type 来确保返回 JSON
-            response = self.generate_content(
-                prompt, 
-                model=model,
-                response_mime_type='application/json'
-            )
-        except Exception as e:
-            print(f"Error generating JSON with response_mime_type: {e}")
-            # 回退到不使用 response_mime_type
-            response = self.generate_content(prompt, model=model)
+        response = self.generate_content(
+            prompt,
+            model=model,
+            response_mime_type='application/json',
+            response_schema=response_schema,
+            system_instruction=system_instruction
+        )
         
         # 安全获取响应文本
         text = ''
@@ -169,7 +369,7 @@ class GeminiService:
         if not text:
             text = '{}'
         
-        # 清理可能的 markdown 包装
+        # 清理可能的 markdown 包装（自由文本回退路径）
         if text.startswith('```'):
             text = text.split('```')[1]
             if text.startswith('json'):
@@ -195,76 +395,32 @@ class GeminiService:
         Args:
             prompt: 文本提示词
             images: 输入图片列表 [{"data": base64_string, "mimeType": "image/jpeg"}]
-            aspect_ratio: 宽高比 ('1:1', '16:9', '9:16', '4:3', '3:4', '4:5')
+            aspect_ratio: 宽高比（IMAGE_ASPECT_RATIOS 之一，其他值抛出 ValueError）
             model_level: 'banana' (gemini-2.5-flash-image) 或 'banana_pro' (gemini-3-pro-image-preview)
         
         Returns:
             base64 编码的图片字符串
         """
         model_name = 'gemini-3-pro-image-preview' if model_level == 'banana_pro' else 'gemini-2.5-flash-image'
+        if aspect_ratio not in IMAGE_ASPECT_RATIOS:
+            raise ValueError(f"Unsupported aspect ratio '{aspect_ratio}', expected one of {', '.join(IMAGE_ASPECT_RATIOS)}")
         
         try:
-            import base64
-            
-            # 构建 parts - Python SDK 使用不同的格式
-            parts = []
-            if images:
-                for img in images:
-                    # 使用 genai 的 Part 对象
-                    parts.append({
-                        'inline_data': {
-                            'mime_type': img.get('mimeType', 'image/jpeg'),
-                            'data': img.get('data', '')
-                        }
-                    })
-            # 文本部分直接作为字符串
-            parts.append(prompt)
-            
-            # 创建模型实例 - 尝试在初始化时设置配置
-            try:
-                # 某些版本的 SDK 可能支持在模型初始化时设置
-                image_model = genai.GenerativeModel(
-                    model_name,
-                    generation_config={
-                        'response_modalities': ['IMAGE'],
-                        'image_config': {'aspect_ratio': aspect_ratio}
-                    }
-                )
-                response = image_model.generate_content(parts)
-            except (TypeError, AttributeError, ValueError) as e:
-                # 如果初始化时设置失败，尝试直接调用（让模型自动返回图片）
-                print(f"Model init with config failed: {e}, trying simple method")
-                image_model = genai.GenerativeModel(model_name)
-                # 直接调用，某些模型会自动返回图片
-                response = image_model.generate_content(parts)
+            contents = _image_contents(prompt, images)
+            # 模型不接受 image_config 时不指定宽高比（让模型自动返回图片）；协商结果按模型缓存
+            response = self.negotiate('image_config', model_name, [
+                ('image_config', lambda: self.client.models.generate_content(
+                    model=model_name,
+                    contents=contents,
+                    config=genai_types.GenerateContentConfig(
+                        response_modalities=['IMAGE'],
+                        image_config=genai_types.ImageConfig(aspect_ratio=aspect_ratio)
+                    )
+                )),
+                ('plain', lambda: self.client.models.generate_content(model=model_name, contents=contents)),
+            ], fields=('image_config', 'imageconfig', 'aspect_ratio', 'aspectratio'))
             
-            # 提取图片数据
-            if hasattr(response, 'candidates') and response.candidates:
-                candidate = response.candidates[0]
-                if hasattr(candidate, 'content') and candidate.content:
-                    response_parts = getattr(candidate.content, 'parts', [])
-                    for part in response_parts:
-                        inline_data = None
-                        if hasattr(part, 'inline_data') and part.inline_data:
-                            inline_data = part.inline_data
-                        elif hasattr(part, 'inlineData') and part.inlineData:
-                            inline_data = part.inlineData
-                        
-                        if inline_data:
-                            data = inline_data.data if hasattr(inline_data, 'data') else None
-                            if data:
-                                # 如果是 bytes，转换为 base64 字符串
-                                if isinstance(data, bytes):
-                                    return base64.b64encode(data).decode('utf-8')
-                                elif isinstance(data, str):
-                                    # 验证是否是 base64
-                                    try:
-                                        base64.b64decode(data)
-                                        return data
-                                    except:
-                                        return base64.b64encode(data.encode('utf-8')).decode('utf-8')
-            
-            raise ValueError("No image data in response")
+            return _extract_image(response)
         except Exception as e:
             print(f"Error generating image with aspect ratio: {e}")
             import traceback
@@ -289,48 +445,22 @@ class GeminiService:
             base64 编码的图片字符串
         """
         try:
-            import base64
-            
-            # Python SDK 可能使用不同的 API
-            # 尝试使用 genai.GenerativeModel 的 generate_content 方法
-            # 对于 Imagen，可能需要使用不同的模型名称或方法
             try:
-                # 尝试使用 imagen 模型的 generate_content
-                imagen_model = genai.GenerativeModel('imagen-4.0-generate-001')
-                response = imagen_model.generate_content(
-                    prompt,
-                    generation_config={
-                        'response_modalities': ['IMAGE'],
-                        'image_config': {'aspect_ratio': aspect_ratio}
-                    }
+                response = self.client.models.generate_images(
+                    model='imagen-4.0-generate-001',
+                    prompt=prompt,
+                    config=genai_types.GenerateImagesConfig(
+                        number_of_images=number_of_images,
+                        aspect_ratio=aspect_ratio
+                    )
                 )
-                
-                # 提取图片数据
-                if hasattr(response, 'candidates') and response.candidates:
-                    candidate = response.candidates[0]
-                    if hasattr(candidate, 'content') and candidate.content:
-                        response_parts = getattr(candidate.content, 'parts', [])
-                        for part in response_parts:
-                            inline_data = None
-                            if hasattr(part, 'inline_data') and part.inline_data:
-                                inline_data = part.inline_data
-                            elif hasattr(part, 'inlineData') and part.inlineData:
-                                inline_data = part.inlineData
-                            
-                            if inline_data:
-                                data = inline_data.data if hasattr(inline_data, 'data') else None
-                                if data:
-                                    if isinstance(data, bytes):
-                                        return base64.b64encode(data).decode('utf-8')
-                                    elif isinstance(data, str):
-                                        try:
-                                            base64.b64decode(data)
-                                            return data
-                                        except:
-                                            return base64.b64encode(data.encode('utf-8')).decode('utf-8')
-                
-                raise ValueError("No image data in response")
-            except (TypeError, AttributeError, ValueError) as e:
+                generated = response.generated_images or []
+                if not generated or not generated[0].image or not generated[0].image.image_bytes:
+                    raise ValueError("No image data in response")
+                return base64.b64encode(generated[0].image.image_bytes).decode('utf-8')
+            except Exception as e:
+                if not _is_config_error(e):
+                    raise
                 # 如果上述方法失败，回退到使用 gemini 图片模型
                 print(f"Imagen method failed: {e}, falling back to gemini image model")
                 return self.generate_image_with_aspect_ratio(
@@ -363,61 +493,20 @@ class GeminiService:
             base64 编码的图片字符串
         """
         try:
-            import base64
-            
             model_name = 'gemini-2.5-flash-image'
-            image_model = genai.GenerativeModel(model_name)
+            contents = _image_contents(prompt, [{'data': image_data, 'mimeType': mime_type}])
             
-            parts = [
-                {
-                    'inline_data': {
-                        'mime_type': mime_type,
-                        'data': image_data
-                    }
-                },
-                prompt
-            ]
+            # 如果 response_modalities 不被接受，直接调用；协商结果按模型缓存
+            response = self.negotiate('response_modalities', model_name, [
+                ('response_modalities', lambda: self.client.models.generate_content(
+                    model=model_name,
+                    contents=contents,
+                    config=genai_types.GenerateContentConfig(response_modalities=['IMAGE'])
+                )),
+                ('plain', lambda: self.client.models.generate_content(model=model_name, contents=contents)),
+            ], fields=('response_modalities', 'responsemodalities'))
             
-            # 配置生成参数 - 尝试在模型初始化时设置
-            try:
-                image_model = genai.GenerativeModel(
-                    model_name,
-                    generation_config={
-                        'response_modalities': ['IMAGE']
-                    }
-                )
-                response = image_model.generate_content(parts)
-            except (TypeError, AttributeError, ValueError) as e:
-                # 如果初始化时设置失败，尝试直接调用
-                print(f"Model init with config failed: {e}, trying simple method")
-                image_model = genai.GenerativeModel(model_name)
-                response = image_model.generate_content(parts)
-            
-            # 提取图片数据
-            if hasattr(response, 'candidates') and response.candidates:
-                candidate = response.candidates[0]
-                if hasattr(candidate, 'content') and candidate.content:
-                    response_parts = getattr(candidate.content, 'parts', [])
-                    for part in response_parts:
-                        inline_data = None
-                        if hasattr(part, 'inline_data') and part.inline_data:
-                            inline_data = part.inline_data
-                        elif hasattr(part, 'inlineData') and part.inlineData:
-                            inline_data = part.inlineData
-                        
-                        if inline_data:
-                            data = inline_data.data if hasattr(inline_data, 'data') else None
-                            if data:
-                                if isinstance(data, bytes):
-                                    return base64.b64encode(data).decode('utf-8')
-                                elif isinstance(data, str):
-                                    try:
-                                        base64.b64decode(data)
-                                        return data
-                                    except:
-                                        return base64.b64encode(data.encode('utf-8')).decode('utf-8')
-            
-            raise ValueError("No image data in response")
+            return _extract_image(response)
         except Exception as e:
             print(f"Error generating image with modality: {e}")
             import traceback
@@ -427,12 +516,15 @@ class GeminiService:
 
 # 全局实例
 _gemini_service: Optional[GeminiService] = None
+_gemini_service_lock = threading.Lock()
 
 def get_gemini_service() -> GeminiService:
-    """获取 Gemini 服务实例（单例）"""
+    """获取 Gemini 服务实例（单例，线程安全，可能由后台预热线程创建）"""
     global _gemini_service
     if _gemini_service is None:
-        _gemini_service = GeminiService()
+        with _gemini_service_lock:
+            if _gemini_service is None:
+                _gemini_service = GeminiService()
     return _gemini_service
 
 def get_gemini_service_safe():
@@ -443,3 +535,61 @@ def get_gemini_service_safe():
         from flask import jsonify
         return None, (jsonify({"error": str(e)}), 500)
 
+
+
+def _benchmark(calls: int = 300):
+    """
+    导入耗时、内存占用与单次调用开销基准测试
+    单次调用开销针对本地桩服务器测量（不访问 Gemini API，只包含 SDK 的请求构建、序列化与响应解析）
+    """
+    import json
+    import resource
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    started = time.perf_counter()
+    from google import genai
+    from google.genai import types
+    import_ms = (time.perf_counter() - started) * 1000
+
+    body = json.dumps({
+        'candidates': [{'content': {'role': 'model', 'parts': [{'text': '{"modality": "IMAGE"}'}]}, 'finishReason': 'STOP'}],
+        'usageMetadata': {'promptTokenCount': 10, 'candidatesTokenCount': 5},
+    }).encode()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        wbufsize = 65536
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = genai.Client(api_key='benchmark', http_options=types.HttpOptions(base_url=f'http://127.0.0.1:{server.server_address[1]}'))
+    service = GeminiService(client=client)
+    print(f"import google.genai  {import_ms:8.1f} ms   max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024} MB")
+    for label, kwargs in (
+        ('text', {}),
+        ('system_instruction', {'system_instruction': 'Classify the prompt.'}),
+        ('response_schema', {'response_schema': {'type': 'OBJECT', 'properties': {'modality': {'type': 'STRING'}}}}),
+    ):
+        service._generate(DEFAULT_MODEL, 'warm-up')
+        started = time.perf_counter()
+        for _ in range(calls):
+            service.generate_content('Classify: a drone shot', **kwargs)
+        print(f"{label:20s} {(time.perf_counter() - started) / calls * 1000:8.2f} ms/call")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    _benchmark()
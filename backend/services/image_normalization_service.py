@@ -0,0 +1,299 @@
+"""
+Image Normalization Service
+在把用户上传的图片发送给 Gemini / Veo 之前做一次规范化：
+- 只解码一次（JPEG 使用 draft 模式直接按缩小比例解码）
+- 按目标模型的有效输入分辨率缩小，按需裁剪或填充到目标 aspectRatio
+- 应用 EXIF 方向后去除全部元数据，重新编码为 JPEG（带透明通道时为 WebP，Veo 首帧/尾帧为 PNG）
+- needs_normalization 只解码 base64 头部判断是否需要处理，无需处理的大图可继续走流式上传
+- 结果按内容哈希缓存（LRU，按字节数限制），并统计每次调用节省的字节数
+"""
+
+import base64
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from utils.lazy_import import lazy_import
+from utils.media_probe import probe_base64_image
+
+PIL_Image = lazy_import('PIL.Image')
+PIL_ImageOps = lazy_import('PIL.ImageOps')
+
+# 是否启用规范化（关闭时原样透传）
+IMAGE_NORMALIZE_ENABLED = os.getenv('IMAGE_NORMALIZE_ENABLED', 'true').lower() == 'true'
+# 规范化结果缓存的字节上限
+IMAGE_NORMALIZE_CACHE_BYTES = int(os.getenv('IMAGE_NORMALIZE_CACHE_BYTES', str(64 * 1024 * 1024)))
+
+
+@dataclass(frozen=True)
+class NormalizationProfile:
+    """目标模型的输入规格"""
+    max_edge: int
+    # 'none'：保持原比例；'crop'：居中裁剪到目标比例；'pad'：填充到目标比例
+    fit: str = 'none'
+    quality: int = 90
+    # 带透明通道时的输出格式（'WEBP' 或 'PNG'）
+    alpha_format: str = 'WEBP'
+    # 目标模型接受的 MIME 类型（空表示不限制）；其他格式即使尺寸合适也需要转换
+    accepted_mime_types: Tuple[str, ...] = ()
+
+
+# 各调用场景的输入规格（可用 IMAGE_NORMALIZE_<NAME>_MAX_EDGE 覆盖）
+PROFILES: Dict[str, NormalizationProfile] = {
+    # gemini-2.5-flash-image / gemini-3-pro-image-preview 的参考图输入
+    'image_generation': NormalizationProfile(
+        max_edge=int(os.getenv('IMAGE_NORMALIZE_IMAGE_GENERATION_MAX_EDGE', '1536')), quality=90),
+    # Brand DNA 分析只需要理解风格和配色
+    'brand_dna': NormalizationProfile(
+        max_edge=int(os.getenv('IMAGE_NORMALIZE_BRAND_DNA_MAX_EDGE', '1024')), quality=85),
+    # Veo 首帧/尾帧：输出最高 1080p，且需要与视频比例一致；Veo 只接受 JPEG / PNG
+    'veo_frame': NormalizationProfile(
+        max_edge=int(os.getenv('IMAGE_NORMALIZE_VEO_FRAME_MAX_EDGE', '1920')), fit='crop', quality=92,
+        alpha_format='PNG', accepted_mime_types=('image/jpeg', 'image/png')),
+}
+
+
+@dataclass
+class NormalizedImage:
+    """规范化结果"""
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_bytes: int
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - len(self.data)
+
+
+def parse_aspect_ratio(aspect_ratio: Optional[str]) -> Optional[float]:
+    """把 '9:16' 之类的字符串解析为宽/高比例"""
+    if not aspect_ratio or ':' not in aspect_ratio:
+        return None
+    try:
+        w, h = (float(v) for v in aspect_ratio.split(':', 1))
+        return w / h if w > 0 and h > 0 else None
+    except ValueError:
+        return None
+
+
+def _target_size(width: int, height: int, profile: NormalizationProfile, ratio: Optional[float]) -> Tuple[int, int, Optional[Tuple[int, int, int, int]]]:
+    """
+    计算输出尺寸
+
+    Returns:
+        (out_w, out_h, crop_box)，crop_box 为原图坐标系中的裁剪区域（pad/none 时为 None）
+    """
+    crop_box = None
+    frame_w, frame_h = float(width), float(height)
+    if ratio and profile.fit == 'crop':
+        if width / height > ratio:
+            frame_w = height * ratio
+        else:
+            frame_h = width / ratio
+        left, top = (width - frame_w) / 2, (height - frame_h) / 2
+        crop_box = (round(left), round(top), round(left + frame_w), round(top + frame_h))
+    elif ratio and profile.fit == 'pad':
+        if width / height > ratio:
+            frame_h = width / ratio
+        else:
+            frame_w = height * ratio
+    scale = min(1.0, profile.max_edge / max(frame_w, frame_h))
+    return max(round(frame_w * scale), 1), max(round(frame_h * scale), 1), crop_box
+
+
+def _accepts(profile: NormalizationProfile, source_format: Optional[str]) -> bool:
+    """原图格式是否可以直接发送给目标模型"""
+    if not profile.accepted_mime_types:
+        return True
+    return f"image/{(source_format or '').lower()}" in profile.accepted_mime_types
+
+
+class ImageNormalizationService:
+    """图片规范化服务（线程安全，结果按内容哈希缓存）"""
+
+    def __init__(self, cache_bytes: int = IMAGE_NORMALIZE_CACHE_BYTES):
+        self.cache_bytes = cache_bytes
+        self._cache: "OrderedDict[Tuple[str, str, Optional[str]], NormalizedImage]" = OrderedDict()
+        self._cache_size = 0
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "cache_hits": 0, "passthrough": 0, "bytes_in": 0, "bytes_out": 0}
+
+    def normalize(self, image_bytes: bytes, profile_name: str, aspect_ratio: Optional[str] = None) -> NormalizedImage:
+        """
+        规范化图片
+
+        Args:
+            image_bytes: 原始图片字节
+            profile_name: PROFILES 中的场景名
+            aspect_ratio: 目标比例（如 '9:16'，仅 crop/pad 场景使用）
+
+        Raises:
+            ValueError: 无法解码的图片
+        """
+        profile = PROFILES[profile_name]
+        ratio = parse_aspect_ratio(aspect_ratio) if profile.fit != 'none' else None
+        key = (hashlib.sha256(image_bytes).hexdigest(), profile_name, aspect_ratio if ratio else None)
+
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.stats["calls"] += 1
+                self.stats["cache_hits"] += 1
+                self.stats["bytes_in"] += len(image_bytes)
+                self.stats["bytes_out"] += len(cached.data)
+                return cached
+
+        result = self._normalize(image_bytes, profile, ratio)
+
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["bytes_in"] += len(image_bytes)
+            self.stats["bytes_out"] += len(result.data)
+            if result.data is image_bytes:
+                self.stats["passthrough"] += 1
+            if key not in self._cache and len(result.data) <= self.cache_bytes:
+                self._cache[key] = result
+                self._cache_size += len(result.data)
+                while self._cache_size > self.cache_bytes:
+                    _, evicted = self._cache.popitem(last=False)
+                    self._cache_size -= len(evicted.data)
+
+        saved_pct = result.bytes_saved * 100 / max(len(image_bytes), 1)
+        print(f"[ImageNormalizationService] {profile_name}: {len(image_bytes)} -> {len(result.data)} bytes "
+              f"({result.width}x{result.height} {result.mime_type}, saved {saved_pct:.0f}%)")
+        return result
+
+    def _normalize(self, image_bytes: bytes, profile: NormalizationProfile, ratio: Optional[float]) -> NormalizedImage:
+        try:
+            image = PIL_Image.open(io.BytesIO(image_bytes))
+            source_format = image.format
+            width, height = image.size
+            # EXIF 方向为 5-8 时宽高互换
+            orientation = image.getexif().get(0x0112, 1)
+            if orientation in (5, 6, 7, 8):
+                width, height = height, width
+            out_w, out_h, crop_box = _target_size(width, height, profile, ratio)
+
+            # 无需缩放/裁剪/填充、且已是无元数据的高效格式时，原样透传
+            if (out_w, out_h) == (width, height) and crop_box is None and orientation == 1 \
+                    and source_format in ('JPEG', 'WEBP') and _accepts(profile, source_format) \
+                    and not image.info.get('exif') and not image.info.get('icc_profile'):
+                return NormalizedImage(image_bytes, f"image/{source_format.lower()}", width, height, len(image_bytes))
+
+            if source_format == 'JPEG':
+                # 按最终尺寸直接以 1/2、1/4、1/8 比例解码，减少解码和缩放开销
+                scale = max(out_w / (crop_box[2] - crop_box[0]) if crop_box else out_w / width, 1e-6)
+                draft_w, draft_h = (round(image.size[0] * scale), round(image.size[1] * scale))
+                image.draft('RGB', (draft_w, draft_h))
+            image = PIL_ImageOps.exif_transpose(image)
+        except Exception as e:
+            raise ValueError(f"Unable to decode image: {e}") from e
+
+        has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+        if crop_box:
+            # draft 解码后图片尺寸可能已缩小，按比例换算裁剪区域
+            sx, sy = image.size[0] / width, image.size[1] / height
+            image = image.crop((round(crop_box[0] * sx), round(crop_box[1] * sy),
+                                round(crop_box[2] * sx), round(crop_box[3] * sy)))
+        if profile.fit == 'pad' and ratio:
+            image = self._pad(image, ratio, has_alpha)
+        if image.size != (out_w, out_h):
+            image = image.resize((out_w, out_h), PIL_Image.LANCZOS, reducing_gap=3.0)
+
+        buffer = io.BytesIO()
+        if has_alpha and profile.alpha_format == 'PNG':
+            image.save(buffer, format='PNG', optimize=True)
+            mime_type = 'image/png'
+        elif has_alpha:
+            image.save(buffer, format='WEBP', quality=profile.quality, method=4)
+            mime_type = 'image/webp'
+        else:
+            image.save(buffer, format='JPEG', quality=profile.quality, optimize=True)
+            mime_type = 'image/jpeg'
+        data = buffer.getvalue()
+        # 仅格式转换且结果更大时保留原图（原格式不被目标模型接受时除外）
+        if len(data) >= len(image_bytes) and (out_w, out_h) == (width, height) and not crop_box and profile.fit != 'pad' \
+                and _accepts(profile, source_format):
+            return NormalizedImage(image_bytes, f"image/{(source_format or 'jpeg').lower()}", width, height, len(image_bytes))
+        return NormalizedImage(data, mime_type, out_w, out_h, len(image_bytes))
+
+    @staticmethod
+    def _pad(image, ratio: float, has_alpha: bool):
+        """居中填充到目标比例（透明图片填充透明，否则填充黑色）"""
+        width, height = image.size
+        if abs(width / height - ratio) < 1e-3:
+            return image
+        if width / height > ratio:
+            canvas_size = (width, round(width / ratio))
+        else:
+            canvas_size = (round(height * ratio), height)
+        canvas = PIL_Image.new(image.mode, canvas_size, (0, 0, 0, 0) if has_alpha else (0, 0, 0))
+        canvas.paste(image, ((canvas_size[0] - width) // 2, (canvas_size[1] - height) // 2))
+        return canvas
+
+    def needs_normalization(self, part: Dict[str, Any], profile_name: str) -> bool:
+        """
+        只解码 base64 头部，判断图片是否需要规范化：尺寸超过该场景的 max_edge，或格式不被目标模型接受
+        无法识别头部时按需要处理；不需要时调用方可直接流式上传原图，避免完整解码到内存
+        """
+        if not IMAGE_NORMALIZE_ENABLED:
+            return False
+        profile = PROFILES[profile_name]
+        info = probe_base64_image(part.get('data') or '')
+        if info is None or not info.width or not info.height:
+            return True
+        if profile.accepted_mime_types and info.mime_type not in profile.accepted_mime_types:
+            return True
+        return max(info.width, info.height) > profile.max_edge
+
+    def normalize_part(self, part: Dict[str, Any], profile_name: str, aspect_ratio: Optional[str] = None) -> Dict[str, Any]:
+        """
+        规范化 {"data": base64_string, "mimeType": str} 形式的图片
+
+        未启用或处理失败时原样返回，不影响后续调用
+        """
+        data_str = part.get('data') or ''
+        if not IMAGE_NORMALIZE_ENABLED or not data_str:
+            return part
+        try:
+            if data_str.startswith('data:') and ',' in data_str[:256]:
+                data_str = data_str.split(',', 1)[1]
+            result = self.normalize(base64.b64decode(data_str), profile_name, aspect_ratio)
+        except Exception as e:
+            print(f"[ImageNormalizationService] ⚠️ Normalization skipped ({profile_name}): {e}")
+            return part
+        normalized = dict(part)
+        normalized['data'] = base64.b64encode(result.data).decode('ascii')
+        normalized['mimeType'] = result.mime_type
+        return normalized
+
+    def get_stats(self) -> Dict[str, Any]:
+        """累计统计（含节省的字节数与缓存命中率）"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["bytes_saved"] = stats["bytes_in"] - stats["bytes_out"]
+            stats["cache_entries"] = len(self._cache)
+            stats["cache_bytes"] = self._cache_size
+        return stats
+
+
+_normalization_service: Optional[ImageNormalizationService] = None
+_normalization_service_lock = threading.Lock()
+
+
+def get_image_normalization_service() -> ImageNormalizationService:
+    """获取 ImageNormalizationService 单例"""
+    global _normalization_service
+    if _normalization_service is None:
+        with _normalization_service_lock:
+            if _normalization_service is None:
+                _normalization_service = ImageNormalizationService()
+    return _normalization_service
@@ -0,0 +1,275 @@
+"""
+Image Upscale Service
+本地 CPU 图片放大引擎（用于 /api/reel/upscale）
+- 默认使用向量化 NumPy 实现的可分离 Lanczos3 / Bicubic 重采样，按输出行分块在线程池中并行处理
+- 可选：配置 UPSCALE_ONNX_MODEL_PATH 后使用 ONNX Runtime（CPU）超分模型，按图块推理
+处理的是输入图片本身的像素，不再调用远程生成模型
+"""
+
+import base64
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from utils.lazy_import import lazy_import
+
+# numpy / Pillow 只在放大时使用，延迟加载
+np = lazy_import('numpy')
+PIL_Image = lazy_import('PIL.Image')
+
+# 默认重采样方法：lanczos | bicubic | onnx
+UPSCALE_METHOD = os.getenv('UPSCALE_METHOD', 'lanczos').lower()
+# 可选的 ONNX 超分模型（输入 NCHW float32 RGB [0,1]，输出放大 UPSCALE_ONNX_SCALE 倍）
+UPSCALE_ONNX_MODEL_PATH = os.getenv('UPSCALE_ONNX_MODEL_PATH')
+UPSCALE_ONNX_SCALE = int(os.getenv('UPSCALE_ONNX_SCALE', '4'))
+# 分块大小（NumPy：每块输出行数；ONNX：每块输入边长）
+UPSCALE_TILE_SIZE = int(os.getenv('UPSCALE_TILE_SIZE', '256'))
+UPSCALE_WORKERS = int(os.getenv('UPSCALE_WORKERS', str(min(os.cpu_count() or 2, 8))))
+# 输出像素上限，防止 4x 放大超大图片耗尽内存
+UPSCALE_MAX_OUTPUT_PIXELS = int(os.getenv('UPSCALE_MAX_OUTPUT_PIXELS', str(40_000_000)))
+
+SUPPORTED_FACTORS = (2, 4)
+# ONNX 图块之间的重叠像素，避免拼接处出现接缝
+_ONNX_TILE_OVERLAP = 8
+
+
+def _lanczos_kernel(x, a: int = 3):
+    x = np.abs(x)
+    result = np.sinc(x) * np.sinc(x / a)
+    return np.where(x < a, result, 0.0)
+
+
+def _bicubic_kernel(x, a: float = -0.5):
+    x = np.abs(x)
+    x2, x3 = x * x, x * x * x
+    near = (a + 2) * x3 - (a + 3) * x2 + 1
+    far = a * x3 - 5 * a * x2 + 8 * a * x - 4 * a
+    return np.where(x <= 1, near, np.where(x < 2, far, 0.0))
+
+
+_KERNELS = {
+    'lanczos': (_lanczos_kernel, 3),
+    'bicubic': (_bicubic_kernel, 2),
+}
+
+
+def _resample_taps(in_size: int, out_size: int, method: str):
+    """
+    计算一维重采样的采样位置和权重
+
+    Returns:
+        (indices, weights)，形状均为 (out_size, taps)
+    """
+    kernel, support = _KERNELS[method]
+    scale = out_size / in_size
+    # 缩小时需要放宽核函数以抗锯齿
+    filter_scale = min(scale, 1.0)
+    radius = support / filter_scale
+    taps = int(np.ceil(radius)) * 2 + 1
+    centers = (np.arange(out_size, dtype=np.float64) + 0.5) / scale - 0.5
+    left = np.floor(centers - radius).astype(np.int64) + 1
+    indices = left[:, None] + np.arange(taps)[None, :]
+    weights = kernel((centers[:, None] - indices) * filter_scale)
+    weights /= weights.sum(axis=1, keepdims=True)
+    return np.clip(indices, 0, in_size - 1), weights.astype(np.float32)
+
+
+def _apply_taps(arr, indices, weights, axis: int):
+    """沿指定轴执行加权求和（逐个 tap 累加，内存占用与输出大小成正比）"""
+    out = None
+    for k in range(indices.shape[1]):
+        gathered = np.take(arr, indices[:, k], axis=axis)
+        w = weights[:, k].reshape((-1, 1, 1) if axis == 0 else (1, -1, 1))
+        term = gathered * w
+        out = term if out is None else out + term
+    return out
+
+
+def resize_array(arr, out_h: int, out_w: int, method: str = 'lanczos',
+                 executor: Optional[ThreadPoolExecutor] = None, tile_rows: int = UPSCALE_TILE_SIZE):
+    """
+    可分离重采样 (H, W, C) uint8 数组
+
+    按输出行分块：每块只对所需的输入行做水平重采样，再做垂直重采样，
+    各块在线程池中并行执行（NumPy 运算期间释放 GIL）
+    """
+    in_h, in_w = arr.shape[:2]
+    y_idx, y_w = _resample_taps(in_h, out_h, method)
+    x_idx, x_w = _resample_taps(in_w, out_w, method)
+    out = np.empty((out_h, out_w, arr.shape[2]), dtype=np.uint8)
+
+    def process(start: int):
+        stop = min(start + tile_rows, out_h)
+        rows = y_idx[start:stop]
+        row_lo, row_hi = int(rows.min()), int(rows.max()) + 1
+        band = arr[row_lo:row_hi].astype(np.float32)
+        horizontal = _apply_taps(band, x_idx, x_w, axis=1)
+        vertical = _apply_taps(horizontal, rows - row_lo, y_w[start:stop], axis=0)
+        out[start:stop] = np.clip(vertical + 0.5, 0, 255).astype(np.uint8)
+
+    starts = range(0, out_h, tile_rows)
+    if executor is None:
+        for start in starts:
+            process(start)
+    else:
+        list(executor.map(process, starts))
+    return out
+
+
+class OnnxSuperResolution:
+    """ONNX Runtime CPU 超分模型（按图块推理）"""
+
+    def __init__(self, model_path: str, scale: int):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = 1  # 并行度由图块线程池提供
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.scale = scale
+
+    def upscale_rgb(self, rgb, executor: ThreadPoolExecutor, tile: int = UPSCALE_TILE_SIZE):
+        """放大 (H, W, 3) uint8 RGB 数组，返回 (H*scale, W*scale, 3)"""
+        h, w = rgb.shape[:2]
+        s, pad = self.scale, _ONNX_TILE_OVERLAP
+        out = np.empty((h * s, w * s, 3), dtype=np.uint8)
+
+        def process(origin: Tuple[int, int]):
+            y, x = origin
+            y0, x0 = max(y - pad, 0), max(x - pad, 0)
+            y1, x1 = min(y + tile + pad, h), min(x + tile + pad, w)
+            patch = rgb[y0:y1, x0:x1].astype(np.float32).transpose(2, 0, 1)[None] / 255.0
+            result = self.session.run(None, {self.input_name: patch})[0][0]
+            result = np.clip(result.transpose(1, 2, 0) * 255.0 + 0.5, 0, 255).astype(np.uint8)
+            ty, tx = (y - y0) * s, (x - x0) * s
+            th, tw = (min(y + tile, h) - y) * s, (min(x + tile, w) - x) * s
+            out[y * s:y * s + th, x * s:x * s + tw] = result[ty:ty + th, tx:tx + tw]
+
+        origins = [(y, x) for y in range(0, h, tile) for x in range(0, w, tile)]
+        list(executor.map(process, origins))
+        return out
+
+
+class ImageUpscaleService:
+    """本地图片放大服务"""
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=UPSCALE_WORKERS, thread_name_prefix='upscale')
+        self._onnx: Optional[OnnxSuperResolution] = None
+        self._onnx_error: Optional[str] = None
+        self._onnx_lock = threading.Lock()
+
+    def _get_onnx_model(self) -> Optional[OnnxSuperResolution]:
+        """加载 ONNX 模型（未配置、未安装 onnxruntime 或加载失败时返回 None）"""
+        if not UPSCALE_ONNX_MODEL_PATH or self._onnx_error:
+            return None
+        if self._onnx is None:
+            with self._onnx_lock:
+                if self._onnx is None and not self._onnx_error:
+                    try:
+                        self._onnx = OnnxSuperResolution(UPSCALE_ONNX_MODEL_PATH, UPSCALE_ONNX_SCALE)
+                        print(f"[ImageUpscaleService] ✅ Loaded ONNX model: {UPSCALE_ONNX_MODEL_PATH}")
+                    except Exception as e:
+                        self._onnx_error = str(e)
+                        print(f"[ImageUpscaleService] ⚠️ ONNX model unavailable, using NumPy resampling: {e}")
+        return self._onnx
+
+    def upscale(self, image_bytes: bytes, factor: int, method: Optional[str] = None) -> Dict[str, Any]:
+        """
+        放大图片
+
+        Args:
+            image_bytes: 原始图片字节
+            factor: 放大倍数（2 或 4）
+            method: 'lanczos' | 'bicubic' | 'onnx'（默认 UPSCALE_METHOD）
+
+        Returns:
+            {"data": bytes, "mimeType", "width", "height", "engine", "timings": {stage: ms}}
+        """
+        if not isinstance(factor, int) or factor not in SUPPORTED_FACTORS:
+            raise ValueError(f"Unsupported upscale factor: {factor!r} (expected 2 or 4)")
+        method = (method or UPSCALE_METHOD).lower()
+        if method not in ('lanczos', 'bicubic', 'onnx'):
+            raise ValueError(f"Unsupported upscale method: {method}")
+
+        timings = {}
+        started = time.time()
+        try:
+            image = PIL_Image.open(io.BytesIO(image_bytes))
+            source_format = (image.format or 'PNG').upper()
+            has_alpha = image.mode in ('RGBA', 'LA') or 'transparency' in image.info
+            pixels = np.asarray(image.convert('RGBA' if has_alpha else 'RGB'))
+        except (PIL_Image.UnidentifiedImageError, PIL_Image.DecompressionBombError, OSError) as e:
+            # 非图片、截断或超大（解压炸弹）的输入属于请求错误
+            raise ValueError(f"Invalid image data: {e}") from e
+        timings['decode'] = round((time.time() - started) * 1000, 1)
+
+        in_h, in_w = pixels.shape[:2]
+        out_h, out_w = in_h * factor, in_w * factor
+        if out_h * out_w > UPSCALE_MAX_OUTPUT_PIXELS:
+            raise ValueError(f"Output {out_w}x{out_h} exceeds the {UPSCALE_MAX_OUTPUT_PIXELS} pixel limit")
+
+        started = time.time()
+        onnx_model = self._get_onnx_model() if method == 'onnx' else None
+        if onnx_model is not None:
+            engine = 'onnx'
+            upscaled = onnx_model.upscale_rgb(pixels[..., :3], self.executor)
+            if upscaled.shape[:2] != (out_h, out_w):
+                upscaled = resize_array(upscaled, out_h, out_w, 'lanczos', self.executor)
+            if has_alpha:
+                alpha = resize_array(pixels[..., 3:], out_h, out_w, 'lanczos', self.executor)
+                upscaled = np.concatenate([upscaled, alpha], axis=2)
+        else:
+            engine = 'bicubic' if method == 'bicubic' else 'lanczos'
+            upscaled = resize_array(pixels, out_h, out_w, engine, self.executor)
+        timings['resample'] = round((time.time() - started) * 1000, 1)
+
+        started = time.time()
+        data, mime_type = encode_image(upscaled, source_format)
+        timings['encode'] = round((time.time() - started) * 1000, 1)
+
+        return {
+            "data": data,
+            "mimeType": mime_type,
+            "width": out_w,
+            "height": out_h,
+            "engine": engine,
+            "timings": timings,
+        }
+
+
+def encode_image(pixels, source_format: str = 'PNG') -> Tuple[bytes, str]:
+    """按输入格式编码（JPEG 保持 JPEG，WebP 保持 WebP，其他使用 PNG）"""
+    image = PIL_Image.fromarray(pixels)
+    buffer = io.BytesIO()
+    if source_format == 'JPEG' and image.mode == 'RGB':
+        image.save(buffer, format='JPEG', quality=95)
+        return buffer.getvalue(), 'image/jpeg'
+    if source_format == 'WEBP':
+        image.save(buffer, format='WEBP', quality=95)
+        return buffer.getvalue(), 'image/webp'
+    image.save(buffer, format='PNG', compress_level=3)
+    return buffer.getvalue(), 'image/png'
+
+
+_upscale_service: Optional[ImageUpscaleService] = None
+_upscale_service_lock = threading.Lock()
+
+
+def get_image_upscale_service() -> ImageUpscaleService:
+    """获取 ImageUpscaleService 单例"""
+    global _upscale_service
+    if _upscale_service is None:
+        with _upscale_service_lock:
+            if _upscale_service is None:
+                _upscale_service = ImageUpscaleService()
+    return _upscale_service
+
+
+def decode_base64_image(base64_data: str) -> bytes:
+    """解码 base64 图片（兼容 data URI 前缀）"""
+    if base64_data.startswith('data:') and ',' in base64_data[:256]:
+        base64_data = base64_data.split(',', 1)[1]
+    return base64.b64decode(base64_data)
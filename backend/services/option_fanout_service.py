@@ -0,0 +1,289 @@
+"""
+Option Fan-out Service
+/enhance-prompt 与 /design-plan 的多方案生成：每个方案用聚焦的单方案提示词并发生成，按完成顺序返回
+- 三次调用共享同一 system instruction（利于 Gemini 前缀缓存），总延迟约等于最慢的单个方案，而不是三个方案的总输出长度
+- 所有方案都失败时回退为原来的单次调用（一次生成完整 JSON 数组）
+- 按 endpoint / 模式记录墙钟延迟与 token 消耗（优先使用响应的 usage_metadata，缺失时估算），用于比较两种模式
+- 默认关闭：三次调用各自发送完整的 system instruction 与上下文，输入 token 约为单次调用的三倍，
+  先用 `python -m services.option_fanout_service` 对比两种模式后再通过 OPTION_FANOUT_ENABLED 开启
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from utils.prompt_templates import estimate_tokens
+
+OPTION_FANOUT_ENABLED = os.getenv('OPTION_FANOUT_ENABLED', 'false').lower() == 'true'
+# 所有请求共享的单方案生成线程数
+OPTION_FANOUT_WORKERS = int(os.getenv('OPTION_FANOUT_WORKERS', '12'))
+# 单次请求等待全部方案的最长时间，超时的方案按失败处理；每次模型调用的 HTTP 超时不超过剩余时间，超时后不再占用线程
+OPTION_FANOUT_TIMEOUT_SECONDS = float(os.getenv('OPTION_FANOUT_TIMEOUT_SECONDS', '60'))
+OPTION_MODEL = 'gemini-2.5-flash'
+
+# 各方案的创意方向（与单次调用提示词中的 A/B/C 方案一致；图片提示词原本没有固定方向，这里补充三个，避免并发调用给出雷同方案）
+ENHANCE_VIDEO_OPTIONS = (
+    "**Option A (Realistic/Cinematic)**: Focus on photorealism, movie-like quality, high-end production value (ARRI/IMAX aesthetics).",
+    "**Option B (Creative/Stylized)**: Focus on unique art styles, animation (e.g., claymation, cyber-anime), or surreal visuals.",
+    "**Option C (Dynamic/Action)**: Focus on speed, intense motion, fast cuts, and visual impact.",
+)
+ENHANCE_IMAGE_OPTIONS = (
+    "**Direction A (Photographic/Realistic)**: Professional photography, natural or studio lighting, true-to-life materials and lens choices.",
+    "**Direction B (Artistic/Illustrative)**: A distinctive art style such as illustration, painting, 3D render or anime, with a strong color palette.",
+    "**Direction C (Bold/Conceptual)**: An unexpected composition, surreal or graphic concept, high visual impact.",
+)
+DESIGN_VIDEO_OPTIONS = (
+    "**Scheme A: Cinematic Masterpiece** (Realistic, Physical Light, High-end Camera).",
+    "**Scheme B: Avant-Garde / Stylized** (Unique Art Style, Animation, Mixed Media).",
+    "**Scheme C: Commercial / Dynamic** (High Impact, Fast Paced, Product Showcase).",
+)
+DESIGN_IMAGE_OPTIONS = (
+    "**Strategy A: Authentic / Lifestyle** (Real-world scenes, natural light, relatable moments).",
+    "**Strategy B: Artistic / Stylized** (A distinctive illustration, painting or 3D style with a bold palette).",
+    "**Strategy C: Commercial / Graphic** (Clean product-focused composition, strong typography space, high contrast).",
+)
+
+
+@dataclass
+class OptionResult:
+    index: int
+    option: Optional[Dict[str, Any]]
+    error: Optional[str] = None
+    mode: str = 'fanout'
+
+
+@dataclass
+class _CallUsage:
+    input_tokens: int
+    output_tokens: int
+
+
+def _response_text(response) -> str:
+    """读取响应文本；.text 不可用时拼接首个候选的文本片段"""
+    try:
+        if getattr(response, 'text', None):
+            return response.text.strip()
+    except Exception:
+        pass
+    candidates = getattr(response, 'candidates', None) or []
+    parts = getattr(getattr(candidates[0], 'content', None), 'parts', None) or [] if candidates else []
+    return ' '.join(part.text for part in parts if getattr(part, 'text', None)).strip()
+
+
+def _usage(response, prompt: str, system_instruction: str, text: str) -> _CallUsage:
+    """优先读取 usage_metadata，旧 SDK 或测试替身没有时按文本估算"""
+    metadata = getattr(response, 'usage_metadata', None)
+    input_tokens = getattr(metadata, 'prompt_token_count', None) if metadata is not None else None
+    output_tokens = getattr(metadata, 'candidates_token_count', None) if metadata is not None else None
+    if not isinstance(input_tokens, int):
+        input_tokens = estimate_tokens(prompt) + estimate_tokens(system_instruction)
+    if not isinstance(output_tokens, int):
+        output_tokens = estimate_tokens(text)
+    return _CallUsage(input_tokens=input_tokens, output_tokens=output_tokens)
+
+
+class OptionFanoutService:
+    """多方案并发生成与单次调用回退"""
+
+    def __init__(self, workers: int = OPTION_FANOUT_WORKERS, timeout: float = OPTION_FANOUT_TIMEOUT_SECONDS):
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='option-fanout')
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def generate(
+        self,
+        endpoint: str,
+        gemini,
+        single_prompt: str,
+        option_prompts: List[str],
+        parse_option: Callable[[str], Optional[Dict[str, Any]]],
+        parse_list: Callable[[str], List[Dict[str, Any]]],
+        system_instruction: str = '',
+        fanout: bool = True,
+        option_schema: Optional[Dict[str, Any]] = None,
+        list_schema: Optional[Dict[str, Any]] = None,
+    ) -> Iterator[OptionResult]:
+        """
+        按完成顺序产出各方案
+
+        Args:
+            endpoint: 统计用名称（如 'enhance-prompt/video'）
+            single_prompt: 单次调用模式的提示词（返回 JSON 数组）
+            option_prompts: 每个方案的聚焦提示词（返回单个 JSON 对象）
+            parse_option / parse_list: 解析模型输出，失败时分别返回 None / []
+            fanout: False 时直接使用单次调用模式
+            option_schema / list_schema: 两种模式的结构化输出 schema（可选）
+        """
+        if fanout and option_prompts:
+            succeeded = 0
+            for result in self._fanout(endpoint, gemini, option_prompts, parse_option, system_instruction, option_schema):
+                succeeded += result.option is not None
+                yield result
+            if succeeded:
+                return
+            print(f"[OptionFanoutService] ⚠️ All {len(option_prompts)} options failed for {endpoint}, falling back to single call")
+            self._record(endpoint, 'fanout', fallbacks=1)
+        yield from self._single(endpoint, gemini, single_prompt, parse_list, system_instruction, list_schema)
+
+    def _call(self, gemini, prompt: str, system_instruction: str, schema=None,
+              deadline: Optional[float] = None) -> Tuple[str, _CallUsage]:
+        kwargs: Dict[str, Any] = {'response_schema': schema} if schema is not None else {}
+        if deadline is not None:
+            # 排队到截止时间之后才开始的方案直接跳过，不再发起模型调用
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise FutureTimeoutError('Option generation timed out before it started')
+            kwargs['timeout'] = remaining
+        response = gemini.generate_content(prompt, model=OPTION_MODEL, system_instruction=system_instruction or None, **kwargs)
+        text = _response_text(response)
+        return text, _usage(response, prompt, system_instruction, text)
+
+    def _fanout(self, endpoint, gemini, option_prompts, parse_option, system_instruction, schema) -> Iterator[OptionResult]:
+        started = time.time()
+        deadline = started + self.timeout
+        futures = {
+            self.executor.submit(self._call, gemini, prompt, system_instruction, schema, deadline): index
+            for index, prompt in enumerate(option_prompts)
+        }
+        pending = set(futures)
+        first_latency = None
+        input_tokens = output_tokens = failures = 0
+        try:
+            for future in as_completed(futures, timeout=self.timeout):
+                pending.discard(future)
+                index = futures[future]
+                try:
+                    text, usage = future.result()
+                    input_tokens += usage.input_tokens
+                    output_tokens += usage.output_tokens
+                    option = parse_option(text)
+                    if option is None:
+                        raise ValueError('Model returned no valid option')
+                except Exception as e:
+                    failures += 1
+                    print(f"[OptionFanoutService] ❌ {endpoint} option {index} failed: {e}")
+                    yield OptionResult(index=index, option=None, error=str(e))
+                    continue
+                if first_latency is None:
+                    first_latency = time.time() - started
+                yield OptionResult(index=index, option=option)
+        except FutureTimeoutError:
+            for future in pending:
+                # 排队中的方案直接取消；已开始的调用受 HTTP 超时限制，很快释放线程
+                future.cancel()
+                failures += 1
+                yield OptionResult(index=futures[future], option=None, error='Option generation timed out')
+        latency = time.time() - started
+        self._record(endpoint, 'fanout', latency=latency, first_latency=first_latency or latency,
+                     options=len(option_prompts) - failures, failures=failures,
+                     input_tokens=input_tokens, output_tokens=output_tokens)
+        print(f"[OptionFanoutService] {endpoint} fanout: {len(option_prompts) - failures}/{len(option_prompts)} options "
+              f"in {latency:.2f}s (first {first_latency or latency:.2f}s), {input_tokens}+{output_tokens} tokens")
+
+    def _single(self, endpoint, gemini, prompt, parse_list, system_instruction, schema) -> Iterator[OptionResult]:
+        started = time.time()
+        try:
+            text, usage = self._call(gemini, prompt, system_instruction, schema)
+        except Exception:
+            self._record(endpoint, 'single', latency=time.time() - started, failures=1)
+            raise
+        options = [option for option in parse_list(text) if isinstance(option, dict)]
+        latency = time.time() - started
+        self._record(endpoint, 'single', latency=latency, first_latency=latency, options=len(options),
+                     failures=0 if options else 1, input_tokens=usage.input_tokens, output_tokens=usage.output_tokens)
+        print(f"[OptionFanoutService] {endpoint} single: {len(options)} options in {latency:.2f}s, "
+              f"{usage.input_tokens}+{usage.output_tokens} tokens")
+        for index, option in enumerate(options):
+            yield OptionResult(index=index, option=option, mode='single')
+
+    def _record(self, endpoint: str, mode: str, latency: float = 0.0, first_latency: float = 0.0, options: int = 0,
+                failures: int = 0, fallbacks: int = 0, input_tokens: int = 0, output_tokens: int = 0):
+        with self._lock:
+            stats = self._stats.setdefault(f"{endpoint}/{mode}", {
+                'requests': 0, 'options': 0, 'failures': 0, 'fallbacks': 0, 'totalSeconds': 0.0,
+                'firstOptionSeconds': 0.0, 'inputTokens': 0, 'outputTokens': 0,
+            })
+            stats['requests'] += 0 if fallbacks else 1
+            stats['options'] += options
+            stats['failures'] += failures
+            stats['fallbacks'] += fallbacks
+            stats['totalSeconds'] += latency
+            stats['firstOptionSeconds'] += first_latency
+            stats['inputTokens'] += input_tokens
+            stats['outputTokens'] += output_tokens
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """各 endpoint / 模式的请求数、平均延迟（全部完成 / 首个方案）和平均 token 消耗"""
+        with self._lock:
+            report = {}
+            for name, stats in self._stats.items():
+                requests = max(1, stats['requests'])
+                report[name] = {
+                    **stats,
+                    'avgSeconds': round(stats['totalSeconds'] / requests, 3),
+                    'avgFirstOptionSeconds': round(stats['firstOptionSeconds'] / requests, 3),
+                    'avgTokens': round((stats['inputTokens'] + stats['outputTokens']) / requests),
+                }
+            return report
+
+
+_fanout_service: Optional[OptionFanoutService] = None
+_fanout_service_lock = threading.Lock()
+
+
+def get_option_fanout_service() -> OptionFanoutService:
+    """获取 OptionFanoutService 单例"""
+    global _fanout_service
+    if _fanout_service is None:
+        with _fanout_service_lock:
+            if _fanout_service is None:
+                _fanout_service = OptionFanoutService()
+    return _fanout_service
+
+
+def _benchmark(idea: str = 'a cup of coffee on a rainy morning', rounds: int = 3):
+    """对 /enhance-prompt 的两种模式调用真实 Gemini，比较墙钟延迟与 token 消耗（需要 GEMINI_API_KEY）"""
+    import json
+    from services.gemini_service import get_gemini_service
+    from utils.prompt_templates import render_prompt
+    from utils.response_schemas import ENHANCED_PROMPT, ENHANCED_PROMPT_LIST
+
+    def parse_option(text):
+        try:
+            value = json.loads(text.strip().removeprefix('```json').removesuffix('```'))
+        except ValueError:
+            return None
+        value = value[0] if isinstance(value, list) and value else value
+        return value if isinstance(value, dict) else None
+
+    def parse_list(text):
+        try:
+            value = json.loads(text.strip().removeprefix('```json').removesuffix('```'))
+        except ValueError:
+            return []
+        return value if isinstance(value, list) else []
+
+    gemini = get_gemini_service()
+    service = OptionFanoutService()
+    system_instruction = render_prompt('enhance_prompt_image_system', brand_context='')
+    single_prompt = render_prompt('enhance_prompt_image_user', prompt=idea, brand_context='')
+    option_prompts = [
+        render_prompt('enhance_prompt_image_option', prompt=idea, brand_context='', option=option)
+        for option in ENHANCE_IMAGE_OPTIONS
+    ]
+    for _ in range(rounds):
+        for fanout in (True, False):
+            list(service.generate('benchmark', gemini, single_prompt, option_prompts, parse_option, parse_list,
+                                  system_instruction=system_instruction, fanout=fanout,
+                                  option_schema=ENHANCED_PROMPT, list_schema=ENHANCED_PROMPT_LIST))
+    for name, stats in service.stats().items():
+        print(f"{name:20s} {stats['avgSeconds']:>6.2f}s total  {stats['avgFirstOptionSeconds']:>6.2f}s first  "
+              f"{stats['avgTokens']:>6} tokens  ({stats['requests']} requests, {stats['failures']} failures)")
+
+
+if __name__ == '__main__':
+    _benchmark()
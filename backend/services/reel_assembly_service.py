@@ -0,0 +1,513 @@
+"""
+Reel Assembly Service
+把多个生成的视频片段拼接为一条成片（默认 9:16）
+- 先用 ffprobe 读取各片段的编码参数；参数一致且不需要转场时使用 concat demuxer 直接复制视频流，不重新编码
+- 有共享背景音乐时仍复制视频流，只编码音频
+- 需要交叉淡化（xfade / acrossfade）或片段尺寸、编码不一致时才重新编码
+- 任务在 worker 线程池中执行，通过 ffmpeg -progress 实时更新进度；成片上传到 Storage，并通过视频代理播放
+"""
+
+import base64
+import datetime
+import json
+import math
+import os
+import secrets
+import shutil
+import subprocess
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.firebase_registry import get_firestore_client, get_storage_bucket
+from services.firestore_write_buffer import get_firestore_write_buffer
+from services.image_normalization_service import parse_aspect_ratio
+from services.video_proxy_service import get_video_proxy_service, is_valid_video_id
+from services.video_transfer_service import VIDEO_UPLOAD_CHUNK_SIZE
+from services.video_frame_service import FFMPEG_BINARY, get_video_frame_service
+
+FFPROBE_BINARY = os.getenv('FFPROBE_BINARY', 'ffprobe')
+# 同时执行的拼接任务数（ffmpeg 本身是多线程的）
+REEL_ASSEMBLY_WORKERS = int(os.getenv('REEL_ASSEMBLY_WORKERS', '2'))
+REEL_ASSEMBLY_MAX_CLIPS = int(os.getenv('REEL_ASSEMBLY_MAX_CLIPS', '12'))
+REEL_ASSEMBLY_MAX_CROSSFADE = float(os.getenv('REEL_ASSEMBLY_MAX_CROSSFADE', '2'))
+REEL_ASSEMBLY_MAX_AUDIO_BYTES = int(os.getenv('REEL_ASSEMBLY_MAX_AUDIO_BYTES', str(20 * 1024 * 1024)))
+# 背景音乐音量上限（1.0 为原音量）
+REEL_ASSEMBLY_MAX_BED_VOLUME = float(os.getenv('REEL_ASSEMBLY_MAX_BED_VOLUME', '2'))
+# 内存中保留的已结束任务数（结果已写入 Firestore，淘汰后从 Firestore 读取）
+REEL_ASSEMBLY_KEEP_FINISHED = int(os.getenv('REEL_ASSEMBLY_KEEP_FINISHED', '100'))
+REEL_ASSEMBLY_TIMEOUT = float(os.getenv('REEL_ASSEMBLY_TIMEOUT', '900'))
+REEL_ASSEMBLY_WORK_DIR = os.getenv('REEL_ASSEMBLY_WORK_DIR', os.path.join(tempfile.gettempdir(), 'reel-assembly'))
+# 重新编码时的输出规格（Veo 输出为 720p / 24fps）
+REEL_OUTPUT_SHORT_EDGE = int(os.getenv('REEL_OUTPUT_SHORT_EDGE', '720'))
+REEL_OUTPUT_FPS = int(os.getenv('REEL_OUTPUT_FPS', '24'))
+REEL_OUTPUT_CRF = int(os.getenv('REEL_OUTPUT_CRF', '20'))
+REEL_OUTPUT_PRESET = os.getenv('REEL_OUTPUT_PRESET', 'veryfast')
+REEL_STORAGE_PREFIX = os.getenv('REEL_STORAGE_PREFIX', 'reel_assemblies')
+
+ASSEMBLY_COLLECTION = 'reel_assemblies'
+
+_AUDIO_EXTENSIONS = {'audio/mpeg': 'mp3', 'audio/mp3': 'mp3', 'audio/wav': 'wav', 'audio/x-wav': 'wav',
+                     'audio/aac': 'aac', 'audio/mp4': 'm4a', 'audio/x-m4a': 'm4a', 'audio/ogg': 'ogg'}
+# 背景音乐在结尾淡出的时长（秒）
+_BED_FADE_OUT = 1.0
+
+
+@dataclass
+class ClipInfo:
+    """ffprobe 读取的片段参数"""
+    path: str
+    duration: float
+    width: int
+    height: int
+    video_codec: str
+    pix_fmt: Optional[str] = None
+    frame_rate: Optional[str] = None
+    audio_codec: Optional[str] = None
+    sample_rate: Optional[str] = None
+    channels: Optional[int] = None
+
+    @property
+    def has_audio(self) -> bool:
+        return self.audio_codec is not None
+
+    def stream_signature(self) -> Tuple:
+        """concat demuxer 直接复制流要求各片段的这些参数完全一致"""
+        return (self.video_codec, self.width, self.height, self.pix_fmt, self.frame_rate,
+                self.audio_codec, self.sample_rate, self.channels)
+
+
+@dataclass
+class AssemblyOptions:
+    """拼接参数"""
+    crossfade: float = 0.0
+    aspect_ratio: str = '9:16'
+    keep_clip_audio: bool = False
+    bed_volume: float = 1.0
+
+
+@dataclass
+class AssemblyJob:
+    """拼接任务状态"""
+    job_id: str
+    uid: str
+    video_ids: List[str]
+    options: AssemblyOptions
+    status: str = 'queued'
+    progress: float = 0.0
+    mode: Optional[str] = None
+    video_id: Optional[str] = None
+    duration: Optional[float] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    thumbnail: bool = False
+    error: Optional[str] = None
+    created_at: datetime.datetime = field(default_factory=datetime.datetime.now)
+
+    def to_dict(self) -> Dict[str, Any]:
+        src = f"/api/reel/videos/{self.video_id}" if self.video_id else None
+        return {
+            "jobId": self.job_id,
+            "status": self.status,
+            "progress": round(self.progress, 3),
+            "mode": self.mode,
+            "src": src,
+            "thumbnailSrc": f"{src}/poster" if src and self.thumbnail else None,
+            "duration": self.duration,
+            "width": self.width,
+            "height": self.height,
+            "error": self.error,
+        }
+
+
+def output_size(aspect_ratio: str, short_edge: int = REEL_OUTPUT_SHORT_EDGE) -> Tuple[int, int]:
+    """按比例计算输出尺寸（宽高取偶数，满足 yuv420p 要求）"""
+    ratio = parse_aspect_ratio(aspect_ratio) or 9 / 16
+    if ratio < 1:
+        width, height = short_edge, short_edge / ratio
+    else:
+        width, height = short_edge * ratio, short_edge
+    return int(round(width / 2) * 2), int(round(height / 2) * 2)
+
+
+def probe_clip(path: str) -> ClipInfo:
+    """
+    用 ffprobe 读取片段的时长和音视频流参数
+
+    Raises:
+        RuntimeError: ffprobe 失败或没有视频流
+    """
+    result = subprocess.run(
+        [FFPROBE_BINARY, '-v', 'error', '-print_format', 'json', '-show_streams', '-show_format', path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=30, check=False)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe failed: {result.stderr.decode('utf-8', 'replace').strip()[-300:]}")
+    return parse_probe_output(path, json.loads(result.stdout or b'{}'))
+
+
+def parse_probe_output(path: str, probe: Dict[str, Any]) -> ClipInfo:
+    """解析 ffprobe 的 JSON 输出"""
+    streams = probe.get('streams', [])
+    video = next((s for s in streams if s.get('codec_type') == 'video'), None)
+    if video is None:
+        raise RuntimeError("No video stream")
+    audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+    duration = float(probe.get('format', {}).get('duration') or video.get('duration') or 0)
+    return ClipInfo(
+        path=path,
+        duration=duration,
+        width=int(video.get('width') or 0),
+        height=int(video.get('height') or 0),
+        video_codec=video.get('codec_name', ''),
+        pix_fmt=video.get('pix_fmt'),
+        frame_rate=video.get('r_frame_rate'),
+        audio_codec=audio.get('codec_name') if audio else None,
+        sample_rate=audio.get('sample_rate') if audio else None,
+        channels=audio.get('channels') if audio else None,
+    )
+
+
+def total_duration(clips: List[ClipInfo], crossfade: float) -> float:
+    """成片时长（每个转场重叠 crossfade 秒）"""
+    return max(sum(clip.duration for clip in clips) - crossfade * (len(clips) - 1), 0.0)
+
+
+def can_stream_copy(clips: List[ClipInfo], options: AssemblyOptions) -> bool:
+    """无转场、各片段参数一致且尺寸已符合目标比例时，视频流可直接复制"""
+    if options.crossfade > 0 or not clips:
+        return False
+    width, height = output_size(options.aspect_ratio, min(clips[0].width, clips[0].height) or REEL_OUTPUT_SHORT_EDGE)
+    first = clips[0].stream_signature()
+    return all(clip.stream_signature() == first for clip in clips) and (clips[0].width, clips[0].height) == (width, height)
+
+
+def _bed_filter(input_index: int, duration: float, volume: float) -> str:
+    fade_start = max(duration - _BED_FADE_OUT, 0.0)
+    return (f"[{input_index}:a]atrim=0:{duration:.3f},asetpts=PTS-STARTPTS,volume={volume:g},"
+            f"afade=t=out:st={fade_start:.3f}:d={_BED_FADE_OUT:g}")
+
+
+def build_assembly_command(clips: List[ClipInfo], options: AssemblyOptions, output_path: str,
+                           list_path: Optional[str] = None, bed_path: Optional[str] = None) -> Tuple[List[str], str]:
+    """
+    构建拼接命令
+
+    Returns:
+        (command, mode)：mode 为 'copy'（全部流复制）、'copy_video'（复制视频流，编码音频）或 'encode'
+    """
+    duration = total_duration(clips, options.crossfade)
+    use_clip_audio = all(clip.has_audio for clip in clips) and (bed_path is None or options.keep_clip_audio)
+    command = [FFMPEG_BINARY, '-nostdin', '-hide_banner', '-loglevel', 'error', '-y', '-progress', 'pipe:1', '-nostats']
+    audio_encode = ['-c:a', 'aac', '-b:a', '192k']
+
+    if can_stream_copy(clips, options) and list_path:
+        command += ['-f', 'concat', '-safe', '0', '-i', list_path]
+        if bed_path is None:
+            command += ['-map', '0:v', '-map', '0:a?', '-c', 'copy']
+            mode = 'copy'
+        else:
+            command += ['-i', bed_path]
+            bed = _bed_filter(1, duration, options.bed_volume)
+            if use_clip_audio:
+                audio_graph = f"{bed}[bed];[0:a][bed]amix=inputs=2:duration=first:dropout_transition=0[aout]"
+            else:
+                audio_graph = f"{bed}[aout]"
+            command += ['-filter_complex', audio_graph, '-map', '0:v', '-map', '[aout]', '-c:v', 'copy'] + audio_encode
+            mode = 'copy_video'
+        command += ['-t', f'{duration:.3f}', '-movflags', '+faststart', output_path]
+        return command, mode
+
+    width, height = output_size(options.aspect_ratio)
+    for clip in clips:
+        command += ['-i', clip.path]
+    if bed_path:
+        command += ['-i', bed_path]
+
+    graph = []
+    for i in range(len(clips)):
+        graph.append(f"[{i}:v]scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                     f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={REEL_OUTPUT_FPS},format=yuv420p[v{i}]")
+        if use_clip_audio:
+            graph.append(f"[{i}:a]aformat=sample_rates=48000:channel_layouts=stereo[a{i}]")
+
+    if options.crossfade > 0 and len(clips) > 1:
+        # xfade 的 offset 为前面已拼接部分的时长减去转场时长
+        previous, offset = 'v0', 0.0
+        for i in range(1, len(clips)):
+            offset += clips[i - 1].duration - options.crossfade
+            label = 'vout' if i == len(clips) - 1 else f'vx{i}'
+            graph.append(f"[{previous}][v{i}]xfade=transition=fade:duration={options.crossfade:g}:offset={offset:.3f}[{label}]")
+            previous = label
+        if use_clip_audio:
+            previous = 'a0'
+            for i in range(1, len(clips)):
+                label = 'aclips' if i == len(clips) - 1 else f'ax{i}'
+                graph.append(f"[{previous}][a{i}]acrossfade=d={options.crossfade:g}[{label}]")
+                previous = label
+    else:
+        inputs = ''.join(f'[v{i}]' for i in range(len(clips)))
+        graph.append(f"{inputs}concat=n={len(clips)}:v=1:a=0[vout]")
+        if use_clip_audio:
+            inputs = ''.join(f'[a{i}]' for i in range(len(clips)))
+            graph.append(f"{inputs}concat=n={len(clips)}:v=0:a=1[aclips]")
+
+    audio_label = None
+    if bed_path:
+        graph.append(_bed_filter(len(clips), duration, options.bed_volume) + '[bed]')
+        if use_clip_audio:
+            graph.append("[aclips][bed]amix=inputs=2:duration=first:dropout_transition=0[aout]")
+            audio_label = 'aout'
+        else:
+            audio_label = 'bed'
+    elif use_clip_audio:
+        audio_label = 'aclips'
+
+    command += ['-filter_complex', ';'.join(graph), '-map', '[vout]']
+    command += ['-map', f'[{audio_label}]'] + audio_encode if audio_label else ['-an']
+    command += ['-c:v', 'libx264', '-preset', REEL_OUTPUT_PRESET, '-crf', str(REEL_OUTPUT_CRF), '-pix_fmt', 'yuv420p',
+                '-t', f'{duration:.3f}', '-movflags', '+faststart', output_path]
+    return command, 'encode'
+
+
+def parse_progress(line: str) -> Optional[float]:
+    """解析 -progress 输出中的已编码时长（秒）；out_time_ms 实际单位也是微秒"""
+    key, _, value = line.strip().partition('=')
+    if key in ('out_time_us', 'out_time_ms') and value.lstrip('-').isdigit():
+        return max(int(value), 0) / 1_000_000
+    return None
+
+
+class ReelAssemblyService:
+    """成片拼接服务"""
+
+    def __init__(self, workers: int = REEL_ASSEMBLY_WORKERS, proxy=None, bucket=None, db=None,
+                 work_dir: str = REEL_ASSEMBLY_WORK_DIR):
+        self.executor = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='reel-assembly')
+        self._proxy = proxy
+        self._bucket = bucket
+        self._db = db
+        self.work_dir = work_dir
+        self._jobs: Dict[str, AssemblyJob] = {}
+        # 已结束任务的 ID，按结束顺序排列，超过 REEL_ASSEMBLY_KEEP_FINISHED 时从 _jobs 中淘汰最早的
+        self._finished: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def proxy(self):
+        return self._proxy or get_video_proxy_service()
+
+    @staticmethod
+    def is_available() -> bool:
+        return shutil.which(FFMPEG_BINARY) is not None and shutil.which(FFPROBE_BINARY) is not None
+
+    # ------------------------------------------------------------------
+    # 任务 API
+    # ------------------------------------------------------------------
+
+    def submit(self, uid: str, video_ids: List[str], options: AssemblyOptions,
+               audio_bed: Optional[Tuple[bytes, str]] = None) -> AssemblyJob:
+        """
+        提交拼接任务（立即返回）
+
+        Raises:
+            ValueError: 片段数量、视频 ID 或参数无效
+        """
+        if not video_ids or len(video_ids) > REEL_ASSEMBLY_MAX_CLIPS:
+            raise ValueError(f"videoIds must contain 1-{REEL_ASSEMBLY_MAX_CLIPS} videos")
+        if not 0 <= options.crossfade <= REEL_ASSEMBLY_MAX_CROSSFADE:
+            raise ValueError(f"crossfade must be between 0 and {REEL_ASSEMBLY_MAX_CROSSFADE} seconds")
+        if parse_aspect_ratio(options.aspect_ratio) is None:
+            raise ValueError(f"Invalid aspectRatio: {options.aspect_ratio}")
+        if not (math.isfinite(options.bed_volume) and 0 <= options.bed_volume <= REEL_ASSEMBLY_MAX_BED_VOLUME):
+            raise ValueError(f"audioVolume must be between 0 and {REEL_ASSEMBLY_MAX_BED_VOLUME}")
+        if audio_bed and len(audio_bed[0]) > REEL_ASSEMBLY_MAX_AUDIO_BYTES:
+            raise ValueError("Audio bed is too large")
+        records = []
+        for video_id in video_ids:
+            record = self.proxy.resolve(video_id) if is_valid_video_id(video_id) else None
+            if not record:
+                raise ValueError(f"Unknown video: {video_id}")
+            records.append(record)
+
+        job = AssemblyJob(secrets.token_urlsafe(12), uid, list(video_ids), options)
+        with self._lock:
+            self._jobs[job.job_id] = job
+        self._persist(job, create=True)
+        self.executor.submit(self._run, job, records, audio_bed)
+        print(f"[ReelAssemblyService] Queued job {job.job_id} ({len(video_ids)} clips, crossfade={options.crossfade}s)")
+        return job
+
+    def get(self, job_id: str, uid: str) -> Optional[Dict[str, Any]]:
+        """读取任务状态（本实例内存 → Firestore），只返回属于该用户的任务"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict() if job.uid == uid else None
+        db = self._db or get_firestore_client()
+        if db is None:
+            return None
+        try:
+            snapshot = db.collection(ASSEMBLY_COLLECTION).document(job_id).get()
+        except Exception as e:
+            print(f"[ReelAssemblyService] ⚠️ Failed to look up job {job_id}: {e}")
+            return None
+        data = snapshot.to_dict() if snapshot.exists else None
+        if not data or data.get('uid') != uid:
+            return None
+        return data.get('result')
+
+    # ------------------------------------------------------------------
+    # 执行
+    # ------------------------------------------------------------------
+
+    def _run(self, job: AssemblyJob, records: List[Dict[str, Any]], audio_bed: Optional[Tuple[bytes, str]]):
+        job_dir = os.path.join(self.work_dir, job.job_id)
+        try:
+            os.makedirs(job_dir, exist_ok=True)
+            job.status = 'running'
+            clips = [probe_clip(self._materialize(video_id, record, job_dir))
+                     for video_id, record in zip(job.video_ids, records)]
+            if job.options.crossfade > 0 and any(clip.duration <= job.options.crossfade for clip in clips):
+                raise ValueError("Every clip must be longer than the crossfade")
+
+            list_path = os.path.join(job_dir, 'clips.txt')
+            with open(list_path, 'w') as f:
+                for clip in clips:
+                    f.write(f"file '{clip.path}'\n")
+            bed_path = None
+            if audio_bed:
+                bed_path = os.path.join(job_dir, f"bed.{_AUDIO_EXTENSIONS.get(audio_bed[1], 'bin')}")
+                with open(bed_path, 'wb') as f:
+                    f.write(audio_bed[0])
+
+            output_path = os.path.join(job_dir, 'reel.mp4')
+            command, job.mode = build_assembly_command(clips, job.options, output_path, list_path, bed_path)
+            job.duration = round(total_duration(clips, job.options.crossfade), 3)
+            if job.mode == 'encode':
+                job.width, job.height = output_size(job.options.aspect_ratio)
+            else:
+                job.width, job.height = clips[0].width, clips[0].height
+            print(f"[ReelAssemblyService] Job {job.job_id}: mode={job.mode}, {job.width}x{job.height}, {job.duration}s")
+            self._execute(job, command, os.path.join(job_dir, 'ffmpeg.log'))
+
+            job.status = 'uploading'
+            self._publish(job, output_path)
+            job.status = 'completed'
+            job.progress = 1.0
+            print(f"[ReelAssemblyService] ✅ Job {job.job_id} completed: /api/reel/videos/{job.video_id}")
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)[:500]
+            print(f"[ReelAssemblyService] ❌ Job {job.job_id} failed: {e}")
+        finally:
+            self._persist(job)
+            self._finish(job)
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+    def _finish(self, job: AssemblyJob):
+        """记录已结束的任务，只在内存中保留最近的 REEL_ASSEMBLY_KEEP_FINISHED 个"""
+        with self._lock:
+            self._finished[job.job_id] = None
+            while len(self._finished) > max(REEL_ASSEMBLY_KEEP_FINISHED, 0):
+                job_id, _ = self._finished.popitem(last=False)
+                self._jobs.pop(job_id, None)
+
+    def _materialize(self, video_id: str, record: Dict[str, Any], job_dir: str) -> str:
+        """把片段放到任务目录（已缓存的视频创建硬链接，避免拼接过程中被缓存淘汰）"""
+        path = os.path.join(job_dir, f"{video_id}.mp4")
+        cached_path = self.proxy.cached_path(video_id)
+        if cached_path:
+            try:
+                os.link(cached_path, path)
+            except OSError:
+                shutil.copyfile(cached_path, path)
+            return path
+        status, _, chunks = self.proxy.open_source(record)
+        if status != 200:
+            raise RuntimeError(f"Video {video_id} unavailable (HTTP {status})")
+        with open(path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+        return path
+
+    def _execute(self, job: AssemblyJob, command: List[str], log_path: str):
+        """运行 ffmpeg，按 -progress 输出更新进度"""
+        with open(log_path, 'w+b') as log:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=log, text=True)
+            timer = threading.Timer(REEL_ASSEMBLY_TIMEOUT, process.kill)
+            timer.start()
+            try:
+                for line in process.stdout:
+                    encoded = parse_progress(line)
+                    if encoded is not None and job.duration:
+                        job.progress = min(encoded / job.duration, 0.99)
+                returncode = process.wait()
+            finally:
+                timer.cancel()
+            if returncode != 0:
+                log.seek(0)
+                message = log.read().decode('utf-8', 'replace').strip()[-500:]
+                raise RuntimeError(f"ffmpeg exited with {returncode}: {message}")
+
+    def _publish(self, job: AssemblyJob, output_path: str):
+        """上传成片到 Storage，登记到视频代理并预先写入本地缓存"""
+        size = os.path.getsize(output_path)
+        storage_path = None
+        bucket = self._bucket or get_storage_bucket()
+        if bucket is not None:
+            storage_path = f"{REEL_STORAGE_PREFIX}/{job.job_id}.mp4"
+            blob = bucket.blob(storage_path)
+            blob.chunk_size = VIDEO_UPLOAD_CHUNK_SIZE
+            blob.upload_from_filename(output_path, content_type='video/mp4')
+        job.video_id = self.proxy.register(None, storage_path=storage_path, size_bytes=size)
+        if self.proxy.cache:
+            with open(output_path, 'rb') as f:
+                self.proxy.cache.put(job.video_id, iter(lambda: f.read(1024 * 1024), b''))
+        job.thumbnail = get_video_frame_service().submit(job.video_id, self.proxy.resolve(job.video_id) or {}) is not None
+
+    def _persist(self, job: AssemblyJob, create: bool = False):
+        """任务创建和结束时写入 Firestore，供其他实例查询"""
+        db = self._db or get_firestore_client()
+        if db is None:
+            return
+        data = {"uid": job.uid, "result": job.to_dict(), "updated_at": datetime.datetime.now()}
+        if create:
+            data.update(video_ids=job.video_ids, created_at=job.created_at)
+        try:
+            doc_ref = db.collection(ASSEMBLY_COLLECTION).document(job.job_id)
+            if self._db is None:
+                get_firestore_write_buffer().set(doc_ref, data, merge=True)
+            else:
+                doc_ref.set(data, merge=True)
+        except Exception as e:
+            print(f"[ReelAssemblyService] ⚠️ Failed to persist job {job.job_id}: {e}")
+
+
+def decode_audio_bed(audio: Optional[Dict[str, Any]]) -> Optional[Tuple[bytes, str]]:
+    """解析请求中的 {"data": base64, "mimeType": str} 背景音乐"""
+    if not audio or not audio.get('data'):
+        return None
+    data_str = audio['data']
+    if data_str.startswith('data:') and ',' in data_str[:256]:
+        data_str = data_str.split(',', 1)[1]
+    try:
+        return base64.b64decode(data_str, validate=True), audio.get('mimeType', 'audio/mpeg')
+    except Exception as e:
+        raise ValueError(f"Invalid audio data: {e}") from e
+
+
+_reel_assembly_service: Optional[ReelAssemblyService] = None
+_reel_assembly_service_lock = threading.Lock()
+
+
+def get_reel_assembly_service() -> ReelAssemblyService:
+    """获取 ReelAssemblyService 单例"""
+    global _reel_assembly_service
+    if _reel_assembly_service is None:
+        with _reel_assembly_service_lock:
+            if _reel_assembly_service is None:
+                _reel_assembly_service = ReelAssemblyService()
+    return _reel_assembly_service
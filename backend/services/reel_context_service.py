@@ -0,0 +1,175 @@
+"""
+Reel Context Service
+为创意总监组装对话上下文：较早轮次的滚动摘要 + 最近的原始消息，总量控制在固定 token 预算内
+- 摘要由 gemini-2.5-flash 在后台线程增量刷新（旧摘要 + 新移出窗口的消息 → 新摘要），不阻塞请求
+- 摘要尚未追上时，未摘要的消息在预算内按新到旧保留
+"""
+
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from services.reel_session_service import ReelSession, ReelSessionStore, get_reel_session_store
+from utils.prompt_templates import estimate_tokens, truncate_to_tokens
+
+# 创意总监历史上下文的 token 预算（摘要 + 最近消息）
+REEL_CONTEXT_TOKEN_BUDGET = int(os.getenv('REEL_CONTEXT_TOKEN_BUDGET', '1200'))
+# 始终以原文保留的最近消息数，更早的消息折叠进摘要
+REEL_CONTEXT_RECENT_TURNS = int(os.getenv('REEL_CONTEXT_RECENT_TURNS', '4'))
+# 累计多少条移出窗口的消息后刷新一次摘要
+REEL_SUMMARY_BATCH = int(os.getenv('REEL_SUMMARY_BATCH', '4'))
+REEL_SUMMARY_MAX_TOKENS = int(os.getenv('REEL_SUMMARY_MAX_TOKENS', '300'))
+REEL_SUMMARY_MODEL = os.getenv('REEL_SUMMARY_MODEL', 'gemini-2.5-flash')
+REEL_SUMMARY_WORKERS = int(os.getenv('REEL_SUMMARY_WORKERS', '2'))
+
+SUMMARY_PROMPT = """You maintain a running summary of a creative session between a user and an AI creative director that generates images and videos.
+
+Existing summary:
+{summary}
+
+New conversation turns to fold in:
+{turns}
+
+Write the updated summary in at most {max_words} words, in the same language the user writes in.
+Keep what matters for future decisions: what was created or edited (with asset IDs when mentioned), the user's stated preferences, style and subject choices, and open requests.
+Drop greetings and repetition. Return only the summary text."""
+
+
+def format_message(msg: Dict[str, Any]) -> str:
+    role = msg.get('role', 'user')
+    content = msg.get('content', '')
+    if isinstance(content, str):
+        return f"{role}: {content}"
+    return f"{role}: [{msg.get('type', 'unknown')} message]"
+
+
+def format_history(messages: List[Dict[str, Any]], summary: str = '') -> str:
+    """创意总监提示词中的历史记录：可选的摘要行 + 每条消息一行"""
+    lines = [f"[Summary of earlier conversation] {summary}"] if summary else []
+    lines.extend(format_message(msg) for msg in messages)
+    return '\n'.join(lines)
+
+
+@dataclass
+class ConversationContext:
+    summary: str
+    messages: List[Dict[str, Any]]
+
+    def to_prompt(self) -> str:
+        return format_history(self.messages, self.summary)
+
+
+def _gemini_summarizer(prompt: str) -> str:
+    from services.gemini_service import get_gemini_service
+    response = get_gemini_service().generate_content(prompt, model=REEL_SUMMARY_MODEL)
+    return (getattr(response, 'text', '') or '').strip()
+
+
+class ReelContextManager:
+    """按会话维护滚动摘要并组装上下文"""
+
+    def __init__(
+        self,
+        store: ReelSessionStore,
+        summarizer: Optional[Callable[[str], str]] = None,
+        token_budget: int = REEL_CONTEXT_TOKEN_BUDGET,
+        recent_turns: int = REEL_CONTEXT_RECENT_TURNS,
+        summary_batch: int = REEL_SUMMARY_BATCH,
+        summary_max_tokens: int = REEL_SUMMARY_MAX_TOKENS,
+        workers: int = REEL_SUMMARY_WORKERS,
+    ):
+        self.store = store
+        self.summarizer = summarizer or _gemini_summarizer
+        self.token_budget = token_budget
+        self.recent_turns = recent_turns
+        self.summary_batch = summary_batch
+        self.summary_max_tokens = summary_max_tokens
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='reel-summary')
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _first_index(session: ReelSession) -> int:
+        """session.messages[0] 在全部消息中的序号"""
+        return session.message_count - len(session.messages)
+
+    def build_context(self, session: ReelSession) -> ConversationContext:
+        """摘要 + 尚未摘要的最近消息（按新到旧在预算内保留，至少保留最新一条）"""
+        summary = truncate_to_tokens(session.summary, self.summary_max_tokens)
+        remaining = self.token_budget - estimate_tokens(summary)
+        start = max(0, session.summary_count - self._first_index(session))
+        recent: List[Dict[str, Any]] = []
+        for msg in reversed(session.messages[start:]):
+            cost = estimate_tokens(format_message(msg)) + 1
+            if recent and cost > remaining:
+                break
+            recent.append(msg)
+            remaining -= cost
+        recent.reverse()
+        return ConversationContext(summary=summary, messages=recent)
+
+    def pending_messages(self, session: ReelSession) -> List[Dict[str, Any]]:
+        """已移出最近窗口、尚未折叠进摘要的消息"""
+        first = self._first_index(session)
+        start = max(session.summary_count, first) - first
+        end = len(session.messages) - self.recent_turns
+        return session.messages[start:end] if end > start else []
+
+    def schedule_refresh(self, session: ReelSession) -> Optional[Future]:
+        """待摘要消息达到批量阈值时在后台刷新摘要；同一会话同时只有一个刷新任务"""
+        if len(self.pending_messages(session)) < self.summary_batch:
+            return None
+        key = session.key
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None and not future.done():
+                return future
+            future = self.executor.submit(self._refresh, session)
+            self._inflight[key] = future
+        future.add_done_callback(lambda f, k=key: self._forget(k, f))
+        return future
+
+    def _forget(self, key: str, future: Future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def _refresh(self, session: ReelSession) -> Optional[str]:
+        pending = self.pending_messages(session)
+        if not pending:
+            return None
+        summary_count = session.message_count - self.recent_turns
+        prompt = SUMMARY_PROMPT.format(
+            summary=session.summary or '(none)',
+            turns='\n'.join(format_message(msg) for msg in pending),
+            max_words=max(50, self.summary_max_tokens * 3 // 4),
+        )
+        try:
+            summary = truncate_to_tokens(self.summarizer(prompt), self.summary_max_tokens)
+        except Exception as e:
+            print(f"[ReelContextService] ⚠️ Summary refresh failed for {session.key}: {e}")
+            return None
+        if not summary:
+            return None
+        updated = self.store.update_summary(
+            session.uid, session.session_id, summary, summary_count, pending[-1].get('id')
+        )
+        if updated is not None:
+            print(f"[ReelContextService] ✅ Summarized {summary_count} messages for {session.key}")
+        return summary
+
+
+_context_manager: Optional[ReelContextManager] = None
+_context_manager_lock = threading.Lock()
+
+
+def get_reel_context_manager() -> ReelContextManager:
+    """获取 ReelContextManager 单例"""
+    global _context_manager
+    if _context_manager is None:
+        with _context_manager_lock:
+            if _context_manager is None:
+                _context_manager = ReelContextManager(get_reel_session_store())
+    return _context_manager
@@ -0,0 +1,299 @@
+"""
+Reel Session Service
+服务端保存创意总监的会话状态（消息、资产清单、选中资产），按 (uid, sessionId) 索引
+- 客户端每轮只发送增量（新消息、变化的资产），不再重复上传完整状态
+- 内存 LRU（条目数上限 + TTL）在前，Firestore 在后（写入经 write buffer 异步提交），实例重启或请求落到其他实例时从 Firestore 恢复
+- 每次应用增量后 version 加一；客户端的 baseVersion 与服务端不一致时返回冲突，由客户端重新发送完整状态
+"""
+
+import datetime
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+from utils.firebase_registry import get_firestore_client
+from utils.asset_manifest import slim_asset_manifest, slim_messages
+from services.firestore_write_buffer import get_firestore_write_buffer
+
+# 会话闲置多久后过期（秒）
+REEL_SESSION_TTL_SECONDS = int(os.getenv('REEL_SESSION_TTL_SECONDS', str(6 * 3600)))
+# 内存中保留的会话数
+REEL_SESSION_MAX_ENTRIES = int(os.getenv('REEL_SESSION_MAX_ENTRIES', '1000'))
+# 每个会话保存的最近消息数和资产数
+REEL_SESSION_MAX_MESSAGES = int(os.getenv('REEL_SESSION_MAX_MESSAGES', '40'))
+REEL_SESSION_MAX_ASSETS = int(os.getenv('REEL_SESSION_MAX_ASSETS', '500'))
+# 'firestore'：内存 + Firestore；'memory'：仅内存（单实例部署或本地开发）
+REEL_SESSION_BACKEND = os.getenv('REEL_SESSION_BACKEND', 'firestore')
+
+SESSION_COLLECTION = 'reel_sessions'
+_SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+
+class SessionConflictError(Exception):
+    """客户端的 baseVersion 与服务端会话不一致（会话已过期或有并发更新）"""
+
+    def __init__(self, version: int):
+        super().__init__(f"Session is at version {version}")
+        self.version = version
+
+
+def is_valid_session_id(session_id: Any) -> bool:
+    return isinstance(session_id, str) and bool(_SESSION_ID_PATTERN.match(session_id))
+
+
+@dataclass
+class ReelSession:
+    """一个创意总监会话"""
+    uid: str
+    session_id: str
+    version: int = 0
+    messages: List[Dict[str, Any]] = field(default_factory=list)
+    assets: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    selected_asset_id: Optional[str] = None
+    last_generated_asset_id: Optional[str] = None
+    # 累计追加过的消息数（messages 只保留最近 REEL_SESSION_MAX_MESSAGES 条）
+    message_count: int = 0
+    # 较早轮次的滚动摘要，以及摘要已覆盖的消息数（见 reel_context_service）
+    summary: str = ''
+    summary_count: int = 0
+    updated_at: float = field(default_factory=time.time)
+
+    @property
+    def key(self) -> str:
+        return session_key(self.uid, self.session_id)
+
+    def is_expired(self, now: Optional[float] = None) -> bool:
+        return (now or time.time()) - self.updated_at > REEL_SESSION_TTL_SECONDS
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ReelSession':
+        known = {name: data[name] for name in cls.__dataclass_fields__ if name in data}
+        return cls(**known)
+
+
+def session_key(uid: str, session_id: str) -> str:
+    return f"{uid}_{session_id}"
+
+
+class MemorySessionBackend:
+    """内存 LRU + TTL"""
+
+    def __init__(self, max_entries: int = REEL_SESSION_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._sessions: "OrderedDict[str, ReelSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[ReelSession]:
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                return None
+            if session.is_expired():
+                del self._sessions[key]
+                return None
+            self._sessions.move_to_end(key)
+            return session
+
+    def put(self, session: ReelSession):
+        with self._lock:
+            self._sessions[session.key] = session
+            self._sessions.move_to_end(session.key)
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._sessions.pop(key, None)
+
+
+class FirestoreSessionBackend:
+    """Firestore 持久化（写入经 write buffer 批量提交）"""
+
+    def __init__(self, db=None):
+        self._db = db
+
+    def _collection(self):
+        db = self._db or get_firestore_client()
+        return db.collection(SESSION_COLLECTION) if db is not None else None
+
+    def get(self, key: str) -> Optional[ReelSession]:
+        collection = self._collection()
+        if collection is None:
+            return None
+        try:
+            snapshot = collection.document(key).get()
+        except Exception as e:
+            print(f"[ReelSessionService] ⚠️ Failed to load session {key}: {e}")
+            return None
+        if not snapshot.exists:
+            return None
+        session = ReelSession.from_dict(snapshot.to_dict() or {})
+        return None if session.is_expired() else session
+
+    def put(self, session: ReelSession):
+        collection = self._collection()
+        if collection is None:
+            return
+        data = session.to_dict()
+        # 供 Firestore TTL 策略自动清理过期会话
+        data['expires_at'] = datetime.datetime.fromtimestamp(session.updated_at + REEL_SESSION_TTL_SECONDS)
+        try:
+            doc_ref = collection.document(session.key)
+            buffer = get_firestore_write_buffer() if self._db is None else None
+            if buffer is not None:
+                buffer.set(doc_ref, data)
+            else:
+                doc_ref.set(data)
+        except Exception as e:
+            print(f"[ReelSessionService] ⚠️ Failed to persist session {session.key}: {e}")
+
+    def delete(self, key: str):
+        collection = self._collection()
+        if collection is None:
+            return
+        try:
+            collection.document(key).delete()
+        except Exception as e:
+            print(f"[ReelSessionService] ⚠️ Failed to delete session {key}: {e}")
+
+
+class ReelSessionStore:
+    """会话存储：内存在前，持久化后端在后"""
+
+    def __init__(self, memory: Optional[MemorySessionBackend] = None, persistent=None):
+        self.memory = memory or MemorySessionBackend()
+        self.persistent = persistent
+        # 按会话分段加锁，同一会话的增量按顺序应用
+        self._locks = [threading.Lock() for _ in range(64)]
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        return self._locks[hash(key) % len(self._locks)]
+
+    def get(self, uid: str, session_id: str) -> Optional[ReelSession]:
+        key = session_key(uid, session_id)
+        session = self.memory.get(key)
+        if session is None and self.persistent is not None:
+            session = self.persistent.get(key)
+            if session is not None and session.uid == uid:
+                self.memory.put(session)
+            else:
+                session = None
+        return session
+
+    def apply_delta(self, uid: str, session_id: str, delta: Dict[str, Any], base_version: int) -> ReelSession:
+        """
+        应用客户端增量
+
+        Args:
+            delta: {
+                "reset"?: bool,                        # 用完整状态重建会话
+                "messages"?: [ReelMessage],            # 新消息（按 id 去重）
+                "assets"?: {id: manifest | null},      # 新增/变化的资产，null 表示删除
+                "selectedAssetId"?: str | null,
+                "lastGeneratedAssetId"?: str | null
+            }
+            base_version: 客户端认为的当前版本（新会话为 0）
+
+        Raises:
+            ValueError: sessionId 或增量格式无效
+            SessionConflictError: 版本不一致，客户端需发送 reset
+        """
+        if not is_valid_session_id(session_id):
+            raise ValueError("Invalid sessionId")
+        if not isinstance(delta, dict):
+            raise ValueError("delta must be an object")
+        key = session_key(uid, session_id)
+        with self._lock_for(key):
+            current = self.get(uid, session_id)
+            if delta.get('reset'):
+                session = ReelSession(uid, session_id)
+            else:
+                current_version = current.version if current else 0
+                if current_version != base_version:
+                    raise SessionConflictError(current_version)
+                session = ReelSession.from_dict(current.to_dict()) if current else ReelSession(uid, session_id)
+
+            self._merge(session, delta)
+            session.version += 1
+            session.updated_at = time.time()
+            self.memory.put(session)
+            if self.persistent is not None:
+                self.persistent.put(session)
+            return session
+
+    @staticmethod
+    def _merge(session: ReelSession, delta: Dict[str, Any]):
+        known_ids = {msg.get('id') for msg in session.messages if msg.get('id')}
+        for msg in slim_messages(delta.get('messages') or [], REEL_SESSION_MAX_MESSAGES):
+            if msg.get('id') and msg['id'] in known_ids:
+                continue
+            session.messages.append(msg)
+            session.message_count += 1
+        del session.messages[:-REEL_SESSION_MAX_MESSAGES]
+
+        asset_delta = delta.get('assets') or {}
+        if isinstance(asset_delta, dict):
+            for asset_id in [k for k, v in asset_delta.items() if v is None]:
+                session.assets.pop(asset_id, None)
+            manifest, _ = slim_asset_manifest(asset_delta)
+            session.assets.update(manifest)
+            while len(session.assets) > REEL_SESSION_MAX_ASSETS:
+                session.assets.pop(next(iter(session.assets)))
+
+        if 'selectedAssetId' in delta:
+            session.selected_asset_id = delta['selectedAssetId'] or None
+        if 'lastGeneratedAssetId' in delta:
+            session.last_generated_asset_id = delta['lastGeneratedAssetId'] or None
+
+    def update_summary(self, uid: str, session_id: str, summary: str, summary_count: int,
+                       last_message_id: Optional[str]) -> Optional[ReelSession]:
+        """
+        写入滚动摘要（不改变 version，摘要不属于客户端状态）
+
+        Args:
+            summary_count: 摘要覆盖的消息数
+            last_message_id: 摘要覆盖的最后一条消息 ID，用于确认会话期间没有被 reset
+        """
+        key = session_key(uid, session_id)
+        with self._lock_for(key):
+            current = self.get(uid, session_id)
+            if current is None or summary_count <= current.summary_count:
+                return None
+            index = summary_count - 1 - (current.message_count - len(current.messages))
+            if not 0 <= index < len(current.messages) or current.messages[index].get('id') != last_message_id:
+                return None
+            session = ReelSession.from_dict(current.to_dict())
+            session.summary = summary
+            session.summary_count = summary_count
+            self.memory.put(session)
+            if self.persistent is not None:
+                self.persistent.put(session)
+            return session
+
+    def delete(self, uid: str, session_id: str):
+        key = session_key(uid, session_id)
+        self.memory.delete(key)
+        if self.persistent is not None:
+            self.persistent.delete(key)
+
+
+_session_store: Optional[ReelSessionStore] = None
+_session_store_lock = threading.Lock()
+
+
+def get_reel_session_store() -> ReelSessionStore:
+    """获取 ReelSessionStore 单例"""
+    global _session_store
+    if _session_store is None:
+        with _session_store_lock:
+            if _session_store is None:
+                persistent = FirestoreSessionBackend() if REEL_SESSION_BACKEND == 'firestore' else None
+                _session_store = ReelSessionStore(persistent=persistent)
+    return _session_store
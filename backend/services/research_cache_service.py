@@ -0,0 +1,284 @@
+"""
+Research Cache Service
+缓存 /design-plan 的趋势调研摘要（Google Search grounding 调用），相同话题的请求只需一次结构化调用
+- 话题归一化：NFKC（全角/半角）、大小写、空白与标点、常见繁简字、同义词折叠；语言不同的话题分开缓存（摘要语言跟随话题语言）
+- 内存 LRU（按字节预算）+ Firestore research_cache 集合（多实例共享）
+- 新鲜期内直接命中；过期但在陈旧窗口内时先返回旧摘要，并在后台重新调研（stale-while-revalidate）
+- 同一话题并发未命中时只调研一次
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils.firebase_registry import get_firestore_client
+
+RESEARCH_CACHE_ENABLED = os.getenv('RESEARCH_CACHE_ENABLED', 'true').lower() == 'true'
+# 新鲜期：在此之内直接使用缓存
+RESEARCH_CACHE_TTL_SECONDS = int(os.getenv('RESEARCH_CACHE_TTL_SECONDS', str(12 * 3600)))
+# 陈旧窗口：新鲜期之后仍可先返回旧摘要并后台刷新的时长
+RESEARCH_CACHE_STALE_SECONDS = int(os.getenv('RESEARCH_CACHE_STALE_SECONDS', str(3 * 24 * 3600)))
+# 内存中缓存摘要的总字节上限
+RESEARCH_CACHE_MAX_BYTES = int(os.getenv('RESEARCH_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+# 'firestore'：内存 + Firestore；'memory'：仅内存
+RESEARCH_CACHE_BACKEND = os.getenv('RESEARCH_CACHE_BACKEND', 'firestore')
+RESEARCH_CACHE_WORKERS = int(os.getenv('RESEARCH_CACHE_WORKERS', '2'))
+
+RESEARCH_COLLECTION = 'research_cache'
+
+# 同义词折叠（归一化之后按整词/整串替换为规范写法）
+TOPIC_SYNONYMS: Dict[str, str] = {
+    'cafe': 'coffee',
+    'coffee shop': 'coffee',
+    'coffeehouse': 'coffee',
+    'summer promotion': 'summer sale',
+    'skin care': 'skincare',
+    'tech': 'technology',
+    'ecommerce': 'e-commerce',
+    'x-mas': 'christmas',
+    'xmas': 'christmas',
+    '咖啡店': '咖啡',
+    '咖啡馆': '咖啡',
+    '咖啡厅': '咖啡',
+    '夏季促销': '夏日促销',
+    '夏季特卖': '夏日促销',
+    '夏日特卖': '夏日促销',
+    '护肤品': '护肤',
+    '圣诞节': '圣诞',
+}
+# 常见繁体字折叠为简体（话题中高频出现的字）
+_TRADITIONAL_TO_SIMPLIFIED = str.maketrans({
+    '館': '馆', '廳': '厅', '產': '产', '銷': '销', '賣': '卖', '膚': '肤', '誕': '诞', '節': '节',
+    '電': '电', '視': '视', '設': '设', '計': '计', '風': '风', '時': '时', '裝': '装', '鮮': '鲜',
+    '飲': '饮', '廣': '广', '動': '动', '畫': '画', '寵': '宠', '貓': '猫', '車': '车',
+})
+# 以 s 结尾但不是复数的常见词（另外 -ss、-us、-is 结尾的词和同义词表中的词也不去 s）
+_NOT_PLURAL = {'news', 'series', 'species', 'sports', 'glasses', 'jeans', 'cosmetics', 'analytics', 'chaos', 'canvas',
+               'always', 'atlas', 'alias', 'bias', 'texas', 'vegas', 'lens'}
+_SYNONYM_WORDS = {word for phrase in (*TOPIC_SYNONYMS, *TOPIC_SYNONYMS.values()) for word in phrase.split(' ')}
+_PUNCTUATION = re.compile(r"[\s　\"'`“”‘’.,!?;:，。！？；：、()（）\[\]【】<>《》#]+")
+_CJK = re.compile(r'[㐀-鿿豈-﫿]')
+
+
+def topic_language(topic: str) -> str:
+    return 'zh' if _CJK.search(topic) else 'en'
+
+
+def _fold_synonyms(words: List[str]) -> List[str]:
+    """同义词按整串和单词两级折叠"""
+    phrase = ' '.join(words)
+    phrase = TOPIC_SYNONYMS.get(phrase, phrase)
+    return [TOPIC_SYNONYMS.get(w, w) for w in phrase.split(' ')]
+
+
+def _singular(word: str) -> str:
+    """简单去掉复数 s（brands → brand）"""
+    if (len(word) <= 3 or not word.endswith('s') or word.endswith(('ss', 'us', 'is'))
+            or word in _NOT_PLURAL or word in _SYNONYM_WORDS):
+        return word
+    return word[:-1]
+
+
+def normalize_topic(topic: str) -> Tuple[str, str]:
+    """
+    归一化话题
+
+    Returns:
+        (language, canonical)：如 ("en", "coffee brand")、("zh", "咖啡")
+    """
+    text = unicodedata.normalize('NFKC', topic or '').casefold().translate(_TRADITIONAL_TO_SIMPLIFIED)
+    language = topic_language(text)
+    words = [w for w in _PUNCTUATION.split(text) if w]
+    if language == 'en':
+        # 同义词先于去复数折叠（christmas 不会被截成 christma），去掉复数后再折叠一次（cafes → cafe → coffee）
+        words = _fold_synonyms(words)
+        words = _fold_synonyms([_singular(w) for w in words])
+        canonical = ' '.join(words)
+    else:
+        canonical = TOPIC_SYNONYMS.get(''.join(words), ''.join(words))
+        for synonym in sorted(TOPIC_SYNONYMS, key=len, reverse=True):
+            if _CJK.search(synonym) and synonym in canonical:
+                canonical = canonical.replace(synonym, TOPIC_SYNONYMS[synonym])
+    return language, canonical
+
+
+def research_cache_key(mode: str, topic: str) -> str:
+    language, canonical = normalize_topic(topic)
+    return f"{mode}:{language}:{canonical}"
+
+
+@dataclass
+class ResearchEntry:
+    key: str
+    summary: str
+    created_at: float
+
+    @property
+    def size(self) -> int:
+        return len(self.summary.encode('utf-8'))
+
+    def age(self, now: Optional[float] = None) -> float:
+        return (now or time.time()) - self.created_at
+
+
+class ResearchCache:
+    """调研摘要缓存"""
+
+    def __init__(
+        self,
+        db=None,
+        use_firestore: bool = RESEARCH_CACHE_BACKEND == 'firestore',
+        ttl_seconds: int = RESEARCH_CACHE_TTL_SECONDS,
+        stale_seconds: int = RESEARCH_CACHE_STALE_SECONDS,
+        max_bytes: int = RESEARCH_CACHE_MAX_BYTES,
+        workers: int = RESEARCH_CACHE_WORKERS,
+    ):
+        self._db = db
+        self.use_firestore = use_firestore
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, ResearchEntry]" = OrderedDict()
+        self._bytes = 0
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='research-cache')
+
+    def get_or_compute(self, mode: str, topic: str, compute: Callable[[], str]) -> Tuple[str, str]:
+        """
+        读取话题的调研摘要，未命中时调用 compute
+
+        Args:
+            mode: 'video' / 'image'（两种调研提示词不同，分开缓存）
+            compute: 执行调研并返回摘要文本
+
+        Returns:
+            (summary, status)：status 为 'hit' / 'stale' / 'miss'
+        """
+        key = research_cache_key(mode, topic)
+        entry = self._get(key)
+        if entry is not None:
+            age = entry.age()
+            if age < self.ttl_seconds:
+                return entry.summary, 'hit'
+            if age < self.ttl_seconds + self.stale_seconds:
+                self._revalidate(key, compute)
+                return entry.summary, 'stale'
+
+        future, owner = self._claim(key)
+        if owner:
+            self._compute(key, compute, future)
+        # 其他请求正在调研同一话题时等待其结果
+        return future.result(), 'miss'
+
+    def _claim(self, key: str) -> Tuple[Future, bool]:
+        """同一 key 同时只有一个调研任务；新建任务时返回 owner=True"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._inflight[key] = future
+        return future, True
+
+    def _revalidate(self, key: str, compute: Callable[[], str]):
+        future, owner = self._claim(key)
+        if owner:
+            self.executor.submit(self._compute, key, compute, future)
+
+    def _compute(self, key: str, compute: Callable[[], str], future: Future):
+        try:
+            summary = compute()
+            if summary:
+                self._put(ResearchEntry(key=key, summary=summary, created_at=time.time()))
+            future.set_result(summary)
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _get(self, key: str) -> Optional[ResearchEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        entry = self._load(key)
+        if entry is not None:
+            self._remember(entry)
+        return entry
+
+    def _put(self, entry: ResearchEntry):
+        self._remember(entry)
+        self._store(entry)
+
+    def _remember(self, entry: ResearchEntry):
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(entry.key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[entry.key] = entry
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+
+    def _collection(self):
+        if not self.use_firestore:
+            return None
+        db = self._db or get_firestore_client()
+        return db.collection(RESEARCH_COLLECTION) if db is not None else None
+
+    @staticmethod
+    def _doc_id(key: str) -> str:
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()[:40]
+
+    def _load(self, key: str) -> Optional[ResearchEntry]:
+        try:
+            collection = self._collection()
+            if collection is None:
+                return None
+            snapshot = collection.document(self._doc_id(key)).get()
+            if not snapshot.exists:
+                return None
+            data = snapshot.to_dict() or {}
+            if data.get('key') != key or not data.get('summary'):
+                return None
+            return ResearchEntry(key=key, summary=data['summary'], created_at=float(data.get('created_at', 0)))
+        except Exception as e:
+            print(f"[ResearchCacheService] ⚠️ Failed to load research for {key}: {e}")
+            return None
+
+    def _store(self, entry: ResearchEntry):
+        try:
+            collection = self._collection()
+            if collection is not None:
+                collection.document(self._doc_id(entry.key)).set(asdict(entry))
+        except Exception as e:
+            print(f"[ResearchCacheService] ⚠️ Failed to store research for {entry.key}: {e}")
+
+
+_research_cache: Optional[ResearchCache] = None
+_research_cache_lock = threading.Lock()
+
+
+def get_research_cache() -> Optional[ResearchCache]:
+    """获取 ResearchCache 单例（RESEARCH_CACHE_ENABLED=false 时返回 None）"""
+    global _research_cache
+    if not RESEARCH_CACHE_ENABLED:
+        return None
+    if _research_cache is None:
+        with _research_cache_lock:
+            if _research_cache is None:
+                _research_cache = ResearchCache()
+    return _research_cache
@@ -3,29 +3,21 @@ Video Asset Service
 处理视频生成相关的资源管理（上传参考图片到 Firebase Storage，获取 GCS URI）
 """
 
-import sys
-import os
-
-# 处理 firebase_admin 导入路径问题
-try:
-    import firebase_admin
-except ImportError:
-    user_site = os.path.expanduser('~/Library/Python/3.9/lib/site-packages')
-    if os.path.exists(user_site) and user_site not in sys.path:
-        sys.path.append(user_site)
-    try:
-        import firebase_admin
-    except ImportError:
-        print("WARNING: firebase_admin module not found. Video asset features will be disabled.")
-
-from firebase_admin import credentials, firestore, storage
+from utils.firebase_registry import get_firestore_client, get_storage_bucket
+from services.firestore_write_buffer import get_firestore_write_buffer
+from utils.base64_stream import HashingReader
 import io
+import os
 import datetime
-import json
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 不超过该大小的图片使用单次 multipart 上传（整块读入内存，一次往返）
+STORAGE_MULTIPART_MAX_BYTES = int(os.getenv('STORAGE_MULTIPART_MAX_BYTES', str(1024 * 1024)))
+# 更大的图片使用 resumable 分块上传，每块大小（必须是 256KB 的整数倍），决定上传时的内存上限
+STORAGE_UPLOAD_CHUNK_SIZE = max(int(os.getenv('STORAGE_UPLOAD_CHUNK_SIZE', str(1024 * 1024))) // (256 * 1024), 1) * 256 * 1024
+
 
 class VideoAssetService:
     """管理视频生成资源的服务（上传图片到 Firebase Storage）"""
@@ -41,87 +33,55 @@ class VideoAssetService:
         if self._initialized:
             return
 
-        self.db = None
-        self.bucket = None
-        
-        try:
-            # 检查 Firebase 是否已初始化
-            if not firebase_admin._apps:
-                # 尝试从环境变量获取凭证
-                cred_path = os.getenv('FIREBASE_CREDENTIALS_PATH')
-                cred_json = os.getenv('FIREBASE_CREDENTIALS_JSON')
-
-                cred = None
-                if cred_path and os.path.exists(cred_path):
-                    print(f"[VideoAssetService] Initializing Firebase with credentials from: {cred_path}")
-                    cred = credentials.Certificate(cred_path)
-                elif cred_json:
-                    print(f"[VideoAssetService] Initializing Firebase with credentials from JSON string")
-                    try:
-                        cred_dict = json.loads(cred_json)
-                        cred = credentials.Certificate(cred_dict)
-                    except Exception as e:
-                        print(f"[VideoAssetService] Failed to parse FIREBASE_CREDENTIALS_JSON: {e}")
-                else:
-                    # Fallback: 查找默认凭证文件
-                    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-                    default_paths = [
-                        os.path.join(backend_dir, 'serviceAccountKey.json'),
-                        'serviceAccountKey.json',
-                        'backend/serviceAccountKey.json'
-                    ]
-                    for p in default_paths:
-                        if os.path.exists(p):
-                            print(f"[VideoAssetService] Initializing Firebase with default credentials file: {p}")
-                            cred = credentials.Certificate(p)
-                            break
-                
-                if cred:
-                    storage_bucket = os.getenv('FIREBASE_STORAGE_BUCKET')
-                    if not storage_bucket:
-                        print("[VideoAssetService] WARNING: FIREBASE_STORAGE_BUCKET not set in .env")
-                    
-                    firebase_admin.initialize_app(cred, {
-                        'storageBucket': storage_bucket
-                    })
-                    print("[VideoAssetService] ✅ Firebase initialized successfully")
-                else:
-                    print("[VideoAssetService] WARNING: No Firebase credentials found. Asset archiving will be disabled.")
-            
-            # 初始化客户端（如果 Firebase 已初始化）
-            if firebase_admin._apps:
-                self.db = firestore.client()
-                try:
-                    self.bucket = storage.bucket()
-                    print("[VideoAssetService] ✅ Storage bucket initialized")
-                except Exception as e:
-                    print(f"[VideoAssetService] ⚠️ Failed to initialize Storage bucket: {e}")
-            
-        except Exception as e:
-            print(f"[VideoAssetService] ❌ Error initializing VideoAssetService: {e}")
-            import traceback
-            traceback.print_exc()
+        if not self.is_available():
+            print("[VideoAssetService] WARNING: Firestore or Storage bucket unavailable. Asset archiving will be disabled until Firebase recovers.")
 
         self._initialized = True
 
+    @property
+    def db(self):
+        """Firestore 客户端（每次从 firebase_registry 读取，初始化失败后退避重试成功即可恢复）"""
+        return get_firestore_client()
+
+    @property
+    def bucket(self):
+        """Storage bucket（每次从 firebase_registry 读取）"""
+        return get_storage_bucket()
+
     def is_available(self):
         """检查服务是否可用"""
         return self.db is not None and self.bucket is not None
 
-    def archive_and_prepare_reference(self, image_bytes, mime_type, prompt):
+    def reference_prefix(self, owner=None):
+        """参考图片在 Storage 中的路径前缀（按用户隔离）"""
+        return f"veo_references/{owner}/" if owner else "veo_references/"
+
+    def owns_reference(self, gcs_uri, owner):
+        """检查客户端传入的 GCS URI 是否是该用户上传到本服务 bucket 的参考图片"""
+        if not self.is_available() or not owner or not isinstance(gcs_uri, str):
+            return False
+        prefix = f"gs://{self.bucket.name}/{self.reference_prefix(owner)}"
+        return gcs_uri.startswith(prefix) and '..' not in gcs_uri[len(prefix):]
+
+    def archive_and_prepare_reference(self, image_data, mime_type, prompt, size=None, owner=None):
         """
         上传图片到 Firebase Storage 并获取 GCS URI
         
         Args:
-            image_bytes: 图片字节流
+            image_data: 图片字节流，或可流式读取的文件对象（如 utils.base64_stream.Base64DecodingReader）
             mime_type: MIME 类型（如 'image/jpeg', 'image/png'）
             prompt: 提示词（用于 Firestore 记录）
+            size: 图片字节数（可选，未知时按分块上传处理）
+            owner: 上传用户的 UID（存放在 veo_references/<uid>/ 下，/generate 只接受该前缀下的 gcsUri）
         
         Returns:
             (doc_ref, public_url, gcs_uri)
             - doc_ref: Firestore 文档引用（用于追踪，可能为 None）
             - public_url: 公开访问 URL（可能为 None）
             - gcs_uri: GCS URI（格式：gs://bucket-name/path/to/image.jpg）
+
+        Raises:
+            ValueError: 图片数据无效（如 base64 解码失败），由调用方返回 400
         """
         if not self.is_available():
             print("[VideoAssetService] ⚠️ Firebase service not available, skipping archive.")
@@ -136,14 +96,21 @@ class VideoAssetService:
             elif 'webp' in mime_type.lower():
                 ext = '.webp'
             
-            file_name = f"veo_references/{timestamp}{ext}"
+            file_name = f"{self.reference_prefix(owner)}{timestamp}{ext}"
             
             # 1. 上传到 Firebase Storage
             print(f"[VideoAssetService] 📤 Uploading image to Firebase Storage: {file_name}")
             blob = self.bucket.blob(file_name)
             
-            # upload_from_file 需要一个文件类对象
-            blob.upload_from_file(io.BytesIO(image_bytes), content_type=mime_type)
+            # 边上传边计算内容哈希
+            if isinstance(image_data, (bytes, bytearray)):
+                size = len(image_data)
+                reader = HashingReader(io.BytesIO(image_data))
+            elif hasattr(image_data, 'sha256'):
+                reader = image_data
+            else:
+                reader = HashingReader(image_data)
+            self._upload_stream(blob, reader, mime_type, size)
             
             # 获取公开 URL
             public_url = blob.media_link
@@ -152,36 +119,57 @@ class VideoAssetService:
             bucket_name = self.bucket.name
             gcs_uri = f"gs://{bucket_name}/{file_name}"
             
-            print(f"[VideoAssetService] ✅ Image uploaded successfully")
+            print(f"[VideoAssetService] ✅ Image uploaded successfully ({reader.bytes_read} bytes, sha256 {reader.sha256[:12]})")
             print(f"[VideoAssetService] GCS URI: {gcs_uri}")
             
             # 2. 创建 Firestore 记录（可选，用于追踪）
+            # 文档 ID 在本地生成，写入交给后台批量缓冲区，不阻塞生成请求
             doc_ref = None
             try:
                 doc_ref = self.db.collection("veo_assets").document()
                 doc_data = {
                     "type": "reference_image",
+                    "owner": owner,
                     "storage_path": file_name,
                     "public_url": public_url,
                     "gcs_uri": gcs_uri,
+                    "sha256": reader.sha256,
+                    "size_bytes": reader.bytes_read,
                     "prompt": prompt[:500] if prompt else "",  # 限制长度
                     "uploaded_at": datetime.datetime.now(),
                     "veo_status": "processing",
                     "gemini_file_uri": None
                 }
-                doc_ref.set(doc_data)
-                print(f"[VideoAssetService] ✅ Firestore record created")
+                self._write(doc_ref, doc_data)
+                print(f"[VideoAssetService] ✅ Firestore record queued")
             except Exception as e:
-                print(f"[VideoAssetService] ⚠️ Failed to create Firestore record (non-blocking): {e}")
+                print(f"[VideoAssetService] ⚠️ Failed to queue Firestore record (non-blocking): {e}")
             
             return doc_ref, public_url, gcs_uri
 
+        except ValueError:
+            # 输入数据错误（不是存储故障），交给调用方返回 400
+            raise
         except Exception as e:
             print(f"[VideoAssetService] ❌ Error in archive_and_prepare_reference: {e}")
             import traceback
             traceback.print_exc()
             return None, None, None
 
+    def _upload_stream(self, blob, reader, mime_type, size=None):
+        """
+        上传文件对象到 Storage
+
+        小图片（已知大小且不超过 STORAGE_MULTIPART_MAX_BYTES）使用一次 multipart 请求；
+        其他情况使用 resumable 分块上传，每次只读取 STORAGE_UPLOAD_CHUNK_SIZE 字节，
+        峰值内存与图片大小无关
+        """
+        if size is not None and size <= STORAGE_MULTIPART_MAX_BYTES:
+            blob.upload_from_file(reader, size=size, content_type=mime_type)
+        else:
+            blob.chunk_size = STORAGE_UPLOAD_CHUNK_SIZE
+            blob.upload_from_file(reader, content_type=mime_type)
+
     def update_asset_status(self, doc_ref, status, video_uri=None, error=None):
         """
         更新 Firestore 中的资源状态
@@ -202,11 +190,21 @@ class VideoAssetService:
             if error:
                 update_data["error"] = str(error)[:1000]  # 限制错误信息长度
             
-            doc_ref.update(update_data)
-            print(f"[VideoAssetService] ✅ Updated asset status to {status}")
+            self._write(doc_ref, update_data, merge=True)
+            print(f"[VideoAssetService] ✅ Queued asset status update to {status}")
         except Exception as e:
             print(f"[VideoAssetService] ⚠️ Failed to update asset status: {e}")
 
+    def _write(self, doc_ref, data, merge=False):
+        """通过写入缓冲区异步写入；缓冲区不可用时回退为同步写入"""
+        write_buffer = get_firestore_write_buffer()
+        if write_buffer is None:
+            doc_ref.set(data, merge=merge)
+        elif merge:
+            write_buffer.update(doc_ref, data)
+        else:
+            write_buffer.set(doc_ref, data)
+
 
 def get_video_asset_service():
     """获取 VideoAssetService 单例"""
@@ -0,0 +1,347 @@
+"""
+Video Frame Service
+为生成完成的 Veo 视频抽取海报帧和 N 个均匀分布的关键帧
+- 每一帧单独启动一个 ffmpeg 进程，使用输入端 seek（-ss 在 -i 之前）直接跳到目标时间点，不解码整段视频
+- ffmpeg 只读取本地文件（视频代理的磁盘缓存，与代理、转存共用一次上游下载），
+  上游鉴权 header 不会出现在 ffmpeg 的命令行参数中
+- 各帧的 ffmpeg 进程由线程池并发调度，进程间互不阻塞
+- 结果（海报 WebP、关键帧 JPEG 和 frames.json 清单）与视频一起保存在 Storage 的 veo_videos/<id>/ 下，
+  关键帧可直接作为后续 /generate（视频延展）的 images 输入
+"""
+
+import base64
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.firebase_registry import get_storage_bucket
+from utils.media_probe import probe_mp4
+from services.video_proxy_service import get_video_proxy_service
+from services.video_transfer_service import VIDEO_STORAGE_PREFIX
+
+FFMPEG_BINARY = os.getenv('FFMPEG_BINARY', 'ffmpeg')
+VIDEO_FRAMES_ENABLED = os.getenv('VIDEO_FRAMES_ENABLED', 'true').lower() == 'true'
+# 均匀分布的关键帧数量（含首帧和尾帧）
+VIDEO_KEYFRAME_COUNT = int(os.getenv('VIDEO_KEYFRAME_COUNT', '4'))
+# 海报帧的时间点（秒，避开开头的淡入），以及最大边长
+VIDEO_POSTER_OFFSET = float(os.getenv('VIDEO_POSTER_OFFSET', '1.0'))
+VIDEO_POSTER_MAX_EDGE = int(os.getenv('VIDEO_POSTER_MAX_EDGE', '720'))
+VIDEO_POSTER_FORMAT = os.getenv('VIDEO_POSTER_FORMAT', 'webp')
+VIDEO_KEYFRAME_FORMAT = os.getenv('VIDEO_KEYFRAME_FORMAT', 'jpeg')
+# 并发的 ffmpeg 进程数
+VIDEO_FRAME_WORKERS = int(os.getenv('VIDEO_FRAME_WORKERS', str(min(os.cpu_count() or 2, 4))))
+VIDEO_FRAME_TIMEOUT = float(os.getenv('VIDEO_FRAME_TIMEOUT', '30'))
+# 内存中保留抽帧结果的视频数
+VIDEO_FRAME_CACHE_ENTRIES = int(os.getenv('VIDEO_FRAME_CACHE_ENTRIES', '64'))
+# 无法读取时长时使用的默认值（Veo 默认 8 秒）
+VIDEO_FRAME_DEFAULT_DURATION = float(os.getenv('VIDEO_FRAME_DEFAULT_DURATION', '8'))
+
+_FORMAT_MIME = {'jpeg': 'image/jpeg', 'webp': 'image/webp'}
+_FORMAT_EXTENSION = {'jpeg': 'jpg', 'webp': 'webp'}
+_FORMAT_CODEC = {
+    'jpeg': ['-c:v', 'mjpeg', '-q:v', '3'],
+    'webp': ['-c:v', 'libwebp', '-quality', '80'],
+}
+# 尾帧距离结尾的偏移（秒），避免 seek 超出最后一帧后没有输出
+_END_MARGIN = 0.1
+
+
+@dataclass
+class VideoFrame:
+    """一张抽取的帧"""
+    timestamp: float
+    data: bytes
+    mime_type: str
+    path: Optional[str] = None
+
+    def to_image_part(self) -> Dict[str, Any]:
+        """转换为 /generate 的 images 输入格式"""
+        return {
+            "data": base64.b64encode(self.data).decode('ascii'),
+            "mimeType": self.mime_type,
+            "timestamp": round(self.timestamp, 3),
+        }
+
+
+@dataclass
+class VideoFrames:
+    """一个视频的海报帧和关键帧"""
+    video_id: str
+    duration: float
+    poster: Optional[VideoFrame] = None
+    keyframes: List[VideoFrame] = field(default_factory=list)
+
+    def manifest(self) -> Dict[str, Any]:
+        return {
+            "duration": self.duration,
+            "poster": {"path": self.poster.path, "timestamp": self.poster.timestamp,
+                       "mimeType": self.poster.mime_type} if self.poster else None,
+            "keyframes": [{"path": f.path, "timestamp": f.timestamp, "mimeType": f.mime_type}
+                          for f in self.keyframes],
+        }
+
+
+def keyframe_timestamps(duration: float, count: int) -> List[float]:
+    """在 [0, duration) 内均匀取 count 个时间点（包含首帧和接近结尾的尾帧）"""
+    if count <= 0:
+        return []
+    last = max(duration - _END_MARGIN, 0.0)
+    if count == 1:
+        return [0.0]
+    return [round(last * i / (count - 1), 3) for i in range(count)]
+
+
+def build_ffmpeg_command(source: str, timestamp: float, fmt: str, max_edge: Optional[int] = None) -> List[str]:
+    """
+    构建抽取单帧的 ffmpeg 命令（输出写到 stdout）
+
+    source 为本地文件路径（命令行对本机其他用户可见，不能包含任何凭证）；
+    -ss 放在 -i 之前为输入端 seek：先跳到目标时间点之前最近的关键帧，只解码到目标帧为止
+    """
+    command = [FFMPEG_BINARY, '-nostdin', '-hide_banner', '-loglevel', 'error', '-ss', f'{timestamp:.3f}']
+    command += ['-i', source, '-frames:v', '1', '-an']
+    if max_edge:
+        command += ['-vf', f"scale='min({max_edge},iw)':'min({max_edge},ih)':force_original_aspect_ratio=decrease"]
+    command += _FORMAT_CODEC[fmt] + ['-f', 'image2pipe', 'pipe:1']
+    return command
+
+
+def extract_frame(source: str, timestamp: float, fmt: str, max_edge: Optional[int] = None,
+                  timeout: float = VIDEO_FRAME_TIMEOUT) -> bytes:
+    """
+    用 ffmpeg 抽取一帧
+
+    Raises:
+        RuntimeError: ffmpeg 失败或没有输出
+    """
+    command = build_ffmpeg_command(source, timestamp, fmt, max_edge)
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout, check=False)
+    if result.returncode != 0 or not result.stdout:
+        message = result.stderr.decode('utf-8', 'replace').strip()[-300:]
+        raise RuntimeError(f"ffmpeg exited with {result.returncode} at {timestamp:.2f}s: {message or 'no output'}")
+    return result.stdout
+
+
+def _file_reader(path: str):
+    def read_at(offset: int, length: int) -> bytes:
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+    return read_at
+
+
+class VideoFrameService:
+    """视频海报帧 / 关键帧抽取服务"""
+
+    def __init__(self, keyframe_count: int = VIDEO_KEYFRAME_COUNT, workers: int = VIDEO_FRAME_WORKERS,
+                 bucket=None, proxy=None, extractor: Optional[Callable[..., bytes]] = None):
+        self.keyframe_count = keyframe_count
+        # 每个视频一个编排任务；各帧的 ffmpeg 进程在独立的线程池中调度，避免编排任务占满线程池后互相等待
+        self._job_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='video-frame-jobs')
+        self.executor = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='video-frames')
+        self._bucket = bucket
+        self._proxy = proxy
+        self._extractor = extractor or extract_frame
+        self._results: "OrderedDict[str, VideoFrames]" = OrderedDict()
+        self._jobs: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def proxy(self):
+        return self._proxy or get_video_proxy_service()
+
+    def is_available(self) -> bool:
+        """自定义 extractor 或系统中存在 ffmpeg 时可用"""
+        if not VIDEO_FRAMES_ENABLED:
+            return False
+        return self._extractor is not extract_frame or shutil.which(FFMPEG_BINARY) is not None
+
+    # ------------------------------------------------------------------
+    # 抽帧
+    # ------------------------------------------------------------------
+
+    def submit(self, video_id: str, record: Dict[str, Any]) -> Optional[Future]:
+        """提交抽帧任务（同一视频只抽取一次）；不可用时返回 None"""
+        if not self.is_available():
+            return None
+        with self._lock:
+            if video_id in self._results:
+                done: Future = Future()
+                done.set_result(self._results[video_id])
+                return done
+            job = self._jobs.get(video_id)
+            if job is not None:
+                return job
+            job = self._job_executor.submit(self._extract, video_id, record)
+            self._jobs[video_id] = job
+        job.add_done_callback(lambda _: self._finish_job(video_id))
+        return job
+
+    def _finish_job(self, video_id: str):
+        with self._lock:
+            self._jobs.pop(video_id, None)
+
+    def _local_copy(self, video_id: str, record: Dict[str, Any]) -> str:
+        """
+        把视频放到临时目录供 ffmpeg 读取，返回文件路径（调用方负责删除所在目录）
+        优先硬链接代理的磁盘缓存（抽帧期间被 LRU 淘汰也不影响），缓存不可用时通过代理下载一份
+        """
+        work_dir = tempfile.mkdtemp(prefix='video-frames-')
+        path = os.path.join(work_dir, 'source.mp4')
+        try:
+            cached_path = self.proxy.fetch_to_cache(video_id, record)
+            if cached_path:
+                try:
+                    os.link(cached_path, path)
+                except OSError:
+                    try:
+                        shutil.copyfile(cached_path, path)
+                    except OSError:
+                        cached_path = None
+            if not cached_path:
+                status, _, chunks = self.proxy.open_source(record)
+                if status != 200:
+                    raise RuntimeError(f"Video source returned HTTP {status}")
+                with open(path, 'wb') as f:
+                    for chunk in chunks:
+                        f.write(chunk)
+        except Exception:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            raise
+        return path
+
+    def _probe_duration(self, source: str) -> float:
+        try:
+            info = probe_mp4(_file_reader(source), os.path.getsize(source))
+        except Exception as e:
+            print(f"[VideoFrameService] ⚠️ Duration probe failed: {e}")
+            info = None
+        return info.duration if info and info.duration else VIDEO_FRAME_DEFAULT_DURATION
+
+    def _extract(self, video_id: str, record: Dict[str, Any]) -> VideoFrames:
+        source = self._local_copy(video_id, record)
+        try:
+            frames = self._extract_frames(video_id, source)
+        finally:
+            shutil.rmtree(os.path.dirname(source), ignore_errors=True)
+
+        self._upload(frames)
+        self._remember(frames)
+        print(f"[VideoFrameService] ✅ Extracted poster + {len(frames.keyframes)} keyframes for {video_id}")
+        return frames
+
+    def _extract_frames(self, video_id: str, source: str) -> VideoFrames:
+        duration = self._probe_duration(source)
+        poster_at = round(min(VIDEO_POSTER_OFFSET, duration / 2), 3)
+
+        # 海报帧和所有关键帧并发抽取：每一帧是一个独立的 ffmpeg 进程
+        poster_job = self.executor.submit(self._extractor, source, poster_at, VIDEO_POSTER_FORMAT, VIDEO_POSTER_MAX_EDGE)
+        keyframe_jobs = [
+            (ts, self.executor.submit(self._extractor, source, ts, VIDEO_KEYFRAME_FORMAT, None))
+            for ts in keyframe_timestamps(duration, self.keyframe_count)
+        ]
+
+        frames = VideoFrames(video_id, duration)
+        try:
+            frames.poster = VideoFrame(poster_at, poster_job.result(), _FORMAT_MIME[VIDEO_POSTER_FORMAT])
+        except Exception as e:
+            print(f"[VideoFrameService] ⚠️ Poster extraction failed for {video_id}: {e}")
+        for ts, job in keyframe_jobs:
+            try:
+                frames.keyframes.append(VideoFrame(ts, job.result(), _FORMAT_MIME[VIDEO_KEYFRAME_FORMAT]))
+            except Exception as e:
+                print(f"[VideoFrameService] ⚠️ Keyframe at {ts:.2f}s failed for {video_id}: {e}")
+        if frames.poster is None and not frames.keyframes:
+            raise RuntimeError(f"No frames extracted for video {video_id}")
+        return frames
+
+    def _upload(self, frames: VideoFrames):
+        """保存到视频旁边：veo_videos/<id>/poster.webp、frame_00.jpg ...、frames.json"""
+        bucket = self._bucket or get_storage_bucket()
+        if bucket is None:
+            return
+        prefix = f"{VIDEO_STORAGE_PREFIX}/{frames.video_id}"
+        items = []
+        if frames.poster:
+            frames.poster.path = f"{prefix}/poster.{_FORMAT_EXTENSION[VIDEO_POSTER_FORMAT]}"
+            items.append(frames.poster)
+        for index, frame in enumerate(frames.keyframes):
+            frame.path = f"{prefix}/frame_{index:02d}.{_FORMAT_EXTENSION[VIDEO_KEYFRAME_FORMAT]}"
+            items.append(frame)
+        try:
+            for frame in items:
+                blob = bucket.blob(frame.path)
+                blob.cache_control = 'private, max-age=31536000, immutable'
+                blob.upload_from_string(frame.data, content_type=frame.mime_type)
+            bucket.blob(f"{prefix}/frames.json").upload_from_string(
+                json.dumps(frames.manifest()), content_type='application/json')
+        except Exception as e:
+            print(f"[VideoFrameService] ⚠️ Failed to upload frames for {frames.video_id}: {e}")
+
+    def _remember(self, frames: VideoFrames):
+        with self._lock:
+            self._results[frames.video_id] = frames
+            self._results.move_to_end(frames.video_id)
+            while len(self._results) > VIDEO_FRAME_CACHE_ENTRIES:
+                self._results.popitem(last=False)
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+
+    def get(self, video_id: str, wait: float = VIDEO_FRAME_TIMEOUT) -> Optional[VideoFrames]:
+        """读取抽帧结果（内存 → 进行中的任务 → Storage）；不存在时返回 None"""
+        with self._lock:
+            frames = self._results.get(video_id)
+            if frames is not None:
+                self._results.move_to_end(video_id)
+                return frames
+            job = self._jobs.get(video_id)
+        if job is not None:
+            try:
+                return job.result(timeout=wait)
+            except Exception as e:
+                print(f"[VideoFrameService] ⚠️ Frame extraction for {video_id} unavailable: {e}")
+                return None
+        return self._download(video_id)
+
+    def _download(self, video_id: str) -> Optional[VideoFrames]:
+        bucket = self._bucket or get_storage_bucket()
+        if bucket is None:
+            return None
+        prefix = f"{VIDEO_STORAGE_PREFIX}/{video_id}"
+        try:
+            manifest = json.loads(bucket.blob(f"{prefix}/frames.json").download_as_bytes())
+            poster = manifest.get('poster')
+            frames = VideoFrames(video_id, manifest.get('duration') or VIDEO_FRAME_DEFAULT_DURATION)
+            if poster:
+                frames.poster = VideoFrame(poster['timestamp'], bucket.blob(poster['path']).download_as_bytes(),
+                                           poster['mimeType'], poster['path'])
+            for item in manifest.get('keyframes', []):
+                frames.keyframes.append(VideoFrame(item['timestamp'], bucket.blob(item['path']).download_as_bytes(),
+                                                   item['mimeType'], item['path']))
+        except Exception:
+            return None
+        self._remember(frames)
+        return frames
+
+
+_video_frame_service: Optional[VideoFrameService] = None
+_video_frame_service_lock = threading.Lock()
+
+
+def get_video_frame_service() -> VideoFrameService:
+    """获取 VideoFrameService 单例"""
+    global _video_frame_service
+    if _video_frame_service is None:
+        with _video_frame_service_lock:
+            if _video_frame_service is None:
+                _video_frame_service = VideoFrameService()
+    return _video_frame_service
@@ -0,0 +1,424 @@
+"""
+Video Proxy Service
+为 Veo 生成的视频提供服务端代理（/api/reel/videos/<id>）
+- 客户端只拿到不可猜测的视频 ID，API Key 只在服务端以 x-goog-api-key header 发送，不再出现在 URL 或 Firestore 中
+- 支持 HTTP Range（拖动进度条），未缓存时把上游响应分块转发
+- 完整视频在后台下载到本地磁盘缓存（按字节数 LRU 淘汰），之后的请求由 send_file 直接从磁盘提供
+- 视频转存到 Firebase Storage 后（见 video_transfer_service），未命中磁盘缓存的请求改为从 Storage 读取
+"""
+
+import datetime
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from utils.firebase_registry import get_firestore_client, get_storage_bucket
+from services.firestore_write_buffer import get_firestore_write_buffer
+
+# 本地视频缓存
+VIDEO_CACHE_ENABLED = os.getenv('VIDEO_CACHE_ENABLED', 'true').lower() == 'true'
+VIDEO_CACHE_DIR = os.getenv('VIDEO_CACHE_DIR', '/tmp/reel-video-cache')
+VIDEO_CACHE_MAX_BYTES = int(os.getenv('VIDEO_CACHE_MAX_BYTES', str(2 * 1024 * 1024 * 1024)))
+# 转发上游响应时每块的大小
+VIDEO_PROXY_CHUNK_SIZE = int(os.getenv('VIDEO_PROXY_CHUNK_SIZE', str(256 * 1024)))
+VIDEO_PROXY_TIMEOUT = float(os.getenv('VIDEO_PROXY_TIMEOUT', '30'))
+
+# 视频 ID → 源地址的映射（跨实例共享）
+VIDEO_COLLECTION = 'veo_videos'
+# 未转存视频的记录在本实例内的有效期（秒），过期后重新读取 Firestore
+VIDEO_RECORD_REFRESH_SECONDS = float(os.getenv('VIDEO_RECORD_REFRESH_SECONDS', '30'))
+
+_VIDEO_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+_RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+# 需要转发给客户端的上游响应头
+_FORWARDED_HEADERS = ('Content-Type', 'Content-Length', 'Content-Range', 'Accept-Ranges', 'ETag', 'Last-Modified')
+
+
+def is_valid_video_id(video_id: str) -> bool:
+    return bool(_VIDEO_ID_PATTERN.match(video_id or ''))
+
+
+def parse_range(header: Optional[str]) -> Optional[Tuple[Optional[int], Optional[int]]]:
+    """
+    解析单段 Range header
+
+    Returns:
+        (start, end)：'bytes=0-99' → (0, 99)，'bytes=100-' → (100, None)，'bytes=-500' → (None, 500)；
+        无 Range、多段或格式无效时返回 None
+    """
+    if not header:
+        return None
+    match = _RANGE_PATTERN.match(header.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    start = int(match.group(1)) if match.group(1) else None
+    end = int(match.group(2)) if match.group(2) else None
+    if start is not None and end is not None and end < start:
+        return None
+    return start, end
+
+
+def resolve_range(byte_range: Optional[Tuple[Optional[int], Optional[int]]], size: int) -> Optional[Tuple[int, int]]:
+    """
+    把 parse_range 的结果换算为 [start, end] 闭区间
+
+    Returns:
+        (start, end)；范围不可满足时返回 None
+    """
+    start, end = byte_range
+    if start is None:
+        start, end = max(size - end, 0), size - 1
+    else:
+        end = size - 1 if end is None else min(end, size - 1)
+    if start >= size or start > end:
+        return None
+    return start, end
+
+
+class VideoDiskCache:
+    """按字节数 LRU 淘汰的本地视频缓存（文件名即视频 ID）"""
+
+    def __init__(self, directory: str = VIDEO_CACHE_DIR, max_bytes: int = VIDEO_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # 进程重启后按最近访问时间恢复索引
+        entries = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if is_valid_video_id(name) and os.path.isfile(path):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, name, stat.st_size))
+            elif name.endswith('.part'):
+                os.remove(path)
+        for _, name, size in sorted(entries):
+            self._index[name] = size
+            self._size += size
+
+    def path_for(self, video_id: str) -> str:
+        return os.path.join(self.directory, video_id)
+
+    def get(self, video_id: str) -> Optional[str]:
+        """返回缓存文件路径并标记为最近使用；未缓存时返回 None"""
+        with self._lock:
+            if video_id not in self._index:
+                return None
+            self._index.move_to_end(video_id)
+        path = self.path_for(video_id)
+        try:
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._size -= self._index.pop(video_id, 0)
+            return None
+        return path
+
+    def put(self, video_id: str, chunks: Iterator[bytes]) -> Optional[str]:
+        """写入临时文件，完成后原子重命名并淘汰最久未使用的视频"""
+        temp_path = f"{self.path_for(video_id)}.{secrets.token_hex(4)}.part"
+        size = 0
+        try:
+            with open(temp_path, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise ValueError("Video larger than the cache budget")
+            os.replace(temp_path, self.path_for(video_id))
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        with self._lock:
+            self._size += size - self._index.pop(video_id, 0)
+            self._index[video_id] = size
+            while self._size > self.max_bytes and len(self._index) > 1:
+                evicted, evicted_size = self._index.popitem(last=False)
+                self._size -= evicted_size
+                try:
+                    os.remove(self.path_for(evicted))
+                except OSError:
+                    pass
+        return self.path_for(video_id)
+
+
+class VideoProxyService:
+    """Veo 视频代理服务"""
+
+    def __init__(self, session=None, cache: Optional[VideoDiskCache] = None, db=None, bucket=None):
+        self._session = session
+        self.cache = cache
+        if self.cache is None and VIDEO_CACHE_ENABLED:
+            try:
+                self.cache = VideoDiskCache()
+            except OSError as e:
+                print(f"[VideoProxyService] ⚠️ Disk cache disabled: {e}")
+        self._db = db
+        self._bucket = bucket
+        # video_id -> {"source_uri", "storage_path", "size_bytes"}
+        self._records: Dict[str, Dict[str, Any]] = {}
+        # 正在下载到磁盘缓存的视频：video_id -> 下载完成事件（其他调用方等待同一次下载）
+        self._filling: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        return self._session
+
+    @staticmethod
+    def upstream_headers() -> Dict[str, str]:
+        """访问 Gemini Files API 的鉴权 header（API Key 不放在 URL 中）"""
+        api_key = os.getenv('GEMINI_API_KEY') or os.getenv('GOOGLE_API_KEY')
+        return {'x-goog-api-key': api_key} if api_key else {}
+
+    # ------------------------------------------------------------------
+    # 注册与查找
+    # ------------------------------------------------------------------
+
+    def register(self, source_uri: Optional[str], asset_doc_id: Optional[str] = None,
+                 storage_path: Optional[str] = None, size_bytes: Optional[int] = None) -> str:
+        """
+        登记一个视频，返回代理用的视频 ID
+
+        Args:
+            source_uri: Veo 返回的下载地址（不含 API Key）；只存在于 Storage 的视频为 None
+            asset_doc_id: 对应的 veo_assets 文档 ID（可选）
+            storage_path: 已保存在 Storage 中的路径（如拼接生成的成片）
+            size_bytes: Storage 中文件的大小
+        """
+        video_id = secrets.token_urlsafe(16)
+        stored = {key: value for key, value in (
+            ("source_uri", source_uri), ("storage_path", storage_path), ("size_bytes", size_bytes)) if value}
+        with self._lock:
+            self._records[video_id] = {**stored, "checked_at": time.time()}
+        db = self._db or get_firestore_client()
+        if db is not None:
+            record = {
+                **stored,
+                "asset_doc_id": asset_doc_id,
+                "created_at": datetime.datetime.now()
+            }
+            write_buffer = get_firestore_write_buffer() if self._db is None else None
+            try:
+                doc_ref = db.collection(VIDEO_COLLECTION).document(video_id)
+                if write_buffer is not None:
+                    write_buffer.set(doc_ref, record)
+                else:
+                    doc_ref.set(record)
+            except Exception as e:
+                print(f"[VideoProxyService] ⚠️ Failed to persist video mapping (this instance only): {e}")
+        return video_id
+
+    def resolve(self, video_id: str) -> Optional[Dict[str, Any]]:
+        """
+        查找视频记录（本实例内存 → Firestore）
+
+        Returns:
+            {"source_uri", "storage_path"?, "size_bytes"?}；不存在时返回 None
+        """
+        if not is_valid_video_id(video_id):
+            return None
+        with self._lock:
+            record = self._records.get(video_id)
+            if record and (record.get('storage_path') or
+                           time.time() - record.get('checked_at', 0) < VIDEO_RECORD_REFRESH_SECONDS):
+                return dict(record)
+        db = self._db or get_firestore_client()
+        if db is None:
+            return dict(record) if record else None
+        try:
+            # 未转存的视频定期重新查询 Firestore，以便获知其他实例完成的转存
+            snapshot = db.collection(VIDEO_COLLECTION).document(video_id).get()
+        except Exception as e:
+            print(f"[VideoProxyService] ⚠️ Failed to look up video {video_id}: {e}")
+            return dict(record) if record else None
+        if not snapshot.exists:
+            return dict(record) if record else None
+        data = snapshot.to_dict() or {}
+        stored = {key: data.get(key) for key in ('source_uri', 'storage_path', 'size_bytes') if data.get(key)}
+        if not stored.get('source_uri') and not stored.get('storage_path'):
+            return dict(record) if record else None
+        with self._lock:
+            self._records[video_id] = {**(record or {}), **stored, 'checked_at': time.time()}
+            return dict(self._records[video_id])
+
+    def mark_archived(self, video_id: str, storage_path: str, size_bytes: int):
+        """记录视频已转存到 Storage，之后的请求从 Storage 读取"""
+        with self._lock:
+            self._records.setdefault(video_id, {}).update(storage_path=storage_path, size_bytes=size_bytes)
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+
+    def cached_path(self, video_id: str) -> Optional[str]:
+        """已完整缓存到本地磁盘的视频路径"""
+        return self.cache.get(video_id) if self.cache else None
+
+    def open_source(self, record: Dict[str, Any], range_header: Optional[str] = None):
+        """按视频记录打开数据源：已转存的从 Storage 读取，否则请求上游"""
+        if record.get('storage_path'):
+            try:
+                return self.open_storage(record['storage_path'], record.get('size_bytes'), range_header)
+            except Exception as e:
+                if not record.get('source_uri'):
+                    raise
+                print(f"[VideoProxyService] ⚠️ Storage read failed, falling back to upstream: {e}")
+        if not record.get('source_uri'):
+            raise RuntimeError("No readable source for video")
+        return self.open_upstream(record['source_uri'], range_header)
+
+    def open_storage(self, storage_path: str, size: Optional[int] = None, range_header: Optional[str] = None):
+        """
+        从 Firebase Storage 分块读取（可带 Range）
+
+        Returns:
+            (status_code, headers, chunk_iterator)
+        """
+        bucket = self._bucket or get_storage_bucket()
+        if bucket is None:
+            raise RuntimeError("Storage bucket unavailable")
+        blob = bucket.blob(storage_path)
+        if size is None:
+            blob.reload()
+            size = blob.size
+        byte_range = parse_range(range_header)
+        if byte_range:
+            resolved = resolve_range(byte_range, size)
+            if resolved is None:
+                return 416, {'Content-Range': f'bytes */{size}'}, iter(())
+            start, end = resolved
+            status = 206
+        else:
+            start, end = 0, size - 1
+            status = 200
+        headers = {
+            'Content-Type': 'video/mp4',
+            'Content-Length': str(end - start + 1),
+            'Accept-Ranges': 'bytes',
+        }
+        if status == 206:
+            headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+        def relay():
+            reader = blob.open('rb', chunk_size=VIDEO_PROXY_CHUNK_SIZE)
+            try:
+                reader.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = reader.read(min(VIDEO_PROXY_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+            finally:
+                reader.close()
+
+        return status, headers, relay()
+
+    def open_upstream(self, source_uri: str, range_header: Optional[str] = None):
+        """
+        向上游发起（可带 Range 的）流式请求
+
+        Returns:
+            (status_code, headers, chunk_iterator)
+        """
+        headers = self.upstream_headers()
+        if range_header:
+            headers['Range'] = range_header
+        response = self.session.get(source_uri, headers=headers, stream=True, timeout=VIDEO_PROXY_TIMEOUT)
+        if response.status_code >= 400:
+            status = response.status_code
+            response.close()
+            return status, {}, iter(())
+        forwarded = {name: response.headers[name] for name in _FORWARDED_HEADERS if name in response.headers}
+        forwarded.setdefault('Accept-Ranges', 'bytes')
+
+        def relay():
+            try:
+                for chunk in response.iter_content(chunk_size=VIDEO_PROXY_CHUNK_SIZE):
+                    if chunk:
+                        yield chunk
+            finally:
+                response.close()
+
+        return response.status_code, forwarded, relay()
+
+    def fetch_to_cache(self, video_id: str, record: Dict[str, Any], raise_errors: bool = False) -> Optional[str]:
+        """
+        把完整视频下载到磁盘缓存并返回文件路径（阻塞）
+        同一视频只下载一次：已有下载进行中时等待它完成；转存、抽帧等后台任务都从这份缓存读取，不再各自请求上游
+
+        Args:
+            raise_errors: 上游错误时抛出异常（由调用方重试），而不是返回 None
+
+        Returns:
+            缓存文件路径；缓存不可用、视频超出缓存预算、下载失败（raise_errors=False）或等待的下载失败时返回 None
+        """
+        if not self.cache:
+            return None
+        path = self.cache.get(video_id)
+        if path:
+            return path
+        with self._lock:
+            event = self._filling.get(video_id)
+            owner = event is None
+            if owner:
+                event = self._filling[video_id] = threading.Event()
+        if not owner:
+            event.wait()
+            return self.cache.get(video_id)
+        try:
+            status, _, chunks = self.open_source(record)
+            if status != 200:
+                raise RuntimeError(f"Upstream returned HTTP {status}")
+            path = self.cache.put(video_id, chunks)
+            print(f"[VideoProxyService] ✅ Cached video {video_id}")
+            return path
+        except ValueError as e:
+            # 超出缓存预算：调用方直接读取数据源
+            print(f"[VideoProxyService] ⚠️ Not caching video {video_id}: {e}")
+            return None
+        except Exception as e:
+            print(f"[VideoProxyService] ⚠️ Cache fill for {video_id} failed: {e}")
+            if raise_errors:
+                raise
+            return None
+        finally:
+            with self._lock:
+                self._filling.pop(video_id, None)
+            event.set()
+
+    def ensure_cached(self, video_id: str, record: Dict[str, Any]):
+        """在后台把完整视频下载到磁盘缓存（同一视频只下载一次）"""
+        if not self.cache or self.cache.get(video_id):
+            return
+        with self._lock:
+            if video_id in self._filling:
+                return
+        threading.Thread(target=self.fetch_to_cache, args=(video_id, record),
+                         name=f'video-cache-{video_id[:8]}', daemon=True).start()
+
+
+_video_proxy_service: Optional[VideoProxyService] = None
+_video_proxy_service_lock = threading.Lock()
+
+
+def get_video_proxy_service() -> VideoProxyService:
+    """获取 VideoProxyService 单例"""
+    global _video_proxy_service
+    if _video_proxy_service is None:
+        with _video_proxy_service_lock:
+            if _video_proxy_service is None:
+                _video_proxy_service = VideoProxyService()
+    return _video_proxy_service
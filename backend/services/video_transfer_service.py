@@ -0,0 +1,211 @@
+"""
+Video Transfer Service
+把生成完成的 Veo 视频在后台转存到 Firebase Storage
+- 优先从视频代理的本地磁盘缓存上传（与代理、抽帧共用一次上游下载）；缓存不可用时把上游响应分块流式写入 Storage
+  （resumable 上传），内存占用只与分块大小有关
+- 固定数量的 worker 线程限制并发；失败的任务进入重试队列，按指数退避重新入队
+- 完成后在 veo_assets 文档记录 gs:// 地址，并通知视频代理改为从 Storage 读取
+"""
+
+import datetime
+import os
+import queue
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from utils.firebase_registry import get_firestore_client, get_storage_bucket
+from utils.base64_stream import HashingReader, IteratorReader
+from services.firestore_write_buffer import get_firestore_write_buffer
+from services.video_proxy_service import VIDEO_COLLECTION, get_video_proxy_service
+
+# 同时进行的转存数量
+VIDEO_TRANSFER_CONCURRENCY = int(os.getenv('VIDEO_TRANSFER_CONCURRENCY', '2'))
+# 单个视频的最大重试次数
+VIDEO_TRANSFER_MAX_RETRIES = int(os.getenv('VIDEO_TRANSFER_MAX_RETRIES', '4'))
+VIDEO_TRANSFER_BASE_BACKOFF = float(os.getenv('VIDEO_TRANSFER_BASE_BACKOFF', '5'))
+# resumable 上传的分块大小（必须是 256KB 的整数倍）
+VIDEO_UPLOAD_CHUNK_SIZE = max(int(os.getenv('VIDEO_UPLOAD_CHUNK_SIZE', str(8 * 1024 * 1024))) // (256 * 1024), 1) * 256 * 1024
+VIDEO_STORAGE_PREFIX = os.getenv('VIDEO_STORAGE_PREFIX', 'veo_videos')
+
+
+@dataclass
+class TransferJob:
+    video_id: str
+    source_uri: str
+    asset_doc_id: Optional[str] = None
+    attempt: int = 0
+
+
+class VideoTransferService:
+    """Veo 视频转存服务"""
+
+    def __init__(self, concurrency: int = VIDEO_TRANSFER_CONCURRENCY, max_retries: int = VIDEO_TRANSFER_MAX_RETRIES,
+                 base_backoff: float = VIDEO_TRANSFER_BASE_BACKOFF, bucket=None, db=None, proxy=None):
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self._bucket = bucket
+        self._db = db
+        self._proxy = proxy
+        self._queue: "queue.Queue[TransferJob]" = queue.Queue()
+        # 重试队列：(ready_at, seq, job)，由调度线程按到期时间放回主队列
+        self._retry_queue: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._seq = 0
+        self._lock = threading.Lock()
+        self.stats = {"queued": 0, "completed": 0, "retries": 0, "failed": 0, "bytes": 0}
+        self._workers = [
+            threading.Thread(target=self._worker, name=f'video-transfer-{i}', daemon=True)
+            for i in range(max(concurrency, 1))
+        ]
+        for worker in self._workers:
+            worker.start()
+        threading.Thread(target=self._retry_scheduler, name='video-transfer-retry', daemon=True).start()
+
+    @property
+    def proxy(self):
+        return self._proxy or get_video_proxy_service()
+
+    def enqueue(self, video_id: str, source_uri: str, asset_doc_id: Optional[str] = None):
+        """提交一个转存任务（立即返回）"""
+        with self._lock:
+            self.stats["queued"] += 1
+        self._queue.put(TransferJob(video_id, source_uri, asset_doc_id))
+        print(f"[VideoTransferService] Queued transfer for video {video_id}")
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """等待主队列和重试队列全部处理完（用于测试与关闭前排空）"""
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            if self._queue.unfinished_tasks == 0 and self._retry_queue.empty():
+                return True
+            if deadline is not None and time.time() >= deadline:
+                return False
+            time.sleep(0.01)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._transfer(job)
+            except Exception as e:
+                self._handle_failure(job, e)
+            finally:
+                self._queue.task_done()
+
+    def _retry_scheduler(self):
+        while True:
+            ready_at, seq, job = self._retry_queue.get()
+            delay = ready_at - time.time()
+            if delay > 0:
+                # 未到期则放回并等待（期间有更早到期的任务加入也不会被长时间阻塞）
+                self._retry_queue.put((ready_at, seq, job))
+                time.sleep(min(delay, 0.5))
+                continue
+            self._queue.put(job)
+
+    def _handle_failure(self, job: TransferJob, error: Exception):
+        if job.attempt >= self.max_retries:
+            with self._lock:
+                self.stats["failed"] += 1
+            print(f"[VideoTransferService] ❌ Giving up on video {job.video_id} after {job.attempt + 1} attempts: {error}")
+            self._record(job, {"transfer_status": "failed", "transfer_error": str(error)[:500]})
+            return
+        delay = self.base_backoff * (2 ** job.attempt) * (0.5 + random.random() / 2)
+        job.attempt += 1
+        with self._lock:
+            self.stats["retries"] += 1
+            self._seq += 1
+            seq = self._seq
+        print(f"[VideoTransferService] ⚠️ Transfer of video {job.video_id} failed ({error}), retry in {delay:.1f}s")
+        self._retry_queue.put((time.time() + delay, seq, job))
+
+    def _transfer(self, job: TransferJob):
+        bucket = self._bucket or get_storage_bucket()
+        if bucket is None:
+            raise RuntimeError("Storage bucket unavailable")
+
+        storage_path = f"{VIDEO_STORAGE_PREFIX}/{job.video_id}.mp4"
+        blob = bucket.blob(storage_path)
+        blob.chunk_size = VIDEO_UPLOAD_CHUNK_SIZE
+        started = time.time()
+        reader = self._upload_cached(job, blob)
+        if reader is None:
+            status, _, chunks = self.proxy.open_upstream(job.source_uri)
+            if status != 200:
+                raise RuntimeError(f"Upstream returned HTTP {status}")
+            reader = IteratorReader(chunks)
+            blob.upload_from_file(reader, content_type='video/mp4')
+
+        gcs_uri = f"gs://{bucket.name}/{storage_path}"
+        with self._lock:
+            self.stats["completed"] += 1
+            self.stats["bytes"] += reader.bytes_read
+        print(f"[VideoTransferService] ✅ Archived video {job.video_id} to {gcs_uri} "
+              f"({reader.bytes_read} bytes in {time.time() - started:.1f}s)")
+
+        self.proxy.mark_archived(job.video_id, storage_path, reader.bytes_read)
+        self._record(job, {
+            "transfer_status": "completed",
+            "storage_path": storage_path,
+            "gcs_uri": gcs_uri,
+            "size_bytes": reader.bytes_read,
+            "sha256": reader.sha256,
+            "archived_at": datetime.datetime.now()
+        }, asset_fields={
+            "generated_video_gcs_uri": gcs_uri,
+            "generated_video_storage_path": storage_path,
+            "generated_video_sha256": reader.sha256,
+            "generated_video_size_bytes": reader.bytes_read
+        })
+
+    def _upload_cached(self, job: TransferJob, blob) -> Optional[HashingReader]:
+        """
+        从代理的磁盘缓存上传（缓存中没有时由代理下载一次，上游错误直接抛出进入重试）
+        缓存不可用或视频超出缓存预算时返回 None，由调用方直接转发上游
+        """
+        cached_path = self.proxy.fetch_to_cache(job.video_id, {"source_uri": job.source_uri}, raise_errors=True)
+        if not cached_path:
+            return None
+        try:
+            f = open(cached_path, 'rb')
+        except OSError:
+            # 刚好被 LRU 淘汰
+            return None
+        with f:
+            reader = HashingReader(f)
+            blob.upload_from_file(reader, size=os.fstat(f.fileno()).st_size, content_type='video/mp4')
+        return reader
+
+    def _record(self, job: TransferJob, video_fields: dict, asset_fields: Optional[dict] = None):
+        """更新 veo_videos 映射（供其他实例的代理读取）和 veo_assets 记录"""
+        db = self._db or get_firestore_client()
+        if db is None:
+            return
+        write_buffer = get_firestore_write_buffer() if self._db is None else None
+        writes = [(db.collection(VIDEO_COLLECTION).document(job.video_id), video_fields)]
+        if asset_fields and job.asset_doc_id:
+            writes.append((db.collection('veo_assets').document(job.asset_doc_id), asset_fields))
+        for doc_ref, data in writes:
+            try:
+                if write_buffer is not None:
+                    write_buffer.update(doc_ref, data)
+                else:
+                    doc_ref.set(data, merge=True)
+            except Exception as e:
+                print(f"[VideoTransferService] ⚠️ Failed to record transfer result: {e}")
+
+
+_video_transfer_service: Optional[VideoTransferService] = None
+_video_transfer_service_lock = threading.Lock()
+
+
+def get_video_transfer_service() -> VideoTransferService:
+    """获取 VideoTransferService 单例"""
+    global _video_transfer_service
+    if _video_transfer_service is None:
+        with _video_transfer_service_lock:
+            if _video_transfer_service is None:
+                _video_transfer_service = VideoTransferService()
+    return _video_transfer_service
@@ -0,0 +1,118 @@
+"""
+Asset Derivative Service 测试
+测试预览图优先返回、多尺寸派生图、原图先于派生图上传、内存 LRU 与 Storage 回源
+"""
+
+import io
+import os
+import sys
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.asset_derivative_service import AssetDerivativeService
+
+
+class FakeBlob:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.cache_control = None
+
+    def upload_from_string(self, data, content_type=None):
+        self.bucket.objects[self.name] = data
+        self.bucket.order.append(self.name.rsplit('/', 1)[-1])
+
+    def download_as_bytes(self):
+        if self.name not in self.bucket.objects:
+            raise FileNotFoundError(self.name)
+        return self.bucket.objects[self.name]
+
+
+class FakeBucket:
+    def __init__(self):
+        self.objects = {}
+        self.order = []
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+
+def _png(size=(1080, 1920)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 120, 40)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def test_preview_and_derivatives():
+    """测试预览图随登记返回，缩略图与原图可按需读取"""
+    bucket = FakeBucket()
+    service = AssetDerivativeService(sizes=[('preview', 768), ('thumb', 256)], formats=['webp'], bucket=bucket)
+    original = _png()
+    asset_key, preview = service.register_image(original, 'image/png')
+
+    assert len(asset_key) >= 16
+    data, mime_type = preview
+    assert mime_type == 'image/webp'
+    assert max(Image.open(io.BytesIO(data)).size) == 768
+
+    thumb, thumb_mime = service.get(asset_key, 'thumb')
+    assert thumb_mime == 'image/webp'
+    assert Image.open(io.BytesIO(thumb)).size == (144, 256)
+    assert service.get(asset_key, 'original') == (original, 'image/png')
+    assert service.get('missing-asset-key-000', 'thumb') is None
+
+    service.executor.shutdown(wait=True)
+    assert f"generated_assets/{asset_key}/thumb.webp" in bucket.objects
+
+
+def test_small_image_is_not_upscaled():
+    """测试小于派生尺寸的图片保持原尺寸"""
+    service = AssetDerivativeService(sizes=[('preview', 768)], formats=['webp'], bucket=FakeBucket())
+    _, (data, _) = service.register_image(_png((300, 200)), 'image/png')
+    assert Image.open(io.BytesIO(data)).size == (300, 200)
+
+
+def test_falls_back_to_storage_after_eviction():
+    """测试内存中被淘汰后从 Storage 读取"""
+    bucket = FakeBucket()
+    service = AssetDerivativeService(sizes=[('thumb', 64)], formats=['webp'], bucket=bucket, cache_bytes=1)
+    asset_key, _ = service.register_image(_png((640, 480)), 'image/png')
+    service.executor.shutdown(wait=True)
+
+    data, mime_type = service.get(asset_key, 'thumb')
+    assert mime_type == 'image/webp'
+    assert Image.open(io.BytesIO(data)).size == (64, 48)
+
+
+def test_original_with_unmapped_mime_type_is_found():
+    """测试 GIF 等非派生格式的原图在内存和 Storage 中都能按 original 读取"""
+    bucket = FakeBucket()
+    buffer = io.BytesIO()
+    Image.new('P', (64, 64)).save(buffer, format='GIF')
+    original = buffer.getvalue()
+    service = AssetDerivativeService(sizes=[('thumb', 32)], formats=['webp'], bucket=bucket)
+    asset_key, _ = service.register_image(original, 'image/gif')
+    assert service.get(asset_key, 'original') == (original, 'image/gif')
+
+    service.executor.shutdown(wait=True)
+    evicted = AssetDerivativeService(sizes=[('thumb', 32)], formats=['webp'], bucket=bucket)
+    assert f"generated_assets/{asset_key}/original.gif" in bucket.objects
+    assert evicted.get(asset_key, 'original') == (original, 'image/gif')
+
+
+def test_original_uploaded_before_derivatives():
+    """测试原图不等派生图构建完成即上传；派生图构建失败时原图仍可从 Storage 读取"""
+    bucket = FakeBucket()
+    service = AssetDerivativeService(sizes=[('preview', 256), ('thumb', 64)], formats=['webp'], bucket=bucket, workers=1)
+    service.register_image(_png((640, 480)), 'image/png')
+    service.executor.shutdown(wait=True)
+    assert bucket.order == ['original.png', 'preview.webp', 'thumb.webp']
+
+    bucket = FakeBucket()
+    service = AssetDerivativeService(sizes=[('thumb', 64)], formats=['webp'], bucket=bucket)
+    asset_key, preview = service.register_image(b'not an image', 'image/png')
+    service.executor.shutdown(wait=True)
+    assert preview is None
+    assert bucket.objects[f"generated_assets/{asset_key}/original.png"] == b'not an image'
@@ -0,0 +1,56 @@
+"""
+Asset Manifest 测试
+测试资产清单精简、消息裁剪，以及 /creative-director 对过大请求体的拒绝
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.asset_manifest import asset_id_if_type, slim_asset_manifest, slim_messages
+import routes.reel as reel_module
+
+
+def test_full_assets_are_stripped_to_manifest():
+    """测试旧客户端发送的完整资产被去掉 src 等大字段"""
+    manifest, stripped = slim_asset_manifest({
+        'a1': {'id': 'a1', 'type': 'image', 'src': 'data:image/png;base64,' + 'A' * 100000, 'prompt': 'p' * 2000,
+               'width': 768, 'height': 1344, 'x': 10, 'y': 20, 'generationParams': {'seed': 1}},
+        'v1': {'type': 'video', 'prompt': 'drone', 'width': 720, 'height': 1280, 'duration': 8.0},
+        'bad': 'not-a-dict',
+    })
+    assert set(manifest) == {'a1', 'v1'}
+    assert 'src' not in manifest['a1'] and len(manifest['a1']['prompt']) == 500
+    assert manifest['v1'] == {'type': 'video', 'prompt': 'drone', 'width': 720, 'height': 1280, 'duration': 8.0}
+    assert stripped == 5
+
+
+def test_asset_id_if_type_returns_id():
+    """测试类型匹配时返回资产 ID 本身"""
+    manifest = {'v1': {'type': 'video'}, 'i1': {'type': 'image'}}
+    assert asset_id_if_type(manifest, 'v1', 'video') == 'v1'
+    assert asset_id_if_type(manifest, 'i1', 'video') is None
+    assert asset_id_if_type(manifest, None, 'video') is None
+
+
+def test_slim_messages_keeps_recent_text():
+    """测试只保留最近的消息，非文本内容替换为 None"""
+    messages = [{'role': 'user', 'type': 'text', 'content': f'm{i}'} for i in range(10)]
+    messages.append({'role': 'assistant', 'type': 'generated-asset', 'content': {'src': 'data:...'}})
+    slimmed = slim_messages(messages, 4)
+    assert [m['content'] for m in slimmed] == ['m7', 'm8', 'm9', None]
+    assert slimmed[-1]['type'] == 'generated-asset'
+
+
+def test_oversized_creative_director_request_rejected(monkeypatch):
+    """测试超过上限的请求体在解析前返回 413"""
+    import firebase_admin.auth
+    firebase_stub = type('FirebaseAdmin', (), {'_apps': {'[DEFAULT]': object()}})
+    monkeypatch.setattr('utils.auth._initialize_firebase', lambda: firebase_stub)
+    monkeypatch.setattr(firebase_admin.auth, 'verify_id_token', lambda token: {'uid': 'test-user'})
+    monkeypatch.setattr(reel_module, 'CREATIVE_DIRECTOR_MAX_BODY_BYTES', 1024)
+    from app import app
+    response = app.test_client().post('/api/reel/creative-director', headers={'Authorization': 'Bearer token'},
+                                      json={'userPrompt': 'x', 'assets': {'a': {'src': 'A' * 4096}}})
+    assert response.status_code == 413
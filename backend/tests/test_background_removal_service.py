@@ -0,0 +1,139 @@
+"""
+Background Removal Service 测试
+使用假的推理会话测试批量推理、遮罩上采样、alpha 细化与 PNG 输出，以及 /remove-background 的逐张回退与数量上限
+"""
+
+import base64
+import io
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import routes.reel as reel_module
+from services.background_removal_service import BackgroundRemovalService, refine_alpha
+
+
+class FakeInput:
+    name = 'input.1'
+
+
+class FakeSession:
+    """左半边为前景的分割模型；batch_limit 模拟只支持 batch=1 的导出模型"""
+
+    def __init__(self, batch_limit=None):
+        self.batch_limit = batch_limit
+        self.calls = []
+
+    def get_inputs(self):
+        return [FakeInput()]
+
+    def run(self, output_names, feeds):
+        batch = feeds['input.1']
+        self.calls.append(batch.shape[0])
+        if self.batch_limit and batch.shape[0] > self.batch_limit:
+            raise RuntimeError("batch dimension mismatch")
+        n, _, h, w = batch.shape
+        logits = np.full((n, 1, h, w), -8.0, dtype=np.float32)
+        logits[:, :, :, : w // 2] = 8.0
+        return [logits]
+
+
+def _encode(size=(40, 30), color=(200, 30, 60)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, format='JPEG', quality=95)
+    return buffer.getvalue()
+
+
+def test_batched_inference_and_alpha():
+    """测试多张图片在一次推理中完成，输出保持原尺寸且左半边不透明"""
+    session = FakeSession()
+    service = BackgroundRemovalService(input_size=32, batch_size=4, session=session)
+    results = service.remove_backgrounds([_encode(), _encode((20, 50))])
+
+    assert session.calls == [2]
+    assert [(r['width'], r['height']) for r in results] == [(40, 30), (20, 50)]
+    for result in results:
+        assert result['mimeType'] == 'image/png'
+        assert set(result['timings']) == {'decode', 'preprocess', 'inference', 'postprocess', 'encode'}
+        image = Image.open(io.BytesIO(result['data']))
+        assert image.mode == 'RGBA'
+        alpha = np.asarray(image)[:, :, 3]
+        width = image.size[0]
+        assert alpha[:, : width // 4].min() == 255
+        assert alpha[:, -width // 4:].max() == 0
+
+
+def test_falls_back_to_single_image_inference():
+    """测试模型不支持批量时逐张推理"""
+    session = FakeSession(batch_limit=1)
+    service = BackgroundRemovalService(input_size=16, batch_size=4, session=session)
+    results = service.remove_backgrounds([_encode(), _encode(), _encode()])
+    assert len(results) == 3
+    assert session.calls == [3, 1, 1, 1]
+
+
+def test_failed_image_does_not_discard_batch():
+    """测试批次中一张图片无法解码时逐张重试，只有该图片返回 None"""
+    session = FakeSession()
+    service = BackgroundRemovalService(input_size=16, batch_size=4, session=session)
+    results = service.try_remove_backgrounds([_encode(), b'not an image', None, _encode()])
+    assert [r is not None for r in results] == [True, False, False, True]
+    assert results[3]['width'] == 40
+
+
+@pytest.fixture
+def client(monkeypatch):
+    import firebase_admin.auth
+    firebase_stub = type('FirebaseAdmin', (), {'_apps': {'[DEFAULT]': object()}})
+    monkeypatch.setattr('utils.auth._initialize_firebase', lambda: firebase_stub)
+    monkeypatch.setattr(firebase_admin.auth, 'verify_id_token', lambda token: {'uid': 'test-user'})
+    service = BackgroundRemovalService(input_size=16, batch_size=2, session=FakeSession())
+    monkeypatch.setattr(reel_module, 'get_background_removal_service', lambda: service)
+    gemini_calls = []
+
+    def fake_gemini(gemini, base64_data, mime_type):
+        gemini_calls.append(base64_data)
+        return 'gemini-result'
+    monkeypatch.setattr(reel_module, '_remove_background_with_gemini', fake_gemini)
+    monkeypatch.setattr(reel_module, 'get_gemini_service_safe', lambda: (object(), None))
+    from app import app
+    return app.test_client(), gemini_calls
+
+
+def test_route_falls_back_per_image(client):
+    """测试批量请求中只有失败的图片回退到 Gemini，无效 base64 只影响该项，超过上限返回 400"""
+    test_client, gemini_calls = client
+    headers = {'Authorization': 'Bearer token'}
+    good = base64.b64encode(_encode()).decode()
+    broken = base64.b64encode(b'not an image').decode()
+    response = test_client.post('/api/reel/remove-background', headers=headers, json={'images': [
+        {'base64Data': good}, {'base64Data': broken}, {'base64Data': 'not*base64!'}, {'base64Data': good},
+    ]})
+    images = response.get_json()['images']
+    assert [image.get('engine') for image in images] == ['local', 'gemini', None, 'local']
+    assert images[2] == {'error': 'Invalid base64 image data'}
+    assert gemini_calls == [broken]
+
+    response = test_client.post('/api/reel/remove-background', headers=headers,
+                                json={'images': [{'base64Data': good}] * (reel_module.BG_REMOVAL_MAX_IMAGES + 1)})
+    assert response.status_code == 400
+    response = test_client.post('/api/reel/remove-background', headers=headers, json={'base64Data': 'not*base64!'})
+    assert response.status_code == 400
+
+
+def test_unavailable_without_model():
+    """测试未配置模型时不可用"""
+    assert not BackgroundRemovalService(model_path=None).is_available()
+
+
+def test_refine_alpha_thresholds():
+    """测试 alpha 细化：阈值外硬切，阈值内单调过渡"""
+    alpha = refine_alpha(np.array([0.0, 0.04, 0.3, 0.5, 0.7, 0.96, 1.0]), low=0.05, high=0.95)
+    assert alpha[0] == 0 and alpha[1] == 0
+    assert alpha[-1] == 255 and alpha[-2] == 255
+    assert list(alpha) == sorted(alpha)
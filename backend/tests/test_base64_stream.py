@@ -0,0 +1,127 @@
+"""
+流式 base64 解码与分块上传测试
+"""
+
+import os
+import sys
+import io
+import base64
+import hashlib
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.base64_stream import open_base64, decoded_base64_length
+from services import video_asset_service
+from services.video_asset_service import VideoAssetService
+
+
+def test_incremental_decode_matches_full_decode():
+    """测试增量解码结果与一次性解码一致，并计算正确的哈希"""
+    raw = os.urandom(300_001)
+    encoded = base64.b64encode(raw).decode()
+    for source in (encoded, io.StringIO(encoded), 'data:image/png;base64,' + encoded):
+        reader = open_base64(source, read_chunk=4096)
+        chunks = iter(lambda: reader.read(65536), b'')
+        assert b''.join(chunks) == raw
+        assert reader.sha256 == hashlib.sha256(raw).hexdigest()
+        assert reader.bytes_read == len(raw)
+    assert decoded_base64_length(encoded) == len(raw)
+
+
+def test_large_image_uses_chunked_resumable_upload(monkeypatch):
+    """测试大图片以分块方式上传：每次读取不超过 chunk_size"""
+    raw = os.urandom(3 * 1024 * 1024)
+    encoded = base64.b64encode(raw).decode()
+    reads = []
+
+    def fake_upload(stream, size=None, content_type=None):
+        assert size is None
+        while True:
+            chunk = stream.read(blob.chunk_size)
+            if not chunk:
+                break
+            reads.append(len(chunk))
+
+    blob = MagicMock()
+    blob.chunk_size = None
+    blob.upload_from_file.side_effect = fake_upload
+    service = object.__new__(VideoAssetService)
+    reader = open_base64(encoded)
+    service._upload_stream(blob, reader, 'image/png', size=len(raw))
+
+    assert blob.chunk_size == video_asset_service.STORAGE_UPLOAD_CHUNK_SIZE
+    assert max(reads) <= video_asset_service.STORAGE_UPLOAD_CHUNK_SIZE
+    assert sum(reads) == len(raw)
+    assert reader.sha256 == hashlib.sha256(raw).hexdigest()
+
+
+def _fake_service(monkeypatch):
+    monkeypatch.setattr(video_asset_service, 'get_firestore_write_buffer', lambda: None)
+    bucket = MagicMock()
+    bucket.name = 'reel-bucket'
+    bucket.blob.return_value.upload_from_file.side_effect = lambda stream, **kwargs: stream.read()
+    monkeypatch.setattr(video_asset_service, 'get_firestore_client', lambda: MagicMock())
+    monkeypatch.setattr(video_asset_service, 'get_storage_bucket', lambda: bucket)
+    return object.__new__(VideoAssetService)
+
+
+def test_invalid_base64_raises_value_error(monkeypatch):
+    """测试无效 base64 不被当作存储故障吞掉，而是抛出 ValueError（接口返回 400）"""
+    service = _fake_service(monkeypatch)
+    try:
+        service.archive_and_prepare_reference(open_base64('not*base64!'), 'image/png', '', owner='user-1')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('expected ValueError')
+
+
+def test_references_scoped_to_owner(monkeypatch):
+    """测试参考图片按用户前缀存放，且只接受该用户前缀下、本 bucket 中的 gcsUri"""
+    service = _fake_service(monkeypatch)
+    _, _, gcs_uri = service.archive_and_prepare_reference(b'png', 'image/png', '', owner='user-1')
+    assert gcs_uri.startswith('gs://reel-bucket/veo_references/user-1/')
+    assert service.owns_reference(gcs_uri, 'user-1')
+    assert not service.owns_reference(gcs_uri, 'user-2')
+    assert not service.owns_reference('gs://other-bucket/veo_references/user-1/1.png', 'user-1')
+    assert not service.owns_reference('gs://reel-bucket/veo_references/user-1/../user-2/1.png', 'user-1')
+    assert not service.owns_reference(gcs_uri, None)
+
+
+def test_service_recovers_after_registry_recovers(monkeypatch):
+    """测试 Firebase 初始化失败后退避重试成功时，单例无需重启即恢复可用"""
+    registry = {'db': None, 'bucket': None}
+    monkeypatch.setattr(video_asset_service, 'get_firestore_client', lambda: registry['db'])
+    monkeypatch.setattr(video_asset_service, 'get_storage_bucket', lambda: registry['bucket'])
+    service = object.__new__(VideoAssetService)
+    assert not service.is_available()
+
+    registry.update(db=MagicMock(), bucket=MagicMock())
+    assert service.is_available()
+    assert service.bucket is registry['bucket']
+
+
+def test_veo_frame_within_profile_is_streamed(monkeypatch):
+    """测试不超过 Veo 分辨率的 JPEG / PNG 首帧不完整解码，直接流式上传；超出时先规范化"""
+    import io as _io
+    from PIL import Image
+    import routes.reel as reel_module
+
+    def encoded(size):
+        buffer = _io.BytesIO()
+        Image.new('RGB', size, (10, 20, 30)).save(buffer, format='PNG')
+        return base64.b64encode(buffer.getvalue()).decode()
+
+    uploads = []
+    service = MagicMock()
+    service.archive_and_prepare_reference.side_effect = \
+        lambda source, mime_type, prompt, size=None, owner=None: uploads.append((source, mime_type)) or (None, None, 'gs://b/x.png')
+
+    reel_module._prepare_veo_frame(service, {'data': encoded((720, 1280)), 'mimeType': 'image/png'}, 'p', 'base image', '9:16', 'user-1')
+    source, mime_type = uploads[-1]
+    assert not isinstance(source, bytes) and mime_type == 'image/png'
+
+    reel_module._prepare_veo_frame(service, {'data': encoded((2160, 3840)), 'mimeType': 'image/png'}, 'p', 'base image', '9:16', 'user-1')
+    source, mime_type = uploads[-1]
+    assert isinstance(source, bytes) and mime_type == 'image/jpeg'
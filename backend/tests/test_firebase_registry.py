@@ -0,0 +1,76 @@
+"""
+Firebase Client Registry 测试
+测试并发首次请求时 Firebase 只初始化一次，且 Firestore 客户端被复用；初始化出错时退避后重试
+"""
+
+import os
+import sys
+import threading
+import pytest
+from unittest.mock import patch, MagicMock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import firebase_registry
+
+
+@pytest.fixture
+def fresh_registry():
+    """重置 registry 的全局状态"""
+    with patch.object(firebase_registry, '_app', None), \
+            patch.object(firebase_registry, '_app_initialized', False), \
+            patch.object(firebase_registry, '_init_failures', 0), \
+            patch.object(firebase_registry, '_retry_at', 0.0), \
+            patch.object(firebase_registry, '_firestore_client', None), \
+            patch.object(firebase_registry, '_storage_bucket', None), \
+            patch('firebase_admin._apps', {}):
+        yield firebase_registry
+
+
+def test_concurrent_first_requests_initialize_once(fresh_registry, monkeypatch):
+    """测试多线程同时获取 Firestore 客户端时只初始化一次"""
+    monkeypatch.setenv('FIREBASE_STORAGE_BUCKET', 'test-bucket.appspot.com')
+    fake_app = MagicMock()
+    with patch.object(fresh_registry, '_load_credentials', return_value=MagicMock()), \
+            patch('firebase_admin.initialize_app', return_value=fake_app) as mock_init, \
+            patch('firebase_admin.firestore.client', side_effect=lambda app: MagicMock()) as mock_client:
+        results = []
+        barrier = threading.Barrier(8)
+
+        def worker():
+            barrier.wait()
+            results.append(fresh_registry.get_firestore_client())
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    assert mock_init.call_count == 1
+    assert mock_init.call_args[0][1] == {'storageBucket': 'test-bucket.appspot.com'}
+    assert mock_client.call_count == 1
+    assert len(set(id(r) for r in results)) == 1
+
+
+def test_missing_credentials_returns_none(fresh_registry):
+    """测试没有凭证时返回 None 而不是抛出异常"""
+    with patch.object(fresh_registry, '_load_credentials', return_value=None):
+        assert fresh_registry.get_firebase_app() is None
+        assert fresh_registry.get_firestore_client() is None
+        assert fresh_registry.get_storage_bucket() is None
+
+
+def test_transient_failure_retries_after_backoff(fresh_registry):
+    """测试初始化出错时不固定结果：退避期内返回 None，退避结束后重新初始化成功"""
+    fake_app = MagicMock()
+    with patch.object(fresh_registry, '_load_credentials', return_value=MagicMock()), \
+            patch('firebase_admin.initialize_app', side_effect=[RuntimeError('metadata server timeout'), fake_app]) as mock_init:
+        assert fresh_registry.get_firebase_app() is None
+        assert fresh_registry.get_firebase_app() is None  # 退避中，不再调用 initialize_app
+        assert mock_init.call_count == 1
+
+        fresh_registry._retry_at = 0.0
+        assert fresh_registry.get_firebase_app() is fake_app
+        assert fresh_registry.get_firebase_app() is fake_app
+        assert mock_init.call_count == 2
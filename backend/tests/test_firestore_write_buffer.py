@@ -0,0 +1,130 @@
+"""
+Firestore Write-Behind Buffer 测试
+测试批量提交、按时间刷新、失败重试、关闭时排空，以及 SIGTERM 处理不在信号处理函数中排空
+"""
+
+import os
+import sys
+import threading
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import firestore_write_buffer
+from services.firestore_write_buffer import FirestoreWriteBuffer
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.ops = []
+
+    def set(self, doc_ref, data, merge=False):
+        self.ops.append((doc_ref, data, merge))
+
+    def commit(self):
+        with self.db.lock:
+            if self.db.failures_left > 0:
+                self.db.failures_left -= 1
+                raise RuntimeError("deadline exceeded")
+            self.db.commits.append(list(self.ops))
+
+
+class FakeDB:
+    def __init__(self, failures=0):
+        self.lock = threading.Lock()
+        self.failures_left = failures
+        self.commits = []
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+def test_flush_on_size_keeps_order():
+    """测试攒满批次后提交，且 set/update 保持入队顺序"""
+    db = FakeDB()
+    buffer = FirestoreWriteBuffer(db, batch_size=3, flush_interval=5)
+    buffer.set('doc-1', {'veo_status': 'processing'})
+    buffer.update('doc-1', {'veo_status': 'completed'})
+    buffer.set('doc-2', {'veo_status': 'processing'})
+    assert buffer.flush(timeout=2)
+
+    assert len(db.commits) == 1
+    assert db.commits[0] == [
+        ('doc-1', {'veo_status': 'processing'}, False),
+        ('doc-1', {'veo_status': 'completed'}, True),
+        ('doc-2', {'veo_status': 'processing'}, False),
+    ]
+    buffer.close()
+
+
+def test_flush_on_interval():
+    """测试未攒满批次时按时间间隔提交"""
+    db = FakeDB()
+    buffer = FirestoreWriteBuffer(db, batch_size=50, flush_interval=0.05)
+    buffer.set('doc-1', {'a': 1})
+    assert buffer.flush(timeout=2)
+    assert len(db.commits) == 1
+    buffer.close()
+
+
+def test_retry_with_backoff():
+    """测试提交失败后重试成功"""
+    db = FakeDB(failures=2)
+    buffer = FirestoreWriteBuffer(db, batch_size=1, flush_interval=0.01, base_backoff=0.001)
+    buffer.set('doc-1', {'a': 1})
+    assert buffer.flush(timeout=2)
+    assert len(db.commits) == 1
+    assert buffer.stats_snapshot() == {'enqueued': 1, 'committed': 1, 'batches': 1, 'retries': 2, 'dropped': 0}
+    buffer.close()
+
+
+def test_drop_after_max_retries():
+    """测试超过最大重试次数后放弃该批次，不阻塞后续写入"""
+    db = FakeDB(failures=10)
+    buffer = FirestoreWriteBuffer(db, batch_size=1, flush_interval=0.01, max_retries=1, base_backoff=0.001)
+    buffer.set('doc-1', {'a': 1})
+    assert buffer.flush(timeout=2)
+    assert buffer.stats['dropped'] == 1
+    buffer.close()
+
+
+def test_close_drains_pending_writes():
+    """测试关闭时排空队列中尚未提交的写入"""
+    db = FakeDB()
+    buffer = FirestoreWriteBuffer(db, batch_size=2, flush_interval=10)
+    for i in range(5):
+        buffer.set(f'doc-{i}', {'i': i})
+    assert buffer.close(timeout=2)
+    committed = [op[0] for batch in db.commits for op in batch]
+    assert committed == [f'doc-{i}' for i in range(5)]
+
+
+def test_sigterm_defers_drain_to_atexit():
+    """测试 SIGTERM 只记录关闭请求并在宽限期后中断主线程，排空只在 atexit 中执行"""
+    buffer = FirestoreWriteBuffer(FakeDB(), flush_interval=10)
+    handlers, exits, interrupts = {}, [], []
+    interrupted = threading.Event()
+
+    def interrupt_main():
+        interrupts.append(True)
+        interrupted.set()
+    with patch.object(firestore_write_buffer, '_write_buffer', buffer), \
+            patch.object(firestore_write_buffer, '_shutdown_requested', threading.Event()), \
+            patch.object(firestore_write_buffer, 'SHUTDOWN_GRACE_SECONDS', 0), \
+            patch.object(firestore_write_buffer.atexit, 'register', exits.append), \
+            patch.object(firestore_write_buffer.signal, 'signal', lambda signum, handler: handlers.setdefault(signum, handler)), \
+            patch.object(firestore_write_buffer._thread, 'interrupt_main', interrupt_main):
+        firestore_write_buffer.install_shutdown_hooks()
+        handler = handlers[firestore_write_buffer.signal.SIGTERM]
+        handler(firestore_write_buffer.signal.SIGTERM, None)
+        handler(firestore_write_buffer.signal.SIGTERM, None)
+        assert interrupted.wait(2)
+        time.sleep(0.05)
+        assert interrupts == [True]
+        assert not buffer._closed
+
+        assert exits == [firestore_write_buffer.drain_firestore_write_buffer]
+        exits[0]()
+        assert buffer._closed
@@ -0,0 +1,123 @@
+"""
+Gemini Context Cache Service 测试
+测试后台创建、命中、临近过期续期、创建失败冷却、LRU 淘汰删除，以及 GeminiService 引用缓存调用
+"""
+
+import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import services.gemini_service as gemini_module
+from services.gemini_cache_service import GeminiContextCache
+
+LONG_INSTRUCTION = 'You are a Senior VEO 3.1 Prompt Specialist. ' * 200
+
+
+class FakeCached:
+    def __init__(self, name, ttl_seconds):
+        self.name = name
+        self.expire_time = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=ttl_seconds)
+
+
+class FakeCaches:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.created = []
+        self.updated = []
+        self.deleted = []
+
+    def create(self, model, config):
+        if self.fail:
+            raise RuntimeError('Cached content is too small')
+        self.created.append((model, config.system_instruction, config.ttl))
+        return FakeCached(f'cachedContents/{len(self.created)}', 3600)
+
+    def update(self, name, config):
+        self.updated.append(name)
+        return FakeCached(name, 3600)
+
+    def delete(self, name):
+        self.deleted.append(name)
+
+
+class FakeModels:
+    def __init__(self):
+        self.calls = []
+
+    def generate_content(self, model, contents, config):
+        self.calls.append((model, contents, config.cached_content))
+        return type('Response', (), {'text': '[]'})()
+
+
+class FakeClient:
+    def __init__(self, fail=False):
+        self.caches = FakeCaches(fail)
+        self.models = FakeModels()
+
+
+def wait(cache):
+    cache.executor.submit(lambda: None).result(timeout=5)
+
+
+def test_short_instruction_not_cached():
+    """测试低于最小 token 数的指令不创建缓存"""
+    client = FakeClient()
+    cache = GeminiContextCache(client=client)
+    assert cache.lookup('gemini-2.5-flash', 'You are an expert AI Art Director.') is None
+    wait(cache)
+    assert client.caches.created == []
+
+
+def test_created_in_background_then_reused_and_extended():
+    """测试首次查找后台创建、之后命中，临近过期时后台续期"""
+    client = FakeClient()
+    cache = GeminiContextCache(client=client, ttl_seconds=3600)
+    assert cache.lookup('gemini-2.5-flash', LONG_INSTRUCTION) is None
+    wait(cache)
+    assert client.caches.created[0][2] == '3600s'
+    assert cache.lookup('gemini-2.5-flash', LONG_INSTRUCTION) == 'cachedContents/1'
+    # 不同模型各自缓存
+    assert cache.lookup('gemini-2.5-pro', LONG_INSTRUCTION) is None
+
+    cache.refresh_margin = 7200
+    assert cache.lookup('gemini-2.5-flash', LONG_INSTRUCTION) == 'cachedContents/1'
+    wait(cache)
+    assert client.caches.updated == ['cachedContents/1']
+
+
+def test_failed_create_cools_down():
+    """测试创建失败后冷却期内不再重试"""
+    client = FakeClient(fail=True)
+    cache = GeminiContextCache(client=client, failure_cooldown=600)
+    cache.lookup('gemini-2.5-flash', LONG_INSTRUCTION)
+    wait(cache)
+    client.caches.fail = False
+    assert cache.lookup('gemini-2.5-flash', LONG_INSTRUCTION) is None
+    wait(cache)
+    assert client.caches.created == []
+
+
+def test_eviction_deletes_cached_content():
+    """测试超过条目上限时淘汰最久未使用的缓存并在服务端删除"""
+    client = FakeClient()
+    cache = GeminiContextCache(client=client, max_entries=1)
+    cache.lookup('gemini-2.5-flash', LONG_INSTRUCTION)
+    wait(cache)
+    cache.lookup('gemini-2.5-flash', LONG_INSTRUCTION + ' Brand DNA: Acme')
+    wait(cache)
+    assert client.caches.deleted == ['cachedContents/1']
+
+
+def test_gemini_service_uses_cached_content(monkeypatch):
+    """测试 GeminiService 在缓存就绪时引用 cached content，只发送用户内容"""
+    client = FakeClient()
+    cache = GeminiContextCache(client=client)
+    cache.lookup('gemini-2.5-flash', LONG_INSTRUCTION)
+    wait(cache)
+    monkeypatch.setattr(gemini_module, 'get_gemini_context_cache', lambda: cache)
+    service = gemini_module.GeminiService(client=client)
+    response = service.generate_content('The user idea is: a cat', system_instruction=LONG_INSTRUCTION)
+    assert response.text == '[]'
+    assert client.models.calls == [('gemini-2.5-flash', 'The user idea is: a cat', 'cachedContents/1')]
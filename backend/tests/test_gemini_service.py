@@ -0,0 +1,168 @@
+"""
+GeminiService（google.genai）测试
+测试原生 system instruction 与 tools、图片生成的宽高比配置及其回退、Brand DNA 提取的多模态结构化调用，
+以及请求格式协商结果的缓存（只缓存明确针对该字段的拒绝）
+"""
+
+import base64
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import services.gemini_service as gemini_module
+
+PNG_BYTES = b'\x89PNG\r\n\x1a\nfake'
+
+
+class ConfigRejected(Exception):
+    code = 400
+
+
+class QuotaExceeded(Exception):
+    code = 429
+
+
+class FakeModels:
+    def __init__(self, image_error=None, text='{}', reject_tools=False):
+        self.image_error = image_error
+        self.text = text
+        self.reject_tools = reject_tools
+        self.calls = []
+
+    def generate_content(self, model, contents, config=None):
+        self.calls.append((model, contents, config))
+        if config is not None and config.image_config is not None and self.image_error:
+            raise self.image_error
+        if config is not None and config.tools and self.reject_tools:
+            raise ConfigRejected('Tool use with google_search is not supported')
+        part = type('Part', (), {'inline_data': type('Blob', (), {'data': PNG_BYTES})()})()
+        content = type('Content', (), {'parts': [part]})()
+        return type('Response', (), {'text': self.text, 'candidates': [type('Candidate', (), {'content': content})()]})()
+
+
+@pytest.fixture
+def make_service(monkeypatch):
+    monkeypatch.setattr(gemini_module, 'get_gemini_context_cache', lambda: None)
+
+    def make(models):
+        return gemini_module.GeminiService(client=type('Client', (), {'models': models})())
+    return make
+
+
+def test_system_instruction_and_tools_sent_natively(make_service):
+    """测试 system instruction 和 tools 通过 GenerateContentConfig 发送，不再拼接到提示词中"""
+    models = FakeModels()
+    service = make_service(models)
+    service.generate_content_with_google_search('coffee trends')
+    service.generate_content('a cat', system_instruction='You are an art director.')
+
+    model, contents, config = models.calls[0]
+    assert model == 'gemini-2.5-flash' and contents == 'coffee trends'
+    assert config.tools[0].google_search is not None
+    _, contents, config = models.calls[1]
+    assert contents == 'a cat' and config.system_instruction == 'You are an art director.'
+
+
+def test_image_generation_falls_back_only_on_config_errors(make_service):
+    """测试 image_config 被拒绝（400）时去掉宽高比重试，配额等其他错误直接抛出"""
+    models = FakeModels(image_error=ConfigRejected('image_config not supported'))
+    service = make_service(models)
+    result = service.generate_image_with_aspect_ratio('a cat', images=[{'data': base64.b64encode(b'in').decode(), 'mimeType': 'image/png'}],
+                                                      aspect_ratio='9:16')
+    assert base64.b64decode(result) == PNG_BYTES
+    assert models.calls[0][2].image_config.aspect_ratio == '9:16'
+    assert models.calls[1][2] is None
+    assert models.calls[0][1][0].inline_data.data == b'in'
+
+    # 协商结果按模型缓存，之后的请求不再发送已知被拒绝的 image_config
+    service.generate_image_with_aspect_ratio('a dog', aspect_ratio='9:16')
+    assert len(models.calls) == 3 and models.calls[2][2] is None
+    assert service.capabilities() == {'image_config:gemini-2.5-flash-image': 'plain'}
+
+    # 不提及 image_config 的 400（如输入内容问题）只对当前请求回退，不影响之后的请求
+    models = FakeModels(image_error=ConfigRejected('Request contains an invalid argument.'))
+    service = make_service(models)
+    service.generate_image_with_aspect_ratio('a cat', aspect_ratio='9:16')
+    service.generate_image_with_aspect_ratio('a dog', aspect_ratio='9:16')
+    assert [config is None for _, _, config in models.calls] == [False, True, False, True]
+    assert service.capabilities() == {}
+
+    # 不支持的宽高比在调用前拒绝
+    with pytest.raises(ValueError):
+        service.generate_image_with_aspect_ratio('a cat', aspect_ratio='7:3')
+    assert len(models.calls) == 4
+
+    # 配额等错误直接抛出，不记录为格式不被支持
+    models = FakeModels(image_error=QuotaExceeded('quota exceeded'))
+    service = make_service(models)
+    with pytest.raises(QuotaExceeded):
+        service.generate_image_with_aspect_ratio('a cat', aspect_ratio='1:1')
+    assert len(models.calls) == 1
+    assert service.capabilities() == {}
+
+
+@pytest.fixture
+def brand_module(monkeypatch):
+    import services.brand_dna_service as brand_module
+    monkeypatch.setattr(brand_module, 'get_image_normalization_service',
+                        lambda: type('Normalizer', (), {'normalize_part': lambda self, part, purpose: part})())
+    return brand_module
+
+
+def test_brand_dna_uses_structured_multimodal_call(make_service, brand_module, monkeypatch):
+    """测试无视频 URL 时 Brand DNA 以图片 parts + 原生 system instruction + BRAND_DNA schema 调用"""
+    dna = {'visualStyle': 'Matte', 'colorPalette': 'Purple', 'mood': 'Calm',
+           'negativeConstraint': 'No neon', 'motionStyle': 'Slow pan'}
+    models = FakeModels(text=json.dumps(dna))
+    monkeypatch.setattr(brand_module, 'get_gemini_service', lambda: make_service(models))
+
+    result = brand_module.extract_brand_dna(logo_image={'data': base64.b64encode(b'logo').decode(), 'mimeType': 'image/png'},
+                                            description='tea brand')
+    assert result == dna
+    _, contents, config = models.calls[0]
+    assert contents[0].inline_data.data == b'logo'
+    assert 'tea brand' in contents[-1]
+    assert config.response_schema['title'] == 'BrandDNA'
+    assert config.system_instruction.startswith('You are a Senior Art Director')
+
+
+def test_brand_dna_search_tool_negotiated_once(make_service, brand_module, monkeypatch):
+    """测试 Google Search 工具格式只在首次提取时逐个探测，之后直接使用已知可用的格式"""
+    models = FakeModels(text='{"motionStyle": "Handheld"}', reject_tools=True)
+    service = make_service(models)
+    monkeypatch.setattr(brand_module, 'get_gemini_service', lambda: service)
+
+    for _ in range(3):
+        result = brand_module.extract_brand_dna(description='tea brand', video_urls=['https://youtu.be/x'])
+        assert result == {'motionStyle': 'Handheld'}
+
+    # 首次：googleSearch 被拒绝后无工具成功；之后每次只有一次请求
+    assert len(models.calls) == 2 + 1 + 1
+    assert [bool(config.tools) for _, _, config in models.calls] == [True, False, False, False]
+    assert service.capabilities() == {'search_tool:gemini-2.5-flash': 'none'}
+
+
+def test_negotiated_capability_expires(make_service, monkeypatch):
+    """测试协商结果过期后重新从首选格式探测"""
+    service = make_service(FakeModels())
+    attempts = []
+
+    def variant(name, ok):
+        def call():
+            attempts.append(name)
+            if not ok:
+                raise ConfigRejected(f"field {name} is not supported")
+            return name
+        return (name, call)
+
+    assert service.negotiate('cap', 'm', [variant('a', False), variant('b', True)], fields=('field a',)) == 'b'
+    assert service.negotiate('cap', 'm', [variant('a', False), variant('b', True)], fields=('field a',)) == 'b'
+    assert attempts == ['a', 'b', 'b']
+
+    monkeypatch.setattr(gemini_module, 'GEMINI_CAPABILITY_TTL_SECONDS', -1)
+    assert service.negotiate('cap', 'm', [variant('a', True), variant('b', True)], fields=('field a',)) == 'a'
+    assert attempts == ['a', 'b', 'b', 'a']
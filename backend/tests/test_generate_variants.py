@@ -0,0 +1,102 @@
+"""
+图片变体批量生成测试
+测试 /api/reel/generate 的 count 参数：共享准备工作只执行一次、变体并发生成、NDJSON 逐个返回及部分失败，以及 aspectRatio 校验
+"""
+
+import base64
+import io
+import json
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import routes.reel as reel_module
+
+
+def _png_base64(width=8, height=16):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), (200, 10, 10)).save(buffer, format='PNG')
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+class FakeGemini:
+    """第 2 次调用失败，其余调用返回 PNG；记录最大并发数"""
+
+    def __init__(self):
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def generate_image_with_aspect_ratio(self, prompt, images=None, aspect_ratio='1:1', model_level='banana'):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.05)
+        with self._lock:
+            self.active -= 1
+        if call == 2:
+            raise RuntimeError("quota exceeded")
+        return _png_base64()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    import firebase_admin.auth
+    firebase_stub = type('FirebaseAdmin', (), {'_apps': {'[DEFAULT]': object()}})
+    monkeypatch.setattr('utils.auth._initialize_firebase', lambda: firebase_stub)
+    monkeypatch.setattr(firebase_admin.auth, 'verify_id_token', lambda token: {'uid': 'test-user'})
+    gemini = FakeGemini()
+    monkeypatch.setattr(reel_module, 'get_gemini_service_safe', lambda: (gemini, None))
+    monkeypatch.setattr(reel_module, 'ASSET_DERIVATIVES_ENABLED', False)
+    from app import app
+    return app.test_client(), gemini
+
+
+def test_variants_stream_as_ndjson(client):
+    """测试 4 个变体并发生成，成功与失败的变体逐行返回"""
+    test_client, gemini = client
+    response = test_client.post('/api/reel/generate', headers={'Authorization': 'Bearer token'},
+                                json={'prompt': 'a red cube', 'model': 'banana', 'aspectRatio': '9:16', 'count': 4})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    variants = [e for e in events if e['event'] == 'variant']
+    errors = [e for e in events if e['event'] == 'error']
+    assert len(variants) == 3 and len(errors) == 1
+    assert errors[0]['error'] == 'quota exceeded'
+    assert len({v['asset']['assetId'] for v in variants}) == 3
+    assert variants[0]['asset']['width'] == 8 and variants[0]['asset']['height'] == 16
+    assert events[-1] == {'event': 'done', 'count': 4, 'succeeded': 3, 'failed': 1}
+    assert gemini.max_active > 1
+
+
+def test_invalid_variant_count(client):
+    """测试 count 超出范围或用于视频模型时返回 400"""
+    test_client, gemini = client
+    headers = {'Authorization': 'Bearer token'}
+    assert test_client.post('/api/reel/generate', headers=headers,
+                            json={'prompt': 'x', 'model': 'banana', 'count': 99}).status_code == 400
+    assert test_client.post('/api/reel/generate', headers=headers,
+                            json={'prompt': 'x', 'model': 'veo_fast', 'variants': 2}).status_code == 400
+    assert gemini.calls == 0
+
+
+def test_unsupported_aspect_ratio(client):
+    """测试模型不支持的 aspectRatio 在调用模型前返回 400"""
+    test_client, gemini = client
+    headers = {'Authorization': 'Bearer token'}
+    assert test_client.post('/api/reel/generate', headers=headers,
+                            json={'prompt': 'x', 'model': 'banana', 'aspectRatio': '7:3'}).status_code == 400
+    assert test_client.post('/api/reel/generate', headers=headers,
+                            json={'prompt': 'x', 'model': 'veo_fast', 'aspectRatio': '1:1'}).status_code == 400
+    assert gemini.calls == 0
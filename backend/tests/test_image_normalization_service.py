@@ -0,0 +1,129 @@
+"""
+Image Normalization Service 测试
+测试缩放、按比例裁剪/填充、EXIF 方向、元数据去除、透传、内容哈希缓存，以及 Veo 首帧的格式与是否需要规范化的判断
+"""
+
+import base64
+import io
+import os
+import sys
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.image_normalization_service import (
+    ImageNormalizationService,
+    NormalizationProfile,
+    PROFILES,
+)
+
+
+def _encode(image, fmt='PNG', **kwargs):
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, **kwargs)
+    return buffer.getvalue()
+
+
+def _noise(size, mode='RGB'):
+    return Image.frombytes(mode, size, os.urandom(size[0] * size[1] * len(mode)))
+
+
+def test_downsizes_large_png_to_jpeg():
+    """测试大尺寸 PNG 被缩小到 max_edge 并转为 JPEG"""
+    service = ImageNormalizationService()
+    source = _encode(_noise((3000, 2000)))
+    result = service.normalize(source, 'brand_dna')
+    assert max(result.width, result.height) == PROFILES['brand_dna'].max_edge
+    assert result.mime_type == 'image/jpeg'
+    assert result.bytes_saved > 0
+    assert Image.open(io.BytesIO(result.data)).size == (result.width, result.height)
+
+
+def test_crop_to_aspect_ratio_and_exif_orientation():
+    """测试先应用 EXIF 方向，再居中裁剪到目标比例，输出不含元数据"""
+    service = ImageNormalizationService()
+    image = _noise((1600, 1200))
+    exif = Image.Exif()
+    exif[0x0112] = 6  # 旋转 90 度：显示为 1200x1600
+    source = _encode(image, 'JPEG', exif=exif.tobytes())
+
+    result = service.normalize(source, 'veo_frame', '9:16')
+    output = Image.open(io.BytesIO(result.data))
+    assert abs(output.size[0] / output.size[1] - 9 / 16) < 0.01
+    assert output.size[1] == 1600
+    assert not output.info.get('exif')
+
+
+def test_pad_keeps_alpha_as_webp():
+    """测试 pad 模式填充到目标比例，透明图片输出 WebP"""
+    PROFILES['test_pad'] = NormalizationProfile(max_edge=512, fit='pad')
+    try:
+        service = ImageNormalizationService()
+        result = service.normalize(_encode(_noise((400, 100), 'RGBA')), 'test_pad', '1:1')
+        assert result.mime_type == 'image/webp'
+        assert (result.width, result.height) == (400, 400)
+        assert Image.open(io.BytesIO(result.data)).mode == 'RGBA'
+    finally:
+        del PROFILES['test_pad']
+
+
+def test_small_jpeg_passthrough_and_cache():
+    """测试无需处理的小 JPEG 原样透传，重复内容命中缓存"""
+    service = ImageNormalizationService()
+    source = _encode(_noise((320, 240)), 'JPEG', quality=80)
+    first = service.normalize(source, 'image_generation')
+    second = service.normalize(source, 'image_generation')
+    assert first.data is source
+    assert second is first
+    stats = service.get_stats()
+    assert stats['calls'] == 2 and stats['cache_hits'] == 1 and stats['passthrough'] == 1
+
+
+def test_cache_evicts_by_bytes():
+    """测试缓存按字节上限淘汰最久未使用的条目"""
+    first_source = _encode(_noise((64, 64)), 'JPEG')
+    second_source = _encode(_noise((64, 64)), 'JPEG')
+    service = ImageNormalizationService(cache_bytes=max(len(first_source), len(second_source)) + 1)
+    service.normalize(first_source, 'image_generation')
+    service.normalize(second_source, 'image_generation')
+    stats = service.get_stats()
+    assert stats['cache_entries'] == 1
+    assert stats['cache_bytes'] == len(second_source)
+
+
+def test_normalize_part_falls_back_on_invalid_data():
+    """测试无法解码时原样返回 part"""
+    service = ImageNormalizationService()
+    part = {'data': base64.b64encode(b'not an image').decode(), 'mimeType': 'image/png'}
+    assert service.normalize_part(part, 'image_generation') is part
+    normalized = service.normalize_part(
+        {'data': base64.b64encode(_encode(_noise((2000, 1000)))).decode(), 'mimeType': 'image/png'},
+        'image_generation'
+    )
+    assert normalized['mimeType'] == 'image/jpeg'
+
+
+def test_veo_frame_with_alpha_is_png():
+    """测试 Veo 首帧带透明通道时输出 PNG（Veo 不接受 WebP），WebP 原图也会被转换"""
+    service = ImageNormalizationService()
+    result = service.normalize(_encode(_noise((2400, 1350), 'RGBA')), 'veo_frame', '16:9')
+    assert result.mime_type == 'image/png'
+    assert max(result.width, result.height) == PROFILES['veo_frame'].max_edge
+
+    webp = _encode(_noise((320, 180)), 'WEBP', quality=80)
+    assert service.normalize(webp, 'veo_frame').mime_type == 'image/jpeg'
+
+
+def test_needs_normalization_reads_only_header():
+    """测试只有超过 max_edge 或格式不被接受的图片需要规范化"""
+    service = ImageNormalizationService()
+
+    def part(data):
+        return {'data': base64.b64encode(data).decode('ascii')}
+
+    assert not service.needs_normalization(part(_encode(_noise((1280, 720)), 'JPEG')), 'veo_frame')
+    assert not service.needs_normalization(part(_encode(_noise((720, 1280), 'RGBA'))), 'veo_frame')
+    assert service.needs_normalization(part(_encode(_noise((2400, 1350)), 'JPEG')), 'veo_frame')
+    assert service.needs_normalization(part(_encode(_noise((320, 180)), 'WEBP')), 'veo_frame')
+    assert service.needs_normalization({'data': 'not-an-image'}, 'veo_frame')
@@ -0,0 +1,86 @@
+"""
+Image Upscale Service 测试
+测试本地 Lanczos / Bicubic 重采样的尺寸、保真度以及分块并行结果一致性
+"""
+
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.image_upscale_service import ImageUpscaleService, resize_array
+
+
+def _encode(pixels, fmt='PNG'):
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def _gradient(h, w):
+    y, x = np.mgrid[0:h, 0:w]
+    return np.stack([x * 255 // max(w - 1, 1), y * 255 // max(h - 1, 1), (x + y) % 256], axis=2).astype(np.uint8)
+
+
+def test_constant_image_is_preserved():
+    """测试纯色图片放大后颜色不变（权重归一化）"""
+    pixels = np.full((9, 7, 3), 137, dtype=np.uint8)
+    for method in ('lanczos', 'bicubic'):
+        out = resize_array(pixels, 36, 28, method)
+        assert out.shape == (36, 28, 3)
+        assert np.all(out == 137)
+
+
+def test_tiled_matches_single_pass():
+    """测试按行分块并行处理与单块处理结果一致"""
+    pixels = _gradient(37, 23)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        tiled = resize_array(pixels, 74, 46, 'lanczos', executor, tile_rows=8)
+    single = resize_array(pixels, 74, 46, 'lanczos', None, tile_rows=1000)
+    assert np.array_equal(tiled, single)
+
+
+def test_close_to_pillow_lanczos():
+    """测试与 Pillow 的 Lanczos 实现结果接近"""
+    pixels = _gradient(32, 24)
+    ours = resize_array(pixels, 128, 96, 'lanczos').astype(np.int16)
+    reference = np.asarray(Image.fromarray(pixels).resize((96, 128), Image.LANCZOS)).astype(np.int16)
+    assert np.abs(ours - reference).mean() < 2.0
+
+
+def test_upscale_keeps_format_and_alpha():
+    """测试 upscale 返回正确尺寸，保留 PNG 透明通道和 JPEG 格式"""
+    service = ImageUpscaleService()
+    rgba = np.dstack([_gradient(10, 6), np.full((10, 6), 128, dtype=np.uint8)])
+
+    result = service.upscale(_encode(rgba), 4)
+    assert result['mimeType'] == 'image/png'
+    assert (result['width'], result['height']) == (24, 40)
+    assert Image.open(io.BytesIO(result['data'])).mode == 'RGBA'
+
+    result = service.upscale(_encode(_gradient(10, 6), 'JPEG'), 2, method='bicubic')
+    assert result['mimeType'] == 'image/jpeg'
+    assert result['engine'] == 'bicubic'
+    assert Image.open(io.BytesIO(result['data'])).size == (12, 20)
+
+
+def test_invalid_factor_rejected():
+    """测试不支持的放大倍数（包括浮点数 2.0）"""
+    with pytest.raises(ValueError):
+        ImageUpscaleService().upscale(_encode(_gradient(4, 4)), 3)
+    with pytest.raises(ValueError):
+        ImageUpscaleService().upscale(_encode(_gradient(4, 4)), 2.0)
+
+
+def test_invalid_image_bytes_rejected():
+    """测试非图片或截断的数据抛出 ValueError（接口返回 400 而不是 500）"""
+    with pytest.raises(ValueError):
+        ImageUpscaleService().upscale(b'not an image', 2)
+    with pytest.raises(ValueError):
+        ImageUpscaleService().upscale(_encode(_gradient(32, 32), 'JPEG')[:200], 2)
@@ -0,0 +1,116 @@
+"""
+Media Probe 测试
+测试只读取文件头获取图片/视频的尺寸、MIME 类型和时长
+"""
+
+import base64
+import io
+import os
+import struct
+import sys
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.media_probe import probe_base64_image, probe_bytes, probe_image, NeedMoreData
+import utils.media_probe as media_probe
+
+
+def _encode(fmt, size=(123, 45), **kwargs):
+    buffer = io.BytesIO()
+    mode = 'RGBA' if fmt in ('PNG', 'WEBP') else 'RGB'
+    Image.new(mode, size).save(buffer, format=fmt, **kwargs)
+    return buffer.getvalue()
+
+
+def _box(kind, payload):
+    return struct.pack('>I', len(payload) + 8) + kind + payload
+
+
+def _mp4(moov_at_end=False, mdat_size=200000):
+    mvhd = b'\x00' * 12 + struct.pack('>II', 600, 4800) + b'\x00' * 80
+    audio_tkhd = b'\x00' * 76 + struct.pack('>II', 0, 0)
+    video_tkhd = b'\x00' * 76 + struct.pack('>II', 1280 << 16, 720 << 16)
+    moov = _box(b'moov', _box(b'mvhd', mvhd)
+                + _box(b'trak', _box(b'tkhd', audio_tkhd))
+                + _box(b'trak', _box(b'tkhd', video_tkhd)))
+    ftyp = _box(b'ftyp', b'isom\x00\x00\x02\x00')
+    mdat = _box(b'mdat', b'\x00' * mdat_size)
+    return ftyp + (mdat + moov if moov_at_end else moov + mdat)
+
+
+def test_image_formats():
+    """测试 PNG / JPEG / WebP（有损与无损）/ GIF 的尺寸与 MIME"""
+    cases = [
+        ('PNG', {}, 'image/png'),
+        ('JPEG', {}, 'image/jpeg'),
+        ('JPEG', {'progressive': True}, 'image/jpeg'),
+        ('WEBP', {}, 'image/webp'),
+        ('WEBP', {'lossless': True}, 'image/webp'),
+        ('GIF', {}, 'image/gif'),
+    ]
+    for fmt, kwargs, mime in cases:
+        info = probe_bytes(_encode(fmt, **kwargs))
+        assert (info.mime_type, info.width, info.height) == (mime, 123, 45), fmt
+
+
+def test_jpeg_with_large_exif_in_base64():
+    """测试 JPEG 头部带有大段 EXIF 时逐步扩大 base64 解码范围"""
+    exif = Image.Exif()
+    exif[0x010E] = 'x' * 30000  # ImageDescription
+    data = base64.b64encode(_encode('JPEG', (640, 360), exif=exif.tobytes())).decode()
+    info = probe_base64_image('data:image/jpeg;base64,' + data)
+    assert (info.width, info.height) == (640, 360)
+
+
+def test_truncated_and_unknown_data():
+    """测试截断的头部与无法识别的数据"""
+    try:
+        probe_image(_encode('PNG')[:20])
+        assert False, "expected NeedMoreData"
+    except NeedMoreData:
+        pass
+    assert probe_base64_image(base64.b64encode(b'hello world, not an image').decode()) is None
+    assert probe_base64_image('!!!not base64!!!') is None
+
+
+def test_mp4_duration_and_video_track():
+    """测试 MP4 时长（mvhd）与视频轨道尺寸（跳过宽高为 0 的音频轨道）"""
+    for moov_at_end in (False, True):
+        info = probe_bytes(_mp4(moov_at_end))
+        assert info.to_dict() == {'mime_type': 'video/mp4', 'width': 1280, 'height': 720, 'duration': 8.0}
+
+
+class FakeResponse:
+    def __init__(self, data, status_code):
+        self.status_code = status_code
+        self.raw = io.BytesIO(data)
+        self.raw.read = lambda n, decode_content=False, _read=self.raw.read: _read(n)
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeSession:
+    def __init__(self, data):
+        self.data = data
+        self.ranges = []
+
+    def get(self, url, headers, timeout, stream):
+        start, end = (int(v) for v in headers['Range'][len('bytes='):].split('-'))
+        self.ranges.append((start, end))
+        return FakeResponse(self.data[start:end + 1], 206)
+
+
+def test_remote_probe_reads_only_needed_ranges():
+    """测试远程探测只请求 ftyp/moov 所在的 Range 块"""
+    data = _mp4(moov_at_end=True, mdat_size=5 * media_probe._RANGE_CHUNK)
+    session = FakeSession(data)
+    info = media_probe.probe_remote_video('https://example.com/video.mp4', session=session)
+    assert (info.width, info.height, info.duration) == (1280, 720, 8.0)
+    fetched = sum(end - start + 1 for start, end in session.ranges)
+    assert fetched < len(data) / 2
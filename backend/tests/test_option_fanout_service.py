@@ -0,0 +1,168 @@
+"""
+Option Fan-out Service 测试
+测试多方案并发生成、按完成顺序返回、部分失败、全部失败时回退单次调用、超时、统计，以及 /enhance-prompt 与 /design-plan 的响应格式
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import routes.reel as reel_module
+from services.option_fanout_service import OptionFanoutService
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGemini:
+    """按提示词中的方案标记返回结果；delays 控制各方案耗时，failing 中的方案抛出异常"""
+
+    def __init__(self, delays=None, failing=(), single_text=None):
+        self.delays = delays or {}
+        self.failing = set(failing)
+        self.single_text = single_text
+        self.prompts = []
+        self.timeouts = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt, model=None, system_instruction=None, **kwargs):
+        with self._lock:
+            self.prompts.append(prompt)
+            self.timeouts.append(kwargs.get('timeout'))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            marker = next((m for m in 'ABC' if f"{m} (" in prompt or f"{m}: " in prompt), None)
+            if 'ONE' not in prompt:
+                return FakeResponse(self.single_text or json.dumps([{'title': 'single-1'}, {'title': 'single-2'}]))
+            time.sleep(self.delays.get(marker, 0.01))
+            if marker in self.failing:
+                raise RuntimeError(f"option {marker} failed")
+            return FakeResponse(json.dumps({'title': f"option-{marker}"}))
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def parse_option(text):
+    value = json.loads(text)
+    return value if isinstance(value, dict) else None
+
+
+def parse_list(text):
+    value = json.loads(text)
+    return value if isinstance(value, list) else []
+
+
+def test_options_yield_in_completion_order():
+    """测试各方案并发生成并按完成顺序产出"""
+    service = OptionFanoutService(workers=4)
+    gemini = FakeGemini(delays={'A': 0.15, 'B': 0.01, 'C': 0.08})
+    prompts = [f"ONE option {m} (x)" for m in 'ABC']
+    results = list(service.generate('test', gemini, 'single', prompts, parse_option, parse_list))
+
+    assert [r.index for r in results] == [1, 2, 0]
+    assert [r.option['title'] for r in results] == ['option-B', 'option-C', 'option-A']
+    assert gemini.max_active == 3
+    stats = service.stats()['test/fanout']
+    assert stats['requests'] == 1 and stats['options'] == 3
+    assert stats['inputTokens'] > 0 and stats['outputTokens'] > 0
+    assert stats['avgFirstOptionSeconds'] < stats['avgSeconds']
+
+
+def test_partial_failure_keeps_successful_options():
+    """测试单个方案失败时其余方案照常返回，不触发回退"""
+    service = OptionFanoutService(workers=4)
+    gemini = FakeGemini(failing={'B'})
+    prompts = [f"ONE option {m} (x)" for m in 'ABC']
+    results = list(service.generate('test', gemini, 'single', prompts, parse_option, parse_list))
+
+    assert sorted(r.option['title'] for r in results if r.option) == ['option-A', 'option-C']
+    assert [r.error for r in results if r.option is None] == ['option B failed']
+    assert 'single' not in gemini.prompts
+
+
+def test_all_failures_fall_back_to_single_call():
+    """测试所有方案都失败时回退为一次生成全部方案"""
+    service = OptionFanoutService(workers=4)
+    gemini = FakeGemini(failing={'A', 'B', 'C'})
+    prompts = [f"ONE option {m} (x)" for m in 'ABC']
+    results = list(service.generate('test', gemini, 'single', prompts, parse_option, parse_list))
+
+    options = [r for r in results if r.option is not None]
+    assert [r.option['title'] for r in options] == ['single-1', 'single-2']
+    assert {r.mode for r in options} == {'single'}
+    stats = service.stats()
+    assert stats['test/fanout']['fallbacks'] == 1
+    assert stats['test/single']['requests'] == 1
+
+
+def test_timed_out_options_release_workers():
+    """测试超时的方案按失败处理：调用带剩余时间作为 HTTP 超时，排队到截止时间之后的方案不再调用模型"""
+    service = OptionFanoutService(workers=1, timeout=0.1)
+    gemini = FakeGemini(delays={'A': 0.2, 'B': 0.01, 'C': 0.01})
+    prompts = [f"ONE option {m} (x)" for m in 'ABC']
+    results = list(service._fanout('test', gemini, prompts, parse_option, '', None))
+
+    assert sorted(r.index for r in results) == [0, 1, 2]
+    assert all(r.option is None and 'timed out' in r.error for r in results)
+    assert len(gemini.prompts) == 1 and 0 < gemini.timeouts[0] <= 0.1
+    time.sleep(0.2)
+    assert len(gemini.prompts) == 1
+    assert service.stats()['test/fanout']['failures'] == 3
+
+    # 截止时间已过时不发起调用
+    with pytest.raises(Exception, match='timed out'):
+        service._call(gemini, 'ONE option A (x)', '', deadline=time.time() - 1)
+    assert len(gemini.prompts) == 1
+
+
+@pytest.fixture
+def client(monkeypatch):
+    import firebase_admin.auth
+    firebase_stub = type('FirebaseAdmin', (), {'_apps': {'[DEFAULT]': object()}})
+    monkeypatch.setattr('utils.auth._initialize_firebase', lambda: firebase_stub)
+    monkeypatch.setattr(firebase_admin.auth, 'verify_id_token', lambda token: {'uid': 'test-user'})
+    monkeypatch.setattr(reel_module, 'get_research_cache', lambda: None)
+    gemini = FakeGemini(delays={'A': 0.1})
+    monkeypatch.setattr(reel_module, 'get_gemini_service_safe', lambda: (gemini, None))
+    from app import app
+    return app.test_client(), gemini
+
+
+def test_enhance_prompt_returns_options_in_order(client):
+    """测试 /enhance-prompt 默认单次调用，开启并发后非流式响应仍按 A/B/C 顺序返回数组"""
+    test_client, gemini = client
+    response = test_client.post('/api/reel/enhance-prompt', headers={'Authorization': 'Bearer token'},
+                                json={'prompt': 'a cat', 'model': 'banana'})
+    assert [o['title'] for o in response.get_json()] == ['single-1', 'single-2']
+    assert not any('ONE' in p for p in gemini.prompts)
+
+    response = test_client.post('/api/reel/enhance-prompt', headers={'Authorization': 'Bearer token'},
+                                json={'prompt': 'a cat', 'model': 'banana', 'fanout': True})
+    assert response.status_code == 200
+    assert [o['title'] for o in response.get_json()] == ['option-A', 'option-B', 'option-C']
+    assert sum('ONE' in p for p in gemini.prompts) == 3
+
+
+def test_design_plan_streams_options(client):
+    """测试 /design-plan 的 stream 模式按完成顺序逐行返回"""
+    test_client, _ = client
+    response = test_client.post('/api/reel/design-plan', headers={'Authorization': 'Bearer token'},
+                                json={'topic': 'coffee', 'model': 'veo_fast', 'stream': True, 'fanout': True})
+    assert response.mimetype == 'application/x-ndjson'
+    events = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    options = [e for e in events if e['event'] == 'option']
+    assert [e['index'] for e in options][-1] == 0
+    assert {e['option']['title'] for e in options} == {'option-A', 'option-B', 'option-C'}
+    assert events[-1] == {'event': 'done', 'succeeded': 3, 'mode': 'fanout'}
@@ -0,0 +1,69 @@
+"""
+Prompt Templates 测试
+测试 ${name} 占位符渲染、缺失值报错、字节数统计，以及 Brand DNA 片段按修订版本缓存
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils.brand_dna_utils as brand_dna_utils
+from utils.prompt_templates import PromptTemplateRegistry, PROMPT_TEMPLATES_DIR
+
+
+def test_render_placeholders_and_stats(tmp_path):
+    """测试只替换 ${name}，{ } 与单独的 $ 原样保留，并统计渲染字节数"""
+    (tmp_path / 'sample.txt').write_text('Topic: "${topic}"\ninterface X { a: string; } costs $5\n', encoding='utf-8')
+    registry = PromptTemplateRegistry(str(tmp_path))
+    text = registry.render('sample', topic='猫')
+    assert text == 'Topic: "猫"\ninterface X { a: string; } costs $5'
+
+    stats = registry.stats()['sample']
+    assert stats['renders'] == 1
+    assert stats['totalBytes'] == len(text.encode('utf-8'))
+    assert len(stats['version']) == 12
+
+    with pytest.raises(KeyError):
+        registry.render('sample')
+    with pytest.raises(ValueError):
+        registry.render('../secrets')
+
+
+def test_shipped_templates_render():
+    """测试仓库中的所有模板都能用其占位符渲染"""
+    registry = PromptTemplateRegistry()
+    names = [f[:-4] for f in os.listdir(PROMPT_TEMPLATES_DIR) if f.endswith('.txt')]
+    assert 'enhance_prompt_video_system' in names
+    for name in names:
+        template = registry.get(name)
+        text = template.render(**{key: f'<{key}>' for key in template.placeholders})
+        assert '${' not in text
+
+
+def test_brand_fragment_cached_by_revision(monkeypatch):
+    """测试同一 profile 修订版本只渲染一次，修订版本变化后重新渲染"""
+    monkeypatch.setattr(brand_dna_utils, '_fragment_cache', type(brand_dna_utils._fragment_cache)())
+    renders = []
+    real_render = brand_dna_utils.render_prompt
+
+    def counting_render(name, **values):
+        renders.append(name)
+        return real_render(name, **values)
+
+    monkeypatch.setattr(brand_dna_utils, 'render_prompt', counting_render)
+    profile = {'id': 'p1', 'revision': 'r1', 'name': 'Acme', 'visualStyle': 'flat', 'motionStyle': 'slow pans'}
+
+    first = brand_dna_utils.render_brand_guidelines(profile, 'enhance', is_video=True)
+    assert brand_dna_utils.render_brand_guidelines(profile, 'enhance', is_video=True) == first
+    assert '- **Motion Style**: slow pans' in first
+    assert renders == ['brand_guidelines_enhance']
+
+    brand_dna_utils.render_brand_guidelines(dict(profile, revision='r2', name='Acme 2'), 'enhance', is_video=True)
+    brand_dna_utils.render_brand_guidelines(profile, 'design', is_video=False)
+    assert len(renders) == 3
+
+    injected = brand_dna_utils.inject_brand_dna_to_prompt('a cat', profile, is_video=False)
+    assert injected.startswith('a cat\n\n\n[BRAND DNA ACTIVE: Acme]')
@@ -0,0 +1,86 @@
+"""
+Readiness 端点测试
+测试 /ready 在依赖预热完成前后的状态
+"""
+
+import os
+import sys
+import time
+import json
+import pytest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+from utils import warmup
+
+
+@pytest.fixture
+def client():
+    """创建测试客户端"""
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        yield client
+
+
+@pytest.fixture
+def fake_tasks():
+    """替换预热任务并重置状态"""
+    def failing():
+        raise RuntimeError("bucket missing")
+
+    tasks = {'firebase': lambda: None, 'storage': failing}
+    with patch.object(warmup, 'WARMUP_TASKS', tasks), \
+            patch.object(warmup, '_dependency_status', {}), \
+            patch.object(warmup, 'READY_REQUIRED_DEPENDENCIES', []):
+        yield tasks
+
+
+def _wait_for_warmup(timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        states = [s['state'] for s in warmup._dependency_status.values()]
+        if states and 'pending' not in states:
+            return
+        time.sleep(0.01)
+
+
+def test_ready_reports_per_dependency_status(client, fake_tasks):
+    """测试 /ready 返回每个依赖的状态，存在失败依赖时返回 503"""
+    client.get('/ready')
+    _wait_for_warmup()
+
+    response = client.get('/ready')
+    assert response.status_code == 503
+    data = json.loads(response.data)
+    assert data['status'] == 'warming_up'
+    assert data['dependencies']['firebase']['state'] == 'ready'
+    assert data['dependencies']['storage']['state'] == 'failed'
+    assert 'bucket missing' in data['dependencies']['storage']['error']
+
+
+def test_ready_when_required_dependencies_ready(client, fake_tasks):
+    """测试只要求部分依赖时，必需依赖就绪即返回 200"""
+    with patch.object(warmup, 'READY_REQUIRED_DEPENDENCIES', ['firebase']):
+        client.get('/ready')
+        _wait_for_warmup()
+        response = client.get('/ready')
+    assert response.status_code == 200
+    assert json.loads(response.data)['status'] == 'ready'
+
+
+def test_health_does_not_depend_on_readiness(client, fake_tasks):
+    """测试 /health 不受依赖状态影响"""
+    response = client.get('/health')
+    assert response.status_code == 200
+
+
+def test_auth_certs_warmup_survives_firebase_internals_change():
+    """测试 firebase_admin 内部接口变化时，证书预热改为直接请求公开证书地址"""
+    response = type('Response', (), {'status_code': 200})()
+    with patch.object(warmup, '_warm_firebase', lambda: None), \
+            patch('firebase_admin.auth._get_client', return_value=object()), \
+            patch('requests.get', return_value=response) as mock_get:
+        warmup._warm_auth_certs()
+    assert mock_get.call_args[0][0] == warmup.FIREBASE_ID_TOKEN_CERT_URL
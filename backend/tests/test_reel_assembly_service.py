@@ -0,0 +1,159 @@
+"""
+Reel Assembly Service 测试
+测试流复制 / 重新编码的选择、xfade 偏移、背景音乐、进度解析，以及任务提交校验
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import services.reel_assembly_service as reel_assembly_module
+from services.reel_assembly_service import (
+    AssemblyJob, AssemblyOptions, ClipInfo, ReelAssemblyService, build_assembly_command, output_size,
+    parse_probe_output, parse_progress, total_duration
+)
+from services.video_proxy_service import VideoDiskCache, VideoProxyService
+from tests.test_video_proxy_service import FakeBucket, FakeDB, FakeSession
+
+
+def _clip(name, duration=8.0, width=720, height=1280, codec='h264', audio='aac'):
+    return ClipInfo(f'/tmp/{name}.mp4', duration, width, height, codec, 'yuv420p', '24/1',
+                    audio, '48000' if audio else None, 2 if audio else None)
+
+
+def test_output_size():
+    """测试按比例计算偶数尺寸"""
+    assert output_size('9:16') == (720, 1280)
+    assert output_size('16:9') == (1280, 720)
+    assert output_size('4:5') == (720, 900)
+
+
+def test_matching_clips_use_stream_copy():
+    """测试参数一致且无转场时使用 concat demuxer 复制流"""
+    command, mode = build_assembly_command([_clip('a'), _clip('b')], AssemblyOptions(), 'out.mp4', 'list.txt')
+    assert mode == 'copy'
+    assert command[command.index('-c') + 1] == 'copy'
+    assert 'libx264' not in command
+
+
+def test_audio_bed_keeps_video_stream_copy():
+    """测试背景音乐只编码音频，视频流仍直接复制"""
+    command, mode = build_assembly_command([_clip('a'), _clip('b')], AssemblyOptions(bed_volume=0.5),
+                                           'out.mp4', 'list.txt', 'bed.mp3')
+    assert mode == 'copy_video'
+    assert command[command.index('-c:v') + 1] == 'copy'
+    graph = command[command.index('-filter_complex') + 1]
+    assert 'atrim=0:16.000' in graph and 'volume=0.5' in graph and 'amix' not in graph
+
+
+def test_crossfade_reencodes_with_xfade_offsets():
+    """测试转场时重新编码，xfade 偏移为累计时长减去转场时长"""
+    clips = [_clip('a', 8.0), _clip('b', 6.0), _clip('c', 8.0)]
+    options = AssemblyOptions(crossfade=0.5)
+    command, mode = build_assembly_command(clips, options, 'out.mp4', 'list.txt')
+    graph = command[command.index('-filter_complex') + 1]
+    assert mode == 'encode'
+    assert 'offset=7.500[vx1]' in graph and 'offset=13.000[vout]' in graph
+    assert 'acrossfade=d=0.5[aclips]' in graph
+    assert total_duration(clips, 0.5) == 21.0
+
+
+def test_mismatched_clips_reencode_without_audio():
+    """测试尺寸不一致时重新编码；部分片段没有音轨时输出不含音频"""
+    clips = [_clip('a'), _clip('b', width=1280, height=720, audio=None)]
+    command, mode = build_assembly_command(clips, AssemblyOptions(), 'out.mp4', 'list.txt')
+    assert mode == 'encode'
+    assert '-an' in command
+    assert 'concat=n=2:v=1:a=0[vout]' in command[command.index('-filter_complex') + 1]
+
+
+def test_parse_probe_and_progress():
+    """测试解析 ffprobe 输出与 -progress 行"""
+    clip = parse_probe_output('/tmp/a.mp4', {
+        'streams': [{'codec_type': 'video', 'codec_name': 'h264', 'width': 720, 'height': 1280,
+                     'pix_fmt': 'yuv420p', 'r_frame_rate': '24/1'},
+                    {'codec_type': 'audio', 'codec_name': 'aac', 'sample_rate': '48000', 'channels': 2}],
+        'format': {'duration': '8.000000'}
+    })
+    assert clip.duration == 8.0 and clip.has_audio
+    assert parse_progress('out_time_us=2500000\n') == 2.5
+    assert parse_progress('out_time_ms=1000000') == 1.0
+    assert parse_progress('progress=continue') is None
+
+
+def test_submit_validation(tmp_path):
+    """测试未知视频、片段数量和转场参数校验"""
+    proxy = VideoProxyService(session=FakeSession(), cache=VideoDiskCache(str(tmp_path)), db=FakeDB())
+    service = ReelAssemblyService(proxy=proxy, bucket=FakeBucket(), db=FakeDB(), work_dir=str(tmp_path))
+    with pytest.raises(ValueError):
+        service.submit('uid', [], AssemblyOptions())
+    with pytest.raises(ValueError):
+        service.submit('uid', ['unknown-video-id-0000'], AssemblyOptions())
+    video_id = proxy.register('https://upstream.example/files/abc')
+    with pytest.raises(ValueError):
+        service.submit('uid', [video_id], AssemblyOptions(crossfade=10))
+    for volume in (-1, 5, float('nan')):
+        with pytest.raises(ValueError):
+            service.submit('uid', [video_id], AssemblyOptions(bed_volume=volume))
+
+
+def test_finished_jobs_are_evicted(tmp_path, monkeypatch):
+    """测试内存中只保留最近结束的任务，运行中的任务不被淘汰"""
+    monkeypatch.setattr(reel_assembly_module, 'REEL_ASSEMBLY_KEEP_FINISHED', 2)
+    service = ReelAssemblyService(bucket=FakeBucket(), db=FakeDB(), work_dir=str(tmp_path))
+    jobs = [AssemblyJob(f'job-{i}', 'uid', [], AssemblyOptions()) for i in range(4)]
+    for job in jobs:
+        service._jobs[job.job_id] = job
+    for job in jobs[:3]:
+        service._finish(job)
+    assert list(service._jobs) == ['job-1', 'job-2', 'job-3']
+    assert service.get('job-0', 'uid') is None
+    assert service.get('job-3', 'uid')['jobId'] == 'job-3'
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None or shutil.which('ffprobe') is None, reason='ffmpeg not installed')
+def test_assemble_with_ffmpeg(tmp_path, monkeypatch):
+    """测试真实 ffmpeg 拼接两个片段（流复制）并通过视频代理提供"""
+    import services.video_frame_service as video_frame_module
+    monkeypatch.setattr(video_frame_module, 'VIDEO_FRAMES_ENABLED', False)
+    proxy = VideoProxyService(session=FakeSession(), cache=VideoDiskCache(str(tmp_path / 'cache')), db=FakeDB())
+    bucket = FakeBucket()
+    service = ReelAssemblyService(proxy=proxy, bucket=bucket, db=FakeDB(), work_dir=str(tmp_path / 'work'))
+    video_ids = []
+    for i in range(2):
+        path = str(tmp_path / f'clip{i}.mp4')
+        subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-f', 'lavfi', '-i', 'testsrc=size=720x1280:rate=24',
+                        '-t', '2', '-pix_fmt', 'yuv420p', '-c:v', 'libx264', path], check=True)
+        video_id = proxy.register('https://upstream.example/unused')
+        with open(path, 'rb') as f:
+            proxy.cache.put(video_id, iter([f.read()]))
+        video_ids.append(video_id)
+
+    job = service.submit('uid', video_ids, AssemblyOptions())
+    for _ in range(300):
+        if job.status in ('completed', 'failed'):
+            break
+        time.sleep(0.05)
+    assert job.status == 'completed', job.error
+    assert job.mode == 'copy'
+    assert proxy.cached_path(job.video_id)
+    assert service.get(job.job_id, 'uid')['src'] == f'/api/reel/videos/{job.video_id}'
+    assert service.get(job.job_id, 'other-user') is None
+
+
+def test_bed_volume_parsing():
+    """测试 audioVolume：未提供时为 1.0，显式 0 为静音，超出范围的值被限制到 0-2"""
+    from routes.reel import _bed_volume
+    assert _bed_volume(None) == 1.0
+    assert _bed_volume(0) == 0.0
+    assert _bed_volume('0.5') == 0.5
+    assert _bed_volume(-3) == 0.0
+    assert _bed_volume(50) == 2.0
+    with pytest.raises(ValueError):
+        _bed_volume('loud')
@@ -0,0 +1,77 @@
+"""
+Reel Context Service 测试
+测试 token 估算、预算内的上下文组装、后台滚动摘要刷新，以及 reset 后丢弃过期摘要
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.reel_context_service import ReelContextManager, estimate_tokens, format_history, truncate_to_tokens
+from services.reel_session_service import ReelSessionStore
+
+SESSION_ID = 'reel-session-0001'
+
+
+def message(index, content=None):
+    return {'id': f'm{index}', 'role': 'user', 'type': 'text', 'content': content or f'turn {index}'}
+
+
+def add_messages(store, start, end, version):
+    return store.apply_delta('u1', SESSION_ID, {'messages': [message(i) for i in range(start, end)]}, version)
+
+
+def test_token_estimate_and_truncate():
+    """测试 ASCII 与中文的 token 估算以及按预算截断"""
+    assert estimate_tokens('abcdefgh') == 2
+    assert estimate_tokens('创意总监') == 4
+    assert estimate_tokens(truncate_to_tokens('x' * 100, 10)) <= 10
+    assert format_history([message(1)], 'earlier') == '[Summary of earlier conversation] earlier\nuser: turn 1'
+    assert format_history([{'role': 'assistant', 'type': 'generated-asset', 'content': None}]) == \
+        'assistant: [generated-asset message]'
+
+
+def test_context_respects_token_budget():
+    """测试未摘要时在预算内按新到旧保留消息"""
+    store = ReelSessionStore()
+    manager = ReelContextManager(store, summarizer=lambda prompt: '', token_budget=30, recent_turns=2, summary_batch=100)
+    session = store.apply_delta('u1', SESSION_ID, {'messages': [message(i, 'x' * 40) for i in range(5)]}, 0)
+    context = manager.build_context(session)
+    assert [m['id'] for m in context.messages] == ['m3', 'm4']
+    assert context.summary == ''
+
+
+def test_summary_refreshed_in_background():
+    """测试移出窗口的消息达到阈值后后台生成摘要，上下文变为摘要 + 最近消息"""
+    store = ReelSessionStore()
+    prompts = []
+
+    def summarizer(prompt):
+        prompts.append(prompt)
+        return 'user asked for a cat, then made it blue'
+
+    manager = ReelContextManager(store, summarizer=summarizer, recent_turns=2, summary_batch=3)
+    session = add_messages(store, 0, 4, 0)
+    assert manager.schedule_refresh(session) is None  # 只有 2 条待摘要
+
+    session = add_messages(store, 4, 6, 1)
+    future = manager.schedule_refresh(session)
+    assert future.result(timeout=5) == 'user asked for a cat, then made it blue'
+    assert 'user: turn 3' in prompts[0] and 'turn 4' not in prompts[0]
+
+    session = store.get('u1', SESSION_ID)
+    assert session.summary_count == 4
+    assert session.version == 2  # 摘要不改变客户端版本
+    context = manager.build_context(session)
+    assert context.summary == 'user asked for a cat, then made it blue'
+    assert [m['id'] for m in context.messages] == ['m4', 'm5']
+
+
+def test_stale_summary_discarded_after_reset():
+    """测试会话在摘要期间被 reset 时不写入旧摘要"""
+    store = ReelSessionStore()
+    session = add_messages(store, 0, 6, 0)
+    store.apply_delta('u1', SESSION_ID, {'reset': True, 'messages': [message(i + 10) for i in range(6)]}, 0)
+    assert store.update_summary('u1', SESSION_ID, 'stale', 4, session.messages[3]['id']) is None
+    assert store.get('u1', SESSION_ID).summary == ''
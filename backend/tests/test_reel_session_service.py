@@ -0,0 +1,118 @@
+"""
+Reel Session Service 测试
+测试增量合并、版本冲突、reset 重建、LRU 淘汰，以及从持久化后端恢复会话
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.reel_session_service import (
+    MemorySessionBackend,
+    ReelSession,
+    ReelSessionStore,
+    SessionConflictError,
+)
+
+SESSION_ID = 'reel-session-0001'
+
+
+class FakePersistentBackend:
+    """以字典模拟 Firestore 后端"""
+
+    def __init__(self):
+        self.docs = {}
+
+    def get(self, key):
+        data = self.docs.get(key)
+        return ReelSession.from_dict(data) if data else None
+
+    def put(self, session):
+        self.docs[session.key] = session.to_dict()
+
+    def delete(self, key):
+        self.docs.pop(key, None)
+
+
+def message(msg_id, content):
+    return {'id': msg_id, 'role': 'user', 'type': 'text', 'content': content}
+
+
+def test_apply_delta_merges_incrementally():
+    """测试增量追加消息（按 id 去重）、更新和删除资产、更新选中状态"""
+    store = ReelSessionStore()
+    session = store.apply_delta('u1', SESSION_ID, {
+        'messages': [message('m1', 'hello')],
+        'assets': {'a1': {'type': 'image', 'prompt': 'cat', 'src': 'data:image/png;base64,AAAA'}},
+        'selectedAssetId': 'a1',
+    }, base_version=0)
+    assert session.version == 1
+    assert session.assets == {'a1': {'type': 'image', 'prompt': 'cat'}}
+
+    session = store.apply_delta('u1', SESSION_ID, {
+        'messages': [message('m1', 'hello'), message('m2', 'make it blue')],
+        'assets': {'a1': None, 'a2': {'type': 'video', 'prompt': 'dog'}},
+        'lastGeneratedAssetId': 'a2',
+    }, base_version=1)
+    assert session.version == 2
+    assert [m['id'] for m in session.messages] == ['m1', 'm2']
+    assert list(session.assets) == ['a2']
+    assert session.selected_asset_id == 'a1'
+    assert session.last_generated_asset_id == 'a2'
+
+
+def test_version_conflict_and_reset():
+    """测试 baseVersion 不一致时抛出冲突，reset 用完整状态重建会话"""
+    store = ReelSessionStore()
+    store.apply_delta('u1', SESSION_ID, {'messages': [message('m1', 'a')]}, base_version=0)
+
+    with pytest.raises(SessionConflictError) as exc_info:
+        store.apply_delta('u1', SESSION_ID, {'messages': [message('m2', 'b')]}, base_version=0)
+    assert exc_info.value.version == 1
+
+    # 未知会话（过期或落到其他实例）也视为冲突
+    with pytest.raises(SessionConflictError):
+        store.apply_delta('u1', 'reel-session-unknown', {}, base_version=3)
+
+    session = store.apply_delta('u1', SESSION_ID, {'reset': True, 'messages': [message('m2', 'b')]}, base_version=0)
+    assert session.version == 1
+    assert [m['id'] for m in session.messages] == ['m2']
+
+
+def test_invalid_session_id_rejected():
+    """测试格式无效的 sessionId"""
+    store = ReelSessionStore()
+    with pytest.raises(ValueError):
+        store.apply_delta('u1', 'bad id!', {}, base_version=0)
+
+
+def test_sessions_isolated_by_user_and_restored_from_persistent():
+    """测试会话按用户隔离，内存淘汰后从持久化后端恢复"""
+    persistent = FakePersistentBackend()
+    store = ReelSessionStore(memory=MemorySessionBackend(max_entries=1), persistent=persistent)
+    store.apply_delta('u1', SESSION_ID, {'messages': [message('m1', 'a')]}, base_version=0)
+    store.apply_delta('u2', SESSION_ID, {'messages': [message('m9', 'z')]}, base_version=0)
+
+    # u1 的会话已被内存 LRU 淘汰，从持久化后端恢复后继续按版本应用增量
+    session = store.apply_delta('u1', SESSION_ID, {'messages': [message('m2', 'b')]}, base_version=1)
+    assert [m['id'] for m in session.messages] == ['m1', 'm2']
+    assert [m['id'] for m in store.get('u2', SESSION_ID).messages] == ['m9']
+
+
+def test_creative_director_returns_409_when_out_of_sync(monkeypatch):
+    """测试 /creative-director 在会话版本不一致时返回 409，客户端据此发送 reset"""
+    import firebase_admin.auth
+    import services.reel_session_service as session_module
+    firebase_stub = type('FirebaseAdmin', (), {'_apps': {'[DEFAULT]': object()}})
+    monkeypatch.setattr('utils.auth._initialize_firebase', lambda: firebase_stub)
+    monkeypatch.setattr(firebase_admin.auth, 'verify_id_token', lambda token: {'uid': 'test-user'})
+    monkeypatch.setattr(session_module, '_session_store', ReelSessionStore())
+    from app import app
+    response = app.test_client().post('/api/reel/creative-director', headers={'Authorization': 'Bearer token'},
+                                      json={'userPrompt': 'x', 'sessionId': SESSION_ID, 'baseVersion': 5,
+                                            'sessionDelta': {'messages': [message('m1', 'x')]}})
+    assert response.status_code == 409
+    assert response.get_json()['error'] == 'session_out_of_sync'
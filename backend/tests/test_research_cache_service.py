@@ -0,0 +1,120 @@
+"""
+Research Cache Service 测试
+测试话题归一化、新鲜/陈旧/未命中三种读取路径、并发单飞，以及按字节预算淘汰
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.research_cache_service import TOPIC_SYNONYMS, ResearchCache, normalize_topic, research_cache_key
+
+
+def make_cache(**kwargs):
+    kwargs.setdefault('use_firestore', False)
+    return ResearchCache(**kwargs)
+
+
+def test_normalize_topic_folds_equivalent_topics():
+    """测试大小写、空白、标点、复数、全角、繁简与同义词折叠"""
+    assert normalize_topic('Coffee Brand') == normalize_topic('  coffee   BRANDS! ') == ('en', 'coffee brand')
+    assert normalize_topic('Coffee Shop') == ('en', 'coffee')
+    assert normalize_topic('ＳＵＭＭＥＲ　Sales') == ('en', 'summer sale')
+    assert normalize_topic('news') == ('en', 'news')
+    assert normalize_topic('咖啡館') == normalize_topic('咖啡店') == ('zh', '咖啡')
+    assert normalize_topic('夏季促銷') == ('zh', '夏日促销')
+    # 摘要语言跟随话题语言，中英文话题分开缓存
+    assert research_cache_key('video', '咖啡') != research_cache_key('video', 'coffee')
+    assert research_cache_key('video', 'coffee') != research_cache_key('image', 'coffee')
+
+
+def test_every_synonym_entry_folds_to_its_canonical_form():
+    """测试同义词表的每一项（含复数形式）都折叠为规范写法，且去复数不截断非复数词"""
+    for synonym, canonical in TOPIC_SYNONYMS.items():
+        assert normalize_topic(synonym)[1] == normalize_topic(canonical)[1] == canonical, synonym
+    assert normalize_topic('Christmas') == normalize_topic('X-mas') == normalize_topic('XMAS') == ('en', 'christmas')
+    assert normalize_topic('Cafes') == normalize_topic('coffee shops') == ('en', 'coffee')
+    assert normalize_topic('plus size') == ('en', 'plus size')
+    assert normalize_topic('this summer') == ('en', 'this summer')
+    assert normalize_topic('Christmas Brands') == ('en', 'christmas brand')
+
+
+def test_hit_stale_and_miss():
+    """测试新鲜期内命中、陈旧窗口内返回旧摘要并后台刷新、超出陈旧窗口后重新调研"""
+    cache = make_cache(ttl_seconds=100, stale_seconds=100)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return f"summary-{len(calls)}"
+
+    assert cache.get_or_compute('video', 'Coffee', compute) == ('summary-1', 'miss')
+    assert cache.get_or_compute('video', 'coffee shop', compute) == ('summary-1', 'hit')
+
+    key = research_cache_key('video', 'coffee')
+    cache._entries[key].created_at -= 150
+    assert cache.get_or_compute('video', 'coffee', compute) == ('summary-1', 'stale')
+    cache.executor.shutdown(wait=True)
+    assert cache._entries[key].summary == 'summary-2'
+
+    cache._entries[key].created_at -= 500
+    assert cache.get_or_compute('video', 'coffee', compute) == ('summary-3', 'miss')
+
+
+def test_concurrent_misses_compute_once():
+    """测试同一话题并发未命中时只调研一次"""
+    cache = make_cache()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'trend summary'
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(cache.get_or_compute('image', 'Skin Care', compute)))
+    first.start()
+    started.wait(5)
+    second = threading.Thread(target=lambda: results.append(cache.get_or_compute('image', 'skincare', compute)))
+    second.start()
+    time.sleep(0.05)
+    release.set()
+    first.join(5)
+    second.join(5)
+
+    assert len(calls) == 1
+    assert results == [('trend summary', 'miss'), ('trend summary', 'miss')]
+
+
+def test_failed_or_empty_research_not_cached():
+    """测试调研失败时异常传给调用方，空摘要不写入缓存"""
+    cache = make_cache()
+
+    def fail():
+        raise RuntimeError('search unavailable')
+
+    try:
+        cache.get_or_compute('video', 'coffee', fail)
+        assert False, 'expected RuntimeError'
+    except RuntimeError:
+        pass
+    assert cache.get_or_compute('video', 'coffee', lambda: '') == ('', 'miss')
+    assert cache.get_or_compute('video', 'coffee', lambda: 'ok') == ('ok', 'miss')
+
+
+def test_byte_budget_evicts_least_recently_used():
+    """测试超出字节预算时淘汰最久未使用的摘要"""
+    cache = make_cache(max_bytes=20)
+    cache.get_or_compute('video', 'alpha', lambda: 'a' * 8)
+    cache.get_or_compute('video', 'beta', lambda: 'b' * 8)
+    cache.get_or_compute('video', 'alpha', lambda: 'unused')
+    cache.get_or_compute('video', 'gamma', lambda: 'c' * 8)
+
+    assert set(cache._entries) == {research_cache_key('video', 'alpha'), research_cache_key('video', 'gamma')}
+    assert cache._bytes == 16
@@ -0,0 +1,85 @@
+"""
+Startup Profile 与 Lazy Import 测试
+测试延迟导入在首次访问属性时才真正导入模块、启动阶段与延迟导入的记录，以及后台预热完成后只打印一次报告
+"""
+
+import os
+import sys
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import startup_profile as startup_profile_module
+from utils import warmup
+from utils.lazy_import import lazy_import, preload
+from utils.startup_profile import StartupProfile
+
+
+def test_lazy_import_defers_until_first_attribute_access():
+    """测试创建代理时不导入模块，首次访问属性时导入并记录耗时"""
+    sys.modules.pop('colorsys', None)
+    profile = StartupProfile()
+    with patch.object(startup_profile_module, 'startup_profile', profile):
+        colorsys = lazy_import('colorsys')
+        assert 'colorsys' not in sys.modules
+        assert 'not loaded' in repr(colorsys)
+
+        assert colorsys.rgb_to_hsv(1.0, 0.0, 0.0) == (0.0, 1.0, 1.0)
+        assert 'colorsys' in sys.modules
+        assert 'not loaded' not in repr(colorsys)
+        colorsys.hls_to_rgb(0.0, 0.5, 1.0)
+
+    assert [item['module'] for item in profile.lazy_imports] == ['colorsys']
+
+
+def test_preload_imports_immediately():
+    """测试 preload 立即加载延迟模块（后台预热使用）"""
+    sys.modules.pop('quopri', None)
+    profile = StartupProfile()
+    with patch.object(startup_profile_module, 'startup_profile', profile):
+        preload(lazy_import('quopri'))
+    assert 'quopri' in sys.modules
+    assert profile.lazy_imports[0]['module'] == 'quopri'
+
+
+def test_profile_records_phases():
+    """测试 phase 记录名称、耗时与线程，异常时也记录"""
+    profile = StartupProfile()
+    with profile.phase('import:flask'):
+        time.sleep(0.01)
+    try:
+        with profile.phase('firebase_init'):
+            raise RuntimeError('no credentials')
+    except RuntimeError:
+        pass
+
+    report = profile.report()
+    assert [item['name'] for item in report['phases']] == ['import:flask', 'firebase_init']
+    assert report['phases'][0]['durationMs'] >= 10
+    assert report['phases'][0]['thread'] == 'MainThread'
+    assert report['firstResponse'] is None
+
+    assert profile.mark_first_response('/health', 200)
+    assert not profile.mark_first_response('/ready', 200)
+    assert profile.report()['firstResponse']['path'] == '/health'
+
+
+def test_report_printed_once_after_warmup(capsys):
+    """测试所有依赖首次预热结束后打印报告（含预热阶段），重试不重复打印"""
+    profile = StartupProfile()
+    tasks = {'firebase': lambda: None, 'gemini': lambda: None}
+    status = {name: {'state': 'pending'} for name in tasks}
+    with patch.object(warmup, 'startup_profile', profile), \
+            patch.object(warmup, 'STARTUP_PROFILE_ENABLED', True), \
+            patch.object(warmup, '_dependency_status', status):
+        warmup._run_task('firebase', tasks['firebase'], status['firebase'])
+        assert 'Startup Profile' not in capsys.readouterr().out
+
+        warmup._run_task('gemini', tasks['gemini'], status['gemini'])
+        output = capsys.readouterr().out
+        assert output.count('Startup Profile') == 1
+        assert 'warmup:firebase' in output and 'warmup:gemini' in output
+
+        warmup._run_task('gemini', tasks['gemini'], status['gemini'])
+        assert 'Startup Profile' not in capsys.readouterr().out
@@ -0,0 +1,94 @@
+"""
+结构化输出测试
+测试 GeminiService 通过 response_schema 生成 JSON、schema 被拒绝时回退为自由文本（配额等错误不回退）、按 schema 统计，以及各接口 schema 的字段
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import services.gemini_service as gemini_module
+from utils.response_schemas import DESIGN_PLAN_LIST, ENHANCED_PROMPT_LIST, MISMATCH_VERDICT, MODALITY_VERDICT
+
+
+class ApiError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+class FakeModels:
+    """fail 为异常时用它拒绝带 response_schema 的请求，自由文本请求返回 markdown 包装的 JSON"""
+
+    def __init__(self, text='{"modality": "VIDEO"}', fail=None):
+        self.text = text
+        self.fail = fail
+        self.configs = []
+
+    def generate_content(self, model, contents, config):
+        self.configs.append(config)
+        if config.response_schema is None:
+            return type('Response', (), {'text': '```json\n{"modality": "IMAGE"}\n```'})()
+        if self.fail:
+            raise self.fail
+        return type('Response', (), {'text': self.text})()
+
+
+def make_service(monkeypatch, models):
+    monkeypatch.setattr(gemini_module, 'get_gemini_context_cache', lambda: None)
+    return gemini_module.GeminiService(client=type('Client', (), {'models': models})())
+
+
+def test_response_schema_sent_with_native_system_instruction(monkeypatch):
+    """测试设置 response_schema 时通过 google.genai 发送 schema 与原生 system instruction"""
+    models = FakeModels()
+    service = make_service(monkeypatch, models)
+    result = service.generate_json('User prompt: "a drone shot"', response_schema=MODALITY_VERDICT,
+                                   system_instruction='Classify the prompt.')
+
+    assert result == {'modality': 'VIDEO'}
+    config = models.configs[0]
+    assert config.response_mime_type == 'application/json'
+    assert config.response_schema['title'] == 'ModalityVerdict'
+    assert config.system_instruction == 'Classify the prompt.'
+    assert len(models.configs) == 1
+    assert service.structured_output_stats() == {'ModalityVerdict': {'structured': 1, 'failures': 0}}
+
+
+def test_structured_failure_falls_back_to_free_text(monkeypatch):
+    """测试 schema 被拒绝（400）时回退为原来的自由文本调用"""
+    models = FakeModels(fail=ApiError(400, 'response_schema not supported'))
+    service = make_service(monkeypatch, models)
+    result = service.generate_json('User prompt: "a logo"', response_schema=MODALITY_VERDICT,
+                                   system_instruction='Classify the prompt.')
+
+    assert result == {'modality': 'IMAGE'}
+    fallback = models.configs[-1]
+    assert fallback.response_schema is None and fallback.system_instruction == 'Classify the prompt.'
+    assert service.structured_output_stats() == {'ModalityVerdict': {'structured': 0, 'failures': 1}}
+
+
+def test_quota_and_timeout_errors_do_not_retry_as_free_text(monkeypatch):
+    """测试配额、超时等非配置错误直接抛出，不再发起第二次自由文本调用"""
+    for error in (ApiError(429, 'quota exceeded'), TimeoutError('read timed out')):
+        models = FakeModels(fail=error)
+        service = make_service(monkeypatch, models)
+        with pytest.raises(type(error)):
+            service.generate_content('a logo', response_schema=MODALITY_VERDICT, timeout=5)
+        assert len(models.configs) == 1
+        assert models.configs[0].http_options.timeout == 5000
+
+
+def test_schemas_match_endpoint_fields():
+    """测试各 schema 的字段与前端类型一致，且全部为必填"""
+    assert ENHANCED_PROMPT_LIST['items']['propertyOrdering'] == ['title', 'description', 'tags', 'fullPrompt']
+    assert DESIGN_PLAN_LIST['items']['required'] == ['title', 'description', 'prompt', 'referenceImagePrompt']
+    assert MISMATCH_VERDICT['properties']['suggestedModel']['enum'] == ['veo_fast', 'banana']
+    # schema 可被 google.genai 直接接受
+    from google.genai import types
+    config = types.GenerateContentConfig(response_mime_type='application/json', response_schema=ENHANCED_PROMPT_LIST)
+    assert json.loads(json.dumps(config.model_dump(exclude_none=True), default=str))
@@ -0,0 +1,118 @@
+"""
+Video Frame Service 测试
+测试关键帧时间点、ffmpeg 命令（输入端 seek）、抽帧结果的 Storage 往返，以及海报/关键帧端点
+"""
+
+import base64
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.video_frame_service import (
+    VideoFrameService, build_ffmpeg_command, extract_frame, keyframe_timestamps
+)
+from services.video_proxy_service import VideoDiskCache, VideoProxyService
+import services.video_frame_service as video_frame_module
+import services.video_proxy_service as video_proxy_module
+from tests.test_video_proxy_service import FakeBucket, FakeDB, FakeSession
+
+
+def fake_extractor(source, timestamp, fmt, max_edge=None):
+    assert os.path.isfile(source)
+    return f'{fmt}@{timestamp:.3f}'.encode()
+
+
+def _make_service(tmp_path, bucket=None):
+    proxy = VideoProxyService(session=FakeSession(), cache=VideoDiskCache(str(tmp_path)), db=FakeDB())
+    return VideoFrameService(keyframe_count=4, bucket=bucket or FakeBucket(), proxy=proxy,
+                             extractor=fake_extractor), proxy
+
+
+def test_keyframe_timestamps():
+    """测试关键帧均匀分布，包含首帧和接近结尾的尾帧"""
+    assert keyframe_timestamps(8.0, 4) == [0.0, 2.633, 5.267, 7.9]
+    assert keyframe_timestamps(8.0, 1) == [0.0]
+    assert keyframe_timestamps(8.0, 0) == []
+
+
+def test_ffmpeg_command_seeks_before_input():
+    """测试 -ss 位于 -i 之前（输入端 seek）"""
+    command = build_ffmpeg_command('/tmp/v.mp4', 2.5, 'jpeg')
+    assert command.index('-ss') < command.index('-i')
+    assert command[-1] == 'pipe:1'
+
+    local = build_ffmpeg_command('/tmp/v.mp4', 1.0, 'webp', max_edge=720)
+    assert 'libwebp' in local and '-vf' in local
+
+
+def test_ffmpeg_reads_local_copy_without_credentials(tmp_path, monkeypatch):
+    """测试 ffmpeg 只读取本地文件（命令行不含 API Key），且与代理缓存共用一次上游下载"""
+    monkeypatch.setenv('GEMINI_API_KEY', 'secret-key')
+    sources = []
+
+    def recording_extractor(source, timestamp, fmt, max_edge=None):
+        sources.append(source)
+        assert 'secret-key' not in ' '.join(build_ffmpeg_command(source, timestamp, fmt, max_edge))
+        return fake_extractor(source, timestamp, fmt, max_edge)
+
+    service, proxy = _make_service(tmp_path)
+    service._extractor = recording_extractor
+    video_id = proxy.register('https://upstream.example/files/abc')
+    service.submit(video_id, proxy.resolve(video_id)).result(timeout=5)
+
+    assert len(sources) == 5 and not any(source.startswith('http') for source in sources)
+    assert not os.path.exists(sources[0])  # 临时副本已清理
+    assert proxy.cached_path(video_id)
+    assert len(proxy.session.requests) == 1
+
+
+def test_extract_and_reload_from_storage(tmp_path):
+    """测试抽帧结果上传到视频旁边，其他实例可从 Storage 读回"""
+    bucket = FakeBucket()
+    service, proxy = _make_service(tmp_path, bucket)
+    video_id = proxy.register('https://upstream.example/files/abc')
+    frames = service.submit(video_id, proxy.resolve(video_id)).result(timeout=5)
+
+    assert len(frames.keyframes) == 4
+    assert frames.poster.mime_type == 'image/webp'
+    assert f'veo_videos/{video_id}/poster.webp' in bucket.store
+    assert f'veo_videos/{video_id}/frame_03.jpg' in bucket.store
+
+    other, _ = _make_service(tmp_path, bucket)
+    reloaded = other.get(video_id)
+    assert [f.data for f in reloaded.keyframes] == [f.data for f in frames.keyframes]
+    assert reloaded.keyframes[0].to_image_part()['mimeType'] == 'image/jpeg'
+
+
+def test_frame_endpoints(tmp_path, monkeypatch):
+    """测试海报端点返回图片、关键帧端点返回可直接用于 /generate 的 images"""
+    service, proxy = _make_service(tmp_path)
+    monkeypatch.setattr(video_proxy_module, '_video_proxy_service', proxy)
+    monkeypatch.setattr(video_frame_module, '_video_frame_service', service)
+    video_id = proxy.register('https://upstream.example/files/abc')
+    from app import app
+    client = app.test_client()
+
+    poster = client.get(f'/api/reel/videos/{video_id}/poster')
+    assert poster.status_code == 200
+    assert poster.mimetype == 'image/webp'
+
+    body = client.get(f'/api/reel/videos/{video_id}/frames').get_json()
+    assert len(body['images']) == 4
+    assert base64.b64decode(body['images'][-1]['data']) == b'jpeg@7.900'
+    assert client.get('/api/reel/videos/unknown-video-id-0000/frames').status_code == 404
+
+
+@pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='ffmpeg not installed')
+def test_extract_frame_with_ffmpeg(tmp_path):
+    """测试真实 ffmpeg 抽取 JPEG 帧"""
+    path = str(tmp_path / 'clip.mp4')
+    subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-f', 'lavfi', '-i', 'testsrc=size=320x568:rate=24',
+                    '-t', '3', '-pix_fmt', 'yuv420p', path], check=True)
+    data = extract_frame(path, 2.0, 'jpeg')
+    assert data[:2] == b'\xff\xd8'
@@ -0,0 +1,188 @@
+"""
+Video Proxy Service 测试
+测试 Range 解析、磁盘 LRU 缓存、代理端点的 Range 转发与缓存命中，以及已转存视频从 Storage 读取
+"""
+
+import io
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.video_proxy_service import VideoDiskCache, VideoProxyService, parse_range
+import services.video_proxy_service as video_proxy_module
+
+VIDEO = bytes(range(256)) * 4096  # 1MB
+
+
+class FakeUpstreamResponse:
+    def __init__(self, data, status_code, headers):
+        self._data = data
+        self.status_code = status_code
+        self.headers = headers
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self._data), chunk_size):
+            yield self._data[i:i + chunk_size]
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    """模拟支持 Range 的上游，记录请求头"""
+
+    def __init__(self):
+        self.requests = []
+
+    def get(self, url, headers, stream, timeout):
+        self.requests.append(dict(headers))
+        byte_range = parse_range(headers.get('Range'))
+        if byte_range:
+            start, end = byte_range
+            end = len(VIDEO) - 1 if end is None else end
+            body = VIDEO[start:end + 1]
+            return FakeUpstreamResponse(body, 206, {
+                'Content-Type': 'video/mp4',
+                'Content-Length': str(len(body)),
+                'Content-Range': f'bytes {start}-{end}/{len(VIDEO)}',
+            })
+        return FakeUpstreamResponse(VIDEO, 200, {'Content-Type': 'video/mp4', 'Content-Length': str(len(VIDEO))})
+
+
+class FakeDB:
+    def collection(self, name):
+        raise RuntimeError("firestore unavailable")
+
+
+def test_parse_range():
+    """测试单段 Range 解析"""
+    assert parse_range('bytes=0-99') == (0, 99)
+    assert parse_range('bytes=100-') == (100, None)
+    assert parse_range('bytes=-500') == (None, 500)
+    assert parse_range('bytes=5-1') is None
+    assert parse_range('bytes=0-1,5-6') is None
+    assert parse_range(None) is None
+
+
+def test_disk_cache_lru_eviction(tmp_path):
+    """测试按字节上限淘汰最久未使用的视频，并在重启后恢复索引"""
+    cache = VideoDiskCache(str(tmp_path), max_bytes=250)
+    cache.put('a' * 22, iter([b'x' * 100]))
+    cache.put('b' * 22, iter([b'x' * 100]))
+    assert cache.get('a' * 22)  # a 变为最近使用
+    cache.put('c' * 22, iter([b'x' * 100]))
+    assert cache.get('b' * 22) is None
+    assert cache.get('a' * 22) and cache.get('c' * 22)
+
+    reopened = VideoDiskCache(str(tmp_path), max_bytes=250)
+    assert reopened.get('a' * 22) and reopened.get('c' * 22)
+
+
+@pytest.fixture
+def proxy_client(tmp_path, monkeypatch):
+    monkeypatch.setenv('GEMINI_API_KEY', 'secret-key')
+    session = FakeSession()
+    service = VideoProxyService(session=session, cache=VideoDiskCache(str(tmp_path)), db=FakeDB())
+    monkeypatch.setattr(video_proxy_module, '_video_proxy_service', service)
+    from app import app
+    return app.test_client(), service, session
+
+
+def test_proxy_range_and_cache(proxy_client):
+    """测试代理转发 Range、API Key 只出现在上游 header，缓存完成后从磁盘提供"""
+    client, service, session = proxy_client
+    video_id = service.register('https://upstream.example/files/abc:download?alt=media')
+    assert 'secret-key' not in video_id
+
+    response = client.get(f'/api/reel/videos/{video_id}', headers={'Range': 'bytes=100-199'})
+    assert response.status_code == 206
+    assert response.data == VIDEO[100:200]
+    assert response.headers['Content-Range'] == f'bytes 100-199/{len(VIDEO)}'
+    assert session.requests[0]['x-goog-api-key'] == 'secret-key'
+
+    # 等待后台缓存完成
+    for _ in range(100):
+        if service.cached_path(video_id):
+            break
+        time.sleep(0.02)
+    assert service.cached_path(video_id)
+
+    upstream_calls = len(session.requests)
+    response = client.get(f'/api/reel/videos/{video_id}', headers={'Range': 'bytes=-10'})
+    assert response.status_code == 206
+    assert response.data == VIDEO[-10:]
+    assert len(session.requests) == upstream_calls
+
+
+def test_unknown_video_returns_404(proxy_client):
+    """测试未知或格式无效的视频 ID"""
+    client, _, _ = proxy_client
+    assert client.get('/api/reel/videos/unknown-video-id-0000').status_code == 404
+    assert client.get('/api/reel/videos/short').status_code == 404
+
+
+class FakeBlob:
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+        self.size = None
+        self.chunk_size = None
+
+    def reload(self):
+        self.size = len(self.store[self.name])
+
+    def open(self, mode, chunk_size=None):
+        return io.BytesIO(self.store[self.name])
+
+    def upload_from_file(self, file_obj, size=None, content_type=None):
+        data = b''
+        while True:
+            chunk = file_obj.read(self.chunk_size or 1024)
+            if not chunk:
+                break
+            data += chunk
+        self.store[self.name] = data
+
+    def upload_from_string(self, data, content_type=None):
+        self.store[self.name] = data
+
+    def download_as_bytes(self):
+        if self.name not in self.store:
+            raise FileNotFoundError(self.name)
+        return self.store[self.name]
+
+
+class FakeBucket:
+    name = 'test-bucket'
+
+    def __init__(self):
+        self.store = {}
+
+    def blob(self, name):
+        return FakeBlob(self.store, name)
+
+
+def test_archived_video_served_from_storage(tmp_path):
+    """测试已转存的视频从 Storage 按 Range 读取，不再请求上游；越界 Range 返回 416"""
+    bucket = FakeBucket()
+    bucket.store['veo_videos/v.mp4'] = VIDEO
+    session = FakeSession()
+    service = VideoProxyService(session=session, cache=VideoDiskCache(str(tmp_path)), db=FakeDB(), bucket=bucket)
+    video_id = service.register('https://upstream.example/files/abc:download?alt=media')
+    service.mark_archived(video_id, 'veo_videos/v.mp4', len(VIDEO))
+    record = service.resolve(video_id)
+
+    status, headers, chunks = service.open_source(record, 'bytes=1000-')
+    assert status == 206
+    assert b''.join(chunks) == VIDEO[1000:]
+    assert headers['Content-Range'] == f'bytes 1000-{len(VIDEO) - 1}/{len(VIDEO)}'
+    assert session.requests == []
+
+    status, headers, _ = service.open_source(record, f'bytes={len(VIDEO)}-')
+    assert status == 416
+    assert headers['Content-Range'] == f'bytes */{len(VIDEO)}'
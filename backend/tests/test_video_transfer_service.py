@@ -0,0 +1,102 @@
+"""
+Video Transfer Service 测试
+测试视频流式转存到 Storage、记录 sha256 / gs:// 地址、复用代理的磁盘缓存，以及失败后的退避重试
+"""
+
+import hashlib
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.video_proxy_service import VideoDiskCache, VideoProxyService
+from services.video_transfer_service import VideoTransferService, VIDEO_UPLOAD_CHUNK_SIZE
+from tests.test_video_proxy_service import VIDEO, FakeBucket, FakeSession
+
+
+class FlakySession(FakeSession):
+    """前 failures 次请求返回 503"""
+
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def get(self, url, headers, stream, timeout):
+        if self.failures > 0:
+            self.failures -= 1
+            self.requests.append(dict(headers))
+            return type('Response', (), {'status_code': 503, 'close': lambda self: None})()
+        return super().get(url, headers, stream, timeout)
+
+
+class FakeDocument:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+
+    def set(self, data, merge=False):
+        self.db.writes.setdefault(self.path, {}).update(data)
+
+
+class FakeDB:
+    def __init__(self):
+        self.writes = {}
+
+    def collection(self, name):
+        db = self
+        return type('Collection', (), {'document': lambda self, doc_id: FakeDocument(db, f'{name}/{doc_id}')})()
+
+
+def _make_service(tmp_path, session, max_retries=4):
+    bucket, db = FakeBucket(), FakeDB()
+    proxy = VideoProxyService(session=session, cache=VideoDiskCache(str(tmp_path)), db=db, bucket=bucket)
+    transfer = VideoTransferService(concurrency=2, max_retries=max_retries, base_backoff=0.01,
+                                    bucket=bucket, db=db, proxy=proxy)
+    return transfer, proxy, bucket, db
+
+
+def test_transfer_archives_video(tmp_path):
+    """测试转存完成后 Storage 内容一致，Firestore 记录 gs:// 地址与 sha256，代理改为从 Storage 读取"""
+    transfer, proxy, bucket, db = _make_service(tmp_path, FakeSession())
+    video_id = proxy.register('https://upstream.example/files/abc:download?alt=media', asset_doc_id='asset1')
+    transfer.enqueue(video_id, 'https://upstream.example/files/abc:download?alt=media', asset_doc_id='asset1')
+    assert transfer.wait_idle(timeout=5)
+
+    storage_path = f'veo_videos/{video_id}.mp4'
+    assert bucket.store[storage_path] == VIDEO
+    asset = db.writes['veo_assets/asset1']
+    assert asset['generated_video_gcs_uri'] == f'gs://test-bucket/{storage_path}'
+    assert asset['generated_video_sha256'] == hashlib.sha256(VIDEO).hexdigest()
+    assert db.writes[f'veo_videos/{video_id}']['size_bytes'] == len(VIDEO)
+    assert proxy.resolve(video_id)['storage_path'] == storage_path
+    assert VIDEO_UPLOAD_CHUNK_SIZE % (256 * 1024) == 0
+
+
+def test_transfer_retries_with_backoff(tmp_path):
+    """测试上游暂时失败时重试，超过次数后标记失败"""
+    transfer, proxy, bucket, _ = _make_service(tmp_path, FlakySession(failures=2))
+    transfer.enqueue('v' * 22, 'https://upstream.example/files/abc')
+    assert transfer.wait_idle(timeout=5)
+    assert transfer.stats['retries'] == 2
+    assert bucket.store[f'veo_videos/{"v" * 22}.mp4'] == VIDEO
+
+    transfer, _, _, db = _make_service(tmp_path, FlakySession(failures=10), max_retries=1)
+    transfer.enqueue('w' * 22, 'https://upstream.example/files/abc')
+    assert transfer.wait_idle(timeout=5)
+    assert transfer.stats['failed'] == 1
+    assert db.writes[f'veo_videos/{"w" * 22}']['transfer_status'] == 'failed'
+
+
+def test_transfer_reuses_proxy_cache_fill(tmp_path):
+    """测试代理缓存填充与转存同时进行时，上游只下载一次，转存从磁盘缓存上传"""
+    session = FakeSession()
+    transfer, proxy, bucket, _ = _make_service(tmp_path, session)
+    source_uri = 'https://upstream.example/files/abc:download?alt=media'
+    video_id = proxy.register(source_uri)
+    proxy.ensure_cached(video_id, {'source_uri': source_uri})
+    transfer.enqueue(video_id, source_uri)
+    assert transfer.wait_idle(timeout=5)
+
+    assert bucket.store[f'veo_videos/{video_id}.mp4'] == VIDEO
+    assert proxy.cached_path(video_id)
+    assert len(session.requests) == 1
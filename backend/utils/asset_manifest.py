@@ -0,0 +1,75 @@
+"""
+Asset Manifest 工具
+创意总监只需要画布资产的元数据（类型、提示词、尺寸），不需要图片/视频内容。
+客户端发送 id → 元数据的精简清单；旧客户端仍发送完整 ReelAsset 时，在这里去掉 src 等大字段
+"""
+
+import os
+from typing import Any, Dict, List, Tuple
+
+# /creative-director 请求体上限：超过时在解析 JSON 之前直接拒绝（413），解析耗时与画布资产数量无关
+CREATIVE_DIRECTOR_MAX_BODY_BYTES = int(os.getenv('CREATIVE_DIRECTOR_MAX_BODY_BYTES', str(1024 * 1024)))
+# 清单中保留的提示词长度
+MANIFEST_PROMPT_MAX_CHARS = int(os.getenv('MANIFEST_PROMPT_MAX_CHARS', '500'))
+
+# 清单中允许的字段（其余字段如 src / fullSrc / generationParams 一律丢弃）
+MANIFEST_FIELDS = ('type', 'prompt', 'width', 'height', 'mimeType', 'duration', 'status',
+                   'generationModel', 'sourceAssetId')
+_NUMERIC_FIELDS = ('width', 'height', 'duration')
+
+
+def slim_asset_manifest(assets: Any) -> Tuple[Dict[str, Dict[str, Any]], int]:
+    """
+    把 assets 规范化为精简清单
+
+    Args:
+        assets: {asset_id: ReelAsset 或 manifest entry}
+
+    Returns:
+        (manifest, stripped)：stripped 为被丢弃的字段数（旧客户端发送完整资产时大于 0）
+    """
+    if not isinstance(assets, dict):
+        return {}, 0
+    manifest: Dict[str, Dict[str, Any]] = {}
+    stripped = 0
+    for asset_id, asset in assets.items():
+        if not isinstance(asset, dict):
+            continue
+        entry = {}
+        for key, value in asset.items():
+            if key not in MANIFEST_FIELDS or value is None:
+                stripped += 1
+            elif key in _NUMERIC_FIELDS:
+                if isinstance(value, (int, float)):
+                    entry[key] = value
+            elif isinstance(value, str):
+                entry[key] = value[:MANIFEST_PROMPT_MAX_CHARS] if key == 'prompt' else value[:128]
+        manifest[str(asset_id)] = entry
+    return manifest, stripped
+
+
+def slim_messages(messages: Any, limit: int) -> List[Dict[str, Any]]:
+    """只保留最近 limit 条消息的 id / role / type 和文本内容（非文本内容替换为 None）"""
+    if not isinstance(messages, list):
+        return []
+    slimmed = []
+    for msg in messages[-limit:]:
+        if not isinstance(msg, dict):
+            continue
+        content = msg.get('content')
+        entry = {
+            'role': msg.get('role', 'user'),
+            'type': msg.get('type', 'unknown'),
+            'content': content if isinstance(content, str) else None,
+        }
+        if isinstance(msg.get('id'), str):
+            entry['id'] = msg['id'][:128]
+        slimmed.append(entry)
+    return slimmed
+
+
+def asset_id_if_type(manifest: Dict[str, Dict[str, Any]], asset_id: Any, asset_type: str):
+    """asset_id 存在且类型匹配时返回该 ID，否则返回 None"""
+    if asset_id and manifest.get(asset_id, {}).get('type') == asset_type:
+        return asset_id
+    return None
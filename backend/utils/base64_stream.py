@@ -0,0 +1,163 @@
+"""
+Streaming Base64 / Hashing Readers
+以文件对象的形式增量解码 base64（来自字符串或请求流），边读边计算内容哈希，
+用于把图片、视频分块流式上传到 Firebase Storage，而不在内存中持有完整的内容
+"""
+
+import base64
+import binascii
+import hashlib
+from typing import Optional, Union
+
+# 每次从源读取的 base64 字符数（4 的倍数）
+BASE64_READ_CHUNK = 256 * 1024
+
+_WHITESPACE = b' \t\r\n'
+
+
+def decoded_base64_length(data: str) -> int:
+    """根据 base64 字符串长度计算解码后的字节数（不解码，忽略 data URI 前缀和空白）"""
+    if data.startswith('data:') and ',' in data[:256]:
+        data = data.split(',', 1)[1]
+    length = len(data) - sum(data.count(c) for c in ' \t\r\n')
+    padding = 2 if data.rstrip().endswith('==') else (1 if data.rstrip().endswith('=') else 0)
+    return (length * 3) // 4 - padding
+
+
+class _HashingMixin:
+    """读取时累计字节数与 SHA-256"""
+
+    def _init_hash(self):
+        self._sha256 = hashlib.sha256()
+        self.bytes_read = 0
+
+    def _track(self, chunk: bytes) -> bytes:
+        self._sha256.update(chunk)
+        self.bytes_read += len(chunk)
+        return chunk
+
+    @property
+    def sha256(self) -> str:
+        """已读取内容的 SHA-256（读取完成后即为完整内容的哈希）"""
+        return self._sha256.hexdigest()
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def tell(self) -> int:
+        # google-resumable-media 使用 tell() 记录已上传的位置
+        return self.bytes_read
+
+
+class HashingReader(_HashingMixin):
+    """包装一个二进制流，读取时计算 SHA-256"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._init_hash()
+
+    def read(self, size: int = -1) -> bytes:
+        return self._track(self._stream.read(size) if size is not None else self._stream.read())
+
+
+class IteratorReader(_HashingMixin):
+    """把字节块迭代器（如 requests 的 iter_content）包装为文件对象，读取时计算 SHA-256"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b''
+        self._eof = False
+        self._init_hash()
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None:
+            size = -1
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self._eof = True
+            else:
+                self._buffer += chunk
+        if size < 0:
+            result, self._buffer = self._buffer, b''
+        else:
+            result, self._buffer = self._buffer[:size], self._buffer[size:]
+        return self._track(result)
+
+
+class Base64DecodingReader(_HashingMixin):
+    """
+    增量解码 base64 的文件对象
+
+    Args:
+        source: base64 字符串，或带 read() 方法的文本/二进制流（如 Flask 的 request.stream）
+        read_chunk: 每次从源读取的 base64 字符数
+    """
+
+    def __init__(self, source: Union[str, bytes, object], read_chunk: int = BASE64_READ_CHUNK):
+        self._source = source
+        self._offset = 0
+        self._read_chunk = read_chunk - read_chunk % 4 or 4
+        self._pending = b''   # 尚未凑满 4 字符的 base64 片段
+        self._buffer = b''    # 已解码但未被读取的字节
+        self._eof = False
+        self._prefix_checked = False
+        self._init_hash()
+
+    def _read_source(self) -> bytes:
+        if isinstance(self._source, (str, bytes)):
+            chunk = self._source[self._offset:self._offset + self._read_chunk]
+            self._offset += len(chunk)
+        else:
+            chunk = self._source.read(self._read_chunk)
+        if isinstance(chunk, str):
+            chunk = chunk.encode('ascii')
+        return chunk or b''
+
+    def _fill(self, size: int):
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            chunk = self._read_source()
+            if not chunk:
+                self._eof = True
+            if not self._prefix_checked:
+                # 兼容 data:image/png;base64,XXXX 形式
+                if not chunk and self._pending:
+                    chunk, self._pending = self._pending, b''
+                candidate = self._pending + chunk
+                if candidate.startswith(b'data:'):
+                    if b',' not in candidate and not self._eof:
+                        self._pending = candidate
+                        continue
+                    candidate = candidate.split(b',', 1)[1] if b',' in candidate else b''
+                self._pending, chunk = b'', candidate
+                self._prefix_checked = True
+            data = self._pending + chunk.translate(None, _WHITESPACE)
+            usable = len(data) if self._eof else len(data) - len(data) % 4
+            self._pending = data[usable:]
+            if usable:
+                try:
+                    self._buffer += base64.b64decode(data[:usable], validate=True)
+                except binascii.Error as e:
+                    raise ValueError(f"Invalid base64 data: {e}") from e
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None:
+            size = -1
+        self._fill(size)
+        if size < 0:
+            result, self._buffer = self._buffer, b''
+        else:
+            result, self._buffer = self._buffer[:size], self._buffer[size:]
+        return self._track(result)
+
+    def read_all(self) -> bytes:
+        """读取剩余全部内容（仅用于需要完整字节的回退路径）"""
+        return self.read(-1)
+
+
+def open_base64(source: Union[str, bytes, object], read_chunk: Optional[int] = None) -> Base64DecodingReader:
+    """创建增量 base64 解码器"""
+    return Base64DecodingReader(source, read_chunk or BASE64_READ_CHUNK)
@@ -3,9 +3,18 @@ Brand DNA Utilities
 从 Firestore 读取 Brand DNA 配置的辅助函数
 """
 
-from typing import Optional, Dict, Any
-import firebase_admin
-from firebase_admin import firestore
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+from utils.firebase_registry import get_firestore_client
+from utils.prompt_templates import render_prompt
+
+# 已渲染的 Brand DNA 提示词片段缓存（按 profile ID + 修订版本）
+BRAND_FRAGMENT_CACHE_SIZE = int(os.getenv('BRAND_FRAGMENT_CACHE_SIZE', '256'))
+
+_fragment_cache: "OrderedDict[Tuple, str]" = OrderedDict()
+_fragment_cache_lock = threading.Lock()
 
 
 def get_brand_dna_profile(uid: str, profile_id: str) -> Optional[Dict[str, Any]]:
@@ -20,11 +29,11 @@ def get_brand_dna_profile(uid: str, profile_id: str) -> Optional[Dict[str, Any]]
         Brand DNA 配置字典，如果不存在则返回 None
     """
     try:
-        if not firebase_admin._apps:
+        db = get_firestore_client()
+        if db is None:
             print("[BrandDNAUtils] Firebase not initialized")
             return None
         
-        db = firestore.client()
         doc_ref = db.collection('visual_profiles').document(profile_id)
         doc = doc_ref.get()
         
@@ -39,6 +48,10 @@ def get_brand_dna_profile(uid: str, profile_id: str) -> Optional[Dict[str, Any]]
             print(f"[BrandDNAUtils] Profile {profile_id} does not belong to user {uid}")
             return None
         
+        # 文档更新时间作为修订版本，用于缓存渲染好的提示词片段
+        data['id'] = profile_id
+        update_time = getattr(doc, 'update_time', None)
+        data['revision'] = update_time.isoformat() if hasattr(update_time, 'isoformat') else None
         return data
     
     except Exception as e:
@@ -48,6 +61,53 @@ def get_brand_dna_profile(uid: str, profile_id: str) -> Optional[Dict[str, Any]]
         return None
 
 
+def _fragment_cache_key(template_name: str, brand_dna: Dict[str, Any], is_video: bool) -> Tuple:
+    """有 profile ID 和修订版本时按二者缓存，否则按参与渲染的字段值缓存"""
+    if brand_dna.get('id') and brand_dna.get('revision'):
+        return (template_name, is_video, brand_dna['id'], brand_dna['revision'])
+    fields = ('name', 'visualStyle', 'colorPalette', 'mood', 'negativeConstraint', 'motionStyle')
+    return (template_name, is_video) + tuple(repr(brand_dna.get(key)) for key in fields)
+
+
+def _render_brand_fragment(template_name: str, brand_dna: Dict[str, Any], is_video: bool, **values: Any) -> str:
+    key = _fragment_cache_key(template_name, brand_dna, is_video)
+    with _fragment_cache_lock:
+        fragment = _fragment_cache.get(key)
+        if fragment is not None:
+            _fragment_cache.move_to_end(key)
+            return fragment
+    fragment = render_prompt(template_name, **values)
+    with _fragment_cache_lock:
+        _fragment_cache[key] = fragment
+        while len(_fragment_cache) > BRAND_FRAGMENT_CACHE_SIZE:
+            _fragment_cache.popitem(last=False)
+    return fragment
+
+
+def render_brand_guidelines(brand_dna: Dict[str, Any], purpose: str, is_video: bool = False) -> str:
+    """
+    渲染 enhance-prompt / design-plan 使用的 Brand DNA 指南片段（带缓存）
+    
+    Args:
+        brand_dna: Brand DNA 配置字典
+        purpose: 'enhance' 或 'design'
+        is_video: 是否为视频模型（视频模型追加 Motion Style）
+    """
+    template_name = f'brand_guidelines_{purpose}'
+    motion_style_line = ""
+    if is_video and brand_dna.get('motionStyle'):
+        motion_style_line = f"\n- **Motion Style**: {brand_dna.get('motionStyle', '')}"
+    return _render_brand_fragment(
+        template_name, brand_dna, is_video,
+        profile_name=brand_dna.get('name', 'Active Profile'),
+        visual_style=brand_dna.get('visualStyle', ''),
+        color_palette=brand_dna.get('colorPalette', ''),
+        mood=brand_dna.get('mood', ''),
+        negative_constraint=brand_dna.get('negativeConstraint', ''),
+        motion_style_line=motion_style_line,
+    )
+
+
 def inject_brand_dna_to_prompt(
     original_prompt: str,
     brand_dna: Dict[str, Any],
@@ -64,33 +124,20 @@ def inject_brand_dna_to_prompt(
     Returns:
         注入 Brand DNA 后的提示词
     """
-    profile_name = brand_dna.get('name', 'Brand DNA')
-    visual_style = brand_dna.get('visualStyle', '')
-    color_palette = brand_dna.get('colorPalette', '')
-    mood = brand_dna.get('mood', '')
-    negative_constraint = brand_dna.get('negativeConstraint', '')
-    
+    values = {
+        'profile_name': brand_dna.get('name', 'Brand DNA'),
+        'visual_style': brand_dna.get('visualStyle', ''),
+        'color_palette': brand_dna.get('colorPalette', ''),
+        'mood': brand_dna.get('mood', ''),
+        'negative_constraint': brand_dna.get('negativeConstraint', ''),
+    }
     if is_video:
         # 视频模式：只注入文本约束（不使用 styleReferenceUrl）
-        motion_style = brand_dna.get('motionStyle', 'Stable cinematic movement')
-        brand_context = f"""
-[BRAND DNA ACTIVE: {profile_name}]
-Strictly adhere to these visual and motion constraints:
-- Visual Style: {visual_style}
-- Color Palette: {color_palette}
-- Mood: {mood}
-- Motion Style: {motion_style}
-- Negative Constraints (AVOID): {negative_constraint}
-"""
+        values['motion_style'] = brand_dna.get('motionStyle', 'Stable cinematic movement')
+        brand_context = _render_brand_fragment('brand_dna_inject_video', brand_dna, True, **values)
     else:
         # 图片模式：注入文本约束
-        brand_context = f"""
-[BRAND DNA ACTIVE: {profile_name}]
-- Visual Style: {visual_style}
-- Color Palette: {color_palette}
-- Mood: {mood}
-- Negative Constraints: {negative_constraint}
-"""
+        brand_context = _render_brand_fragment('brand_dna_inject_image', brand_dna, False, **values)
     
     return f"{original_prompt}\n\n{brand_context}"
 
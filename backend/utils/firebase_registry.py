@@ -0,0 +1,194 @@
+"""
+Firebase Client Registry
+统一管理 Firebase App、Firestore 客户端和 Storage bucket（进程内单例，线程安全）
+所有服务都从这里获取客户端，保证只初始化一次且使用一致的配置（包括 storageBucket）
+"""
+
+import os
+import json
+import threading
+import time
+from typing import Any, Optional
+
+# Storage 客户端 HTTP 连接池大小（并发上传/下载时复用连接）
+STORAGE_HTTP_POOL_SIZE = int(os.getenv('STORAGE_HTTP_POOL_SIZE', '32'))
+# 初始化失败（凭证加载、initialize_app 出错）后的重试间隔：从 FIREBASE_INIT_RETRY_SECONDS 开始逐次翻倍，最多 FIREBASE_INIT_RETRY_MAX_SECONDS
+FIREBASE_INIT_RETRY_SECONDS = float(os.getenv('FIREBASE_INIT_RETRY_SECONDS', '1'))
+FIREBASE_INIT_RETRY_MAX_SECONDS = float(os.getenv('FIREBASE_INIT_RETRY_MAX_SECONDS', '60'))
+
+_lock = threading.RLock()
+_app = None
+_app_initialized = False
+_init_failures = 0
+_retry_at = 0.0
+_firestore_client = None
+_storage_bucket = None
+
+
+def _resolve_credentials_path(cred_path: str) -> Optional[str]:
+    """解析凭证文件路径：相对路径依次尝试 backend 目录、当前工作目录、utils 目录"""
+    if os.path.isabs(cred_path):
+        return cred_path if os.path.exists(cred_path) else None
+
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    possible_bases = [
+        backend_dir,  # backend/ 目录
+        os.getcwd(),  # 当前工作目录
+        os.path.dirname(os.path.abspath(__file__)),  # utils/ 目录
+    ]
+    for base in possible_bases:
+        candidate = os.path.join(base, cred_path.lstrip('./'))
+        if os.path.exists(candidate):
+            return candidate
+    # 如果仍然找不到，尝试直接用原始路径（可能是相对于当前工作目录）
+    return cred_path if os.path.exists(cred_path) else None
+
+
+def _load_credentials():
+    """
+    按优先级加载 Service Account 凭证
+
+    Priority 1: FIREBASE_CREDENTIALS_PATH
+    Priority 2: FIREBASE_CREDENTIALS_JSON
+    Fallback: serviceAccountKey.json（backend 目录或当前目录）
+    """
+    from firebase_admin import credentials
+
+    env_path = os.getenv('FIREBASE_CREDENTIALS_PATH')
+    cred_json = os.getenv('FIREBASE_CREDENTIALS_JSON')
+
+    cred_path = _resolve_credentials_path(env_path) if env_path else None
+    if cred_path:
+        print(f"[FirebaseRegistry] Initializing Firebase with credentials from: {cred_path}")
+        return credentials.Certificate(cred_path)
+
+    if cred_json:
+        print("[FirebaseRegistry] Initializing Firebase with credentials from JSON string")
+        try:
+            return credentials.Certificate(json.loads(cred_json))
+        except Exception as e:
+            print(f"[FirebaseRegistry] Failed to parse FIREBASE_CREDENTIALS_JSON: {e}")
+            return None
+
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    default_paths = [
+        os.path.join(backend_dir, 'serviceAccountKey.json'),
+        'serviceAccountKey.json',
+        'backend/serviceAccountKey.json',
+    ]
+    for p in default_paths:
+        if os.path.exists(p):
+            print(f"[FirebaseRegistry] Initializing Firebase with default credentials file: {p}")
+            return credentials.Certificate(p)
+
+    # 详细错误信息，帮助调试
+    error_details = []
+    if env_path:
+        error_details.append(f"FIREBASE_CREDENTIALS_PATH='{env_path}' (not found)")
+    if not cred_json:
+        error_details.append("FIREBASE_CREDENTIALS_JSON not set")
+    print(
+        "❌ ERROR: No Firebase credentials found.\n"
+        f"  Details: {'; '.join(error_details)}\n"
+        f"  Current working directory: {os.getcwd()}\n"
+        f"  Backend directory: {os.path.dirname(os.path.dirname(os.path.abspath(__file__)))}\n"
+        "  Please set FIREBASE_CREDENTIALS_PATH or FIREBASE_CREDENTIALS_JSON in .env file.\n"
+        "  Auth verification will fail."
+    )
+    return None
+
+
+def get_firebase_app():
+    """
+    获取 Firebase App（首次调用时初始化）
+    初始化成功或未配置凭证时结果固定；初始化出错时不记录结果，退避一段时间后的下一次调用重新初始化
+
+    Returns:
+        firebase_admin.App，未配置凭证、firebase_admin 未安装或初始化失败（退避中）时返回 None
+    """
+    global _app, _app_initialized, _init_failures, _retry_at
+    if _app_initialized:
+        return _app
+
+    with _lock:
+        if _app_initialized:
+            return _app
+        if time.monotonic() < _retry_at:
+            return None
+        try:
+            import firebase_admin
+
+            if firebase_admin._apps:
+                # 已被其他代码初始化（例如测试），直接复用
+                _app = firebase_admin.get_app()
+            else:
+                cred = _load_credentials()
+                if cred:
+                    options = {}
+                    storage_bucket = os.getenv('FIREBASE_STORAGE_BUCKET')
+                    if storage_bucket:
+                        options['storageBucket'] = storage_bucket
+                    else:
+                        print("[FirebaseRegistry] WARNING: FIREBASE_STORAGE_BUCKET not set in .env")
+                    _app = firebase_admin.initialize_app(cred, options)
+                    print("[FirebaseRegistry] ✅ Firebase Admin SDK initialized successfully")
+        except ImportError:
+            print("WARNING: firebase_admin not installed. Firebase features will be disabled.")
+        except Exception as e:
+            delay = min(FIREBASE_INIT_RETRY_SECONDS * (2 ** _init_failures), FIREBASE_INIT_RETRY_MAX_SECONDS)
+            _init_failures += 1
+            _retry_at = time.monotonic() + delay
+            print(f"[FirebaseRegistry] ❌ ERROR: Failed to initialize Firebase Admin SDK: {e} (retrying in {delay:.0f}s)")
+            return None
+        _app_initialized = True
+        _init_failures = 0
+        return _app
+
+
+def get_firestore_client() -> Optional[Any]:
+    """获取共享的 Firestore 客户端（Firebase 未初始化时返回 None）"""
+    global _firestore_client
+    if _firestore_client is not None:
+        return _firestore_client
+
+    with _lock:
+        if _firestore_client is None:
+            app = get_firebase_app()
+            if app is None:
+                return None
+            from firebase_admin import firestore
+            _firestore_client = firestore.client(app)
+        return _firestore_client
+
+
+def get_storage_bucket() -> Optional[Any]:
+    """获取共享的 Storage bucket（Firebase 未初始化或未配置 bucket 时返回 None）"""
+    global _storage_bucket
+    if _storage_bucket is not None:
+        return _storage_bucket
+
+    with _lock:
+        if _storage_bucket is None:
+            app = get_firebase_app()
+            if app is None:
+                return None
+            from firebase_admin import storage
+            try:
+                bucket = storage.bucket(app=app)
+            except Exception as e:
+                print(f"[FirebaseRegistry] ⚠️ Failed to initialize Storage bucket: {e}")
+                return None
+            _configure_http_pool(bucket.client)
+            _storage_bucket = bucket
+            print("[FirebaseRegistry] ✅ Storage bucket initialized")
+        return _storage_bucket
+
+
+def _configure_http_pool(storage_client):
+    """扩大 Storage 客户端的 HTTP 连接池，避免并发请求时频繁建立连接"""
+    try:
+        from requests.adapters import HTTPAdapter
+        adapter = HTTPAdapter(pool_connections=STORAGE_HTTP_POOL_SIZE, pool_maxsize=STORAGE_HTTP_POOL_SIZE)
+        storage_client._http.mount('https://', adapter)
+    except Exception as e:
+        print(f"[FirebaseRegistry] ⚠️ Failed to configure Storage HTTP pool: {e}")
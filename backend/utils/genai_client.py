@@ -0,0 +1,33 @@
+"""
+Gen AI Client Registry
+进程内共享一个 google.genai 客户端（文本、图片、结构化输出、cached content 与 Veo 共用同一 HTTP 连接池）
+"""
+
+import os
+import threading
+from typing import Optional
+
+from utils.lazy_import import lazy_import
+
+genai_new = lazy_import('google.genai')
+
+_lock = threading.Lock()
+_client = None
+
+
+def get_genai_api_key() -> Optional[str]:
+    # Support both GEMINI_API_KEY and GOOGLE_API_KEY for compatibility
+    return os.getenv('GEMINI_API_KEY') or os.getenv('GOOGLE_API_KEY')
+
+
+def get_genai_client():
+    """获取共享的 google.genai 客户端（首次调用时创建，未配置 API Key 时抛出 ValueError）"""
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                api_key = get_genai_api_key()
+                if not api_key:
+                    raise ValueError("GEMINI_API_KEY not configured")
+                _client = genai_new.Client(api_key=api_key)
+    return _client
@@ -0,0 +1,70 @@
+"""
+Lazy Import
+按需加载只在部分路由中使用的重量级 SDK（google.genai、firebase_admin）
+首次访问属性时才真正导入模块，把导入耗时从冷启动路径移到第一次使用（或后台预热）时
+"""
+
+import importlib
+import threading
+import time
+from types import ModuleType
+
+
+class LazyModule(ModuleType):
+    """模块代理：首次访问属性时导入真实模块"""
+
+    def __init__(self, module_name: str):
+        super().__init__(module_name)
+        object.__setattr__(self, '_lazy_module_name', module_name)
+        object.__setattr__(self, '_lazy_module', None)
+        object.__setattr__(self, '_lazy_lock', threading.Lock())
+
+    def _load(self) -> ModuleType:
+        module = object.__getattribute__(self, '_lazy_module')
+        if module is not None:
+            return module
+        with object.__getattribute__(self, '_lazy_lock'):
+            module = object.__getattribute__(self, '_lazy_module')
+            if module is None:
+                module_name = object.__getattribute__(self, '_lazy_module_name')
+                started = time.time()
+                module = importlib.import_module(module_name)
+                duration = time.time() - started
+                object.__setattr__(self, '_lazy_module', module)
+                from utils.startup_profile import startup_profile
+                startup_profile.record_lazy_import(module_name, duration)
+        return module
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self._load(), name)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        module_name = object.__getattribute__(self, '_lazy_module_name')
+        state = 'loaded' if object.__getattribute__(self, '_lazy_module') is not None else 'not loaded'
+        return f"<lazy module '{module_name}' ({state})>"
+
+
+def lazy_import(module_name: str) -> LazyModule:
+    """
+    返回一个延迟加载的模块代理
+
+    使用方法:
+        types = lazy_import('google.genai.types')
+        types.GenerateContentConfig(...)  # 此时才真正导入 google.genai.types
+    """
+    return LazyModule(module_name)
+
+
+def preload(*modules: LazyModule):
+    """立即加载给定的延迟模块（用于后台预热线程）"""
+    for module in modules:
+        module._load()
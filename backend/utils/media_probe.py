@@ -0,0 +1,346 @@
+"""
+Media Probe
+只读取文件头获取媒体的真实尺寸、MIME 类型和时长，不做完整解码
+- 图片：PNG (IHDR)、JPEG (SOFn)、WebP (VP8 / VP8L / VP8X)、GIF
+- 视频：MP4 / MOV（moov → mvhd 时长、trak → tkhd 尺寸），远程视频通过 HTTP Range 只拉取需要的 box
+
+运行 `python -m utils.media_probe` 进行吞吐量基准测试
+"""
+
+import base64
+import binascii
+import struct
+from dataclasses import dataclass, asdict
+from typing import Callable, Dict, Optional
+
+# base64 图片头部：先解码这么多字符，不够（如 JPEG 带大段 EXIF）时逐步加倍
+_BASE64_HEAD_CHARS = 4096
+# 远程 MP4 每次 Range 请求读取的字节数
+_RANGE_CHUNK = 64 * 1024
+# 防止异常文件导致无限读取
+_MAX_BOX_SCAN = 4096
+
+
+@dataclass
+class MediaInfo:
+    """媒体元数据"""
+    mime_type: str
+    width: Optional[int] = None
+    height: Optional[int] = None
+    duration: Optional[float] = None  # 秒（仅视频）
+
+    def to_dict(self) -> Dict[str, object]:
+        return {k: v for k, v in asdict(self).items() if v is not None}
+
+
+class NeedMoreData(Exception):
+    """头部数据不完整，需要读取更多字节"""
+
+
+# ---------------------------------------------------------------------------
+# 图片
+# ---------------------------------------------------------------------------
+
+def _probe_png(data: bytes) -> MediaInfo:
+    if len(data) < 24:
+        raise NeedMoreData()
+    width, height = struct.unpack('>II', data[16:24])
+    return MediaInfo('image/png', width, height)
+
+
+def _probe_gif(data: bytes) -> MediaInfo:
+    if len(data) < 10:
+        raise NeedMoreData()
+    width, height = struct.unpack('<HH', data[6:10])
+    return MediaInfo('image/gif', width, height)
+
+
+# SOF0-SOF15，排除 DHT(C4)、JPG(C8)、DAC(CC)
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _probe_jpeg(data: bytes) -> Optional[MediaInfo]:
+    offset = 2
+    length = len(data)
+    while True:
+        # 跳过填充字节
+        while offset < length and data[offset] == 0xFF:
+            offset += 1
+        if offset >= length:
+            raise NeedMoreData()
+        marker = data[offset]
+        offset += 1
+        if marker == 0xD8 or 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            continue
+        if marker in (0xD9, 0xDA):
+            # 到达 EOI/SOS 仍未找到 SOF
+            return None
+        if offset + 2 > length:
+            raise NeedMoreData()
+        segment_length = (data[offset] << 8) | data[offset + 1]
+        if marker in _JPEG_SOF_MARKERS:
+            if offset + 7 > length:
+                raise NeedMoreData()
+            height, width = struct.unpack('>HH', data[offset + 3:offset + 7])
+            return MediaInfo('image/jpeg', width, height)
+        offset += segment_length
+
+
+def _probe_webp(data: bytes) -> Optional[MediaInfo]:
+    if len(data) < 30:
+        raise NeedMoreData()
+    chunk = data[12:16]
+    if chunk == b'VP8X':
+        width = 1 + int.from_bytes(data[24:27], 'little')
+        height = 1 + int.from_bytes(data[27:30], 'little')
+    elif chunk == b'VP8L':
+        bits = int.from_bytes(data[21:25], 'little')
+        width = (bits & 0x3FFF) + 1
+        height = ((bits >> 14) & 0x3FFF) + 1
+    elif chunk == b'VP8 ':
+        width, height = struct.unpack('<HH', data[26:30])
+        width &= 0x3FFF
+        height &= 0x3FFF
+    else:
+        return None
+    return MediaInfo('image/webp', width, height)
+
+
+def probe_image(data: bytes) -> Optional[MediaInfo]:
+    """
+    从图片头部读取尺寸和 MIME 类型
+
+    Returns:
+        MediaInfo；无法识别的格式返回 None
+
+    Raises:
+        NeedMoreData: 头部数据不完整（调用方可读取更多字节后重试）
+    """
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return _probe_png(data)
+    if data.startswith(b'\xff\xd8'):
+        return _probe_jpeg(data)
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return _probe_webp(data)
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return _probe_gif(data)
+    if len(data) < 12:
+        raise NeedMoreData()
+    return None
+
+
+def probe_base64_image(data: str) -> Optional[MediaInfo]:
+    """
+    探测 base64 图片（只解码头部，兼容 data URI 前缀）
+
+    Returns:
+        MediaInfo；无法识别或数据无效时返回 None
+    """
+    if data.startswith('data:') and ',' in data[:256]:
+        data = data.split(',', 1)[1]
+    chars = _BASE64_HEAD_CHARS
+    while True:
+        head = data[:chars]
+        complete = len(head) == len(data)
+        try:
+            decoded = base64.b64decode(head[:len(head) - len(head) % 4] if not complete else head)
+            return probe_image(decoded)
+        except NeedMoreData:
+            if complete:
+                return None
+            chars *= 4
+        except (binascii.Error, ValueError):
+            return None
+
+
+# ---------------------------------------------------------------------------
+# 视频 (ISO BMFF: MP4 / MOV)
+# ---------------------------------------------------------------------------
+
+ReadAt = Callable[[int, int], bytes]
+
+
+def _iter_boxes(read_at: ReadAt, start: int, end: Optional[int]):
+    """遍历 [start, end) 范围内的 box，产出 (type, payload_offset, box_end)"""
+    offset = start
+    for _ in range(_MAX_BOX_SCAN):
+        if end is not None and offset + 8 > end:
+            return
+        header = read_at(offset, 16)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack('>I4s', header[:8])
+        header_size = 8
+        if size == 1:
+            if len(header) < 16:
+                return
+            size = struct.unpack('>Q', header[8:16])[0]
+            header_size = 16
+        elif size == 0:
+            # box 延伸到文件末尾
+            yield box_type, offset + header_size, end
+            return
+        if size < header_size:
+            return
+        yield box_type, offset + header_size, offset + size
+        offset += size
+
+
+def _parse_mvhd(payload: bytes) -> Optional[float]:
+    version = payload[0]
+    if version == 1:
+        timescale, duration = struct.unpack('>IQ', payload[20:32])
+    else:
+        timescale, duration = struct.unpack('>II', payload[12:20])
+    return round(duration / timescale, 3) if timescale else None
+
+
+def _parse_tkhd(payload: bytes):
+    # 最后 8 字节为 16.16 定点数的宽高
+    width, height = struct.unpack('>II', payload[-8:])
+    return width >> 16, height >> 16
+
+
+def probe_mp4(read_at: ReadAt, file_size: Optional[int] = None) -> Optional[MediaInfo]:
+    """
+    探测 MP4 / MOV 的尺寸和时长
+
+    Args:
+        read_at: read_at(offset, length) -> bytes，按需读取（本地字节或 HTTP Range）
+        file_size: 文件大小（可选）
+
+    Returns:
+        MediaInfo；不是 MP4 或没有 moov 时返回 None
+    """
+    head = read_at(0, 12)
+    if len(head) < 12 or head[4:8] != b'ftyp':
+        return None
+    mime_type = 'video/quicktime' if head[8:12] == b'qt  ' else 'video/mp4'
+    info = MediaInfo(mime_type)
+
+    for box_type, payload_start, box_end in _iter_boxes(read_at, 0, file_size):
+        if box_type != b'moov':
+            continue
+        # moov 通常只有几十 KB，一次读入后在内存中解析
+        moov = read_at(payload_start, (box_end or payload_start + _RANGE_CHUNK) - payload_start)
+        moov_read = lambda offset, length: moov[offset:offset + length]
+        for child, child_start, child_end in _iter_boxes(moov_read, 0, len(moov)):
+            if child == b'mvhd':
+                info.duration = _parse_mvhd(moov[child_start:child_end])
+            elif child == b'trak' and info.width is None:
+                for grandchild, gc_start, gc_end in _iter_boxes(moov_read, child_start, child_end):
+                    if grandchild == b'tkhd':
+                        width, height = _parse_tkhd(moov[gc_start:gc_end])
+                        # 音频轨道的宽高为 0
+                        if width and height:
+                            info.width, info.height = width, height
+                        break
+        return info
+    return None
+
+
+def probe_bytes(data: bytes) -> Optional[MediaInfo]:
+    """探测内存中的图片或视频"""
+    try:
+        image_info = probe_image(data)
+    except NeedMoreData:
+        image_info = None
+    if image_info:
+        return image_info
+    return probe_mp4(lambda offset, length: data[offset:offset + length], len(data))
+
+
+class _RangeReader:
+    """按 HTTP Range 读取远程文件，带简单的块缓存（ftyp/moov 通常在头部，一次请求即可）"""
+
+    def __init__(self, session, url: str, timeout: float, headers: Optional[Dict[str, str]] = None):
+        self.session = session
+        self.url = url
+        self.timeout = timeout
+        self.headers = headers or {}
+        self._chunks: Dict[int, bytes] = {}
+        self.requests = 0
+
+    def _chunk(self, index: int) -> bytes:
+        if index not in self._chunks:
+            start = index * _RANGE_CHUNK
+            self.requests += 1
+            response = self.session.get(
+                self.url,
+                headers={**self.headers, 'Range': f'bytes={start}-{start + _RANGE_CHUNK - 1}'},
+                timeout=self.timeout,
+                stream=True
+            )
+            try:
+                response.raise_for_status()
+                if response.status_code == 206:
+                    data = response.raw.read(_RANGE_CHUNK, decode_content=True)
+                elif index == 0:
+                    # 服务器不支持 Range：只读取开头部分
+                    data = response.raw.read(_RANGE_CHUNK, decode_content=True)
+                else:
+                    data = b''
+            finally:
+                response.close()
+            self._chunks[index] = data
+        return self._chunks[index]
+
+    def read_at(self, offset: int, length: int) -> bytes:
+        first, last = offset // _RANGE_CHUNK, (offset + length - 1) // _RANGE_CHUNK
+        data = b''.join(self._chunk(i) for i in range(first, last + 1))
+        start = offset - first * _RANGE_CHUNK
+        return data[start:start + length]
+
+
+def probe_remote_video(url: str, timeout: float = 10.0, session=None,
+                       headers: Optional[Dict[str, str]] = None) -> Optional[MediaInfo]:
+    """
+    通过 HTTP Range 探测远程 MP4 的尺寸和时长（只下载 ftyp/moov 所在的块）
+
+    Args:
+        headers: 额外的请求头（如鉴权用的 x-goog-api-key）
+
+    Returns:
+        MediaInfo；请求失败或格式无法识别时返回 None
+    """
+    import requests
+    session = session or requests.Session()
+    reader = _RangeReader(session, url, timeout, headers)
+    try:
+        return probe_mp4(reader.read_at)
+    except Exception as e:
+        print(f"[MediaProbe] ⚠️ Failed to probe remote video: {e}")
+        return None
+    finally:
+        print(f"[MediaProbe] Remote probe used {reader.requests} range request(s)")
+
+
+def _benchmark(iterations: int = 20000):
+    """头部探测吞吐量基准测试"""
+    import io
+    import time
+    from PIL import Image
+
+    samples = {}
+    for fmt, mime in (('PNG', 'png'), ('JPEG', 'jpeg'), ('WEBP', 'webp'), ('GIF', 'gif')):
+        buffer = io.BytesIO()
+        Image.new('RGB', (1080, 1920), (120, 80, 40)).save(buffer, format=fmt)
+        samples[mime] = buffer.getvalue()
+    # 最小的 MP4 头部：ftyp + moov(mvhd + trak(tkhd))
+    mvhd = b'\x00' * 12 + struct.pack('>II', 1000, 8000) + b'\x00' * 80
+    tkhd = b'\x00' * 76 + struct.pack('>II', 720 << 16, 1280 << 16)
+    box = lambda kind, payload: struct.pack('>I', len(payload) + 8) + kind + payload
+    samples['mp4'] = box(b'ftyp', b'isom\x00\x00\x02\x00') + box(b'moov', box(b'mvhd', mvhd) + box(b'trak', box(b'tkhd', tkhd)))
+    samples['base64-jpeg'] = base64.b64encode(samples['jpeg']).decode('ascii')
+
+    for name, sample in samples.items():
+        probe = probe_base64_image if isinstance(sample, str) else probe_bytes
+        started = time.perf_counter()
+        for _ in range(iterations):
+            info = probe(sample)
+        elapsed = time.perf_counter() - started
+        print(f"{name:12s} {iterations / elapsed:>12,.0f} headers/s  -> {info.to_dict()}")
+
+
+if __name__ == '__main__':
+    _benchmark()
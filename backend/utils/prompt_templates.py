@@ -0,0 +1,143 @@
+"""
+Prompt Templates
+提示词模板：模板文本放在 backend/prompts/*.txt，进程内只加载一次，渲染时统计字节数
+- 占位符只识别 ${name}（$$ 表示字面量 $），提示词中的 { } 与 JSON / TypeScript 示例无需转义
+- 文件末尾的一个换行符不属于模板内容（模板本身以换行结尾时文件末尾有两个换行）
+- 版本号为模板内容的 sha256 前 12 位，修改模板后版本自动变化，便于在日志中对照
+"""
+
+import hashlib
+import os
+import re
+import string
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Optional
+
+PROMPT_TEMPLATES_DIR = os.getenv(
+    'PROMPT_TEMPLATES_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'prompts')
+)
+# 渲染时打印模板名、版本和字节数
+PROMPT_LOG_SIZES = os.getenv('PROMPT_LOG_SIZES', 'false').lower() == 'true'
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：ASCII 约 4 字符 1 token，中文等非 ASCII 字符约 1 字符 1 token"""
+    if not text:
+        return 0
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return non_ascii + (len(text) - non_ascii + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """按估算 token 数截断文本（保留开头）"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low]
+
+
+class _BracedTemplate(string.Template):
+    """只替换 ${name}，提示词中单独的 $ 保持原样"""
+    pattern = r"""
+    \$(?:
+        (?P<escaped>\$) |
+        \{(?P<braced>[_a-z][_a-z0-9]*)\} |
+        (?P<named>(?!)) |
+        (?P<invalid>(?!))
+    )
+    """
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    name: str
+    source: str
+    version: str
+    placeholders: FrozenSet[str]
+
+    def render(self, /, **values: Any) -> str:
+        missing = self.placeholders - values.keys()
+        if missing:
+            raise KeyError(f"Prompt template '{self.name}' missing values: {', '.join(sorted(missing))}")
+        return _BracedTemplate(self.source).substitute(values)
+
+
+class PromptTemplateRegistry:
+    """模板注册表：首次使用时加载，记录每个模板的渲染次数和字节数"""
+
+    def __init__(self, directory: str = PROMPT_TEMPLATES_DIR):
+        self.directory = directory
+        self._templates: Dict[str, PromptTemplate] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> PromptTemplate:
+        template = self._templates.get(name)
+        if template is None:
+            with self._lock:
+                template = self._templates.get(name)
+                if template is None:
+                    template = self._load(name)
+                    self._templates[name] = template
+        return template
+
+    def _load(self, name: str) -> PromptTemplate:
+        if not re.match(r'^[a-z0-9_]+$', name):
+            raise ValueError(f"Invalid prompt template name: {name}")
+        with open(os.path.join(self.directory, f'{name}.txt'), encoding='utf-8') as f:
+            source = f.read()
+        if source.endswith('\n'):
+            source = source[:-1]
+        placeholders = frozenset(
+            m.group('braced') for m in _BracedTemplate.pattern.finditer(source) if m.group('braced')
+        )
+        version = hashlib.sha256(source.encode('utf-8')).hexdigest()[:12]
+        return PromptTemplate(name=name, source=source, version=version, placeholders=placeholders)
+
+    def render(self, name: str, /, **values: Any) -> str:
+        template = self.get(name)
+        text = template.render(**values)
+        size = len(text.encode('utf-8'))
+        with self._lock:
+            stats = self._stats.setdefault(name, {'renders': 0, 'totalBytes': 0, 'maxBytes': 0})
+            stats['renders'] += 1
+            stats['totalBytes'] += size
+            stats['maxBytes'] = max(stats['maxBytes'], size)
+        if PROMPT_LOG_SIZES:
+            print(f"[PromptTemplates] {name}@{template.version}: {size} bytes")
+        return text
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """各模板的版本、渲染次数、累计/最大字节数"""
+        with self._lock:
+            return {
+                name: {'version': self._templates[name].version, **stats}
+                for name, stats in self._stats.items()
+            }
+
+
+_registry: Optional[PromptTemplateRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_prompt_registry() -> PromptTemplateRegistry:
+    """获取模板注册表单例"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = PromptTemplateRegistry()
+    return _registry
+
+
+def render_prompt(name: str, /, **values: Any) -> str:
+    """渲染 prompts/<name>.txt"""
+    return get_prompt_registry().render(name, **values)
@@ -0,0 +1,63 @@
+"""
+Response Schemas
+各 JSON 接口的 Gemini 结构化输出 schema（google.genai 的 response_schema，OpenAPI 子集，写法与函数声明一致）
+- title 同时作为 GeminiService 结构化输出统计的名称
+- propertyOrdering 与提示词中 TypeScript 接口的字段顺序一致
+"""
+
+from typing import Any, Dict
+
+Schema = Dict[str, Any]
+
+
+def _object(title: str, properties: Dict[str, Schema]) -> Schema:
+    return {
+        'type': 'OBJECT',
+        'title': title,
+        'properties': properties,
+        'required': list(properties),
+        'propertyOrdering': list(properties),
+    }
+
+
+def _array(title: str, item: Schema) -> Schema:
+    return {'type': 'ARRAY', 'title': title, 'items': item}
+
+
+_STRING = {'type': 'STRING'}
+
+ENHANCED_PROMPT: Schema = _object('EnhancedPrompt', {
+    'title': _STRING,
+    'description': _STRING,
+    'tags': {'type': 'ARRAY', 'items': _STRING},
+    'fullPrompt': _STRING,
+})
+ENHANCED_PROMPT_LIST: Schema = _array('EnhancedPrompt[]', ENHANCED_PROMPT)
+
+DESIGN_PLAN: Schema = _object('DesignPlan', {
+    'title': _STRING,
+    'description': _STRING,
+    'prompt': _STRING,
+    'referenceImagePrompt': _STRING,
+})
+DESIGN_PLAN_LIST: Schema = _array('DesignPlan[]', DESIGN_PLAN)
+
+BRAND_DNA: Schema = _object('BrandDNA', {
+    'visualStyle': _STRING,
+    'colorPalette': _STRING,
+    'mood': _STRING,
+    'negativeConstraint': _STRING,
+    'motionStyle': _STRING,
+})
+
+# /detect-modality
+MODALITY_VERDICT: Schema = _object('ModalityVerdict', {
+    'modality': {'type': 'STRING', 'enum': ['VIDEO', 'IMAGE']},
+})
+
+# /creative-director 的模型不匹配检查
+MISMATCH_VERDICT: Schema = _object('MismatchVerdict', {
+    'mismatch': {'type': 'BOOLEAN'},
+    'suggestedModel': {'type': 'STRING', 'enum': ['veo_fast', 'banana']},
+    'reasoning': _STRING,
+})
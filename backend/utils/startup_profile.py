@@ -0,0 +1,141 @@
+"""
+Startup Profile
+记录冷启动各阶段耗时（模块导入、Firebase/Gemini 预热、首个响应），用于 Cloud Run 冷启动预算
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+# 冷启动预算（从进程启动到首个响应），超出时打印警告
+COLD_START_BUDGET_MS = float(os.getenv('COLD_START_BUDGET_MS', '3000'))
+# 是否在启动完成后打印耗时报告
+STARTUP_PROFILE_ENABLED = os.getenv('STARTUP_PROFILE', 'false').lower() == 'true'
+
+
+def _process_start_time() -> float:
+    """
+    获取进程启动时间（epoch 秒）
+
+    Linux 下从 /proc 读取真实的进程启动时间（包含解释器启动耗时），
+    其他平台回退为本模块首次导入的时间。
+    """
+    try:
+        with open('/proc/self/stat') as f:
+            # 进程名可能包含空格，从最后一个 ')' 之后开始解析
+            fields = f.read().rsplit(')', 1)[1].split()
+        start_ticks = int(fields[19])
+        with open('/proc/stat') as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith('btime'))
+        return boot_time + start_ticks / os.sysconf('SC_CLK_TCK')
+    except Exception:
+        return time.time()
+
+
+class StartupProfile:
+    """冷启动耗时记录器（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.process_start = _process_start_time()
+        self.profile_start = time.time()
+        self.phases: List[Dict[str, Any]] = []
+        self.lazy_imports: List[Dict[str, Any]] = []
+        self.first_response: Optional[Dict[str, Any]] = None
+        self._reported = False
+
+    @contextmanager
+    def phase(self, name: str):
+        """记录一个启动阶段的耗时"""
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.record_phase(name, started, time.time())
+
+    def record_phase(self, name: str, started: float, finished: float):
+        with self._lock:
+            self.phases.append({
+                "name": name,
+                "offsetMs": round((started - self.process_start) * 1000, 1),
+                "durationMs": round((finished - started) * 1000, 1),
+                "thread": threading.current_thread().name,
+            })
+
+    def record_lazy_import(self, module_name: str, duration: float):
+        """记录按需加载的模块（由 utils.lazy_import 调用）"""
+        with self._lock:
+            self.lazy_imports.append({
+                "module": module_name,
+                "offsetMs": round((time.time() - duration - self.process_start) * 1000, 1),
+                "durationMs": round(duration * 1000, 1),
+                "thread": threading.current_thread().name,
+            })
+
+    def mark_first_response(self, path: str, status_code: int) -> bool:
+        """
+        记录首个响应（冷启动到首个响应的耗时）
+
+        Returns:
+            是否为首个响应（只有第一次调用返回 True）
+        """
+        with self._lock:
+            if self.first_response is not None:
+                return False
+            elapsed_ms = round((time.time() - self.process_start) * 1000, 1)
+            self.first_response = {
+                "path": path,
+                "statusCode": status_code,
+                "coldStartMs": elapsed_ms,
+                "budgetMs": COLD_START_BUDGET_MS,
+                "withinBudget": elapsed_ms <= COLD_START_BUDGET_MS,
+            }
+        if elapsed_ms > COLD_START_BUDGET_MS:
+            print(f"[StartupProfile] ⚠️ Cold start to first response took {elapsed_ms:.0f}ms "
+                  f"(budget: {COLD_START_BUDGET_MS:.0f}ms, path: {path})")
+        else:
+            print(f"[StartupProfile] ✅ Cold start to first response: {elapsed_ms:.0f}ms "
+                  f"(budget: {COLD_START_BUDGET_MS:.0f}ms)")
+        return True
+
+    def report(self) -> Dict[str, Any]:
+        """返回当前的启动耗时报告"""
+        with self._lock:
+            return {
+                "interpreterBootMs": round((self.profile_start - self.process_start) * 1000, 1),
+                "phases": list(self.phases),
+                "lazyImports": list(self.lazy_imports),
+                "firstResponse": dict(self.first_response) if self.first_response else None,
+                "budgetMs": COLD_START_BUDGET_MS,
+            }
+
+    def print_report_once(self) -> bool:
+        """
+        只打印一次报告（后台预热完成时调用；之后失败依赖的重试不再重复打印）
+
+        Returns:
+            本次是否打印
+        """
+        with self._lock:
+            if self._reported:
+                return False
+            self._reported = True
+        self.print_report()
+        return True
+
+    def print_report(self):
+        """以表格形式打印启动耗时报告"""
+        report = self.report()
+        print("=" * 50)
+        print("Startup Profile:")
+        print(f"  interpreter boot: {report['interpreterBootMs']:>8.1f} ms")
+        for item in report['phases']:
+            print(f"  {item['name']:<28} +{item['offsetMs']:>8.1f} ms  {item['durationMs']:>8.1f} ms  [{item['thread']}]")
+        for item in report['lazyImports']:
+            print(f"  lazy import {item['module']:<16} +{item['offsetMs']:>8.1f} ms  {item['durationMs']:>8.1f} ms  [{item['thread']}]")
+        print("=" * 50)
+
+
+startup_profile = StartupProfile()
@@ -0,0 +1,162 @@
+"""
+Background Warm-up & Readiness
+在后台线程中并行初始化各依赖（Firebase、Firestore、Storage、Auth 证书缓存、Gemini），
+对每个依赖执行一次低成本探测，并记录就绪状态供 /ready 端点使用
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from utils.startup_profile import startup_profile, STARTUP_PROFILE_ENABLED
+
+# 失败的依赖在 /ready 被调用时重新预热的最小间隔（秒）
+READY_RETRY_SECONDS = float(os.getenv('READY_RETRY_SECONDS', '10'))
+# 所有依赖都就绪后 /ready 才返回 200（逗号分隔，默认全部）
+READY_REQUIRED_DEPENDENCIES = [
+    name.strip() for name in os.getenv('READY_REQUIRED_DEPENDENCIES', '').split(',') if name.strip()
+]
+
+# Firebase ID Token 公钥证书地址（firebase_admin 内部接口不可用时直接请求）
+FIREBASE_ID_TOKEN_CERT_URL = 'https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com'
+
+_warmup_lock = threading.Lock()
+_warmup_executor: Optional[ThreadPoolExecutor] = None
+_dependency_status: Dict[str, Dict[str, Any]] = {}
+
+
+def _warm_firebase():
+    """初始化 Firebase Admin SDK"""
+    from utils.firebase_registry import get_firebase_app
+    if get_firebase_app() is None:
+        raise RuntimeError("Firebase Admin SDK not initialized")
+
+
+def _warm_firestore():
+    """创建共享 Firestore 客户端并读取一个探测文档（不存在也算成功）"""
+    from utils.firebase_registry import get_firestore_client
+    db = get_firestore_client()
+    if db is None:
+        raise RuntimeError("Firestore client not available")
+    db.collection('_readiness').document('probe').get()
+
+
+def _warm_storage():
+    """初始化 VideoAssetService 并确认 Storage bucket 可访问"""
+    from services.video_asset_service import get_video_asset_service
+    asset_service = get_video_asset_service()
+    if not asset_service.is_available():
+        raise RuntimeError("VideoAssetService not available (Firestore or Storage bucket missing)")
+    if not asset_service.bucket.exists():
+        raise RuntimeError(f"Storage bucket {asset_service.bucket.name} does not exist")
+
+
+def _warm_auth_certs():
+    """
+    预取 Firebase ID Token 公钥证书，填充 verify_id_token 使用的 HTTP 缓存
+    firebase_admin 内部接口不可用时（升级后变化），改为直接请求公开的证书地址，只确认可访问
+    """
+    _warm_firebase()
+    from firebase_admin import auth
+    try:
+        verifier = auth._get_client(None)._token_verifier
+        request, cert_url = verifier.request, verifier.id_token_verifier.cert_url
+    except AttributeError as e:
+        print(f"[Warmup] ⚠️ firebase_admin internals changed ({e}), fetching public certificates directly")
+        import requests
+        response = requests.get(FIREBASE_ID_TOKEN_CERT_URL, timeout=10)
+        if response.status_code != 200:
+            raise RuntimeError(f"Failed to fetch ID token certificates: HTTP {response.status_code}")
+        return
+    response = request(cert_url)
+    if response.status != 200:
+        raise RuntimeError(f"Failed to fetch ID token certificates: HTTP {response.status}")
+
+
+def _warm_gemini():
+    """导入 google.genai，创建 GeminiService 单例并读取模型元数据（同时建立共享客户端的连接）"""
+    from services.gemini_service import get_gemini_service, DEFAULT_MODEL
+    get_gemini_service().client.models.get(model=DEFAULT_MODEL)
+
+
+WARMUP_TASKS: Dict[str, Callable[[], None]] = {
+    'firebase': _warm_firebase,
+    'firestore': _warm_firestore,
+    'storage': _warm_storage,
+    'auth_certs': _warm_auth_certs,
+    'gemini': _warm_gemini,
+}
+
+
+def _run_task(name: str, task: Callable[[], None], status: Dict[str, Any]):
+    started = time.time()
+    try:
+        with startup_profile.phase(f"warmup:{name}"):
+            task()
+        state, error = 'ready', None
+        print(f"[Warmup] ✅ {name} ready")
+    except Exception as e:
+        state, error = 'failed', str(e)
+        print(f"[Warmup] ⚠️ {name} warm-up failed: {e}")
+    with _warmup_lock:
+        status.update({
+            'state': state,
+            'error': error,
+            'durationMs': round((time.time() - started) * 1000, 1),
+            'checkedAt': time.time(),
+        })
+        finished = all(s['state'] != 'pending' for s in _dependency_status.values())
+    # 所有依赖首次预热结束后打印启动报告（包含延迟加载的 SDK 与各预热阶段）
+    if finished and STARTUP_PROFILE_ENABLED:
+        startup_profile.print_report_once()
+
+
+def _submit_locked(name: str):
+    """提交一个预热任务（调用方需持有 _warmup_lock）"""
+    global _warmup_executor
+    if _warmup_executor is None:
+        _warmup_executor = ThreadPoolExecutor(max_workers=len(WARMUP_TASKS), thread_name_prefix='warmup')
+    attempts = _dependency_status.get(name, {}).get('attempts', 0)
+    status = {'state': 'pending', 'error': None, 'attempts': attempts + 1}
+    _dependency_status[name] = status
+    _warmup_executor.submit(_run_task, name, WARMUP_TASKS[name], status)
+
+
+def start_background_warmup():
+    """启动后台预热（幂等，多次调用只启动一次）"""
+    with _warmup_lock:
+        for name in WARMUP_TASKS:
+            if name not in _dependency_status:
+                _submit_locked(name)
+
+
+def retry_failed_warmup():
+    """重新预热失败且超过重试间隔的依赖"""
+    now = time.time()
+    with _warmup_lock:
+        for name, status in _dependency_status.items():
+            if status['state'] == 'failed' and now - status.get('checkedAt', 0) >= READY_RETRY_SECONDS:
+                _submit_locked(name)
+
+
+def get_readiness() -> Dict[str, Any]:
+    """
+    获取各依赖的就绪状态
+
+    Returns:
+        {
+            "ready": bool,
+            "dependencies": {name: {"state": "pending" | "ready" | "failed", "error", "durationMs", "attempts"}}
+        }
+    """
+    start_background_warmup()
+    retry_failed_warmup()
+    with _warmup_lock:
+        dependencies = {name: dict(status) for name, status in _dependency_status.items()}
+    required = READY_REQUIRED_DEPENDENCIES or list(WARMUP_TASKS)
+    ready = all(dependencies.get(name, {}).get('state') == 'ready' for name in required)
+    for status in dependencies.values():
+        status.pop('checkedAt', None)
+    return {"ready": ready, "dependencies": dependencies}
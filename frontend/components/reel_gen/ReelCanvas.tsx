@@ -78,6 +78,7 @@ const ReelCanvas: React.FC<ReelCanvasProps> = ({
                 <video 
                     id={`reel-video-${asset.id}`}
                     src={asset.src} 
+                    poster={asset.thumbnailSrc}
                     className="w-full h-full object-cover" 
                     controls 
                     playsInline 
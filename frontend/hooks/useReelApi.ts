@@ -154,8 +154,17 @@ async function apiRequest<T>(
     throw new Error('请求失败：已达到最大重试次数');
 }
 
+type CreativeDirectorResult = {
+    action: 'NEW_ASSET' | 'EDIT_ASSET' | 'ANSWER_QUESTION' | 'MODEL_MISMATCH';
+    prompt: string;
+    reasoning: string;
+    targetAssetId?: string;
+    suggestedModel?: string;
+};
+
 /**
  * 创意总监：分析用户意图并决定下一步动作
+ * 传入 sessionId 时使用服务端会话：只发送上次请求之后的新消息和变化的资产
  */
 export async function getReelCreativeDirectorAction(
     userPrompt: string,
@@ -164,27 +173,165 @@ export async function getReelCreativeDirectorAction(
     selectedAssetId: string | null,
     lastGeneratedAssetId: string | null,
     messages: ReelMessage[],
-    hasUploadedFiles: boolean
-): Promise<{
-    action: 'NEW_ASSET' | 'EDIT_ASSET' | 'ANSWER_QUESTION' | 'MODEL_MISMATCH';
-    prompt: string;
-    reasoning: string;
-    targetAssetId?: string;
-    suggestedModel?: string;
-}> {
-    // 创意总监需要调用 Gemini API，可能需要较长时间，设置 60 秒超时
-    return apiRequest('/api/reel/creative-director', {
+    hasUploadedFiles: boolean,
+    sessionId?: string
+): Promise<CreativeDirectorResult> {
+    // 创意总监需要调用 Gemini API，可能需要较长时间，设置 90 秒超时
+    // 只发送资产清单和最近的文本消息，请求体大小不随画布资产数量增长
+    const request = (body: Record<string, unknown>) => apiRequest<CreativeDirectorResult>('/api/reel/creative-director', {
         method: 'POST',
-        body: JSON.stringify({
-            userPrompt,
-            selectedModel,
-            assets,
+        body: JSON.stringify({ userPrompt, selectedModel, hasUploadedFiles, ...body }),
+    }, 3, 90000); // 90 秒超时
+
+    if (!sessionId) {
+        return request({
+            assets: toAssetManifest(assets),
             selectedAssetId,
             lastGeneratedAssetId,
-            messages,
-            hasUploadedFiles,
-        }),
-    }, 3, 90000); // 90 秒超时
+            messages: messages.slice(-CREATIVE_DIRECTOR_HISTORY_MESSAGES).map(toSessionMessage),
+        });
+    }
+
+    const manifest = toAssetManifest(assets);
+    const sendDelta = (reset: boolean) => {
+        const tracker = reset ? newSessionTracker() : (sessionTrackers.get(sessionId) || newSessionTracker());
+        const { delta, next } = buildSessionDelta(tracker, manifest, selectedAssetId, lastGeneratedAssetId, messages, reset);
+        // 先记录新状态：请求失败时整体丢弃，下次以 reset 重新同步
+        sessionTrackers.delete(sessionId);
+        return request({ sessionId, baseVersion: tracker.version, sessionDelta: delta }).then(result => {
+            sessionTrackers.set(sessionId, next);
+            return result;
+        });
+    };
+
+    try {
+        return await sendDelta(!sessionTrackers.has(sessionId));
+    } catch (error: any) {
+        // 服务端会话过期 / 实例切换 / 版本冲突：发送完整状态重建会话
+        if (error?.message !== 'session_out_of_sync') {
+            throw error;
+        }
+        console.warn(`[API] Reel session ${sessionId} out of sync, resending full state`);
+        return sendDelta(true);
+    }
+}
+
+/**
+ * 客户端记录的已同步会话状态，用于计算增量
+ */
+interface SessionTracker {
+    version: number;
+    messageIds: Set<string>;
+    assets: Map<string, string>;  // asset id -> 清单条目 JSON
+    selectedAssetId: string | null;
+    lastGeneratedAssetId: string | null;
+}
+
+const sessionTrackers = new Map<string, SessionTracker>();
+
+function newSessionTracker(): SessionTracker {
+    return { version: 0, messageIds: new Set(), assets: new Map(), selectedAssetId: null, lastGeneratedAssetId: null };
+}
+
+function toSessionMessage(msg: ReelMessage) {
+    return {
+        id: msg.id,
+        role: msg.role,
+        type: msg.type,
+        content: typeof msg.content === 'string' ? msg.content : null,
+    };
+}
+
+function buildSessionDelta(
+    tracker: SessionTracker,
+    manifest: Record<string, ReelAssetManifestEntry>,
+    selectedAssetId: string | null,
+    lastGeneratedAssetId: string | null,
+    messages: ReelMessage[],
+    reset: boolean
+): { delta: Record<string, unknown>; next: SessionTracker } {
+    const delta: Record<string, unknown> = {};
+    if (reset) {
+        delta.reset = true;
+    }
+
+    const recent = reset ? messages.slice(-SESSION_SYNC_MESSAGES) : messages;
+    const newMessages = recent.filter(msg => !tracker.messageIds.has(msg.id));
+    if (newMessages.length > 0) {
+        delta.messages = newMessages.map(toSessionMessage);
+    }
+
+    const assetDelta: Record<string, ReelAssetManifestEntry | null> = {};
+    const assetSnapshot = new Map<string, string>();
+    for (const [id, entry] of Object.entries(manifest)) {
+        const serialized = JSON.stringify(entry);
+        assetSnapshot.set(id, serialized);
+        if (tracker.assets.get(id) !== serialized) {
+            assetDelta[id] = entry;
+        }
+    }
+    for (const id of tracker.assets.keys()) {
+        if (!assetSnapshot.has(id)) {
+            assetDelta[id] = null;
+        }
+    }
+    if (Object.keys(assetDelta).length > 0) {
+        delta.assets = assetDelta;
+    }
+
+    if (reset || selectedAssetId !== tracker.selectedAssetId) {
+        delta.selectedAssetId = selectedAssetId;
+    }
+    if (reset || lastGeneratedAssetId !== tracker.lastGeneratedAssetId) {
+        delta.lastGeneratedAssetId = lastGeneratedAssetId;
+    }
+
+    const messageIds = new Set(tracker.messageIds);
+    newMessages.forEach(msg => messageIds.add(msg.id));
+    return {
+        delta,
+        next: {
+            version: tracker.version + 1,
+            messageIds,
+            assets: assetSnapshot,
+            selectedAssetId,
+            lastGeneratedAssetId,
+        },
+    };
+}
+
+/**
+ * 生成服务端会话 ID（与后端 ^[A-Za-z0-9_-]{8,64}$ 一致）
+ */
+export function createReelSessionId(): string {
+    const random = globalThis.crypto?.randomUUID?.() || `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+    return `reel-${random}`.replace(/[^A-Za-z0-9_-]/g, '').slice(0, 64);
+}
+
+// 重建会话时发送的最近消息数（与后端 REEL_SESSION_MAX_MESSAGES 一致）
+const SESSION_SYNC_MESSAGES = 40;
+
+// 与后端 CREATIVE_DIRECTOR_HISTORY_MESSAGES 一致
+const CREATIVE_DIRECTOR_HISTORY_MESSAGES = 4;
+
+export type ReelAssetManifestEntry = Pick<ReelAsset, 'type' | 'prompt' | 'width' | 'height' | 'mimeType' | 'duration'>;
+
+/**
+ * 资产清单：只包含创意总监需要的元数据，不包含 src 等图片/视频内容
+ */
+export function toAssetManifest(assets: Record<string, ReelAsset>): Record<string, ReelAssetManifestEntry> {
+    const manifest: Record<string, ReelAssetManifestEntry> = {};
+    for (const [id, asset] of Object.entries(assets)) {
+        manifest[id] = {
+            type: asset.type,
+            prompt: (asset.prompt || '').slice(0, 500),
+            width: asset.width,
+            height: asset.height,
+            mimeType: asset.mimeType,
+            duration: asset.duration,
+        };
+    }
+    return manifest;
 }
 
 /**
@@ -213,6 +360,10 @@ export async function generateReelAsset(
         prompt: string;
         width: number;
         height: number;
+        mimeType?: string;
+        duration?: number;
+        fullSrc?: string;
+        thumbnailSrc?: string;
         status: 'done';
         generationModel: string;
     }>('/api/reel/generate', {
@@ -230,10 +381,14 @@ export async function generateReelAsset(
     return {
         id: response.assetId,
         type: response.type,
-        src: response.src,
+        src: resolveApiUrl(response.src), // 视频为后端代理地址 /api/reel/videos/<id>
         prompt: response.prompt,
         width: response.width,
         height: response.height,
+        mimeType: response.mimeType,
+        duration: response.duration,
+        fullSrc: response.fullSrc ? resolveApiUrl(response.fullSrc) : undefined,
+        thumbnailSrc: response.thumbnailSrc ? resolveApiUrl(response.thumbnailSrc) : undefined,
         x: 0,
         y: 0,
         status: response.status,
@@ -242,6 +397,46 @@ export async function generateReelAsset(
     };
 }
 
+/**
+ * 把后端返回的相对路径（如 /api/reel/assets/...）转换为完整 URL
+ */
+export function resolveApiUrl(path: string): string {
+    return path.startsWith('/') ? `${API_BASE_URL}${path}` : path;
+}
+
+// 原图刚生成时可能仍在上传到 Storage（请求落到其他实例时会短暂 404），按间隔重试
+const FULL_ASSET_RETRY_DELAYS_MS = [500, 1000, 2000];
+
+/**
+ * 获取资源的完整分辨率版本（Data URI）
+ * 画布上只显示预览图；下载、放大、去背景、作为参考图等需要原图时再按需拉取
+ * 重试后仍失败时抛出异常，不会用预览图代替原图
+ */
+export async function loadFullAssetSrc(asset: ReelAsset): Promise<string> {
+    if (asset.type !== 'image' || !asset.fullSrc) {
+        return asset.src;
+    }
+    let response = await fetch(asset.fullSrc);
+    for (const delay of FULL_ASSET_RETRY_DELAYS_MS) {
+        if (response.ok || (response.status !== 404 && response.status < 500)) {
+            break;
+        }
+        console.warn(`[API] Full asset not available yet (${response.status}), retrying in ${delay}ms`);
+        await new Promise(resolve => setTimeout(resolve, delay));
+        response = await fetch(asset.fullSrc);
+    }
+    if (!response.ok) {
+        throw new Error(`Failed to load full-resolution image (${response.status})`);
+    }
+    const blob = await response.blob();
+    return new Promise((resolve, reject) => {
+        const reader = new FileReader();
+        reader.onloadend = () => resolve(reader.result as string);
+        reader.onerror = reject;
+        reader.readAsDataURL(blob);
+    });
+}
+
 /**
  * 优化提示词
  */
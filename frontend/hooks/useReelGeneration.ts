@@ -8,7 +8,9 @@ import {
     upscaleImage,
     removeBackground,
     generateReferenceImage,
-    detectReelModality
+    detectReelModality,
+    loadFullAssetSrc,
+    createReelSessionId
 } from './useReelApi';
 import { subscribeToGallery, uploadImageToStorage, saveGalleryItem } from '../services/galleryService';
 import { deductUserCredits } from '../services/userService';
@@ -97,6 +99,8 @@ export const useReelGeneration = (initialPrompt: string, userProfile: UserProfil
     const messagesEndRef = useRef<HTMLDivElement>(null);
     const userInputRef = useRef<HTMLTextAreaElement>(null);
     const initialPromptHandled = useRef(false);
+    // 服务端创意总监会话：每个 Reel 编辑器实例一个，请求只发送增量
+    const sessionIdRef = useRef<string>(createReelSessionId());
     const isPanning = useRef(false);
     const lastMousePosition = useRef({ x: 0, y: 0 });
     const dragState = useRef<{ assetId: string | null; startX: number; startY: number; initialX: number; initialY: number }>({ assetId: null, startX: 0, startY: 0, initialX: 0, initialY: 0 });
@@ -302,7 +306,7 @@ export const useReelGeneration = (initialPrompt: string, userProfile: UserProfil
             } else if (sourceAsset && sourceAsset.type === 'image') {
                 // Use source asset as input
                 try {
-                    const imageData = await prepareImageForApi(sourceAsset.src);
+                    const imageData = await prepareImageForApi(await loadFullAssetSrc(sourceAsset));
                     imageInputs.push(imageData);
                 } catch (e) {
                     console.warn("Failed to prepare source asset image", e);
@@ -350,9 +354,16 @@ export const useReelGeneration = (initialPrompt: string, userProfile: UserProfil
                 });
                 
                 if (newAsset.type === 'image') {
-                    // Extract base64 from data URI
-                    if (newAsset.src.startsWith('data:image')) {
-                        const base64Match = newAsset.src.match(/data:image\/[^;]+;base64,(.+)/);
+                    // 画布只显示预览图，保存到创作档案时使用原图；原图不可用时不保存，避免把预览图当作原图存档
+                    const fullSrc = await loadFullAssetSrc(newAsset).catch(err => {
+                        console.error('[Reel] ❌ Failed to load full-resolution image:', err);
+                        addMessage('assistant', 'text', `⚠️ 原图加载失败，未保存到创作档案: ${err.message || '未知错误'}`);
+                        return null;
+                    });
+                    if (fullSrc === null) {
+                        // 已提示用户
+                    } else if (fullSrc.startsWith('data:image')) {
+                        const base64Match = fullSrc.match(/data:image\/[^;]+;base64,(.+)/);
                         if (base64Match && base64Match[1]) {
                             const base64Image = base64Match[1];
                             
@@ -369,10 +380,12 @@ export const useReelGeneration = (initialPrompt: string, userProfile: UserProfil
                                 .then(async (downloadUrl) => {
                                     console.log('[Reel] ✅ Image uploaded to Storage:', downloadUrl.substring(0, 80) + '...');
                                     
-                                    // Update asset src to use cloud URL
+                                    // 原图改用云端 URL；带预览图的资源继续在画布上显示预览
                                     setAssets(prev => ({
                                         ...prev,
-                                        [newAsset.id]: { ...prev[newAsset.id], src: downloadUrl }
+                                        [newAsset.id]: newAsset.fullSrc
+                                            ? { ...prev[newAsset.id], fullSrc: downloadUrl }
+                                            : { ...prev[newAsset.id], src: downloadUrl }
                                     }));
                                     
                                     const galleryItemData = {
@@ -424,7 +437,7 @@ export const useReelGeneration = (initialPrompt: string, userProfile: UserProfil
                                 });
                         } else {
                             console.warn('[Reel] ⚠️ Failed to extract base64 from data URI');
-                            console.warn('[Reel] Data URI format:', newAsset.src.substring(0, 100));
+                            console.warn('[Reel] Data URI format:', fullSrc.substring(0, 100));
                             addMessage('assistant', 'text', '⚠️ 图片格式异常，无法保存到创作档案');
                         }
                     } else {
@@ -573,7 +586,8 @@ export const useReelGeneration = (initialPrompt: string, userProfile: UserProfil
                 selectedAssetId,
                 lastGeneratedAssetId,
                 messages,
-                uploadedFiles.length > 0
+                uploadedFiles.length > 0,
+                sessionIdRef.current
             );
 
             // Force new creation if uploads exist
@@ -728,7 +742,7 @@ export const useReelGeneration = (initialPrompt: string, userProfile: UserProfil
         if (!selectedAssetId || !assets[selectedAssetId]) return;
         const asset = assets[selectedAssetId];
         const link = document.createElement('a');
-        link.href = asset.src;
+        link.href = asset.fullSrc || asset.src;
         const ext = asset.type === 'video' ? 'mp4' : 'jpg';
         link.download = `reel-${asset.type}-${asset.id}.${ext}`;
         link.referrerPolicy = "no-referrer";
@@ -824,7 +838,7 @@ export const useReelGeneration = (initialPrompt: string, userProfile: UserProfil
         addMessage('assistant', 'tool-usage', { text: `HD 超清放大 (${factor}x)` });
 
         try {
-            const { data, mimeType } = await prepareImageForApi(asset.src);
+            const { data, mimeType } = await prepareImageForApi(await loadFullAssetSrc(asset));
             
             const result = await upscaleImage(data, mimeType, factor, asset.prompt);
             
@@ -903,7 +917,7 @@ export const useReelGeneration = (initialPrompt: string, userProfile: UserProfil
         addMessage('assistant', 'tool-usage', { text: '去除背景' });
 
         try {
-            const { data, mimeType } = await prepareImageForApi(asset.src);
+            const { data, mimeType } = await prepareImageForApi(await loadFullAssetSrc(asset));
             const result = await removeBackground(data, mimeType);
             
             const newAssetId = `reel-img-rmbg-${Date.now()}`;
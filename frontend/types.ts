@@ -325,6 +325,10 @@ export interface ReelAsset {
     prompt: string;
     width: number;
     height: number;
+    mimeType?: string; // 服务端从文件头读取的真实格式
+    duration?: number; // 视频时长（秒）
+    fullSrc?: string; // 原图 URL（src 为预览图时按需加载）
+    thumbnailSrc?: string; // 缩略图 URL（视频为海报帧）
     x: number;
     y: number;
     status?: 'generating' | 'saving' | 'done' | 'error';